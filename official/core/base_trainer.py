@@ -32,6 +32,117 @@ from official.modeling.hyperparams import config_definitions
 ExperimentConfig = config_definitions.ExperimentConfig
 
 
+class _GradientAccumulationOptimizer(tf.keras.optimizers.Optimizer):
+  """Stands in for the optimizer of a task while gradients are accumulated.
+
+  `apply_gradients` adds the gradients to a `orbit.utils.GradientAccumulator`
+  instead of updating the variables, so `Task.train_step` computes the
+  gradients of a micro-batch unchanged.
+  """
+
+  def __init__(self, accumulator, name='GradientAccumulation'):
+    super().__init__(name)
+    self._accumulator = accumulator
+
+  def apply_gradients(self,
+                      grads_and_vars,
+                      name=None,
+                      experimental_aggregate_gradients=True):
+    del name, experimental_aggregate_gradients
+    return self._accumulator.accumulate(grads_and_vars)
+
+  def get_config(self):
+    return {'name': self._name}
+
+
+class _LossScaleGradientAccumulationOptimizer(
+    tf.keras.mixed_precision.experimental.LossScaleOptimizer):
+  """Stands in for a `LossScaleOptimizer` while gradients are accumulated.
+
+  Tasks scale the loss and unscale the gradients of a micro-batch through it,
+  which uses the loss scale of the trainer optimizer without updating it.
+  Micro-batches with non-finite gradients are not accumulated but counted in
+  `overflows`, so the loss scale is only updated once per train step, when
+  the trainer optimizer applies the mean gradient.
+  """
+
+  def __init__(self,
+               accumulator,
+               optimizer,
+               name='LossScaleGradientAccumulation'):
+    # Nothing is wrapped and the loss scale belongs to `optimizer`, so the
+    # `LossScaleOptimizer` constructor is skipped. `_optimizer` is set first
+    # since `LossScaleOptimizer.__setattr__` reads it.
+    self._optimizer = optimizer
+    tf.keras.optimizers.Optimizer.__init__(self, name)
+    self._accumulator = accumulator
+    self._overflows = tf.Variable(
+        0,
+        dtype=tf.int64,
+        trainable=False,
+        name='%s/overflows' % name,
+        synchronization=tf.VariableSynchronization.ON_READ,
+        aggregation=tf.VariableAggregation.SUM)
+
+  @property
+  def overflows(self):
+    """The number of micro-batches skipped since the last `reset_overflows`."""
+    return self._overflows
+
+  def get_scaled_loss(self, loss):
+    return self._optimizer.get_scaled_loss(loss)
+
+  def get_unscaled_gradients(self, grads):
+    return self._optimizer.get_unscaled_gradients(grads)
+
+  def apply_gradients(self,
+                      grads_and_vars,
+                      name=None,
+                      experimental_aggregate_gradients=True):
+    del name, experimental_aggregate_gradients
+    grads_and_vars = list(grads_and_vars)
+    is_finite = tf.reduce_all([
+        tf.reduce_all(tf.math.is_finite(tf.convert_to_tensor(grad)))
+        for grad, _ in grads_and_vars
+        if grad is not None
+    ])
+
+    def accumulate():
+      with tf.control_dependencies(
+          [self._accumulator.accumulate(grads_and_vars)]):
+        return tf.constant(True)
+
+    def skip():
+      with tf.control_dependencies([self._overflows.assign_add(1)]):
+        return tf.constant(False)
+
+    return tf.cond(is_finite, accumulate, skip)
+
+  def with_overflows(self, gradients):
+    """Makes `gradients` non-finite if a micro-batch overflowed.
+
+    The trainer optimizer then skips the update and lowers its loss scale,
+    like it would for a single non-finite batch.
+
+    Args:
+      gradients: The mean gradients of the accumulated micro-batches.
+
+    Returns:
+      The gradients, all `inf` if a micro-batch was skipped.
+    """
+    overflow = self._overflows.read_value() > 0
+    return [
+        grad + tf.cast(tf.where(overflow, float('inf'), 0.0), grad.dtype)
+        for grad in gradients
+    ]
+
+  def reset_overflows(self):
+    self._overflows.assign(0)
+
+  def get_config(self):
+    return {'name': self._name}
+
+
 @gin.configurable
 class Trainer(orbit.StandardTrainer, orbit.StandardEvaluator):
   """Implements the common trainer shared for TensorFlow models."""
@@ -107,6 +218,15 @@ class Trainer(orbit.StandardTrainer, orbit.StandardEvaluator):
     self._validation_metrics = self.task.build_metrics(
         training=False) + self.model.metrics
 
+    self._gradient_accumulator = None
+    self._accumulation_optimizer = None
+    accumulation_steps = config.trainer.gradient_accumulation_steps
+    if accumulation_steps < 1:
+      raise ValueError('`gradient_accumulation_steps` should be a positive '
+                       'integer, got %s' % accumulation_steps)
+    if train and accumulation_steps > 1:
+      self._create_gradient_accumulation()
+
     if train:
       train_dataset = orbit.utils.make_distributed_dataset(
           self.strategy, self.task.build_inputs, self.config.task.train_data)
@@ -199,8 +319,28 @@ class Trainer(orbit.StandardTrainer, orbit.StandardEvaluator):
       logs['learning_rate'] = self.optimizer.learning_rate
     return logs
 
+  def _create_gradient_accumulation(self):
+    """Creates the gradient accumulator and the optimizer tasks train with."""
+    if not self.model.trainable_variables:
+      raise ValueError('Gradient accumulation requires the model to be built '
+                       'when the trainer is created.')
+    self._gradient_accumulator = orbit.utils.GradientAccumulator(
+        self.model.trainable_variables)
+    if isinstance(self.optimizer,
+                  tf.keras.mixed_precision.experimental.LossScaleOptimizer):
+      # Tasks scale the loss of each micro-batch with the loss scale of the
+      # trainer optimizer, which is updated once when the mean is applied.
+      optimizer = _LossScaleGradientAccumulationOptimizer(
+          self._gradient_accumulator, self.optimizer)
+    else:
+      optimizer = _GradientAccumulationOptimizer(self._gradient_accumulator)
+    self._accumulation_optimizer = optimizer
+
   def train_step(self, iterator):
     """See base class."""
+    if self._gradient_accumulator is not None:
+      self._accumulated_train_step(iterator)
+      return
 
     def step_fn(inputs):
       logs = self.task.train_step(
@@ -213,6 +353,43 @@ class Trainer(orbit.StandardTrainer, orbit.StandardEvaluator):
 
     self.strategy.run(step_fn, args=(next(iterator),))
 
+  def _accumulated_train_step(self, iterator):
+    """Applies the optimizer once to the mean gradient of N micro-batches.
+
+    The training loss and metrics are updated by every micro-batch, so they
+    average over the micro-batches like over a larger batch.
+
+    Args:
+      iterator: The train dataset iterator, `gradient_accumulation_steps`
+        batches are read from it.
+    """
+
+    def micro_step_fn(inputs):
+      logs = self.task.train_step(
+          inputs,
+          model=self.model,
+          optimizer=self._accumulation_optimizer,
+          metrics=self.train_metrics)
+      self._train_loss.update_state(logs[self.task.loss])
+
+    def apply_fn():
+      accumulator = self._gradient_accumulator
+      gradients = accumulator.gradients()
+      if isinstance(self._accumulation_optimizer,
+                    _LossScaleGradientAccumulationOptimizer):
+        gradients = self._accumulation_optimizer.with_overflows(gradients)
+      self.optimizer.apply_gradients(
+          list(zip(gradients, accumulator.variables)))
+      accumulator.reset()
+      if isinstance(self._accumulation_optimizer,
+                    _LossScaleGradientAccumulationOptimizer):
+        self._accumulation_optimizer.reset_overflows()
+      self.global_step.assign_add(1)
+
+    for _ in tf.range(self.config.trainer.gradient_accumulation_steps):
+      self.strategy.run(micro_step_fn, args=(next(iterator),))
+    self.strategy.run(apply_fn)
+
   def eval_begin(self):
     """Sets up metrics."""
     for metric in self.validation_metrics + [self.validation_loss]:
@@ -18,6 +18,7 @@
 
 import os
 from absl.testing import parameterized
+import orbit
 import tensorflow as tf
 
 from tensorflow.python.distribute import combinations
@@ -106,6 +107,80 @@ class TrainerTest(tf.test.TestCase, parameterized.TestCase):
     metrics = trainer.train(tf.convert_to_tensor(5, dtype=tf.int32))
     self.assertIn('training_loss', metrics)
 
+  @combinations.generate(
+      combinations.combine(
+          distribution=[
+              strategy_combinations.default_strategy,
+              strategy_combinations.one_device_strategy_gpu,
+          ],
+          mixed_precision_dtype=['float32', 'float16'],
+          mode='eager',
+      ))
+  def test_trainer_gradient_accumulation(self, distribution,
+                                         mixed_precision_dtype):
+    config = cfg.ExperimentConfig(
+        runtime=cfg.RuntimeConfig(
+            mixed_precision_dtype=mixed_precision_dtype, loss_scale='dynamic'),
+        trainer=cfg.TrainerConfig(
+            gradient_accumulation_steps=3,
+            optimizer_config=cfg.OptimizationConfig({
+                'optimizer': {
+                    'type': 'sgd'
+                },
+                'learning_rate': {
+                    'type': 'constant'
+                }
+            })))
+    with distribution.scope():
+      trainer = self.create_test_trainer(config)
+      logs = trainer.train(tf.convert_to_tensor(2, dtype=tf.int32))
+    self.assertIn('training_loss', logs)
+    # The optimizer is applied once per train step.
+    self.assertEqual(2, trainer.global_step.numpy())
+    self.assertEqual(2, trainer.optimizer.iterations.numpy())
+    self.assertEqual(0, trainer._gradient_accumulator.count.numpy())
+
+  def test_loss_scale_gradient_accumulation_optimizer(self):
+    variable = tf.Variable([1.0, 2.0])
+    accumulator = orbit.utils.GradientAccumulator([variable])
+    optimizer = tf.keras.mixed_precision.experimental.LossScaleOptimizer(
+        tf.keras.optimizers.SGD(1.0), 'dynamic')
+    stand_in = trainer_lib._LossScaleGradientAccumulationOptimizer(
+        accumulator, optimizer)
+    loss_scale = optimizer.get_scaled_loss(tf.constant(1.0)).numpy()
+
+    # The loss scale of the trainer optimizer is used and not updated.
+    self.assertEqual(loss_scale,
+                     stand_in.get_scaled_loss(tf.constant(1.0)).numpy())
+    self.assertAllClose([1.0, 2.0],
+                        stand_in.get_unscaled_gradients(
+                            [tf.constant([loss_scale, 2 * loss_scale])])[0])
+    self.assertTrue(
+        stand_in.apply_gradients([(tf.constant([1.0, 3.0]), variable)]))
+    self.assertFalse(
+        stand_in.apply_gradients([(tf.constant([1.0, float('nan')]),
+                                   variable)]))
+    self.assertEqual(1, accumulator.count.numpy())
+    self.assertEqual(1, stand_in.overflows.numpy())
+    self.assertEqual(loss_scale,
+                     optimizer.get_scaled_loss(tf.constant(1.0)).numpy())
+    self.assertAllClose([1.0, 2.0], variable)
+
+    # A skipped micro-batch makes the trainer optimizer skip the step.
+    gradients = stand_in.with_overflows(accumulator.gradients())
+    self.assertFalse(tf.reduce_any(tf.math.is_finite(gradients[0])))
+    stand_in.reset_overflows()
+    self.assertAllClose([[1.0, 3.0]],
+                        stand_in.with_overflows(accumulator.gradients()))
+
+  def test_invalid_gradient_accumulation_steps(self):
+    config = cfg.ExperimentConfig(
+        trainer=cfg.TrainerConfig(
+            gradient_accumulation_steps=0,
+            optimizer_config=self._config.trainer.optimizer_config))
+    with self.assertRaises(ValueError):
+      self.create_test_trainer(config)
+
   @combinations.generate(all_strategy_combinations())
   def test_export_best_ckpt(self, distribution):
     config = cfg.ExperimentConfig(
@@ -197,6 +197,11 @@ class TrainerConfig(base_config.Config):
     eval_tf_function: whether or not to use tf_function for eval.
     allow_tpu_summary: Whether to allow summary happen inside the XLA program
       runs on TPU through automatic outside compilation.
+    gradient_accumulation_steps: number of micro-batches whose gradients are
+      averaged before the optimizer is applied once. Each micro-batch is one
+      batch of `train_data`, so the effective batch size is
+      `train_data.global_batch_size * gradient_accumulation_steps`. A train
+      step and the global step still count optimizer updates.
     steps_per_loop: number of steps per loop.
     summary_interval: number of steps between each summary.
     checkpoint_interval: number of steps between checkpoints.
@@ -227,6 +232,7 @@ class TrainerConfig(base_config.Config):
   train_tf_function: bool = True
   eval_tf_function: bool = True
   allow_tpu_summary: bool = False
+  gradient_accumulation_steps: int = 1
   # Trainer intervals.
   steps_per_loop: int = 1000
   summary_interval: int = 1000
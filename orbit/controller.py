@@ -14,6 +14,11 @@
 # ==============================================================================
 """A light weight utilities to train TF2 models."""
 
+import atexit
+import collections
+import contextlib
+import functools
+import math
 import time
 
 from typing import Callable, Dict, Optional, Text, Union
@@ -44,10 +49,17 @@ class Controller:
       global_step: Optional[tf.Variable] = None,
       # Train related
       steps_per_loop: Optional[int] = None,
+      auto_steps_per_loop: bool = False,
+      max_loop_overhead: float = 0.05,
+      max_steps_per_loop: Optional[int] = None,
       checkpoint_manager: Optional[tf.train.CheckpointManager] = None,
+      async_checkpoint: bool = False,
+      max_pending_checkpoints: int = 1,
       # Summary related
       summary_interval: Optional[int] = None,
       summary_dir: Optional[Text] = None,
+      async_summaries: bool = False,
+      max_queued_summaries: int = 32,
       # Evaluation related
       eval_summary_dir: Optional[Text] = None):
     """Constructs a `Controller` instance.
@@ -67,7 +79,28 @@ class Controller:
         `aggregation=tf.VariableAggregation.ONLY_FIRST_REPLICA`.
       steps_per_loop: The number of steps to run in each "inner loop" of
         training (passed to the `num_steps` parameter of `trainer.train`).
+        With `auto_steps_per_loop` this is the length of the first loops.
+      auto_steps_per_loop: Whether to tune `steps_per_loop` during training,
+        see `StepsPerLoopTuner`. After every loop the host overhead (reading
+        values back to the host and writing summaries) is compared with the
+        time of the steps, and `steps_per_loop` is set to the smallest length
+        that keeps the overhead under `max_loop_overhead`. The loop length
+        stays a divisor of `summary_interval`, loops end when a checkpoint is
+        due, and `train_and_evaluate` still stops at every `eval_interval`.
+      max_loop_overhead: The fraction of a loop's time that may be host
+        overhead when `auto_steps_per_loop` is True.
+      max_steps_per_loop: The maximum `steps_per_loop` chosen when
+        `auto_steps_per_loop` is True. If None, the length is only limited by
+        `summary_interval`.
       checkpoint_manager: An instance of `tf.train.CheckpointManager`.
+      async_checkpoint: Whether to save checkpoints asynchronously. The train
+        loop only waits while the variables are copied to host memory, and the
+        checkpoint is written on a background thread, see
+        `orbit.utils.AsyncCheckpointSaver`. `train` and `train_and_evaluate`
+        wait for the pending checkpoints before they return.
+      max_pending_checkpoints: The maximum number of checkpoints waiting to be
+        written in the background when `async_checkpoint` is True. A save
+        waits until fewer checkpoints are pending.
       summary_interval: Step interval for training summaries. Note that this
         argument only applies to the summaries inside `trainer.train` function.
         Summaries outside like "steps_per_second" and outputs from
@@ -79,10 +112,17 @@ class Controller:
       eval_summary_dir: The directory to write eval summaries. If None, it will
         be set to `summary_dir`. If both `summary_dir` and `eval_summary_dir`
         are None, it will not write evaluation summarizes.
+      async_summaries: Whether to write summaries on a background thread, see
+        `orbit.utils.AsyncSummaryManager`. The outputs of `trainer.train` are
+        then logged and converted to numpy by the writer thread instead of
+        after every train loop.
+      max_queued_summaries: The maximum number of summary dictionaries waiting
+        to be written when `async_summaries` is True.
 
     Raises:
       ValueError: If both `trainer` and `evaluator` are None.
       ValueError: If `steps_per_loop` is not a positive integer.
+      ValueError: If `max_loop_overhead` is not in (0, 1).
       ValueError: If `summary_interval` is not a positive integer or it cannot
         be divisible by `steps_per_loop`.
     """
@@ -97,6 +137,9 @@ class Controller:
       if not isinstance(steps_per_loop, int) or steps_per_loop < 1:
         raise ValueError("`steps_per_loop` should be a positive integer")
 
+      if auto_steps_per_loop and not 0 < max_loop_overhead < 1:
+        raise ValueError("`max_loop_overhead` should be in (0, 1)")
+
       if summary_interval is not None:
         if summary_interval <= 0:
           raise ValueError("`summary_interval` should be larger than 0")
@@ -112,12 +155,32 @@ class Controller:
 
     self.global_step = global_step
     self.checkpoint_manager = checkpoint_manager
+    self.checkpoint_saver = None
+    if self.checkpoint_manager is not None and async_checkpoint:
+      self.checkpoint_saver = utils.AsyncCheckpointSaver(
+          self.checkpoint_manager, max_pending=max_pending_checkpoints)
+      # Pending checkpoints are written before the process exits.
+      atexit.register(self.checkpoint_saver.wait)
+
+    self.async_summaries = async_summaries
+    if async_summaries:
+      summary_manager_cls = functools.partial(
+          utils.AsyncSummaryManager, max_queue_size=max_queued_summaries)
+    else:
+      summary_manager_cls = utils.SummaryManager
 
     if self.trainer is not None:
       self.step_timer = None
       self.steps_per_loop = steps_per_loop
       self.summary_interval = summary_interval
-      self.summary_manager = utils.SummaryManager(
+      self.steps_per_loop_tuner = None
+      if auto_steps_per_loop:
+        self.steps_per_loop_tuner = StepsPerLoopTuner(
+            steps_per_loop,
+            max_overhead=max_loop_overhead,
+            max_steps_per_loop=max_steps_per_loop,
+            interval=summary_interval)
+      self.summary_manager = summary_manager_cls(
           summary_dir, tf.summary.scalar, global_step=self.global_step)
 
     if self.evaluator is not None:
@@ -127,7 +190,7 @@ class Controller:
         # are the same.
         self.eval_summary_manager = self.summary_manager
       else:
-        self.eval_summary_manager = utils.SummaryManager(
+        self.eval_summary_manager = summary_manager_cls(
             eval_summary_dir, tf.summary.scalar, global_step=self.global_step)
 
     if self.global_step is not None:
@@ -167,12 +230,17 @@ class Controller:
       logging.info("Train at step %s of %s", current_step, steps)
       # Calculates steps to run for the next train loop.
       num_steps = min(steps - current_step, self.steps_per_loop)
+      if self.steps_per_loop_tuner is not None:
+        num_steps = min(num_steps, self._steps_to_checkpoint(current_step))
       self._train_n_steps(num_steps)
       self._maybe_save_checkpoint()
       current_step = self.global_step.numpy()  # This is an expensive access.
 
     if checkpoint_at_completion:
       self.save_checkpoint()
+      self.wait_for_checkpoint()
+    # The summaries of the last loop are written when `train` returns.
+    self.summary_manager.flush()
 
   def evaluate(self, steps: int = None) -> Optional[Dict[Text, np.number]]:
     """Runs evaluation.
@@ -229,6 +297,7 @@ class Controller:
       The path to the restored checkpoint if a restore happened, or None
         if no restore occurred.
     """
+    self.wait_for_checkpoint()
     with self.strategy.scope():
       # Checkpoint restoring should be inside scope. b/139450638
       if checkpoint_path is not None:
@@ -248,6 +317,14 @@ class Controller:
     """
     self._maybe_save_checkpoint(force_trigger=True)
 
+  def wait_for_checkpoint(self):
+    """Blocks until the checkpoints saved in the background are written.
+
+    This is a no-op unless `async_checkpoint` is enabled.
+    """
+    if self.checkpoint_saver is not None:
+      self.checkpoint_saver.wait()
+
   def train_and_evaluate(self,
                          train_steps: int = None,
                          eval_steps: int = None,
@@ -281,6 +358,7 @@ class Controller:
       self.evaluate(steps=eval_steps)
       current_step = self.global_step.numpy()  # This is an expensive access.
     self.save_checkpoint()
+    self.wait_for_checkpoint()
 
   def evaluate_continuously(self,
                             steps: int = None,
@@ -329,10 +407,12 @@ class Controller:
       self.step_timer = StepTimer(self.global_step)
 
     # Calculates steps to run for the next train loop.
-    current_step = self.global_step.numpy()
+    with self.step_timer.timed("transfer"):
+      current_step = self.global_step.numpy()
     logging.info("Entering training loop at step %s to run %s steps",
                  current_step, num_steps)
     current_step += num_steps
+    loop_steps = num_steps
     num_steps = tf.convert_to_tensor(num_steps, dtype=tf.int32)
 
     with self.summary_manager.summary_writer().as_default():
@@ -341,27 +421,92 @@ class Controller:
       if self.summary_interval:
         should_record = lambda: (self.global_step % self.summary_interval == 0)
       with tf.summary.record_if(should_record):
-        train_outputs = self.trainer.train(num_steps)
-
-    # Updates and verifies the current step after a training loop finishes.
-    if current_step != self.global_step.numpy():
+        with self.step_timer.timed("train"):
+          train_outputs = self.trainer.train(num_steps)
+
+    with self.step_timer.timed("sync"):
+      # Updates and verifies the current step after a training loop finishes.
+      # This waits for the device to finish the steps of the loop.
+      actual_step = self.global_step.numpy()
+    if current_step != actual_step:
       raise RuntimeError("`trainer.train` function is not updating "
                          "`global_step` correctly, expected: %s, actual: %s" %
-                         (current_step, self.global_step.numpy()))
-
-    # Print information like metrics and steps_per_second after a training
-    # loop.
-    if train_outputs:
-      train_outputs = tf.nest.map_structure(utils.get_value, train_outputs)
-
-    train_outputs = train_outputs or {}
-    steps_per_second = self.step_timer.steps_per_second()
-    info = "step: {}        steps_per_second: {:.2f}        {}".format(
-        current_step, steps_per_second, train_outputs)
-    _log_info(info)
+                         (current_step, actual_step))
+
+    with self.step_timer.timed("transfer"):
+      # Print information like metrics and steps_per_second after a training
+      # loop. With asynchronous summaries the outputs stay on device until the
+      # writer thread logs them.
+      if train_outputs and not self.async_summaries:
+        train_outputs = tf.nest.map_structure(utils.get_value, train_outputs)
+
+    train_outputs = dict(train_outputs or {})
+    steps_per_second = self.step_timer.steps_per_second(
+        restart=False, current_step=current_step)
+
+    def log_train_outputs(outputs):
+      outputs = dict(outputs)
+      outputs.pop("steps_per_second", None)
+      info = "step: {}        steps_per_second: {:.2f}        {}".format(
+          current_step, steps_per_second, outputs)
+      _log_info(info)
 
     train_outputs["steps_per_second"] = steps_per_second
-    self.summary_manager.write_summaries(train_outputs)
+    with self.step_timer.timed("summary"):
+      if self.async_summaries:
+        self.summary_manager.write_summaries(
+            train_outputs, callback=log_train_outputs)
+      else:
+        log_train_outputs(train_outputs)
+        self.summary_manager.write_summaries(train_outputs)
+    breakdown = self._write_step_breakdown()
+    if self.steps_per_loop_tuner is not None:
+      self._tune_steps_per_loop(loop_steps, breakdown)
+    self.step_timer.start(current_step)
+
+  def _steps_to_checkpoint(self, current_step: int) -> int:
+    """Returns the number of steps until the next checkpoint is due."""
+    manager = self.checkpoint_manager
+    if manager and manager.checkpoint_interval:
+      # `CheckpointManager` counts the interval from the last checkpoint.
+      last_step = getattr(manager, "_last_checkpoint_step", None)
+      if last_step is not None:
+        steps = last_step + manager.checkpoint_interval - current_step
+        if steps > 0:
+          return steps
+    return self.steps_per_loop
+
+  def _tune_steps_per_loop(self, num_steps: int, breakdown: Dict[Text, float]):
+    """Updates `steps_per_loop` from the breakdown of the last loop."""
+    overhead_seconds = (
+        breakdown.get("transfer_seconds", 0.0) +
+        breakdown.get("summary_seconds", 0.0))
+    compute_seconds = (
+        breakdown.get("input_seconds", 0.0) + breakdown["step_seconds"] +
+        breakdown.get("sync_seconds", 0.0))
+    steps_per_loop = self.steps_per_loop_tuner.update(num_steps,
+                                                      compute_seconds,
+                                                      overhead_seconds)
+    if steps_per_loop != self.steps_per_loop:
+      logging.info("Changing steps_per_loop from %s to %s",
+                   self.steps_per_loop, steps_per_loop)
+      self.steps_per_loop = steps_per_loop
+    self.summary_manager.write_summaries({"steps_per_loop": steps_per_loop})
+
+  def _write_step_breakdown(self) -> Dict[Text, float]:
+    """Logs and writes where the time of the last train loop went."""
+    trainer_breakdown = None
+    if hasattr(self.trainer, "train_loop_breakdown"):
+      trainer_breakdown = self.trainer.train_loop_breakdown()
+    breakdown = self.step_timer.breakdown(trainer_breakdown)
+    if "input_bound" in breakdown:
+      bound = "input-bound" if breakdown["input_bound"] else "compute-bound"
+    else:
+      bound = "unknown, enable `record_step_breakdown` to time the input"
+    logging.info("Train loop breakdown (%s): %s", bound, breakdown)
+    self.summary_manager.write_summaries(
+        {"step_breakdown/" + name: value for name, value in breakdown.items()})
+    return breakdown
 
   def _maybe_save_checkpoint(self, force_trigger: bool = False):
     """Save checkpoints if necessary.
@@ -374,6 +519,18 @@ class Controller:
       A boolean indicating whether a checkpoint was saved.
     """
     if self.checkpoint_manager and self.checkpoint_manager.checkpoint_interval:
+      if self.checkpoint_saver is not None:
+        ckpt_path = self.checkpoint_saver.save(
+            checkpoint_number=self.global_step.numpy(),
+            check_interval=not force_trigger)
+        if ckpt_path is not None:
+          timing = self.checkpoint_saver.timing()
+          logging.info("Saving checkpoints in %s in the background, timing: %s",
+                       ckpt_path, timing)
+          self._write_checkpoint_timing(timing)
+          return True
+        return False
+
       ckpt_path = self.checkpoint_manager.save(
           checkpoint_number=self.global_step.numpy(),
           check_interval=not force_trigger)
@@ -382,21 +539,191 @@ class Controller:
         return True
     return False
 
+  def _write_checkpoint_timing(self, timing: Dict[Text, float]):
+    """Writes the seconds spent in each phase of the asynchronous saves."""
+    if self.trainer is None or not timing:
+      return
+    self.summary_manager.write_summaries(
+        {"checkpoint_" + name: value for name, value in timing.items()})
+
 
 class StepTimer:
-  """Utility class for measuring steps/second."""
+  """Utility class for measuring steps/second and where the time goes.
 
-  def __init__(self, step):
+  The time since the last `start` is split into the phases timed with `timed`.
+  The `Controller` times `train` (the call to `trainer.train`), `sync` (the
+  first read of the global step after `trainer.train`, which waits for the
+  device to finish the steps), `transfer` (the other reads of the global step
+  and the train outputs back to the host), and `summary` (writing the train
+  summaries).
+  """
+
+  def __init__(self, step, input_bound_threshold: float = 0.2):
+    """Constructs a `StepTimer` instance.
+
+    Args:
+      step: The global step variable.
+      input_bound_threshold: The fraction of the time spent waiting for the
+        input above which a loop is classified as input-bound.
+    """
     self.step = step
+    self.input_bound_threshold = input_bound_threshold
     self.start()
 
-  def start(self):
-    self.last_iteration = self.step.numpy()
-    self.last_time = time.time()
+  def start(self, current_step: Optional[int] = None):
+    """Restarts the timer.
 
-  def steps_per_second(self, restart=True):
-    value = ((self.step.numpy() - self.last_iteration) /
+    Args:
+      current_step: The current value of `step`, if known. Passing it avoids
+        an expensive read of the step variable.
+    """
+    if current_step is None:
+      current_step = self.step.numpy()
+    self.last_iteration = current_step
+    self.last_time = time.time()
+    self.phases = collections.OrderedDict()
+
+  @contextlib.contextmanager
+  def timed(self, phase: Text):
+    """A context manager that adds the time spent inside it to `phase`."""
+    start = time.time()
+    try:
+      yield
+    finally:
+      self.phases[phase] = self.phases.get(phase, 0.0) + time.time() - start
+
+  def steps_per_second(self, restart=True, current_step: Optional[int] = None):
+    if current_step is None:
+      current_step = self.step.numpy()
+    value = ((current_step - self.last_iteration) /
              (time.time() - self.last_time))
     if restart:
-      self.start()
+      self.start(current_step)
     return value
+
+  def breakdown(
+      self,
+      trainer_breakdown: Optional[Dict[Text, float]] = None
+  ) -> Dict[Text, float]:
+    """Returns where the time since the last `start` went.
+
+    Args:
+      trainer_breakdown: An optional dictionary with the `input_seconds` and
+        `step_seconds` of the last `trainer.train` call, see
+        `orbit.StandardTrainer.train_loop_breakdown`. Without it the input
+        time is unknown and all of `train` counts as `step_seconds`.
+
+    Returns:
+      A dictionary with the seconds of each phase, `other_seconds` for the
+      rest (python overhead, checkpoints, and evaluation), the fraction of the
+      total time of each phase, and if the input time is known an
+      `input_bound` value that is 1.0 if the loop is input-bound and 0.0 if it
+      is compute-bound.
+    """
+    total = time.time() - self.last_time
+    phases = dict(self.phases)
+    train_seconds = phases.pop("train", 0.0)
+    seconds = collections.OrderedDict()
+    if trainer_breakdown:
+      seconds["input"] = trainer_breakdown["input_seconds"]
+      seconds["step"] = trainer_breakdown["step_seconds"]
+    else:
+      seconds["step"] = train_seconds
+    seconds.update(phases)
+    seconds["other"] = max(total - sum(seconds.values()), 0.0)
+
+    result = collections.OrderedDict()
+    for name, value in seconds.items():
+      result[name + "_seconds"] = value
+    for name, value in seconds.items():
+      result[name + "_fraction"] = value / total if total > 0 else 0.0
+    if "input" in seconds:
+      result["input_bound"] = float(
+          result["input_fraction"] >= self.input_bound_threshold)
+    return result
+
+
+class StepsPerLoopTuner:
+  """Picks the smallest `steps_per_loop` that keeps the loop overhead low.
+
+  A loop of `n` steps takes `overhead + n * step_time` seconds, where the
+  overhead is the host work paid once per loop. The overhead fraction is under
+  `max_overhead` for `n >= overhead * (1 - max_overhead) / (max_overhead *
+  step_time)`. Both times are exponential moving averages over the loops, and
+  the first loop is skipped since it includes tracing the train function.
+  """
+
+  def __init__(self,
+               steps_per_loop: int,
+               max_overhead: float = 0.05,
+               max_steps_per_loop: Optional[int] = None,
+               interval: Optional[int] = None,
+               smoothing: float = 0.5):
+    """Constructs a `StepsPerLoopTuner` instance.
+
+    Args:
+      steps_per_loop: The initial `steps_per_loop`.
+      max_overhead: The maximum fraction of a loop's time spent in overhead.
+      max_steps_per_loop: An optional maximum `steps_per_loop`.
+      interval: An optional interval that `steps_per_loop` should divide, e.g.
+        the summary interval of the `Controller`.
+      smoothing: The weight of the previous average in the moving averages.
+    """
+    self.steps_per_loop = steps_per_loop
+    self.max_overhead = max_overhead
+    self.max_steps_per_loop = max_steps_per_loop
+    self.interval = interval
+    self.smoothing = smoothing
+    self._num_loops = 0
+    self._step_seconds = None
+    self._overhead_seconds = None
+
+  def _average(self, average, value):
+    if average is None:
+      return value
+    return self.smoothing * average + (1 - self.smoothing) * value
+
+  def _valid_length(self, steps_per_loop: int) -> int:
+    """Rounds up to a divisor of `interval` and applies the maximum."""
+    if self.max_steps_per_loop:
+      steps_per_loop = min(steps_per_loop, self.max_steps_per_loop)
+    if self.interval:
+      divisors = [
+          n for n in range(steps_per_loop, self.interval + 1)
+          if self.interval % n == 0
+      ]
+      if self.max_steps_per_loop:
+        divisors = [n for n in divisors if n <= self.max_steps_per_loop]
+      if divisors:
+        return divisors[0]
+      # No divisor up to the maximum, the largest one under it is used.
+      return max(n for n in range(1, steps_per_loop + 1)
+                 if self.interval % n == 0)
+    return max(steps_per_loop, 1)
+
+  def update(self, num_steps: int, compute_seconds: float,
+             overhead_seconds: float) -> int:
+    """Records a loop and returns the `steps_per_loop` of the next loops.
+
+    Args:
+      num_steps: The number of steps of the loop.
+      compute_seconds: The seconds spent running the steps.
+      overhead_seconds: The seconds of host overhead of the loop.
+
+    Returns:
+      The new `steps_per_loop`.
+    """
+    self._num_loops += 1
+    if self._num_loops == 1 or num_steps < 1:
+      return self.steps_per_loop
+    self._step_seconds = self._average(self._step_seconds,
+                                       compute_seconds / num_steps)
+    self._overhead_seconds = self._average(self._overhead_seconds,
+                                           overhead_seconds)
+    if self._step_seconds <= 0:
+      return self.steps_per_loop
+    steps_per_loop = math.ceil(
+        self._overhead_seconds * (1 - self.max_overhead) /
+        (self.max_overhead * self._step_seconds))
+    self.steps_per_loop = self._valid_length(max(steps_per_loop, 1))
+    return self.steps_per_loop
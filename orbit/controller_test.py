@@ -57,7 +57,7 @@ class TestRunner(standard_runner.StandardTrainer,
                  standard_runner.StandardEvaluator):
   """Implements the training and evaluation APIs for the test model."""
 
-  def __init__(self, return_numpy=False):
+  def __init__(self, return_numpy=False, train_options=None):
     self.strategy = tf.distribute.get_strategy()
     self.model = create_model()
     self.optimizer = tf.keras.optimizers.RMSprop(learning_rate=0.1)
@@ -71,7 +71,8 @@ class TestRunner(standard_runner.StandardTrainer,
     eval_dataset = (
         self.strategy.experimental_distribute_datasets_from_function(dataset_fn)
     )
-    standard_runner.StandardTrainer.__init__(self, train_dataset)
+    standard_runner.StandardTrainer.__init__(self, train_dataset,
+                                             train_options)
     standard_runner.StandardEvaluator.__init__(self, eval_dataset)
 
   def train_step(self, iterator):
@@ -674,6 +675,140 @@ class ControllerTest(tf.test.TestCase, parameterized.TestCase):
     self.assertLen(
         summaries_with_matching_keyword("eval_loss", self.model_dir), 2)
 
+  def test_async_checkpoint(self):
+    test_runner = TestRunner()
+
+    checkpoint = tf.train.Checkpoint(
+        model=test_runner.model, optimizer=test_runner.optimizer)
+    checkpoint_manager = tf.train.CheckpointManager(
+        checkpoint,
+        self.model_dir,
+        max_to_keep=None,
+        step_counter=test_runner.global_step,
+        checkpoint_interval=5)
+    test_controller = controller.Controller(
+        trainer=test_runner,
+        global_step=test_runner.global_step,
+        steps_per_loop=5,
+        checkpoint_manager=checkpoint_manager,
+        async_checkpoint=True,
+        summary_dir=self.model_dir)
+    test_controller.train(steps=10)
+
+    # `train` waits for the checkpoints at step 5 and 10.
+    self.assertLen(
+        tf.io.gfile.glob(os.path.join(self.model_dir, "ckpt-*.data*")), 2)
+    self.assertEqual(
+        os.path.join(self.model_dir, "ckpt-10"),
+        tf.train.latest_checkpoint(self.model_dir))
+    self.assertNotEmpty(
+        summaries_with_matching_keyword("checkpoint_blocking_seconds",
+                                        self.model_dir))
+
+    # The checkpoint restores like a synchronous one.
+    new_runner = TestRunner()
+    tf.train.Checkpoint(
+        model=new_runner.model, optimizer=new_runner.optimizer).restore(
+            tf.train.latest_checkpoint(self.model_dir))
+    self.assertEqual(10, new_runner.global_step.numpy())
+    for expected, actual in zip(test_runner.model.variables,
+                                new_runner.model.variables):
+      self.assertAllClose(expected, actual)
+
+  def test_train_step_breakdown(self):
+    test_runner = TestRunner(
+        train_options=standard_runner.StandardTrainerOptions(
+            use_tf_while_loop=False, record_step_breakdown=True))
+    test_controller = controller.Controller(
+        trainer=test_runner,
+        global_step=test_runner.global_step,
+        steps_per_loop=2,
+        summary_dir=self.model_dir)
+    test_controller.train(steps=4)
+
+    for name in ("input_seconds", "step_seconds", "transfer_seconds",
+                 "summary_seconds", "input_bound"):
+      self.assertNotEmpty(
+          summaries_with_matching_keyword("step_breakdown/" + name,
+                                          self.model_dir))
+
+  def test_step_timer_breakdown(self):
+    step = tf.Variable(0, dtype=tf.int64)
+    timer = controller.StepTimer(step, input_bound_threshold=0.5)
+    with timer.timed("train"):
+      step.assign_add(1)
+    with timer.timed("summary"):
+      pass
+    breakdown = timer.breakdown({"input_seconds": 1.0, "step_seconds": 0.0})
+    self.assertEqual(1.0, breakdown["input_seconds"])
+    self.assertIn("summary_seconds", breakdown)
+    self.assertIn("other_seconds", breakdown)
+    self.assertEqual(1.0, breakdown["input_bound"])
+    self.assertNotIn("input_bound", timer.breakdown())
+    self.assertGreater(timer.steps_per_second(current_step=1), 0.0)
+
+  def test_train_with_async_summaries(self):
+    test_runner = TestRunner()
+    test_controller = controller.Controller(
+        trainer=test_runner,
+        global_step=test_runner.global_step,
+        steps_per_loop=2,
+        summary_dir=self.model_dir,
+        async_summaries=True,
+        max_queued_summaries=2)
+    test_controller.train(steps=10)
+
+    # `train` waits for the summaries of every loop.
+    self.assertLen(summaries_with_matching_keyword("loss", self.model_dir), 5)
+    self.assertLen(
+        summaries_with_matching_keyword("steps_per_second", self.model_dir), 5)
+
+  def test_auto_steps_per_loop(self):
+    test_runner = TestRunner()
+    checkpoint = tf.train.Checkpoint(
+        model=test_runner.model, optimizer=test_runner.optimizer)
+    checkpoint_manager = tf.train.CheckpointManager(
+        checkpoint,
+        self.model_dir,
+        max_to_keep=None,
+        step_counter=test_runner.global_step,
+        checkpoint_interval=6)
+    test_controller = controller.Controller(
+        trainer=test_runner,
+        global_step=test_runner.global_step,
+        steps_per_loop=1,
+        auto_steps_per_loop=True,
+        max_steps_per_loop=4,
+        checkpoint_manager=checkpoint_manager,
+        summary_dir=self.model_dir)
+    test_controller.train(steps=13)
+
+    self.assertEqual(13, test_runner.global_step.numpy())
+    self.assertBetween(test_controller.steps_per_loop, 1, 4)
+    self.assertNotEmpty(
+        summaries_with_matching_keyword("steps_per_loop", self.model_dir))
+    # Whatever their length, loops end when a checkpoint is due, so the
+    # checkpoints are `checkpoint_interval` steps apart.
+    self.assertCountEqual(
+        [os.path.join(self.model_dir, "ckpt-%d" % step) for step in (1, 7, 13)],
+        checkpoint_manager.checkpoints)
+
+  def test_steps_per_loop_tuner(self):
+    tuner = controller.StepsPerLoopTuner(
+        1, max_overhead=0.2, interval=100, smoothing=0.0)
+    # The first loop includes tracing and is skipped.
+    self.assertEqual(1, tuner.update(1, 10.0, 0.04))
+    # 16 steps of 0.01s keep 0.04s of overhead at 20%, 20 divides 100.
+    self.assertEqual(20, tuner.update(1, 0.01, 0.04))
+    # Without overhead the shortest loop is enough.
+    self.assertEqual(1, tuner.update(10, 0.1, 0.0))
+
+    tuner = controller.StepsPerLoopTuner(
+        1, max_overhead=0.2, max_steps_per_loop=8, interval=100)
+    tuner.update(1, 10.0, 0.04)
+    # 8 does not divide 100, 5 is the largest divisor under the maximum.
+    self.assertEqual(5, tuner.update(1, 0.01, 0.04))
+
   def test_evaluate_with_nested_summaries(self):
     test_evaluator = TestEvaluatorWithNestedSummary()
     test_controller = controller.Controller(
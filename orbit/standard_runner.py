@@ -15,6 +15,7 @@
 """AbstractTrainer/Evaluator implementations for standard settings."""
 
 import abc
+import time
 
 from typing import Any, Dict, Optional, Text
 
@@ -43,14 +44,100 @@ class StandardTrainerOptions:
       `True`, this optimization creates two `tf.function`s with two XLA programs
       (one with summary calls, and one without). The program with summaries runs
       only for one step when summaries should be recorded.
+    record_step_breakdown: A boolean indicating whether to time the wait for
+      the input separately from the steps. If `True`, the training loop runs in
+      python, each element is read from the iterator eagerly and then passed to
+      a `tf.function` of `train_step`, so `use_tf_while_loop` must be `False`
+      and `train_step` may call `next` at most once per iterator. The loop
+      waits for the device at the end of every step, so the time of an
+      asynchronous device is counted in the step and not in the next read of
+      the input. The times of the last loop are returned by
+      `train_loop_breakdown`.
   """
   use_tf_while_loop: bool = True
   use_tf_function: bool = True
   use_tpu_summary_optimization: bool = False
+  record_step_breakdown: bool = False
+
+
+class _ElementIterator:
+  """An iterator over a single element that was already read from a dataset."""
+
+  def __init__(self, element):
+    self._element = element
+    self._consumed = False
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    if self._consumed:
+      raise ValueError("`record_step_breakdown=True` requires `train_step` to "
+                       "call `next` at most once per iterator and step.")
+    self._consumed = True
+    return self._element
+
+  def get_next(self):
+    return next(self)
+
+
+def _create_breakdown_loop_fn(train_step_fn, options: StandardTrainerOptions):
+  """Creates a python training loop that times the input and the steps.
+
+  Args:
+    train_step_fn: A function which takes `iterator` as input.
+    options: An `orbit.StandardTrainerOptions` instance.
+
+  Returns:
+    A callable `loop_fn(iterator, num_steps)` that returns a dictionary with the
+    `input_seconds` spent waiting for the iterators and the `step_seconds`
+    spent in the steps.
+  """
+
+  def step_fn(structure, elements):
+    iterators = tf.nest.pack_sequence_as(
+        structure, [_ElementIterator(element) for element in elements])
+    train_step_fn(iterators)
+    # Automatic control dependencies make the returned tensor wait for every
+    # stateful op of the step, so reading it waits for the device to finish.
+    return tf.zeros([])
+
+  functions = {}
+
+  def loop_fn(iterator, num_steps):
+    flat_iterators = tf.nest.flatten(iterator)
+    if "step" not in functions:
+      # The structure of the iterators is a python constant of the step.
+      structure = tf.nest.map_structure(lambda _: 0, iterator)
+      fn = lambda elements: step_fn(structure, elements)
+      functions["step"] = tf.function(fn) if options.use_tf_function else fn
+    fn = functions["step"]
+
+    breakdown = {"input_seconds": 0.0, "step_seconds": 0.0}
+    num_steps = int(num_steps)
+    step = 0
+    try:
+      while num_steps == -1 or step < num_steps:
+        start = time.perf_counter()
+        elements = [next(it) for it in flat_iterators]
+        breakdown["input_seconds"] += time.perf_counter() - start
+        start = time.perf_counter()
+        # Without the sync an asynchronous device would only block in the next
+        # `next` call, and its time would be booked as input time.
+        fn(elements).numpy()
+        breakdown["step_seconds"] += time.perf_counter() - start
+        step += 1
+    except (StopIteration, tf.errors.OutOfRangeError):
+      pass
+    return breakdown
+
+  return loop_fn
 
 
 def _create_train_loop_fn(train_step_fn, options: StandardTrainerOptions):
   """Creates a training loop from the given step function and options."""
+  if options.record_step_breakdown:
+    return _create_breakdown_loop_fn(train_step_fn, options)
   if options.use_tf_while_loop:
     loop_fn = loop_fns.create_tf_while_loop_fn(train_step_fn)
     if options.use_tpu_summary_optimization:
@@ -82,11 +169,15 @@ class StandardTrainer(runner.AbstractTrainer, metaclass=abc.ABCMeta):
     if options.use_tpu_summary_optimization and not options.use_tf_while_loop:
       raise ValueError("`use_tpu_summary_optimization=True` and "
                        "`use_tf_while_loop=False` is not supported")
+    if options.record_step_breakdown and options.use_tf_while_loop:
+      raise ValueError("`record_step_breakdown=True` and "
+                       "`use_tf_while_loop=True` is not supported")
 
     self._train_options = options
     self._train_dataset = train_dataset
     self._train_iter = None
     self._train_loop_fn = None
+    self._train_loop_breakdown = None
 
   def train(
       self,
@@ -102,9 +193,21 @@ class StandardTrainer(runner.AbstractTrainer, metaclass=abc.ABCMeta):
     if self._train_iter is None:
       self._train_iter = tf.nest.map_structure(iter, self.train_dataset)
 
-    self._train_loop_fn(self._train_iter, num_steps)
+    outputs = self._train_loop_fn(self._train_iter, num_steps)
+    if self._train_options.record_step_breakdown:
+      self._train_loop_breakdown = outputs
     return self.train_loop_end()
 
+  def train_loop_breakdown(self) -> Optional[Dict[Text, float]]:
+    """Returns where the time of the last training loop went.
+
+    Returns:
+      None unless `record_step_breakdown` is enabled. Otherwise a dictionary
+      with the `input_seconds` spent waiting for the training iterators and the
+      `step_seconds` spent running `train_step` in the last call to `train`.
+    """
+    return self._train_loop_breakdown
+
   def train_loop_begin(self):
     """Called once at the beginning of the training loop.
 
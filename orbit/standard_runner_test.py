@@ -93,6 +93,22 @@ class StandardRunnerTest(tf.test.TestCase):
     trainer = TestTrainer(options)
     self.assertEqual(trainer.train(tf.constant(10)), 10)
 
+  def test_trainer_with_step_breakdown(self):
+    options = standard_runner.StandardTrainerOptions(
+        use_tf_while_loop=False, record_step_breakdown=True)
+    trainer = TestTrainer(options)
+    self.assertIsNone(trainer.train_loop_breakdown())
+    self.assertEqual(trainer.train(tf.constant(10)), 10)
+    breakdown = trainer.train_loop_breakdown()
+    self.assertGreater(breakdown["input_seconds"], 0.0)
+    self.assertGreater(breakdown["step_seconds"], 0.0)
+
+  def test_step_breakdown_requires_python_loop(self):
+    options = standard_runner.StandardTrainerOptions(
+        record_step_breakdown=True)
+    with self.assertRaises(ValueError):
+      TestTrainer(options)
+
   def test_default_evaluator(self):
     evaluator = TestEvaluator()
     self.assertEqual(evaluator.evaluate(tf.constant(10)), 10)
@@ -14,15 +14,20 @@
 # ==============================================================================
 """Defines exported symbols for `orbit.utils` package."""
 
+from orbit.utils.async_checkpoint import AsyncCheckpointSaver
+
 from orbit.utils.common import create_global_step
 from orbit.utils.common import get_value
 from orbit.utils.common import make_distributed_dataset
 
 from orbit.utils.epoch_helper import EpochHelper
 
+from orbit.utils.gradient_accumulator import GradientAccumulator
+
 from orbit.utils.loop_fns import create_loop_fn
 from orbit.utils.loop_fns import create_tf_while_loop_fn
 
+from orbit.utils.summary_manager import AsyncSummaryManager
 from orbit.utils.summary_manager import SummaryManager
 
 from orbit.utils.tpu_summaries import OptionalSummariesFunction
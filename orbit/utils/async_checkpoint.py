@@ -0,0 +1,220 @@
+# Copyright 2020 The Orbit Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Provides a checkpoint saver that writes checkpoints on a background thread."""
+
+import concurrent.futures
+import threading
+import time
+
+from typing import Dict, Optional, Text
+
+from absl import logging
+
+import tensorflow as tf
+
+# pylint: disable=g-direct-tensorflow-import
+try:
+  from tensorflow.python.training.saving import functional_saver
+  from tensorflow.python.training.saving import saveable_object
+except ImportError:  # pragma: no cover
+  functional_saver = None
+  saveable_object = None
+# pylint: enable=g-direct-tensorflow-import
+
+
+class AsyncCheckpointSaver:
+  """Saves the checkpoints of a `tf.train.CheckpointManager` asynchronously.
+
+  A save has two phases. The blocking phase runs on the calling thread: it
+  copies the value of every saved tensor of the checkpoint to host memory. The
+  background phase serializes the copies, writes them to the checkpoint files,
+  and updates the `CheckpointManager` state (the `checkpoint` file and the
+  deletion of old checkpoints). Training can update the variables as soon as
+  the blocking phase returns.
+
+  One background thread writes the checkpoints in the order they were saved.
+  At most `max_pending` snapshots are pending, a new save first waits until
+  fewer are, so with the default of 1 every save waits for the previous one to
+  be written. Call `wait` before reading the checkpoint directory or exiting.
+
+  The checkpoints are the same as those written by
+  `tf.train.CheckpointManager.save`. If the TensorFlow internals used to copy
+  the checkpoint are not available, saves fall back to the synchronous
+  `CheckpointManager.save`.
+  """
+
+  def __init__(self,
+               checkpoint_manager: tf.train.CheckpointManager,
+               max_pending: int = 1):
+    """Constructs an `AsyncCheckpointSaver` instance.
+
+    Args:
+      checkpoint_manager: An instance of `tf.train.CheckpointManager`. Its
+        `checkpoint_interval` and `step_counter` are respected by `save`.
+      max_pending: The maximum number of checkpoints that are held in host
+        memory while they wait to be written.
+
+    Raises:
+      ValueError: If `max_pending` is not a positive integer.
+    """
+    if not isinstance(max_pending, int) or max_pending < 1:
+      raise ValueError("`max_pending` should be a positive integer")
+    self._manager = checkpoint_manager
+    self._max_pending = max_pending
+    self._executor = concurrent.futures.ThreadPoolExecutor(1)
+    self._pending = []
+    self._lock = threading.Lock()
+    self._blocking_seconds = None
+    self._background_seconds = None
+    self._supported = (
+        functional_saver is not None and
+        hasattr(checkpoint_manager.checkpoint, "_saver") and
+        hasattr(checkpoint_manager.checkpoint._saver, "_gather_saveables") and  # pylint: disable=protected-access
+        hasattr(checkpoint_manager, "_sweep") and
+        hasattr(checkpoint_manager, "_last_checkpoint_step"))
+    if not self._supported:
+      logging.warning("Asynchronous checkpoints are not supported by this "
+                      "TensorFlow version, checkpoints are saved "
+                      "synchronously.")
+
+  @property
+  def checkpoint_manager(self) -> tf.train.CheckpointManager:
+    return self._manager
+
+  def _should_save(self, check_interval: bool) -> bool:
+    """Applies the `checkpoint_interval` check of `CheckpointManager.save`."""
+    manager = self._manager
+    if manager.checkpoint_interval is None:
+      return True
+    current_step = int(manager._step_counter.numpy())  # pylint: disable=protected-access
+    last_step = manager._last_checkpoint_step  # pylint: disable=protected-access
+    if last_step is not None:
+      if current_step == last_step:
+        return False
+      if check_interval and current_step < last_step + manager.checkpoint_interval:
+        return False
+    manager._last_checkpoint_step = current_step  # pylint: disable=protected-access
+    return True
+
+  def _snapshot(self):
+    """Copies every saved tensor of the checkpoint to host memory."""
+    saver = self._manager.checkpoint._saver  # pylint: disable=protected-access
+    named_saveables, _, _ = saver._gather_saveables()  # pylint: disable=protected-access
+    snapshot = []
+    with tf.device("/cpu:0"):
+      for saveable in named_saveables:
+        specs = []
+        for spec in saveable.specs:
+          tensor = tf.identity(spec.tensor)
+          specs.append(
+              saveable_object.SaveSpec(
+                  tensor, spec.slice_spec, spec.name, dtype=spec.dtype))
+        snapshot.append(saveable_object.SaveableObject(None, specs,
+                                                       saveable.name))
+    return snapshot
+
+  def _write(self, snapshot, file_prefix: Text):
+    """Writes a snapshot and updates the `CheckpointManager` state."""
+    start = time.time()
+    functional_saver.MultiDeviceSaver(snapshot).save(file_prefix)
+    manager = self._manager
+    with self._lock:
+      # Same bookkeeping as the end of `CheckpointManager.save`.
+      maybe_delete = manager._maybe_delete  # pylint: disable=protected-access
+      if file_prefix in maybe_delete:
+        del maybe_delete[file_prefix]
+      maybe_delete[file_prefix] = time.time()
+      manager._latest_checkpoint = file_prefix  # pylint: disable=protected-access
+      manager._record_state()  # pylint: disable=protected-access
+      manager._sweep()  # pylint: disable=protected-access
+      manager._record_state()  # pylint: disable=protected-access
+      self._background_seconds = time.time() - start
+    logging.info("Saved checkpoint in %s", file_prefix)
+    return file_prefix
+
+  def save(self,
+           checkpoint_number: Optional[int] = None,
+           check_interval: bool = True) -> Optional[Text]:
+    """Starts saving a checkpoint.
+
+    Args:
+      checkpoint_number: An optional integer used to number the checkpoint. If
+        None, the `save_counter` of the checkpoint is used.
+      check_interval: Whether to skip the save if less than
+        `checkpoint_interval` steps have passed since the last checkpoint.
+
+    Returns:
+      The path prefix of the checkpoint that is being written, or None if no
+      checkpoint was saved.
+    """
+    if not self._supported:
+      start = time.time()
+      path = self._manager.save(
+          checkpoint_number=checkpoint_number, check_interval=check_interval)
+      if path is not None:
+        with self._lock:
+          self._blocking_seconds = time.time() - start
+          self._background_seconds = 0.0
+      return path
+
+    if not self._should_save(check_interval):
+      return None
+
+    # Bounds the number of checkpoints written at the same time.
+    while len(self._pending) >= self._max_pending:
+      self._pending.pop(0).result()
+
+    start = time.time()
+    save_counter = self._manager.checkpoint.save_counter
+    save_counter.assign_add(1)
+    if checkpoint_number is None:
+      checkpoint_number = int(save_counter.numpy())
+    file_prefix = "%s-%d" % (self._manager._prefix, checkpoint_number)  # pylint: disable=protected-access
+    snapshot = self._snapshot()
+    with self._lock:
+      self._blocking_seconds = time.time() - start
+
+    self._pending.append(
+        self._executor.submit(self._write, snapshot, file_prefix))
+    return file_prefix
+
+  def wait(self):
+    """Blocks until every pending checkpoint is written.
+
+    Raises:
+      Any exception raised while writing a checkpoint.
+    """
+    while self._pending:
+      self._pending.pop(0).result()
+
+  def timing(self) -> Dict[Text, float]:
+    """Returns the seconds of both phases of the last checkpoints.
+
+    Returns:
+      A dictionary with the `blocking_seconds` of the last save and the
+      `background_seconds` of the last checkpoint that finished writing. A
+      phase that has not run yet is left out.
+    """
+    with self._lock:
+      timing = {
+          "blocking_seconds": self._blocking_seconds,
+          "background_seconds": self._background_seconds
+      }
+    return {name: value for name, value in timing.items() if value is not None}
+
+  def close(self):
+    """Waits for the pending checkpoints and stops the background thread."""
+    self.wait()
+    self._executor.shutdown(wait=True)
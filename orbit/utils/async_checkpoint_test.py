@@ -0,0 +1,96 @@
+# Copyright 2020 The Orbit Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for orbit.utils.async_checkpoint."""
+
+import os
+
+from orbit.utils import async_checkpoint
+
+import tensorflow as tf
+
+
+class AsyncCheckpointSaverTest(tf.test.TestCase):
+
+  def _create_manager(self, directory, **kwargs):
+    step = tf.Variable(0, dtype=tf.int64)
+    weights = tf.Variable([1.0, 2.0, 3.0])
+    checkpoint = tf.train.Checkpoint(step=step, weights=weights)
+    manager = tf.train.CheckpointManager(
+        checkpoint, directory, step_counter=step, **kwargs)
+    return step, weights, manager
+
+  def test_snapshot_is_taken_before_update(self):
+    directory = self.get_temp_dir()
+    step, weights, manager = self._create_manager(directory, max_to_keep=2)
+    saver = async_checkpoint.AsyncCheckpointSaver(manager)
+
+    path = saver.save(checkpoint_number=1)
+    # The update after `save` returns is not in the checkpoint.
+    weights.assign([4.0, 5.0, 6.0])
+    step.assign(7)
+    saver.wait()
+    self.assertEqual(os.path.join(directory, "ckpt-1"), path)
+    self.assertEqual(path, manager.latest_checkpoint)
+
+    restored_step, restored_weights, _ = self._create_manager(directory)
+    tf.train.Checkpoint(
+        step=restored_step, weights=restored_weights).restore(path)
+    self.assertAllClose([1.0, 2.0, 3.0], restored_weights)
+    self.assertEqual(0, restored_step.numpy())
+
+    timing = saver.timing()
+    self.assertGreaterEqual(timing["blocking_seconds"], 0)
+    self.assertGreaterEqual(timing["background_seconds"], 0)
+
+  def test_keeps_max_to_keep(self):
+    directory = self.get_temp_dir()
+    step, _, manager = self._create_manager(directory, max_to_keep=2)
+    saver = async_checkpoint.AsyncCheckpointSaver(manager, max_pending=2)
+    for i in range(1, 5):
+      step.assign(i)
+      saver.save(checkpoint_number=i)
+    saver.close()
+    self.assertEqual([os.path.join(directory, "ckpt-%d" % i) for i in (3, 4)],
+                     manager.checkpoints)
+    self.assertLen(tf.io.gfile.glob(os.path.join(directory, "ckpt-*.index")),
+                   2)
+    self.assertEqual(manager.latest_checkpoint,
+                     tf.train.latest_checkpoint(directory))
+
+  def test_checkpoint_interval(self):
+    directory = self.get_temp_dir()
+    step, _, manager = self._create_manager(
+        directory, max_to_keep=None, checkpoint_interval=5)
+    saver = async_checkpoint.AsyncCheckpointSaver(manager)
+    saved = []
+    for i in range(1, 11):
+      step.assign(i)
+      if saver.save(checkpoint_number=i) is not None:
+        saved.append(i)
+    step.assign(11)
+    self.assertIsNotNone(saver.save(checkpoint_number=11, check_interval=False))
+    saver.wait()
+    self.assertEqual([1, 6], saved)
+    self.assertLen(tf.io.gfile.glob(os.path.join(directory, "ckpt-*.index")),
+                   3)
+
+  def test_invalid_max_pending(self):
+    _, _, manager = self._create_manager(self.get_temp_dir())
+    with self.assertRaises(ValueError):
+      async_checkpoint.AsyncCheckpointSaver(manager, max_pending=0)
+
+
+if __name__ == "__main__":
+  tf.test.main()
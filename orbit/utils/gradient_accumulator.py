@@ -0,0 +1,143 @@
+# Copyright 2020 The Orbit Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Provides a utility class for accumulating gradients over micro-batches."""
+
+from typing import Iterable, List, Optional, Text, Tuple
+
+import tensorflow as tf
+
+
+class GradientAccumulator:
+  """Sums the gradients of several micro-batches on each replica.
+
+  This allows training with an effective batch size larger than what fits in
+  memory: a `train_step` calls `accumulate` with the gradients of each
+  micro-batch, and then applies `gradients()` (the mean over the micro-batches)
+  with the optimizer and calls `reset`. For example:
+
+  ```
+  def train_step(self, iterator):
+
+    def micro_step_fn(inputs):
+      with tf.GradientTape() as tape:
+        loss = ...
+      grads = tape.gradient(loss, self.model.trainable_variables)
+      self.accumulator.accumulate(zip(grads, self.model.trainable_variables))
+
+    def apply_fn():
+      self.optimizer.apply_gradients(
+          zip(self.accumulator.gradients(), self.accumulator.variables))
+      self.accumulator.reset()
+
+    for _ in tf.range(num_micro_batches):
+      self.strategy.run(micro_step_fn, args=(next(iterator),))
+    self.strategy.run(apply_fn)
+  ```
+
+  The accumulators are replica-local variables, so the gradients are reduced
+  across replicas only once, by the optimizer. The instance should be created
+  under the same distribution strategy scope as the variables, and
+  `accumulate`, `gradients`, and `reset` should be called in a replica context.
+  """
+
+  def __init__(self,
+               variables: Iterable[tf.Variable],
+               name: Text = "gradient_accumulator"):
+    """Constructs a `GradientAccumulator` instance.
+
+    Args:
+      variables: The variables whose gradients are accumulated.
+      name: A name prefix for the accumulator variables.
+
+    Raises:
+      ValueError: If `variables` is empty.
+    """
+    self._variables = list(variables)
+    if not self._variables:
+      raise ValueError("`variables` should not be empty")
+    self._indices = {v.ref(): i for i, v in enumerate(self._variables)}
+    self._accumulators = [
+        tf.Variable(
+            tf.zeros(v.shape, dtype=v.dtype),
+            trainable=False,
+            name="%s/%d" % (name, i),
+            synchronization=tf.VariableSynchronization.ON_READ,
+            aggregation=tf.VariableAggregation.SUM)
+        for i, v in enumerate(self._variables)
+    ]
+    self._count = tf.Variable(
+        0,
+        dtype=tf.int64,
+        trainable=False,
+        name="%s/count" % name,
+        synchronization=tf.VariableSynchronization.ON_READ,
+        aggregation=tf.VariableAggregation.ONLY_FIRST_REPLICA)
+
+  @property
+  def variables(self) -> List[tf.Variable]:
+    """The variables whose gradients are accumulated."""
+    return self._variables
+
+  @property
+  def count(self) -> tf.Variable:
+    """The number of micro-batches accumulated since the last `reset`."""
+    return self._count
+
+  def accumulate(self,
+                 grads_and_vars: Iterable[Tuple[Optional[tf.Tensor],
+                                                tf.Variable]]):
+    """Adds the gradients of one micro-batch.
+
+    Args:
+      grads_and_vars: An iterable of `(gradient, variable)` pairs, like the
+        argument of `Optimizer.apply_gradients`. `None` gradients are skipped
+        and `tf.IndexedSlices` gradients are densified.
+
+    Returns:
+      The op incrementing `count`, which runs after every gradient is added.
+
+    Raises:
+      ValueError: If a variable was not passed to the constructor.
+    """
+    updates = []
+    for grad, var in grads_and_vars:
+      if grad is None:
+        continue
+      index = self._indices.get(var.ref())
+      if index is None:
+        raise ValueError("Variable %s is not accumulated by this "
+                         "`GradientAccumulator`" % var.name)
+      accumulator = self._accumulators[index]
+      grad = tf.cast(tf.convert_to_tensor(grad), accumulator.dtype)
+      updates.append(accumulator.assign_add(grad))
+    with tf.control_dependencies(updates):
+      return self._count.assign_add(1)
+
+  def gradients(self) -> List[tf.Tensor]:
+    """Returns the mean gradient of every variable over the micro-batches.
+
+    The gradients are zero if no micro-batch was accumulated.
+    """
+    gradients = []
+    for accumulator in self._accumulators:
+      count = tf.cast(self._count, accumulator.dtype)
+      gradients.append(tf.math.divide_no_nan(accumulator.read_value(), count))
+    return gradients
+
+  def reset(self):
+    """Sets the accumulated gradients and `count` back to zero."""
+    for accumulator in self._accumulators:
+      accumulator.assign(tf.zeros_like(accumulator))
+    self._count.assign(0)
@@ -0,0 +1,71 @@
+# Copyright 2020 The Orbit Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for orbit.utils.gradient_accumulator."""
+
+from orbit.utils import gradient_accumulator
+
+import tensorflow as tf
+
+
+class GradientAccumulatorTest(tf.test.TestCase):
+
+  def test_mean_of_micro_batches(self):
+    weights = tf.Variable([1.0, 2.0])
+    bias = tf.Variable(0.0)
+    accumulator = gradient_accumulator.GradientAccumulator([weights, bias])
+
+    accumulator.accumulate([(tf.constant([1.0, 3.0]), weights),
+                            (tf.constant(2.0), bias)])
+    # `None` gradients are skipped.
+    accumulator.accumulate([(tf.constant([3.0, 5.0]), weights), (None, bias)])
+
+    self.assertEqual(2, accumulator.count.numpy())
+    gradients = accumulator.gradients()
+    self.assertAllClose([2.0, 4.0], gradients[0])
+    self.assertAllClose(1.0, gradients[1])
+
+    accumulator.reset()
+    self.assertEqual(0, accumulator.count.numpy())
+    self.assertAllClose([[0.0, 0.0], 0.0], accumulator.gradients())
+
+  def test_matches_large_batch(self):
+    model = tf.keras.layers.Dense(1)
+    model.build([None, 2])
+    accumulator = gradient_accumulator.GradientAccumulator(
+        model.trainable_variables)
+    x = tf.constant([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0], [7.0, 8.0]])
+
+    def gradients(inputs):
+      with tf.GradientTape() as tape:
+        loss = tf.reduce_mean(tf.square(model(inputs)))
+      return tape.gradient(loss, model.trainable_variables)
+
+    for micro_batch in (x[:2], x[2:]):
+      accumulator.accumulate(
+          zip(gradients(micro_batch), model.trainable_variables))
+    self.assertAllClose(gradients(x), accumulator.gradients())
+
+  def test_unknown_variable(self):
+    accumulator = gradient_accumulator.GradientAccumulator([tf.Variable(1.0)])
+    with self.assertRaises(ValueError):
+      accumulator.accumulate([(tf.constant(1.0), tf.Variable(2.0))])
+
+  def test_empty_variables(self):
+    with self.assertRaises(ValueError):
+      gradient_accumulator.GradientAccumulator([])
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -12,12 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ==============================================================================
-"""Provides a utility class for managing summary writing."""
+"""Provides utility classes for managing summary writing."""
 
+import atexit
 import os
+import queue
+import threading
+
+from typing import Callable, Optional
+
+from orbit.utils import common
 
 import tensorflow as tf
 
+# Tells the writer thread of an `AsyncSummaryManager` to stop.
+_STOP = object()
+
 
 class SummaryManager:
   """A class manages writing summaries."""
@@ -109,3 +119,162 @@ class SummaryManager:
       else:
         with self.summary_writer(relative_path).as_default():
           self._summary_fn(name, value, step=self._global_step)
+
+
+class AsyncSummaryManager(SummaryManager):
+  """A summary manager that writes summaries on a background thread.
+
+  `write_summaries` only snapshots the global step and puts the values on a
+  bounded queue, tensors stay on their device until the writer thread converts
+  them to numpy. If the queue is full, `write_summaries` blocks until the
+  writer thread catches up. The writer thread takes up to `max_batch_size`
+  queued dictionaries at a time and writes them with one summary writer
+  context per directory.
+
+  `flush` waits until every queued summary is written, and is called when the
+  process exits. An error raised by the writer thread is raised again by the
+  next call to `write_summaries` or `flush`.
+  """
+
+  def __init__(self,
+               summary_dir,
+               summary_fn,
+               global_step=None,
+               max_queue_size: int = 32,
+               max_batch_size: int = 16):
+    """Construct an asynchronous summary manager object.
+
+    Args:
+      summary_dir: the directory to write summaries.
+      summary_fn: A callable defined as `def summary_fn(name, tensor,
+        step=None)`, which describes the summary operation.
+      global_step: A `tf.Variable` instance for the global step.
+      max_queue_size: The maximum number of summary dictionaries waiting to be
+        written.
+      max_batch_size: The maximum number of summary dictionaries written
+        together by the writer thread.
+
+    Raises:
+      ValueError: If `max_queue_size` or `max_batch_size` is not a positive
+        integer.
+    """
+    if not isinstance(max_queue_size, int) or max_queue_size < 1:
+      raise ValueError("`max_queue_size` should be a positive integer")
+    if not isinstance(max_batch_size, int) or max_batch_size < 1:
+      raise ValueError("`max_batch_size` should be a positive integer")
+    super().__init__(summary_dir, summary_fn, global_step=global_step)
+    self._max_batch_size = max_batch_size
+    self._queue = queue.Queue(max_queue_size)
+    self._lock = threading.Lock()
+    self._error = None
+    self._thread = threading.Thread(
+        target=self._run, name="summary_writer", daemon=True)
+    self._thread.start()
+    atexit.register(self.close)
+
+  def summary_writer(self, relative_path=""):
+    """Returns the underlying summary writer.
+
+    Args:
+      relative_path: The current path in which to write summaries, relative to
+        the summary directory. By default it is empty, which specifies the root
+        directory.
+    """
+    # The writers are created by both the caller and the writer thread.
+    with self._lock:
+      return super().summary_writer(relative_path)
+
+  def write_summaries(self,
+                      summary_dict,
+                      callback: Optional[Callable[[dict], None]] = None):
+    """Queues summaries for the given values.
+
+    Subdirectories are created for nested dictionaries like in
+    `SummaryManager.write_summaries`.
+
+    Args:
+      summary_dict: A dictionary of values. If any value in `summary_dict` is
+        itself a dictionary, then the function will recursively create
+        subdirectories with names given by the keys in the dictionary.
+      callback: An optional callable that is called by the writer thread with
+        `summary_dict` converted to numpy values, after the summaries are
+        written. It is called even if summaries are disabled.
+    """
+    self._raise_error()
+    if self._thread is None:
+      raise RuntimeError("`write_summaries` was called after `close`")
+    step = self._global_step
+    if isinstance(step, tf.Variable):
+      step = tf.identity(step)
+    # Variables are copied so later updates do not change the summaries, other
+    # tensors are immutable and stay where they are.
+    values = tf.nest.map_structure(
+        lambda v: tf.identity(v) if isinstance(v, tf.Variable) else v,
+        summary_dict)
+    self._queue.put((values, step, callback))
+
+  def flush(self):
+    """Waits for the queued summaries and flushes the summary writers."""
+    self._queue.join()
+    self._raise_error()
+    with self._lock:
+      super().flush()
+
+  def close(self):
+    """Writes the queued summaries and stops the writer thread."""
+    if self._thread is None:
+      return
+    self._queue.put(_STOP)
+    self._thread.join()
+    self._thread = None
+    atexit.unregister(self.close)
+    self.flush()
+
+  def _raise_error(self):
+    error, self._error = self._error, None
+    if error is not None:
+      raise error
+
+  def _run(self):
+    """The loop of the writer thread."""
+    stop = False
+    while not stop:
+      batch = [self._queue.get()]
+      while len(batch) < self._max_batch_size:
+        try:
+          batch.append(self._queue.get_nowait())
+        except queue.Empty:
+          break
+      stop = any(item is _STOP for item in batch)
+      try:
+        self._write_batch([item for item in batch if item is not _STOP])
+      except Exception as e:  # pylint: disable=broad-except
+        self._error = self._error or e
+      finally:
+        for _ in batch:
+          self._queue.task_done()
+
+  def _write_batch(self, batch):
+    """Converts and writes a batch of queued summaries."""
+    entries = {}
+    callbacks = []
+    for values, step, callback in batch:
+      values = tf.nest.map_structure(common.get_value, values)
+      if self._enabled:
+        self._collect(values, step, "", entries)
+      if callback is not None:
+        callbacks.append((callback, values))
+    for relative_path, path_entries in entries.items():
+      with self.summary_writer(relative_path).as_default():
+        for name, value, step in path_entries:
+          self._summary_fn(name, value, step=step)
+    for callback, values in callbacks:
+      callback(values)
+
+  def _collect(self, summary_dict, step, relative_path, entries):
+    """Groups the values of `summary_dict` by their directory."""
+    for name, value in summary_dict.items():
+      if isinstance(value, dict):
+        self._collect(value, step, os.path.join(relative_path, name), entries)
+      else:
+        entries.setdefault(relative_path, []).append((name, value, step))
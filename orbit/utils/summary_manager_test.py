@@ -0,0 +1,87 @@
+# Copyright 2020 The Orbit Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for orbit.utils.summary_manager."""
+
+import os
+
+from orbit.utils import summary_manager
+
+import tensorflow as tf
+
+
+def read_scalars(summary_dir):
+  """Returns the (step, tag, value) of the scalars in a summary directory."""
+  scalars = []
+  for path in sorted(tf.io.gfile.glob(os.path.join(summary_dir, "events*"))):
+    for event in tf.compat.v1.train.summary_iterator(path):
+      for value in event.summary.value:
+        scalars.append((event.step, value.tag,
+                        float(tf.make_ndarray(value.tensor))))
+  return scalars
+
+
+class AsyncSummaryManagerTest(tf.test.TestCase):
+
+  def test_writes_snapshot_of_step_and_values(self):
+    summary_dir = self.get_temp_dir()
+    step = tf.Variable(1, dtype=tf.int64)
+    metric = tf.Variable(0.5)
+    manager = summary_manager.AsyncSummaryManager(
+        summary_dir, tf.summary.scalar, global_step=step, max_queue_size=2)
+    outputs = []
+    manager.write_summaries({"loss": tf.constant(2.0), "metric": metric},
+                            callback=outputs.append)
+    # Updates after `write_summaries` returns are not in the summaries.
+    step.assign(2)
+    metric.assign(1.5)
+    manager.write_summaries({"eval": {"loss": 3.0}})
+    manager.flush()
+
+    self.assertAllClose([{"loss": 2.0, "metric": 0.5}], outputs)
+    self.assertCountEqual([(1, "loss", 2.0), (1, "metric", 0.5)],
+                          read_scalars(summary_dir))
+    self.assertEqual([(2, "loss", 3.0)],
+                     read_scalars(os.path.join(summary_dir, "eval")))
+    manager.close()
+
+  def test_raises_writer_thread_error(self):
+    manager = summary_manager.AsyncSummaryManager(
+        self.get_temp_dir(), tf.summary.scalar, global_step=0)
+
+    def failing_callback(_):
+      raise ValueError("callback failed")
+
+    manager.write_summaries({"loss": 1.0}, callback=failing_callback)
+    with self.assertRaisesRegex(ValueError, "callback failed"):
+      manager.flush()
+    manager.close()
+    with self.assertRaises(RuntimeError):
+      manager.write_summaries({"loss": 1.0})
+
+  def test_disabled_manager_calls_callbacks(self):
+    manager = summary_manager.AsyncSummaryManager(None, tf.summary.scalar)
+    outputs = []
+    manager.write_summaries({"loss": tf.constant(1.0)}, callback=outputs.append)
+    manager.close()
+    self.assertAllClose([{"loss": 1.0}], outputs)
+
+  def test_invalid_queue_size(self):
+    with self.assertRaises(ValueError):
+      summary_manager.AsyncSummaryManager(
+          None, tf.summary.scalar, max_queue_size=0)
+
+
+if __name__ == "__main__":
+  tf.test.main()
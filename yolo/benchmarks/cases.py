@@ -0,0 +1,129 @@
+"""The benchmark cases, each returns a dict mapping a case name to its measurements."""
+import tensorflow as tf
+
+from yolo.benchmarks import synthetic
+from yolo.benchmarks.harness import measure
+from yolo.benchmarks.harness import measure_dataset
+
+# name: (version, model)
+MODELS = {
+    "v3": ("v3", "regular"),
+    "v3-spp": ("v3", "spp"),
+    "v3-tiny": ("v3", "tiny"),
+    "v4": ("v4", "regular"),
+}
+SUITES = ("forward", "train", "postprocess", "pipeline")
+
+
+def build_model(name, classes=80, static_shapes=False):
+    """a Yolo model with random weights, the weights do not change the time of a step"""
+    version, model_type = MODELS[name]
+    if version == "v3":
+        from yolo import Yolov3
+        model = Yolov3(model=model_type, classes=classes, policy="float32", static_shapes=static_shapes)
+    else:
+        from yolo import Yolov4
+        model = Yolov4(model=model_type, classes=classes, policy="float32", static_shapes=static_shapes)
+    model.build([None, None, None, 3])
+    return model
+
+
+def raw_forward(model):
+    """the backbone, neck, and head without the YoloLayer post processing"""
+    def forward(image):
+        maps = model._backbone(image, training=False)
+        if getattr(model, "_neck", None) != None:
+            maps = model._neck(maps, training=False)
+        return model._head(maps, training=False)
+    return tf.function(forward)
+
+
+def forward_cases(model_name, model, sizes, batch_sizes, **kwargs):
+    results = {}
+    forward = raw_forward(model)
+    for size in sizes:
+        for batch_size in batch_sizes:
+            image = synthetic.images(batch_size, size)
+            results[f"forward/{model_name}/{size}/b{batch_size}"] = measure(forward, (image,), batch_size, **kwargs)
+    return results
+
+
+def train_cases(model_name, model, sizes, batch_sizes, **kwargs):
+    results = {}
+    loss_fn = model.generate_loss(loss_type="ciou")
+    model.compile(optimizer=tf.keras.optimizers.SGD(1e-4), loss=loss_fn)
+    num_anchors = len(model._boxes)
+    train_step = tf.function(model.train_step)
+    for size in sizes:
+        for batch_size in batch_sizes:
+            data = (synthetic.images(batch_size, size),
+                    synthetic.labels(batch_size, classes=model._classes, num_anchors=num_anchors))
+            results[f"train/{model_name}/{size}/b{batch_size}"] = measure(train_step, (data,), batch_size, **kwargs)
+    return results
+
+
+def postprocess_cases(model_name, model, sizes, batch_sizes, **kwargs):
+    """the YoloLayer decode and nms on synthetic head outputs, with dynamic and with static shapes"""
+    from yolo.modeling.building_blocks import YoloLayer
+    results = {}
+    for static_shapes in (False, True):
+        layer = YoloLayer(masks=model._masks,
+                          anchors=model._boxes,
+                          thresh=model._thresh,
+                          cls_thresh=model._class_thresh,
+                          max_boxes=model._max_boxes,
+                          path_scale=model._path_scales,
+                          scale_xy=model._x_y_scales,
+                          static_shapes=static_shapes)
+        decode = tf.function(layer)
+        mode = "static" if static_shapes else "dynamic"
+        for size in sizes:
+            for batch_size in batch_sizes:
+                inputs = synthetic.raw_predictions(batch_size, size, model._masks, model._path_scales, model._classes)
+                results[f"postprocess/{model_name}/{mode}/{size}/b{batch_size}"] = measure(decode, (inputs,), batch_size, **kwargs)
+    return results
+
+
+def pipeline_cases(model_name, model, sizes, batch_sizes, warmup=3, iterations=20):
+    """images per second of the training input pipeline, at one fixed size per case"""
+    from yolo.dataloaders.InputPipeline import InputPipeline
+    from yolo.dataloaders.YoloParser import YoloDecoder
+    from yolo.dataloaders.YoloParser import YoloParser
+    results = {}
+    for size in sizes:
+        decoder = YoloDecoder(image_w=size, image_h=size, anchors=model._boxes)
+        parser = YoloParser(image_w=size, image_h=size, fixed_size=True, masks=model._masks, anchors=model._boxes,
+                            path_scales=model._path_scales, seed=0)
+        for batch_size in batch_sizes:
+            pipeline = InputPipeline(decoder.decode, parser.parse_fn(is_training=True), batch_size,
+                                     cache="memory", repeat=True, seed=0, drop_remainder=True)
+            dataset = pipeline(synthetic.synthetic_coco())
+            results[f"pipeline/{model_name}/{size}/b{batch_size}"] = measure_dataset(dataset, batch_size, warmup=warmup, iterations=iterations)
+    return results
+
+
+CASES = {
+    "forward": forward_cases,
+    "train": train_cases,
+    "postprocess": postprocess_cases,
+    "pipeline": pipeline_cases,
+}
+
+
+def run(suites=SUITES, models=tuple(MODELS), sizes=(320, 416, 608), batch_sizes=(1, 8), warmup=3, iterations=20,
+        device="/CPU:0", seed=0):
+    """
+    run every suite for every model, size, and batch size
+
+    Return:
+        dict mapping each case name (suite/model/.../size/batch) to its measurements
+    """
+    tf.random.set_seed(seed)
+    results = {}
+    for model_name in models:
+        with tf.device(device):
+            model = build_model(model_name)
+            for suite in suites:
+                print(f"running {suite} benchmarks of {model_name}", flush=True)
+                results.update(CASES[suite](model_name, model, sizes, batch_sizes, warmup=warmup, iterations=iterations))
+    return results
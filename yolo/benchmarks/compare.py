@@ -0,0 +1,65 @@
+"""Compare benchmark results against a stored baseline and flag the cases that got slower."""
+
+# metric: True if a larger value is better
+METRICS = {
+    "p50_ms": False,
+    "p99_ms": False,
+    "images_per_sec": True,
+}
+
+
+def relative_change(baseline, current, higher_is_better):
+    """fraction by which current is worse than baseline, negative if it is better"""
+    if baseline == 0:
+        return 0.0
+    change = (current - baseline) / baseline
+    return -change if higher_is_better else change
+
+
+def compare(baseline, current, threshold=0.1, metrics=("p50_ms", "images_per_sec")):
+    """
+    Args:
+        baseline: report loaded from a baseline json file
+        current: report of this run
+        threshold: a case regressed if one of its metrics is more than this fraction worse than the baseline
+        metrics: the metrics that are compared, p99 is noisy on shared hosts so it is left out by default
+
+    Return:
+        list of dicts with the case, metric, baseline value, current value, change, and if it is a regression,
+        one for every metric of every case found in both reports, and the list of warnings
+    """
+    warnings = []
+    if baseline.get("environment") != current.get("environment"):
+        warnings.append("the baseline was recorded in a different environment, the comparison may not be meaningful")
+
+    old, new = baseline["results"], current["results"]
+    for case in sorted(set(old) - set(new)):
+        warnings.append(f"{case} is in the baseline but was not run")
+
+    rows = []
+    for case in sorted(set(old) & set(new)):
+        for metric in metrics:
+            if metric not in old[case] or metric not in new[case]:
+                continue
+            change = relative_change(old[case][metric], new[case][metric], METRICS[metric])
+            rows.append({
+                "case": case,
+                "metric": metric,
+                "baseline": old[case][metric],
+                "current": new[case][metric],
+                "change": change,
+                "regression": change > threshold
+            })
+    return rows, warnings
+
+
+def print_comparison(rows, warnings):
+    for warning in warnings:
+        print(f"warning: {warning}")
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(f"{row['case']:<48s} {row['metric']:>14s} {row['baseline']:12.2f} -> {row['current']:12.2f} "
+              f"({row['change'] * 100:+7.1f}% worse) {flag}")
+    regressions = [row for row in rows if row["regression"]]
+    print(f"{len(regressions)} regressions in {len(rows)} comparisons")
+    return regressions
@@ -0,0 +1,71 @@
+"""Timing, environment, and result files of the benchmark suite."""
+import datetime
+import json
+import os
+import platform
+import time
+
+import tensorflow as tf
+
+from yolo.training.step_profiler import summarize
+from yolo.training.step_profiler import sync
+
+
+def measure(fn, args=(), batch_size=1, warmup=3, iterations=20):
+    """
+    time fn(*args) after warmup calls, waiting for the outputs of every call
+
+    Return:
+        dict with the count, mean, p50, and p99 latency in ms, and the images per second at the mean latency
+    """
+    for _ in range(warmup):
+        sync(fn(*args))
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        sync(fn(*args))
+        times.append(time.perf_counter() - start)
+    result = summarize(times)
+    result["images_per_sec"] = batch_size * 1000 / result["mean_ms"]
+    return result
+
+
+def measure_dataset(dataset, batch_size, warmup=5, iterations=50):
+    """images per second read from a dataset of (image, label) batches"""
+    iterator = iter(dataset)
+    for _ in range(warmup):
+        sync(next(iterator))
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        sync(next(iterator))
+        times.append(time.perf_counter() - start)
+    result = summarize(times)
+    result["images_per_sec"] = batch_size * iterations / sum(times)
+    return result
+
+
+def environment(device):
+    """what the numbers depend on, stored with the results so a comparison can warn about different hosts"""
+    return {
+        "tensorflow": tf.__version__,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "device": device,
+        "gpus": [gpu.name for gpu in tf.config.experimental.list_physical_devices("GPU")],
+        "policy": tf.keras.mixed_precision.experimental.global_policy().name,
+    }
+
+
+def write_results(path, results, env):
+    report = {"created": datetime.datetime.now().isoformat(timespec="seconds"), "environment": env, "results": results}
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    return report
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,61 @@
+"""
+Throughput and latency benchmarks of the YOLO models on synthetic data.
+
+    python -m yolo.benchmarks.run --output results.json
+    python -m yolo.benchmarks.run --models v3-tiny --sizes 416 --batch_sizes 1 --suites forward,postprocess
+    python -m yolo.benchmarks.run --output new.json --baseline results.json --threshold 0.1
+
+with a baseline the process exits with status 1 if any case is more than threshold slower than in the baseline.
+"""
+import argparse
+import sys
+
+from yolo.benchmarks import cases
+from yolo.benchmarks.compare import compare
+from yolo.benchmarks.compare import print_comparison
+from yolo.benchmarks.harness import environment
+from yolo.benchmarks.harness import load_results
+from yolo.benchmarks.harness import write_results
+
+
+def split(value, type=str):
+    return [type(item) for item in value.split(",") if item != ""]
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    args.add_argument("--suites", default=",".join(cases.SUITES), help=f"comma separated subset of {cases.SUITES}")
+    args.add_argument("--models", default=",".join(cases.MODELS), help=f"comma separated subset of {tuple(cases.MODELS)}")
+    args.add_argument("--sizes", default="320,416,608")
+    args.add_argument("--batch_sizes", default="1,8")
+    args.add_argument("--warmup", type=int, default=3)
+    args.add_argument("--iterations", type=int, default=20)
+    args.add_argument("--device", default="/CPU:0")
+    args.add_argument("--seed", type=int, default=0)
+    args.add_argument("--output", default="benchmark_results.json")
+    args.add_argument("--baseline", default=None, help="results json to compare against")
+    args.add_argument("--threshold", type=float, default=0.1, help="fraction of slow down that counts as a regression")
+    args = args.parse_args(argv)
+
+    results = cases.run(suites=split(args.suites),
+                        models=split(args.models),
+                        sizes=split(args.sizes, int),
+                        batch_sizes=split(args.batch_sizes, int),
+                        warmup=args.warmup,
+                        iterations=args.iterations,
+                        device=args.device,
+                        seed=args.seed)
+    report = write_results(args.output, results, environment(args.device))
+    for case, result in sorted(results.items()):
+        print(f"{case:<48s} p50: {result['p50_ms']:10.2f} ms  p99: {result['p99_ms']:10.2f} ms  "
+              f"{result['images_per_sec']:10.1f} images/sec")
+
+    if args.baseline != None:
+        rows, warnings = compare(load_results(args.baseline), report, threshold=args.threshold)
+        if print_comparison(rows, warnings):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
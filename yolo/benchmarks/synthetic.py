@@ -0,0 +1,44 @@
+"""Seeded synthetic inputs for the benchmarks, so every run measures the same data without a dataset on disk."""
+import tensorflow as tf
+
+
+def images(batch_size, size, seed=0):
+    return tf.random.stateless_uniform([batch_size, size, size, 3], seed=[seed, 0])
+
+
+def labels(batch_size, num_boxes=20, classes=80, num_anchors=9, seed=0):
+    """a padded batch of labels in the format produced by YoloParser, about a fifth of the boxes are padding"""
+    xy = tf.random.stateless_uniform([batch_size, num_boxes, 2], seed=[seed, 1], maxval=1.0)
+    wh = tf.random.stateless_uniform([batch_size, num_boxes, 2], seed=[seed, 2], minval=0.01, maxval=0.5)
+    pad = tf.cast(tf.random.stateless_uniform([batch_size, num_boxes, 1], seed=[seed, 3]) > 0.2, tf.float32)
+    ranked = tf.argsort(tf.random.stateless_uniform([batch_size, num_boxes, num_anchors], seed=[seed, 4]), axis=-1)
+    best_anchors = tf.concat([ranked[..., :1], -tf.ones_like(ranked[..., :4])], axis=-1)
+    return {"bbox": tf.concat([xy, wh], axis=-1) * pad,
+            "classes": tf.random.stateless_uniform([batch_size, num_boxes], seed=[seed, 5], maxval=classes, dtype=tf.int32),
+            "best_anchors": tf.cast(best_anchors, tf.float32)}
+
+
+def raw_predictions(batch_size, size, masks, path_scales, classes=80, seed=0):
+    """head outputs of every path, mostly unconfident like a trained model on a busy image"""
+    return {
+        key: tf.random.stateless_normal(
+            [batch_size, size // path_scales[key], size // path_scales[key], len(masks[key]) * (classes + 5)],
+            seed=[seed, i], mean=-2.0) for i, key in enumerate(masks)
+    }
+
+
+def synthetic_coco(num_images=512, seed=0):
+    """random images in the format of tfds coco, decoded once and kept in memory so reading is not measured"""
+    def gen(i):
+        seed_i = tf.stack([tf.constant(seed, tf.int64), i])
+        num_boxes = tf.cast(i % 10 + 1, tf.int32)
+        image = tf.random.stateless_uniform([480, 640, 3], seed=seed_i, maxval=256, dtype=tf.int32)
+        yx = tf.random.stateless_uniform([num_boxes, 2], seed=seed_i + 1, maxval=0.5)
+        hw = tf.random.stateless_uniform([num_boxes, 2], seed=seed_i + 2, minval=0.05, maxval=0.5)
+        return {"image": tf.cast(image, tf.uint8),
+                "image/id": i,
+                "objects": {"bbox": tf.concat([yx, yx + hw], axis=-1),
+                            "label": tf.zeros([num_boxes], tf.int64),
+                            "area": tf.zeros([num_boxes], tf.int64),
+                            "is_crowd": tf.zeros([num_boxes], tf.bool)}}
+    return tf.data.Dataset.range(num_images).map(gen).cache()
@@ -0,0 +1,31 @@
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo.benchmarks.compare import compare
+
+
+def report(results, device="/CPU:0"):
+    return {"environment": {"device": device}, "results": results}
+
+
+class CompareTest(tf.test.TestCase, parameterized.TestCase):
+    @parameterized.named_parameters(("slower", 12.0, 80.0, True), ("faster", 8.0, 120.0, False),
+                                    ("within_threshold", 10.5, 95.0, False))
+    def test_regression(self, p50, rate, regressed):
+        baseline = report({"forward/v3/416/b1": {"p50_ms": 10.0, "images_per_sec": 100.0}})
+        current = report({"forward/v3/416/b1": {"p50_ms": p50, "images_per_sec": rate}})
+        rows, warnings = compare(baseline, current, threshold=0.1)
+        self.assertLen(rows, 2)
+        self.assertEmpty(warnings)
+        self.assertEqual(regressed, any(row["regression"] for row in rows))
+
+    def test_warnings(self):
+        baseline = report({"a": {"p50_ms": 1.0}, "b": {"p50_ms": 1.0}})
+        current = report({"a": {"p50_ms": 1.0}}, device="/GPU:0")
+        rows, warnings = compare(baseline, current)
+        self.assertLen(rows, 1)
+        self.assertLen(warnings, 2)
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -1,6 +1,11 @@
 """Classification parser."""
 from yolo.dataloaders.Parser import Parser
 from yolo.dataloaders.ops.random_ops import _rand_number
+from yolo.dataloaders.ops.random_ops import split_seed
+from yolo.dataloaders.ops.random_ops import element_seed
+from yolo.dataloaders.ops.random_ops import random_brightness
+from yolo.dataloaders.ops.random_ops import random_saturation
+from yolo.dataloaders.ops.random_ops import random_hue
 import tensorflow as tf
 import tensorflow_datasets as tfds
 import tensorflow_addons as tfa
@@ -18,7 +23,8 @@ class Classification_Parser(Parser):
                  aug_rand_hue=True,
                  aug_rand_aspect=True,
                  scale=[128, 448],
-                 dtype='float32'):
+                 dtype='float32',
+                 seed=None):
         """Initializes parameters for parsing annotations in the dataset.
         Args:
             output_size: `Tensor` or `list` for [height, width] of output image. The
@@ -38,6 +44,7 @@ class Classification_Parser(Parser):
                 aspect.
             scale: 'list', `Tensor` or `list` for [low, high] of the bounds of the random
                 scale.
+            seed: `int`, op level seed used for elements without a "seed" key.
         """
         self._output_size = output_size
         self._aug_rand_saturation = aug_rand_saturation
@@ -48,9 +55,10 @@ class Classification_Parser(Parser):
         self._num_classes = num_classes
         self._aug_rand_aspect = aug_rand_aspect
         self._scale = [
-            tf.cast(scale[0], tf.float32)[None],
-            tf.cast(scale[1], tf.float32)[None]
+            tf.cast(scale[0], tf.float32),
+            tf.cast(scale[1], tf.float32)
         ]
+        self._seed = seed
         if dtype == 'float32':
             self._dtype = tf.float32
         elif dtype == 'float16':
@@ -72,19 +80,17 @@ class Classification_Parser(Parser):
         image = image / 255
         w = tf.cast(tf.shape(image)[0], tf.float32)
         h = tf.cast(tf.shape(image)[1], tf.int32)
+        seeds = split_seed(element_seed(decoded_tensors, self._seed), 6)
 
         if self._aug_rand_aspect:
-            aspect = tf.py_function(_rand_number, [.75, 1.25], [tf.float32])
-            aspect = tf.cast(aspect, dtype=tf.float32)[0]
+            aspect = _rand_number(seeds[0], .75, 1.25)
             nh = tf.cast(w / aspect, dtype=tf.int32)
             nw = tf.cast(w, dtype=tf.int32)
             image = tf.image.resize(image, size=(nw, nh))
 
         if self._aug_rand_zoom:
-            scale = tf.py_function(_rand_number,
-                                   [self._scale[0], self._scale[1]],
-                                   [tf.float32])
-            scale = tf.cast(scale, dtype=tf.int32)[0][0]
+            scale = _rand_number(seeds[1], self._scale[0], self._scale[1])
+            scale = tf.cast(scale, dtype=tf.int32)
             image = tf.image.resize_with_crop_or_pad(image,
                                                      target_height=scale,
                                                      target_width=scale)
@@ -94,21 +100,20 @@ class Classification_Parser(Parser):
                                          target_height=self._output_size[1])
 
         if self._aug_rand_rotate:
-            deg = tf.py_function(_rand_number, [-30.0, 30.0], tf.float32)
+            deg = _rand_number(seeds[2], -30.0, 30.0)
             deg = deg * 3.14 / 180.
-            deg.set_shape(())
             image = tfa.image.rotate(image, deg, interpolation="NEAREST")
 
         if self._aug_rand_brightness:
-            image = tf.image.random_brightness(image=image, max_delta=.75)
+            image = random_brightness(image, seeds[3], max_delta=.75)
 
         if self._aug_rand_saturation:
-            image = tf.image.random_saturation(image=image,
-                                               lower=0.75,
-                                               upper=1.25)
+            image = random_saturation(image, seeds[4],
+                                      lower=0.75,
+                                      upper=1.25)
 
         if self._aug_rand_hue:
-            image = tf.image.random_hue(image=image, max_delta=.1)
+            image = random_hue(image, seeds[5], max_delta=.1)
 
         image = tf.clip_by_value(image, 0, 1)
         image = tf.image.convert_image_dtype(image, self._dtype)
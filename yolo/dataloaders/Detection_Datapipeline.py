@@ -11,15 +11,19 @@ from yolo.dataloaders.ops.preprocessing_ops import _get_best_anchor
 from yolo.dataloaders.ops.preprocessing_ops import _jitter_boxes
 from yolo.dataloaders.ops.preprocessing_ops import _translate_image
 
+from yolo.dataloaders.ops.random_ops import split_seed
+from yolo.dataloaders.ops.random_ops import element_seed
 from yolo.dataloaders.ops.random_ops import _box_scale_rand
 from yolo.dataloaders.ops.random_ops import _jitter_rand
 from yolo.dataloaders.ops.random_ops import _translate_rand
-from yolo.dataloaders.ops.random_ops import _rand_number
+from yolo.dataloaders.ops.random_ops import random_brightness
+from yolo.dataloaders.ops.random_ops import random_saturation
+from yolo.dataloaders.ops.random_ops import random_hue
 
 from yolo.utils.box_utils import _xcycwh_to_xyxy
 from yolo.utils.box_utils import _xcycwh_to_yxyx
 from yolo.utils.box_utils import _yxyx_to_xcycwh
-from yolo.utils.loss_utils import build_grided_gt
+from yolo.utils.loss_utils import build_grided_gt_levels
 
 
 class Detection_Parser(Parser):
@@ -35,7 +39,11 @@ class Detection_Parser(Parser):
                  min_process_size=320,
                  pct_rand=0.5,
                  masks=None,
-                 anchors=None):
+                 anchors=None,
+                 path_scales=None,
+                 use_tie_breaker=True,
+                 build_grids=False,
+                 seed=None):
 
         self._image_w = image_w
         self._image_h = image_h
@@ -53,39 +61,55 @@ class Detection_Parser(Parser):
             "256": [0, 1, 2]
         } if masks == None else masks
         self._anchors = anchors  # use K means to find boxes if it is None
+        self._path_scales = {
+            "1024": 32,
+            "512": 16,
+            "256": 8
+        } if path_scales == None else path_scales
+        self._use_tie_breaker = use_tie_breaker
+        self._build_grids = build_grids
+        self._seed = seed
         return
+
+    def _build_grid(self, label, width):
+        """grid the ground truth for each output path on the tf.data worker threads, so the loss does not have to"""
+        if self._build_grids:
+            label["grid"] = build_grided_gt_levels(label, self._masks, width, self._path_scales, self._num_classes, tf.float32, self._use_tie_breaker)
+        return label
     
-    def _parse_train_data(self, data, is_training=True):
-        randscale = self._image_w // self._net_down_scale
-        if not self._fixed_size:
-            randscale = tf.py_function(_box_scale_rand, [
-                self._min_process_size // self._net_down_scale,
-                self._max_process_size // self._net_down_scale, randscale,
-                self._pct_rand
-            ], tf.int32)
+    def parse_train_at_scale(self, data, size):
+        """augment one element for training and resize it to size x size, for use with a MultiScaleSampler"""
+        return self._parse_train_data(data, randscale=size // self._net_down_scale)
+
+    def _parse_train_data(self, data, is_training=True, randscale=None):
+        # one stateless seed per augmentation, all derived from the seed of this element
+        seeds = split_seed(element_seed(data, self._seed), 6)
+        # a size chosen by a MultiScaleSampler is used as is, otherwise it is drawn here
+        if randscale is None:
+            randscale = self._image_w // self._net_down_scale
+            if not self._fixed_size:
+                randscale = _box_scale_rand(seeds[0],
+                                            self._min_process_size // self._net_down_scale,
+                                            self._max_process_size // self._net_down_scale,
+                                            randscale, self._pct_rand)
 
         if self._jitter_im != 0.0:
-            translate_x, translate_y = tf.py_function(_translate_rand,
-                                                      [self._jitter_im],
-                                                      [tf.float32, tf.float32])
+            translate_x, translate_y = _translate_rand(seeds[1], self._jitter_im)
         else:
             translate_x, translate_y = 0.0, 0.0
 
         if self._jitter_boxes != 0.0:
-            j_x, j_y, j_w, j_h = tf.py_function(
-                _jitter_rand, [self._jitter_boxes],
-                [tf.float32, tf.float32, tf.float32, tf.float32])
+            j_x, j_y, j_w, j_h = _jitter_rand(seeds[2], self._jitter_boxes)
         else:
             j_x, j_y, j_w, j_h = 0.0, 0.0, 1.0, 1.0
 
         image = tf.image.resize(data["image"],
-                                size=(randscale * 32,
-                                      randscale * 32))  # Random Resize
-        image = tf.image.random_brightness(image=image,
-                                           max_delta=.1)  # Brightness
-        image = tf.image.random_saturation(image=image, lower=0.75,
-                                           upper=1.25)  # Saturation
-        image = tf.image.random_hue(image=image, max_delta=.1)  # Hue
+                                size=(randscale * self._net_down_scale,
+                                      randscale * self._net_down_scale))  # Random Resize
+        image = random_brightness(image, seeds[3], max_delta=.1)  # Brightness
+        image = random_saturation(image, seeds[4], lower=0.75,
+                                  upper=1.25)  # Saturation
+        image = random_hue(image, seeds[5], max_delta=.1)  # Hue
         image = tf.clip_by_value(image, 0.0, 1.0)
 
         image = tf.image.resize(image, 
@@ -93,15 +117,16 @@ class Detection_Parser(Parser):
                                       randscale * self._net_down_scale)) # Random Resize
         image = _translate_image(image, translate_x, translate_y)
         boxes = _jitter_boxes(data["bbox"], translate_x, translate_y, j_x, j_y, j_w, j_h)
-        return image, {"source_id": data["source_id"],
-                        "bbox": boxes,
-                        "classes": data["classes"],
-                        "area": data["area"],
-                        "is_crowd": data["is_crowd"],
-                        "best_anchors": data["best_anchors"], 
-                        "width": data["width"],
-                        "height": data["height"],
-                        "num_detections": data["num_detections"]}
+        label = {"source_id": data["source_id"],
+                 "bbox": boxes,
+                 "classes": data["classes"],
+                 "area": data["area"],
+                 "is_crowd": data["is_crowd"],
+                 "best_anchors": data["best_anchors"], 
+                 "width": data["width"],
+                 "height": data["height"],
+                 "num_detections": data["num_detections"]}
+        return image, self._build_grid(label, randscale * self._net_down_scale)
 
     def _parse_eval_data(self, data):
         randscale = self._image_w // self._net_down_scale
@@ -109,12 +134,13 @@ class Detection_Parser(Parser):
                                 size=(randscale * self._net_down_scale,
                                       randscale * self._net_down_scale)) # Random Resize
         image = tf.clip_by_value(image, 0.0, 1.0)
-        return image, {"source_id": data["source_id"],
-                        "bbox": data["bbox"],
-                        "classes": data["classes"],
-                        "area": data["area"],
-                        "is_crowd": data["is_crowd"],
-                        "best_anchors": data["best_anchors"], 
-                        "width": data["width"],
-                        "height": data["height"],
-                        "num_detections": data["num_detections"]}
+        label = {"source_id": data["source_id"],
+                 "bbox": data["bbox"],
+                 "classes": data["classes"],
+                 "area": data["area"],
+                 "is_crowd": data["is_crowd"],
+                 "best_anchors": data["best_anchors"], 
+                 "width": data["width"],
+                 "height": data["height"],
+                 "num_detections": data["num_detections"]}
+        return image, self._build_grid(label, randscale * self._net_down_scale)
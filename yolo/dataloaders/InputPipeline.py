@@ -0,0 +1,149 @@
+"""Input pipeline builder: parallel reading and decoding, caching, per example augmentation, batching, and prefetch."""
+import tensorflow as tf
+
+from yolo.dataloaders.ops.random_ops import add_seeds
+
+AUTOTUNE = tf.data.experimental.AUTOTUNE
+
+
+def read_records(file_pattern,
+                 record_decoder=None,
+                 cycle_length=None,
+                 block_length=1,
+                 shuffle_files=True,
+                 seed=None,
+                 record_type=tf.data.TFRecordDataset):
+    """
+    read a sharded record dataset, interleaving cycle_length files at a time on parallel threads
+
+    Args:
+        file_pattern: glob or list of globs of the record files
+        record_decoder: optional callable that turns one serialized record into a dict of tensors,
+                        for a tfds dataset use builder.info.features.decode_example
+        cycle_length: number of files read at once, chosen by tf.data if None
+        block_length: number of consecutive records taken from each file
+        shuffle_files: shuffle the order of the files
+        seed: seed of the file shuffle, the interleave is only deterministic if a seed is set
+        record_type: dataset class used to read one file
+
+    Return:
+        tf.data.Dataset of records, or of decoded records if record_decoder is set
+    """
+    files = tf.data.Dataset.list_files(file_pattern, shuffle=shuffle_files, seed=seed)
+    dataset = files.interleave(record_type,
+                               cycle_length=AUTOTUNE if cycle_length == None else cycle_length,
+                               block_length=block_length,
+                               num_parallel_calls=AUTOTUNE,
+                               deterministic=seed != None)
+    if record_decoder != None:
+        dataset = dataset.map(record_decoder, num_parallel_calls=AUTOTUNE)
+    return dataset
+
+
+class InputPipeline(object):
+    """
+    build a batched dataset from a dataset of raw elements in the order:
+        decode (parallel) -> cache -> shuffle -> repeat -> seed -> augment (parallel, one image at a time) -> batch
+            -> augment batches (parallel) -> prefetch
+
+    the decoder should output uint8 images so the cache holds a quarter of the bytes of float32 images, and the
+    per image augmentation runs on the parallel map after the cache so every epoch is augmented differently.
+    every image that goes into a batch must have the same shape, so parsers that pick a random size per image
+    should be used through a MultiScaleSampler, which picks one size for each batch.
+
+    building the train set of a model:
+        pipeline = InputPipeline(decoder.decode, parser.parse_fn(is_training=True), batch_size=16,
+                                 shuffle_buffer=1000, cache="memory", seed=1)
+        train = pipeline(tfds.load("coco", split="train"))
+
+    Args:
+        decode_fn: callable that turns one element into a dict of tensors
+        parse_fn: callable(data) that returns (image, label) for one element, or callable(data, size) if sampler is set
+        batch_size: global number of images in each batch
+        shuffle_buffer: number of decoded elements to shuffle, no shuffle if None
+        cache: None for no cache, "memory" to cache the decoded elements in memory, or a file path to cache them on disk
+        seed: seed of the shuffle and of the augmentation, if set the pipeline is deterministic
+        repeat: repeat the dataset forever, the seeds are added after the repeat so every epoch is augmented differently
+        sampler: optional MultiScaleSampler used to augment and batch the elements
+        batch_fn: optional callable(image, label) that augments a whole batch, ie YoloParser.augment_batch
+        drop_remainder: drop the last partial batch
+        prefetch: number of batches to prefetch, AUTOTUNE by default
+        prefetch_device: if set the batches are copied to this device (ie "/GPU:0") ahead of time, only use this
+                         when the dataset is not distributed
+        deterministic: keep the order of the elements in the parallel maps, defaults to True if a seed is set
+    """
+    def __init__(self,
+                 decode_fn,
+                 parse_fn,
+                 batch_size,
+                 shuffle_buffer=None,
+                 cache=None,
+                 seed=None,
+                 repeat=False,
+                 sampler=None,
+                 batch_fn=None,
+                 drop_remainder=False,
+                 prefetch=AUTOTUNE,
+                 prefetch_device=None,
+                 deterministic=None):
+        self._decode_fn = decode_fn
+        self._parse_fn = parse_fn
+        self._batch_size = batch_size
+        self._shuffle_buffer = shuffle_buffer
+        self._cache = cache
+        self._seed = seed
+        self._repeat = repeat
+        self._sampler = sampler
+        self._batch_fn = batch_fn
+        self._drop_remainder = drop_remainder
+        self._prefetch = prefetch
+        self._prefetch_device = prefetch_device
+        self._deterministic = seed != None if deterministic == None else deterministic
+        return
+
+    def _cached(self, dataset):
+        if self._cache == None:
+            return dataset
+        if self._cache == "memory":
+            return dataset.cache()
+        return dataset.cache(self._cache)
+
+    def __call__(self, dataset, input_context=None):
+        """
+        Args:
+            dataset: tf.data.Dataset of raw elements, ie from tfds.load or read_records
+            input_context: tf.distribute.InputContext, if set the dataset is sharded and batched per replica
+
+        Return:
+            tf.data.Dataset of (image, label) batches
+        """
+        batch_size = self._batch_size
+        if input_context != None:
+            batch_size = input_context.get_per_replica_batch_size(batch_size)
+            dataset = dataset.shard(input_context.num_input_pipelines, input_context.input_pipeline_id)
+
+        options = tf.data.Options()
+        options.experimental_deterministic = self._deterministic
+        dataset = dataset.with_options(options)
+
+        dataset = dataset.map(self._decode_fn, num_parallel_calls=AUTOTUNE)
+        dataset = self._cached(dataset)
+        if self._shuffle_buffer != None:
+            dataset = dataset.shuffle(self._shuffle_buffer, seed=self._seed, reshuffle_each_iteration=True)
+        if self._repeat:
+            dataset = dataset.repeat()
+        if self._seed != None:
+            dataset = add_seeds(dataset, self._seed)
+
+        if self._sampler != None:
+            dataset = self._sampler(dataset, batch_size, self._parse_fn, num_parallel_calls=AUTOTUNE)
+        else:
+            dataset = dataset.map(self._parse_fn, num_parallel_calls=AUTOTUNE)
+            dataset = dataset.padded_batch(batch_size, drop_remainder=self._drop_remainder)
+        if self._batch_fn != None:
+            dataset = dataset.map(self._batch_fn, num_parallel_calls=AUTOTUNE)
+
+        dataset = dataset.prefetch(self._prefetch)
+        if self._prefetch_device != None:
+            dataset = dataset.apply(tf.data.experimental.prefetch_to_device(self._prefetch_device))
+        return dataset
@@ -0,0 +1,108 @@
+"""Batch level multi-scale training."""
+import random
+
+import tensorflow as tf
+
+# keys of the label that have one row per box
+_BOX_KEYS = ("bbox", "classes", "best_anchors", "area", "is_crowd")
+
+
+class MultiScaleSampler(object):
+    """
+    pick one training resolution for each batch, or for each group of change_every batches as DarkNet does,
+    and resize every image in the batch to it before batching. all batches have the same number of images and
+    boxes, and every image in a batch has the same size, so a tf.function only sees len(scales) input shapes
+    instead of one shape per batch.
+
+    using the sampler with a YoloParser:
+        sampler = MultiScaleSampler(min_size=320, max_size=608, change_every=10, seed=1)
+        train = sampler(decoded_train, batch_size=16, parse_fn=parser.parse_train_at_scale)
+
+    Args:
+        min_size: the smallest image width and height
+        max_size: the largest image width and height
+        net_down_scale: every size is a multiple of this
+        change_every: number of consecutive batches that use the same size
+        max_boxes: every label is padded or cut to this many boxes
+        seed: seed of the stateless random size schedule, random if None
+        scales: optional list of sizes to use instead of every multiple of net_down_scale in [min_size, max_size]
+    """
+    def __init__(self,
+                 min_size=320,
+                 max_size=608,
+                 net_down_scale=32,
+                 change_every=10,
+                 max_boxes=200,
+                 seed=None,
+                 scales=None):
+        if scales == None:
+            scales = list(range(min_size // net_down_scale, max_size // net_down_scale + 1))
+            scales = [scale * net_down_scale for scale in scales]
+        if len(scales) == 0:
+            raise ValueError(f"no sizes between {min_size} and {max_size}")
+        self._scales = list(scales)
+        self._change_every = max(int(change_every), 1)
+        self._max_boxes = max_boxes
+        self._seed = random.randint(0, tf.int32.max) if seed == None else seed
+        return
+
+    @property
+    def scales(self):
+        return list(self._scales)
+
+    def schedule(self):
+        """
+        Return:
+            an infinite tf.data.Dataset with the size of each batch, the same size is repeated for change_every batches
+        """
+        scales = tf.constant(self._scales, dtype=tf.int32)
+        change_every = tf.constant(self._change_every, dtype=tf.int64)
+        seed = tf.constant(self._seed, dtype=tf.int64)
+
+        def pick(step):
+            index = tf.random.stateless_uniform([],
+                                                seed=tf.stack([seed, step // change_every]),
+                                                maxval=len(self._scales),
+                                                dtype=tf.int32)
+            return scales[index]
+
+        return tf.data.Dataset.range(tf.int64.max).map(pick)
+
+    def _limit_boxes(self, image, label):
+        """cut the per box labels to max_boxes so they can be padded to a static shape"""
+        label = dict(label)
+        for key in _BOX_KEYS:
+            if key in label:
+                label[key] = label[key][:self._max_boxes]
+        return image, label
+
+    def _padded_shapes(self, element_spec):
+        image_spec, label_spec = element_spec
+
+        def shape(key, spec):
+            if key in _BOX_KEYS:
+                return tf.TensorShape([self._max_boxes]).concatenate(spec.shape[1:])
+            return spec.shape
+
+        label_shapes = {key: tf.nest.map_structure(lambda spec: shape(key, spec), spec) for key, spec in label_spec.items()}
+        return image_spec.shape, label_shapes
+
+    def __call__(self, dataset, batch_size, parse_fn, num_parallel_calls=tf.data.experimental.AUTOTUNE):
+        """
+        Args:
+            dataset: tf.data.Dataset of decoded, unbatched elements
+            batch_size: integer number of images in each batch, the last partial batch is dropped
+            parse_fn: callable(data, size) that augments one element and resizes it to size x size, returning (image, label)
+            num_parallel_calls: parallelism of the parse map
+
+        Return:
+            tf.data.Dataset of (image, label) batches, every image in a batch is [size, size, 3] for one of the scales
+        """
+        # one size per element, constant across each batch
+        sizes = self.schedule().flat_map(lambda size: tf.data.Dataset.from_tensors(size).repeat(batch_size))
+        dataset = tf.data.Dataset.zip((dataset, sizes))
+        dataset = dataset.map(parse_fn, num_parallel_calls=num_parallel_calls)
+        dataset = dataset.map(self._limit_boxes, num_parallel_calls=num_parallel_calls)
+        return dataset.padded_batch(batch_size,
+                                    padded_shapes=self._padded_shapes(dataset.element_spec),
+                                    drop_remainder=True)
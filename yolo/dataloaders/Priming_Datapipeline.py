@@ -1,6 +1,7 @@
 """Priming parser."""
 from yolo.dataloaders.Parser import Parser
 from yolo.dataloaders.ops.random_ops import _rand_number
+from yolo.dataloaders.ops.random_ops import element_seed
 import tensorflow as tf
 import tensorflow_datasets as tfds
 import tensorflow_addons as tfa
@@ -13,7 +14,8 @@ class Priming_Parser(Parser):
                  num_classes,
                  aug_rand_zoom=True,
                  scale=[128, 448],
-                 dtype='float32'):
+                 dtype='float32',
+                 seed=None):
         """Initializes parameters for parsing annotations in the dataset.
         Args:
             output_size: `Tensor` or `list` for [height, width] of output image. The
@@ -23,14 +25,16 @@ class Priming_Parser(Parser):
                 zoom.
             scale: 'list', `Tensor` or `list` for [low, high] of the bounds of the random
                 scale.
+            seed: `int`, op level seed used for elements without a "seed" key.
         """
         self._output_size = output_size
         self._aug_rand_zoom = aug_rand_zoom
         self._num_classes = num_classes
         self._scale = [
-            tf.cast(scale[0], tf.float32)[None],
-            tf.cast(scale[1], tf.float32)[None]
+            tf.cast(scale[0], tf.float32),
+            tf.cast(scale[1], tf.float32)
         ]
+        self._seed = seed
         if dtype == 'float32':
             self._dtype = tf.float32
         elif dtype == 'float16':
@@ -53,10 +57,9 @@ class Priming_Parser(Parser):
         h = tf.cast(tf.shape(image)[1], tf.int32)
 
         if self._aug_rand_zoom:
-            scale = tf.py_function(_rand_number,
-                                   [self._scale[0], self._scale[1]],
-                                   [tf.float32])
-            scale = tf.cast(scale, dtype=tf.int32)[0][0]
+            scale = _rand_number(element_seed(decoded_tensors, self._seed),
+                                 self._scale[0], self._scale[1])
+            scale = tf.cast(scale, dtype=tf.int32)
             image = tf.image.resize_with_crop_or_pad(image,
                                                      target_height=scale,
                                                      target_width=scale)
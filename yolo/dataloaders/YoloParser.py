@@ -4,19 +4,35 @@ import tensorflow.keras.backend as K
 from yolo.dataloaders.Parser import Parser
 from yolo.dataloaders.decoder import Decoder
 
-from yolo.dataloaders.ops.preprocessing_ops import _scale_image
 from yolo.dataloaders.ops.preprocessing_ops import _get_best_anchor
 from yolo.dataloaders.ops.preprocessing_ops import _jitter_boxes
 from yolo.dataloaders.ops.preprocessing_ops import _translate_image
+from yolo.dataloaders.ops.preprocessing_ops import _get_best_anchor_batch
+from yolo.dataloaders.ops.preprocessing_ops import mosaic
+from yolo.dataloaders.ops.preprocessing_ops import mixup
 
+from yolo.dataloaders.ops.random_ops import split_seed
+from yolo.dataloaders.ops.random_ops import element_seed
 from yolo.dataloaders.ops.random_ops import _box_scale_rand
 from yolo.dataloaders.ops.random_ops import _jitter_rand
 from yolo.dataloaders.ops.random_ops import _translate_rand
+from yolo.dataloaders.ops.random_ops import random_brightness
+from yolo.dataloaders.ops.random_ops import random_saturation
+from yolo.dataloaders.ops.random_ops import random_hue
 
 from yolo.utils.box_utils import _xcycwh_to_xyxy
 from yolo.utils.box_utils import _xcycwh_to_yxyx
 from yolo.utils.box_utils import _yxyx_to_xcycwh
-from yolo.utils.loss_utils import build_grided_gt
+from yolo.utils.loss_utils import build_grided_gt_levels
+from yolo.utils.loss_utils import static_dim
+
+
+def _float_image(image):
+    """uint8 images from the decoder (or its cache) become floats in [0, 1] on the parallel parse map"""
+    if image.dtype == tf.uint8:
+        return tf.image.convert_image_dtype(image, tf.float32)
+    return image
+
 
 class YoloDecoder(Decoder):
     def __init__(self,
@@ -42,8 +58,10 @@ class YoloDecoder(Decoder):
         return
     
     def decode(self, data):
+        # the image is kept as uint8 so a cache of decoded images is 4x smaller, the parser scales it to [0, 1]
         shape = tf.shape(data["image"])
-        image = _scale_image(data["image"], resize=True, w = self._max_process_size, h = self._max_process_size)
+        image = tf.image.resize(data["image"], size=(self._max_process_size, self._max_process_size))
+        image = tf.cast(tf.clip_by_value(tf.round(image), 0.0, 255.0), tf.uint8)
         boxes = _yxyx_to_xcycwh(data["objects"]["bbox"])
         best_anchors = _get_best_anchor(boxes, self._anchors, self._image_w, self._image_h)
         return {
@@ -72,7 +90,20 @@ class YoloParser(Parser):
                  min_process_size=320,
                  pct_rand=0.5,
                  masks=None,
-                 anchors=None):
+                 anchors=None,
+                 path_scales=None,
+                 use_tie_breaker=True,
+                 build_grids=False,
+                 seed=None,
+                 mosaic=0.0,
+                 mixup=0.0):
+        """
+        Args:
+            mosaic: fraction of the training images that are replaced by a 4 image mosaic
+            mixup: fraction of the training images that are blended with another image
+            mosaic and mixup work on batches, so if either is set augment_batch has to be mapped over the
+            batched training set (InputPipeline(batch_fn=parser.augment_batch))
+        """
 
         self._image_w = image_w
         self._image_h = image_h
@@ -90,72 +121,110 @@ class YoloParser(Parser):
             "256": [0, 1, 2]
         } if masks == None else masks
         self._anchors = anchors  # use K means to find boxes if it is None
+        self._path_scales = {
+            "1024": 32,
+            "512": 16,
+            "256": 8
+        } if path_scales == None else path_scales
+        self._use_tie_breaker = use_tie_breaker
+        self._build_grids = build_grids
+        self._seed = seed
+        self._mosaic = 0.0 if mosaic == None else mosaic
+        self._mixup = 0.0 if mixup == None else mixup
         return
+
+    @property
+    def batch_augmentation(self):
+        return self._mosaic > 0.0 or self._mixup > 0.0
+
+    def _build_grid(self, label, width):
+        """grid the ground truth for each output path on the tf.data worker threads, so the loss does not have to"""
+        if self._build_grids:
+            label["grid"] = build_grided_gt_levels(label, self._masks, width, self._path_scales, self._num_classes, tf.float32, self._use_tie_breaker)
+        return label
     
-    def _parse_train_data(self, data, is_training=True):
-        randscale = self._image_w // self._net_down_scale
-        if not self._fixed_size:
-            randscale = tf.py_function(_box_scale_rand, [
-                self._min_process_size // self._net_down_scale,
-                self._max_process_size // self._net_down_scale, randscale,
-                self._pct_rand
-            ], tf.int32)
+    def parse_train_at_scale(self, data, size):
+        """augment one element for training and resize it to size x size, for use with a MultiScaleSampler"""
+        return self._parse_train_data(data, randscale=size // self._net_down_scale)
+
+    def _parse_train_data(self, data, is_training=True, randscale=None):
+        # one stateless seed per augmentation, all derived from the seed of this element
+        seeds = split_seed(element_seed(data, self._seed), 6)
+        # a size chosen by a MultiScaleSampler is used as is, otherwise it is drawn here
+        if randscale is None:
+            randscale = self._image_w // self._net_down_scale
+            if not self._fixed_size:
+                randscale = _box_scale_rand(seeds[0],
+                                            self._min_process_size // self._net_down_scale,
+                                            self._max_process_size // self._net_down_scale,
+                                            randscale, self._pct_rand)
 
         if self._jitter_im != 0.0:
-            translate_x, translate_y = tf.py_function(_translate_rand,
-                                                      [self._jitter_im],
-                                                      [tf.float32, tf.float32])
+            translate_x, translate_y = _translate_rand(seeds[1], self._jitter_im)
         else:
             translate_x, translate_y = 0.0, 0.0
 
         if self._jitter_boxes != 0.0:
-            j_x, j_y, j_w, j_h = tf.py_function(
-                _jitter_rand, [self._jitter_boxes],
-                [tf.float32, tf.float32, tf.float32, tf.float32])
+            j_x, j_y, j_w, j_h = _jitter_rand(seeds[2], self._jitter_boxes)
         else:
             j_x, j_y, j_w, j_h = 0.0, 0.0, 1.0, 1.0
 
-        image = tf.image.resize(data["image"],
-                                size=(randscale * 32,
-                                      randscale * 32))  # Random Resize
-        image = tf.image.random_brightness(image=image,
-                                           max_delta=.1)  # Brightness
-        image = tf.image.random_saturation(image=image, lower=0.75,
-                                           upper=1.25)  # Saturation
-        image = tf.image.random_hue(image=image, max_delta=.1)  # Hue
-        image = tf.clip_by_value(image, 0.0, 1.0)
-
-        image = tf.image.resize(image, 
+        image = tf.image.resize(_float_image(data["image"]),
                                 size=(randscale * self._net_down_scale,
-                                      randscale * self._net_down_scale)) # Random Resize
+                                      randscale * self._net_down_scale))  # Random Resize
+        image = random_brightness(image, seeds[3], max_delta=.1)  # Brightness
+        image = random_saturation(image, seeds[4], lower=0.75,
+                                  upper=1.25)  # Saturation
+        image = random_hue(image, seeds[5], max_delta=.1)  # Hue
+        image = tf.clip_by_value(image, 0.0, 1.0)
         image = _translate_image(image, translate_x, translate_y)
         boxes = _jitter_boxes(data["bbox"], translate_x, translate_y, j_x, j_y, j_w, j_h)
-        return image, {"source_id": data["source_id"],
-                        "bbox": boxes,
-                        "classes": data["classes"],
-                        #"area": data["area"],
-                        #"is_crowd": data["is_crowd"],
-                        "best_anchors": data["best_anchors"], 
-                        #"width": data["width"],
-                        #"height": data["height"],
-                        #"num_detections": data["num_detections"],
-                        }
+        label = {"source_id": data["source_id"],
+                 "bbox": boxes,
+                 "classes": data["classes"],
+                 #"area": data["area"],
+                 #"is_crowd": data["is_crowd"],
+                 "best_anchors": data["best_anchors"], 
+                 #"width": data["width"],
+                 #"height": data["height"],
+                 #"num_detections": data["num_detections"],
+                 }
+        if self.batch_augmentation:
+            # the batch augmentation is seeded by its first image, and grids the labels after moving the boxes
+            label["seed"] = split_seed(seeds[0], 2)[1]
+            return image, label
+        return image, self._build_grid(label, randscale * self._net_down_scale)
+
+    def augment_batch(self, image, label):
+        """mosaic and mixup on a batch of parsed training images, the best anchors of the moved boxes are recomputed"""
+        label = dict(label)
+        seeds = split_seed(label.pop("seed")[0], 2)
+        boxes, classes = label["bbox"], label["classes"]
+        if self._mosaic > 0.0:
+            image, boxes, classes = mosaic(image, boxes, classes, seeds[0], prob=self._mosaic)
+        if self._mixup > 0.0:
+            image, boxes, classes = mixup(image, boxes, classes, seeds[1], prob=self._mixup)
+        label["bbox"] = boxes
+        label["classes"] = classes
+        label["best_anchors"] = _get_best_anchor_batch(boxes, self._anchors, self._image_w, self._image_h)
+        return image, self._build_grid(label, static_dim(image, 1))
 
     def _parse_eval_data(self, data):
         randscale = self._image_w // self._net_down_scale
-        image = tf.image.resize(data["image"], 
+        image = tf.image.resize(_float_image(data["image"]), 
                                 size=(randscale * self._net_down_scale,
                                       randscale * self._net_down_scale)) # Random Resize
         image = tf.clip_by_value(image, 0.0, 1.0)
-        return image, {"source_id": data["source_id"],
-                        "bbox": data["bbox"],
-                        "classes": data["classes"],
-                        "area": data["area"],
-                        "is_crowd": data["is_crowd"],
-                        "best_anchors": data["best_anchors"], 
-                        "width": data["width"],
-                        "height": data["height"],
-                        "num_detections": data["num_detections"]}
+        label = {"source_id": data["source_id"],
+                 "bbox": data["bbox"],
+                 "classes": data["classes"],
+                 "area": data["area"],
+                 "is_crowd": data["is_crowd"],
+                 "best_anchors": data["best_anchors"], 
+                 "width": data["width"],
+                 "height": data["height"],
+                 "num_detections": data["num_detections"]}
+        return image, self._build_grid(label, randscale * self._net_down_scale)
     
     def parse_fn(self, is_training):
         """Returns a parse fn that reads and parses raw tensors from the decoder.
@@ -3,6 +3,8 @@ import tensorflow_addons as tfa
 from tensorflow_addons.image import utils as img_utils
 import tensorflow.keras.backend as K
 from yolo.utils.iou_utils import *
+from yolo.dataloaders.ops.random_ops import split_seed
+from yolo.utils.loss_utils import static_dim
 
 
 @tf.function
@@ -94,8 +96,7 @@ def _jitter_boxes(box, translate_x, translate_y, j_cx, j_cy, j_w, j_h):
 def _translate_image(image, translate_x, translate_y):
     with tf.name_scope("translate_image"):
         if (translate_x != 0 and translate_y != 0):
-            image_jitter = tf.concat([translate_x, translate_y], axis=0)
-            image_jitter.set_shape([2])
+            image_jitter = tf.reshape(tf.stack([translate_x, translate_y]), [2])
             image = tfa.image.translate(
                 image, image_jitter * tf.cast(tf.shape(image)[1], tf.float32))
     return image
@@ -182,3 +183,173 @@ def _get_best_anchor(y_true, anchors, width, height):
         #flatten the list from above and attach to the end of input y_true, then return it
         #y_true = K.concatenate([y_true, K.expand_dims(iou_anchors, axis = -1)], axis = -1)
     return tf.cast(iou_index, dtype=tf.float32)
+
+
+def _get_best_anchor_batch(boxes, anchors, width, height, num=5, iou_thresh=0.213):
+    """
+    batched version of _get_best_anchor, for boxes that were moved or resized after decoding
+    Args:
+        boxes: tf.Tensor[] of shape [batch, num boxes, 4] in the yolo format
+        anchors: list or tensor of the anchor boxes in pixels
+        width, height: size in pixels that the anchors are relative to
+    return:
+        tf.Tensor: [batch, num boxes, num] the ranked anchors of each box, anchors after the first one with an
+        iou under iou_thresh are -1
+    """
+    with tf.name_scope("get_anchor_batch"):
+        anchors = tf.convert_to_tensor(anchors, dtype=tf.float32)
+        anchors = anchors / tf.cast(tf.stack([width, height]), tf.float32)
+        num = min(num, int(anchors.shape[0]))
+
+        # the anchors and the boxes share a center, so the iou only depends on the widths and heights
+        box_wh = tf.expand_dims(tf.cast(boxes[..., 2:4], tf.float32), axis=-2)
+        intersection = tf.reduce_prod(tf.minimum(box_wh, anchors), axis=-1)
+        union = tf.reduce_prod(box_wh, axis=-1) + tf.reduce_prod(anchors, axis=-1) - intersection
+        iou = tf.math.divide_no_nan(intersection, union)
+
+        values, indexes = tf.math.top_k(iou, k=num, sorted=True)
+        keep = tf.concat([tf.ones_like(values[..., :1], dtype=tf.bool), values[..., 1:] > iou_thresh], axis=-1)
+        indexes = tf.where(keep, indexes, -1)
+    return tf.cast(indexes, tf.float32)
+
+
+def _compact_boxes(valid, max_boxes, boxes, classes):
+    """move the valid boxes of each image to the front, zero the others, and keep the first max_boxes"""
+    order = tf.argsort(tf.cast(valid, tf.int32), axis=-1, direction="DESCENDING", stable=True)[:, :max_boxes]
+    valid = tf.gather(valid, order, batch_dims=1)
+    boxes = tf.where(valid[..., None], tf.gather(boxes, order, batch_dims=1), tf.zeros_like(boxes[:, :max_boxes]))
+    classes = tf.where(valid, tf.gather(classes, order, batch_dims=1), tf.zeros_like(classes[:, :max_boxes]))
+    return boxes, classes
+
+
+def _select(apply, new, old):
+    """per image choice between an augmented and an unchanged tensor of the batch"""
+    apply = tf.reshape(apply, [-1] + [1] * (new.shape.rank - 1))
+    return tf.where(apply, new, old)
+
+
+def mosaic(images, boxes, classes, seed, prob=1.0, center_range=(0.25, 0.75), max_zoom=2.0, min_area=0.2, min_size=2.0):
+    """
+    YOLOv4 mosaic on a batch, every image is tiled from a crop of itself and of the previous 3 images of the batch
+    (wrapping around). the 4 tiles meet at one random center per batch, so the batch is tiled with 4
+    crop_and_resize calls and no per image python work. each tile crops a random window of its source image that
+    is between 1 and max_zoom times the size of the tile, so objects keep their size or shrink.
+
+    Args:
+        images: tf.Tensor[] of shape [batch, height, width, channels], floats
+        boxes: tf.Tensor[] of shape [batch, num boxes, 4] in the yolo format [x center, y center, width, height],
+               normalized to the image, padding boxes are all 0
+        classes: tf.Tensor[] of shape [batch, num boxes]
+        seed: stateless seed of shape [2]
+        prob: the fraction of the images of the batch that are replaced by a mosaic
+        center_range: range of the random center, as a fraction of the image size
+        max_zoom: largest down scale of a source image
+        min_area: boxes that keep less than this fraction of their area after the crop are removed
+        min_size: boxes thinner than this many pixels after the crop are removed
+
+    Return:
+        images, boxes, classes with the same shapes as the inputs, the boxes that were kept are at the front
+    """
+    with tf.name_scope("mosaic"):
+        seeds = split_seed(seed, 4)
+        shape = tf.shape(images)
+        batch_size, height, width = shape[0], shape[1], shape[2]
+        max_boxes = static_dim(boxes, 1)
+        fheight, fwidth = tf.cast(height, tf.float32), tf.cast(width, tf.float32)
+
+        center = tf.random.stateless_uniform([2], seed=seeds[0], minval=center_range[0], maxval=center_range[1])
+        cx = tf.clip_by_value(tf.cast(tf.round(center[0] * fwidth), tf.int32), 1, width - 1)
+        cy = tf.clip_by_value(tf.cast(tf.round(center[1] * fheight), tf.int32), 1, height - 1)
+        fx, fy = tf.cast(cx, tf.float32) / fwidth, tf.cast(cy, tf.float32) / fheight
+
+        # tile k is [x0, y0, tile width, tile height] as fractions of the output, and its size in pixels
+        tiles = [(0.0, 0.0, fx, fy, cx, cy),
+                 (fx, 0.0, 1.0 - fx, fy, width - cx, cy),
+                 (0.0, fy, fx, 1.0 - fy, cx, height - cy),
+                 (fx, fy, 1.0 - fx, 1.0 - fy, width - cx, height - cy)]
+        zoom = tf.random.stateless_uniform([4, batch_size], seed=seeds[1], minval=1.0, maxval=max_zoom)
+        offset = tf.random.stateless_uniform([4, batch_size, 2], seed=seeds[2])
+
+        images = tf.cast(images, tf.float32)
+        xyxy = tf.concat([boxes[..., 0:2] - boxes[..., 2:4] / 2, boxes[..., 0:2] + boxes[..., 2:4] / 2], axis=-1)
+        present = tf.reduce_any(tf.not_equal(boxes[..., 2:4], 0.0), axis=-1)
+
+        out_images, out_boxes, out_classes, out_valid = [], [], [], []
+        for k, (x0, y0, tw, th, pw, ph) in enumerate(tiles):
+            source = tf.math.floormod(tf.range(batch_size) - k, batch_size)
+            # window of the source image, as a fraction of the source
+            ww = tf.minimum(tw * zoom[k], 1.0)
+            wh = tf.minimum(th * zoom[k], 1.0)
+            ox = offset[k, :, 0] * (1.0 - ww)
+            oy = offset[k, :, 1] * (1.0 - wh)
+            crop = tf.stack([oy, ox, oy + wh, ox + ww], axis=-1)
+            out_images.append(tf.image.crop_and_resize(images, crop, source, tf.stack([ph, pw])))
+
+            # move the boxes of the source image into the tile and clip them to it
+            box = tf.gather(xyxy, source)
+            scale = tf.stack([tw / ww, th / wh, tw / ww, th / wh], axis=-1)[:, None, :]
+            shift = tf.stack([ox, oy, ox, oy], axis=-1)[:, None, :]
+            box = (box - shift) * scale + tf.stack([x0, y0, x0, y0])
+            clipped = tf.clip_by_value(box, tf.stack([x0, y0, x0, y0]), tf.stack([x0 + tw, y0 + th, x0 + tw, y0 + th]))
+
+            wh_box = box[..., 2:4] - box[..., 0:2]
+            wh_clip = clipped[..., 2:4] - clipped[..., 0:2]
+            area = tf.reduce_prod(wh_box, axis=-1)
+            area_clip = tf.reduce_prod(wh_clip, axis=-1)
+            valid = tf.gather(present, source)
+            valid = tf.logical_and(valid, area_clip >= min_area * area)
+            valid = tf.logical_and(valid, wh_clip[..., 0] * fwidth >= min_size)
+            valid = tf.logical_and(valid, wh_clip[..., 1] * fheight >= min_size)
+
+            out_boxes.append(tf.concat([(clipped[..., 0:2] + clipped[..., 2:4]) / 2, wh_clip], axis=-1))
+            out_classes.append(tf.gather(classes, source))
+            out_valid.append(valid)
+
+        top = tf.concat(out_images[0:2], axis=2)
+        bottom = tf.concat(out_images[2:4], axis=2)
+        tiled = tf.reshape(tf.concat([top, bottom], axis=1), shape)
+        tiled.set_shape(images.shape)
+
+        new_boxes, new_classes = _compact_boxes(tf.concat(out_valid, axis=1), max_boxes,
+                                                tf.concat(out_boxes, axis=1), tf.concat(out_classes, axis=1))
+        apply = tf.random.stateless_uniform([batch_size], seed=seeds[3]) < prob
+        images = _select(apply, tiled, images)
+        boxes = _select(apply, tf.cast(new_boxes, boxes.dtype), boxes)
+        classes = _select(apply, new_classes, classes)
+    return images, boxes, classes
+
+
+def mixup(images, boxes, classes, seed, prob=1.0, ratio_range=(0.35, 0.65)):
+    """
+    mixup on a batch, every image is blended with the previous image of the batch (the first with the last) and keeps
+    the boxes of both
+
+    Args:
+        images: tf.Tensor[] of shape [batch, height, width, channels], floats
+        boxes: tf.Tensor[] of shape [batch, num boxes, 4] in the yolo format, padding boxes are all 0
+        classes: tf.Tensor[] of shape [batch, num boxes]
+        seed: stateless seed of shape [2]
+        prob: the fraction of the images of the batch that are mixed
+        ratio_range: range of the weight of the first image in the blend
+
+    Return:
+        images, boxes, classes with the same shapes as the inputs, if the two images have more boxes than
+        fit in the label the last ones are dropped
+    """
+    with tf.name_scope("mixup"):
+        seeds = split_seed(seed, 2)
+        batch_size = tf.shape(images)[0]
+        max_boxes = static_dim(boxes, 1)
+        ratio = tf.random.stateless_uniform([batch_size, 1, 1, 1], seed=seeds[0],
+                                            minval=ratio_range[0], maxval=ratio_range[1])
+
+        mixed = images * tf.cast(ratio, images.dtype) + tf.roll(images, 1, axis=0) * tf.cast(1.0 - ratio, images.dtype)
+        both = tf.concat([boxes, tf.roll(boxes, 1, axis=0)], axis=1)
+        valid = tf.reduce_any(tf.not_equal(both[..., 2:4], 0.0), axis=-1)
+        new_boxes, new_classes = _compact_boxes(valid, max_boxes, both, tf.concat([classes, tf.roll(classes, 1, axis=0)], axis=1))
+
+        apply = tf.random.stateless_uniform([batch_size], seed=seeds[1]) < prob
+        images = _select(apply, mixed, images)
+        boxes = _select(apply, new_boxes, boxes)
+        classes = _select(apply, new_classes, classes)
+    return images, boxes, classes
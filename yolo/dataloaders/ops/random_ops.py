@@ -1,77 +1,133 @@
+"""
+Stateless random numbers for data augmentation.
+
+Every function takes a seed, a tensor of shape [2], and draws from the
+tf.random.stateless_* ops, so they are graph native, can run in as many
+parallel tf.data map calls as there are cores, and give the same augmentation
+for the same seed.
+"""
 import tensorflow as tf
-import tensorflow_addons as tfa
-from tensorflow_addons.image import utils as img_utils
-import tensorflow.keras.backend as K
 import random
 
-# Global Variable to introduce randomness among each element of a batch
-RANDOM_SEED = tf.random.Generator.from_seed(int(random.randint(300, 9000)))
+_SEED_MIN = tf.int32.min
+_SEED_MAX = tf.int32.max
+
+
+def split_seed(seed, num=2):
+    """Derive num independent seeds from one seed.
+    Args:
+        seed(tensorflow.python.framework.ops.Tensor): int32 or int64 seed of shape [2].
+        num(int): number of seeds to return.
+    Returns:
+        A tensor of shape [num, 2] with one seed in each row.
+    """
+    return tf.random.stateless_uniform([num, 2],
+                                       seed=seed,
+                                       minval=_SEED_MIN,
+                                       maxval=_SEED_MAX,
+                                       dtype=tf.int32)
+
+
+def element_seed(data=None, seed=None):
+    """The seed to augment one element (or batch) with.
+    Args:
+        data(dict): the decoded element, if it has a "seed" key from add_seeds that seed is used.
+        seed(int): op level seed used when the element has no seed of its own.
+    Returns:
+        A tensor of shape [2]. Without a seed in data a new one is drawn for every element, which
+        is not reproducible across runs since parallel maps do not run in a fixed order.
+    """
+    if data is not None and "seed" in data:
+        return data["seed"]
+    return tf.random.uniform([2],
+                             minval=_SEED_MIN,
+                             maxval=_SEED_MAX,
+                             dtype=tf.int32,
+                             seed=seed)
+
 
+def add_seeds(dataset, seed=None):
+    """Attach a unique seed to every element of a dataset of dicts.
 
-def _jitter_rand(box_jitter=0.005):
-    """Image Normalization.
+    The seed of each element is [seed, index of the element], so apply this after
+    dataset.repeat() if every epoch should be augmented differently.
+    Args:
+        dataset(tf.data.Dataset): dataset with dict elements.
+        seed(int): seed of the whole pipeline, random if None.
     Returns:
-        jitter(tensorflow.python.framework.ops.Tensor): A random number generated
-            from a uniform distrubution between -0.3 and 0.3.
-        randscale(tensorflow.python.framework.ops.Tensor): A random integer between
-            -10 and 19.
+        The dataset with a "seed" key of shape [2] in every element.
     """
-    global RANDOM_SEED
-    jitter_cx = RANDOM_SEED.uniform(minval=-box_jitter,
-                                    maxval=box_jitter,
-                                    shape=(),
-                                    dtype=tf.float32)
-    jitter_cy = RANDOM_SEED.uniform(minval=-box_jitter,
-                                    maxval=box_jitter,
-                                    shape=(),
-                                    dtype=tf.float32)
-    jitter_bw = RANDOM_SEED.uniform(
-        minval=-box_jitter, maxval=box_jitter, shape=(),
-        dtype=tf.float32) + 1.0
-    jitter_bh = RANDOM_SEED.uniform(
-        minval=-box_jitter, maxval=box_jitter, shape=(),
-        dtype=tf.float32) + 1.0
-    return jitter_cx, jitter_cy, jitter_bw, jitter_bh
-
-
-def _translate_rand(image_jitter=0.1):
-    global RANDOM_SEED
-    translate_x = RANDOM_SEED.uniform(minval=-image_jitter,
-                                      maxval=image_jitter,
-                                      shape=(),
-                                      dtype=tf.float32)
-    translate_y = RANDOM_SEED.uniform(minval=-image_jitter,
-                                      maxval=image_jitter,
-                                      shape=(),
-                                      dtype=tf.float32)
-    return translate_x, translate_y
-
-
-def _box_scale_rand(min_val=10, max_val=19, randscale=13, frac_dat_scale=0.5):
-    global RANDOM_SEED
-    scale_q = RANDOM_SEED.uniform(minval=0,
-                                  maxval=tf.cast(1 / frac_dat_scale,
-                                                 dtype=tf.int32),
-                                  shape=(),
-                                  dtype=tf.int32)
-    if scale_q == 0:
-        randscale = RANDOM_SEED.uniform(minval=10,
-                                        maxval=19,
-                                        shape=(),
-                                        dtype=tf.int32)
-    return randscale
-
-
-def _rand_number(low, high):
+    seed = random.randint(0, _SEED_MAX) if seed is None else seed
+
+    def attach(index, data):
+        data = dict(data)
+        data["seed"] = tf.stack([tf.constant(seed, dtype=tf.int64), index])
+        return data
+
+    return dataset.enumerate().map(attach)
+
+
+def _rand_number(seed, low, high, dtype=tf.float32):
     """Generates a random number along a uniform distrubution.
     Args:
+        seed(tensorflow.python.framework.ops.Tensor): seed of shape [2].
         low(tensorflow.python.framework.ops.Tensor): Minimum Value of the Distrubution.
         high(tensorflow.python.framework.ops.EagerTensor): Maximum Value of the Distrubution.
     Returns:
-        A tensor of the specified shape filled with random uniform values.
+        A scalar tensor filled with a random uniform value.
+    """
+    return tf.random.stateless_uniform([],
+                                       seed=seed,
+                                       minval=tf.cast(low, dtype),
+                                       maxval=tf.cast(high, dtype),
+                                       dtype=dtype)
+
+
+def _jitter_rand(seed, box_jitter=0.005):
+    """Box Jitter.
+    Returns:
+        jitter_cx, jitter_cy: random shifts of the box centers between -box_jitter and box_jitter.
+        jitter_bw, jitter_bh: random scales of the box sizes between 1 - box_jitter and 1 + box_jitter.
     """
-    global RANDOM_SEED  # Global Variable defined at the beginning of the file.
-    return RANDOM_SEED.uniform(minval=low,
-                               maxval=high,
-                               shape=(),
-                               dtype=tf.float32)
+    jitter = tf.random.stateless_uniform([4],
+                                         seed=seed,
+                                         minval=-box_jitter,
+                                         maxval=box_jitter,
+                                         dtype=tf.float32)
+    return jitter[0], jitter[1], jitter[2] + 1.0, jitter[3] + 1.0
+
+
+def _translate_rand(seed, image_jitter=0.1):
+    translate = tf.random.stateless_uniform([2],
+                                            seed=seed,
+                                            minval=-image_jitter,
+                                            maxval=image_jitter,
+                                            dtype=tf.float32)
+    return translate[0], translate[1]
+
+
+def _box_scale_rand(seed, min_val=10, max_val=19, randscale=13, frac_dat_scale=0.5):
+    """With probability frac_dat_scale, a random scale in [min_val, max_val), otherwise randscale."""
+    seeds = split_seed(seed, 2)
+    scale_q = tf.random.stateless_uniform([], seed=seeds[0], dtype=tf.float32)
+    rand = tf.random.stateless_uniform([],
+                                       seed=seeds[1],
+                                       minval=min_val,
+                                       maxval=max_val,
+                                       dtype=tf.int32)
+    return tf.where(scale_q < frac_dat_scale, rand, tf.cast(randscale, tf.int32))
+
+
+def random_brightness(image, seed, max_delta):
+    delta = _rand_number(seed, -max_delta, max_delta)
+    return tf.image.adjust_brightness(image, delta)
+
+
+def random_saturation(image, seed, lower, upper):
+    factor = _rand_number(seed, lower, upper)
+    return tf.image.adjust_saturation(image, factor)
+
+
+def random_hue(image, seed, max_delta):
+    delta = _rand_number(seed, -max_delta, max_delta)
+    return tf.image.adjust_hue(image, delta)
@@ -0,0 +1,74 @@
+"""
+Images per second of the YOLO input pipeline, the previous batch then augment pipeline against InputPipeline.
+
+    python -m yolo.dataloaders.tests.pipeline_benchmark                 # synthetic COCO like images
+    python -m yolo.dataloaders.tests.pipeline_benchmark --coco          # tfds coco/2017 train split
+"""
+import argparse
+import time
+
+import tensorflow as tf
+
+from yolo.benchmarks.synthetic import synthetic_coco
+from yolo.dataloaders.InputPipeline import InputPipeline
+from yolo.dataloaders.MultiScaleSampler import MultiScaleSampler
+from yolo.dataloaders.YoloParser import YoloDecoder
+from yolo.dataloaders.YoloParser import YoloParser
+
+ANCHORS = [(10, 13), (16, 30), (33, 23), (30, 61), (62, 45), (59, 119), (116, 90), (156, 198), (373, 326)]
+
+
+def legacy_pipeline(dataset, decoder, parser, batch_size):
+    """the previous process_datasets: serial float32 decode, padded batch, then augment whole batches"""
+    def decode(data):
+        data = decoder.decode(data)
+        data["image"] = tf.image.convert_image_dtype(data["image"], tf.float32)
+        return data
+    dataset = dataset.map(decode)
+    dataset = dataset.padded_batch(batch_size)
+    return dataset.map(parser.parse_fn(is_training=True))
+
+
+def images_per_second(dataset, batch_size, num_batches, warmup=5):
+    iterator = iter(dataset)
+    for _ in range(warmup):
+        next(iterator)
+    start = time.time()
+    for _ in range(num_batches):
+        image, _ = next(iterator)
+    _ = image.numpy()
+    return num_batches * batch_size / (time.time() - start)
+
+
+def main(coco=False, batch_size=16, num_batches=50, cache=None, multi_scale_every=10):
+    if coco:
+        import tensorflow_datasets as tfds
+        dataset = tfds.load("coco/2017", split="train", shuffle_files=True)
+    else:
+        dataset = synthetic_coco()
+
+    decoder = YoloDecoder(anchors=ANCHORS)
+    parser = YoloParser(anchors=ANCHORS, seed=0)
+    sampler = MultiScaleSampler(change_every=multi_scale_every, seed=0)
+
+    legacy = legacy_pipeline(dataset.repeat(), decoder, parser, batch_size)
+    pipeline = InputPipeline(decoder.decode, parser.parse_train_at_scale, batch_size,
+                             shuffle_buffer=None if cache == None else 1000, cache=cache, repeat=True, sampler=sampler)
+
+    results = {"legacy": images_per_second(legacy, batch_size, num_batches),
+               "input_pipeline": images_per_second(pipeline(dataset), batch_size, num_batches)}
+    for name, rate in results.items():
+        print(f"{name:>16s}: {rate:8.1f} images/sec")
+    print(f"{'speedup':>16s}: {results['input_pipeline'] / results['legacy']:8.2f}x")
+    return results
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser()
+    args.add_argument("--coco", action="store_true", help="read tfds coco/2017 instead of synthetic images")
+    args.add_argument("--batch_size", type=int, default=16)
+    args.add_argument("--num_batches", type=int, default=50)
+    args.add_argument("--cache", default=None, help="'memory' or a cache file path")
+    args.add_argument("--multi_scale_every", type=int, default=10)
+    args = args.parse_args()
+    main(args.coco, args.batch_size, args.num_batches, args.cache, args.multi_scale_every)
@@ -0,0 +1,68 @@
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo.dataloaders.ops.preprocessing_ops import mosaic
+from yolo.dataloaders.ops.preprocessing_ops import mixup
+from yolo.dataloaders.ops.preprocessing_ops import _get_best_anchor
+from yolo.dataloaders.ops.preprocessing_ops import _get_best_anchor_batch
+
+ANCHORS = [(10, 13), (16, 30), (33, 23), (30, 61), (62, 45), (59, 119), (116, 90), (156, 198), (373, 326)]
+
+
+def labelled_batch(batch_size=4, size=64, max_boxes=6):
+    """image i is filled with the value i and has one box covering the whole image, the rest is padding"""
+    images = tf.ones([batch_size, size, size, 3]) * tf.reshape(tf.range(batch_size, dtype=tf.float32), [-1, 1, 1, 1])
+    boxes = tf.concat([tf.constant([[[0.5, 0.5, 1.0, 1.0]]] * batch_size), tf.zeros([batch_size, max_boxes - 1, 4])], axis=1)
+    classes = tf.concat([tf.range(batch_size)[:, None], tf.zeros([batch_size, max_boxes - 1], tf.int32)], axis=1)
+    return images, boxes, classes
+
+
+class BatchAugmentationTest(tf.test.TestCase, parameterized.TestCase):
+    def test_mosaic_tiles(self):
+        images, boxes, classes = labelled_batch()
+        out_images, out_boxes, out_classes = mosaic(images, boxes, classes, tf.constant([1, 2]),
+                                                    max_zoom=1.0, min_area=0.0)
+        self.assertEqual(images.shape, out_images.shape)
+        self.assertEqual(boxes.shape, out_boxes.shape)
+        for i in range(4):
+            # the corners come from image i and the 3 images before it
+            self.assertAllClose(out_images[i, 0, 0], [i] * 3)
+            self.assertAllClose(out_images[i, -1, -1], [(i - 3) % 4] * 3)
+            self.assertAllEqual(out_classes[i, :4], [i, (i - 1) % 4, (i - 2) % 4, (i - 3) % 4])
+
+        # the whole image boxes are clipped to their tiles, which cover the image
+        tiles = out_boxes[:, :4]
+        self.assertAllClose(tf.reduce_sum(tiles[..., 2] * tiles[..., 3], axis=-1), [1.0] * 4)
+        self.assertAllInRange(tiles[..., :2] - tiles[..., 2:] / 2, 0.0, 1.0)
+        self.assertAllInRange(tiles[..., :2] + tiles[..., 2:] / 2, 0.0, 1.0)
+        self.assertAllEqual(out_boxes[:, 4:], tf.zeros_like(out_boxes[:, 4:]))
+
+    def test_mosaic_filters_small_boxes(self):
+        images, boxes, classes = labelled_batch()
+        _, out_boxes, _ = mosaic(images, boxes, classes, tf.constant([1, 2]), max_zoom=1.0, min_area=0.99)
+        self.assertAllEqual(out_boxes, tf.zeros_like(out_boxes))
+
+    @parameterized.named_parameters(("mosaic", mosaic), ("mixup", mixup))
+    def test_zero_probability_is_identity(self, fn):
+        images, boxes, classes = labelled_batch()
+        out_images, out_boxes, out_classes = fn(images, boxes, classes, tf.constant([3, 4]), prob=0.0)
+        self.assertAllClose(images, out_images)
+        self.assertAllClose(boxes, out_boxes)
+        self.assertAllEqual(classes, out_classes)
+
+    def test_mixup_keeps_both_labels(self):
+        images, boxes, classes = labelled_batch()
+        out_images, out_boxes, out_classes = mixup(images, boxes, classes, tf.constant([5, 6]), ratio_range=(0.5, 0.5))
+        self.assertAllClose(out_images[1], tf.fill([64, 64, 3], 0.5))
+        self.assertAllEqual(out_classes[:, :2], [[0, 3], [1, 0], [2, 1], [3, 2]])
+        self.assertAllClose(out_boxes[:, :2], tf.constant([[[0.5, 0.5, 1.0, 1.0]] * 2] * 4))
+
+    def test_best_anchor_batch_matches(self):
+        boxes = tf.constant([[0.5, 0.5, 0.1, 0.2], [0.2, 0.3, 0.05, 0.05], [0.5, 0.5, 0.9, 0.8]])
+        expected = _get_best_anchor(boxes, ANCHORS, 416, 416)
+        actual = _get_best_anchor_batch(boxes[None], ANCHORS, 416, 416)[0]
+        self.assertAllEqual(expected, actual)
+
+
+if __name__ == "__main__":
+    tf.test.main()
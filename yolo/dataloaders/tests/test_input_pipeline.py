@@ -0,0 +1,86 @@
+import os
+
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo.dataloaders.InputPipeline import InputPipeline
+from yolo.dataloaders.InputPipeline import read_records
+from yolo.dataloaders.MultiScaleSampler import MultiScaleSampler
+from yolo.dataloaders.ops.random_ops import element_seed
+
+
+def raw_dataset(num_images=10):
+    def gen(i):
+        num_boxes = i % 4 + 1
+        return {"image": tf.cast(tf.fill([20 + i, 24, 3], i * 10), tf.uint8),
+                "bbox": tf.fill([num_boxes, 4], 0.25),
+                "classes": tf.range(num_boxes)}
+    return tf.data.Dataset.range(num_images).map(lambda i: gen(tf.cast(i, tf.int32)))
+
+
+def decode(data):
+    data = dict(data)
+    data["image"] = tf.cast(tf.image.resize(data["image"], (32, 32)), tf.uint8)
+    return data
+
+
+def parse(data, size=16):
+    image = tf.image.resize(tf.image.convert_image_dtype(data["image"], tf.float32), (size, size))
+    image += tf.random.stateless_uniform([], seed=element_seed(data))
+    return image, {"bbox": data["bbox"], "classes": data["classes"]}
+
+
+class InputPipelineTest(tf.test.TestCase, parameterized.TestCase):
+    @parameterized.named_parameters(("no_cache", None), ("memory", "memory"), ("file", "file"))
+    def test_batches(self, cache):
+        if cache == "file":
+            cache = os.path.join(self.get_temp_dir(), "cache")
+        pipeline = InputPipeline(decode, parse, batch_size=4, cache=cache, seed=1)
+        batches = list(pipeline(raw_dataset()))
+        self.assertLen(batches, 3)
+        image, label = batches[0]
+        self.assertEqual([4, 16, 16, 3], image.shape.as_list())
+        self.assertEqual([4, 4, 4], label["bbox"].shape.as_list())
+        self.assertEqual([2, 16, 16, 3], batches[-1][0].shape.as_list())
+
+    def test_seed_is_reproducible(self):
+        first = [image for image, _ in InputPipeline(decode, parse, batch_size=4, shuffle_buffer=10, seed=3)(raw_dataset())]
+        second = [image for image, _ in InputPipeline(decode, parse, batch_size=4, shuffle_buffer=10, seed=3)(raw_dataset())]
+        for a, b in zip(first, second):
+            self.assertAllClose(a, b)
+
+    def test_repeat_changes_augmentation(self):
+        pipeline = InputPipeline(decode, parse, batch_size=10, seed=2, repeat=True)
+        first, second = [image for image, _ in pipeline(raw_dataset()).take(2)]
+        self.assertNotAllClose(first, second)
+
+    def test_sampler(self):
+        sampler = MultiScaleSampler(min_size=32, max_size=96, max_boxes=5, seed=0)
+        pipeline = InputPipeline(decode, parse, batch_size=2, seed=0, sampler=sampler)
+        for image, label in pipeline(raw_dataset()):
+            self.assertIn(image.shape[1], sampler.scales)
+            self.assertEqual([2, 5, 4], label["bbox"].shape.as_list())
+
+    def test_shards_per_replica(self):
+        context = tf.distribute.InputContext(num_input_pipelines=2, input_pipeline_id=1, num_replicas_in_sync=2)
+        pipeline = InputPipeline(decode, parse, batch_size=4, drop_remainder=True)
+        batches = list(pipeline(raw_dataset(), context))
+        self.assertLen(batches, 2)
+        self.assertEqual(2, batches[0][0].shape[0])
+
+    def test_read_records(self):
+        paths = []
+        for shard in range(3):
+            path = os.path.join(self.get_temp_dir(), f"data-{shard}.tfrecord")
+            with tf.io.TFRecordWriter(path) as writer:
+                for i in range(4):
+                    writer.write(tf.io.serialize_tensor(tf.constant(shard * 4 + i)).numpy())
+            paths.append(path)
+        dataset = read_records(os.path.join(self.get_temp_dir(), "data-*.tfrecord"),
+                               record_decoder=lambda record: tf.io.parse_tensor(record, tf.int32),
+                               cycle_length=2, seed=1)
+        self.assertCountEqual(range(12), list(dataset.as_numpy_iterator()))
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -0,0 +1,52 @@
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo.dataloaders.MultiScaleSampler import MultiScaleSampler
+
+
+def synthetic_dataset(num_images=24):
+    def gen(i):
+        num_boxes = i % 5 + 1
+        return {"image": tf.fill([40 + i, 30, 3], 0.5),
+                "bbox": tf.fill([num_boxes, 4], 0.25),
+                "classes": tf.range(num_boxes)}
+    return tf.data.Dataset.range(num_images).map(lambda i: gen(tf.cast(i, tf.int32)))
+
+
+def parse_fn(data, size):
+    image = tf.image.resize(data["image"], (size, size))
+    return image, {"bbox": data["bbox"], "classes": data["classes"]}
+
+
+class MultiScaleSamplerTest(tf.test.TestCase, parameterized.TestCase):
+    @parameterized.named_parameters(("every_batch", 1), ("every_3", 3))
+    def test_one_size_per_group(self, change_every):
+        sampler = MultiScaleSampler(min_size=64, max_size=256, change_every=change_every, max_boxes=8, seed=3)
+        batches = list(sampler(synthetic_dataset(), batch_size=2, parse_fn=parse_fn))
+        self.assertLen(batches, 12)
+        sizes = []
+        for image, label in batches:
+            self.assertEqual(image.shape[1], image.shape[2])
+            self.assertIn(image.shape[1], sampler.scales)
+            self.assertEqual([2, 8, 4], label["bbox"].shape.as_list())
+            self.assertEqual([2, 8], label["classes"].shape.as_list())
+            sizes.append(image.shape[1])
+        for i in range(0, len(sizes), change_every):
+            self.assertLen(set(sizes[i:i + change_every]), 1)
+
+    def test_schedule_is_reproducible(self):
+        first = list(MultiScaleSampler(seed=7).schedule().take(50).as_numpy_iterator())
+        second = list(MultiScaleSampler(seed=7).schedule().take(50).as_numpy_iterator())
+        self.assertAllEqual(first, second)
+        self.assertGreater(len(set(first)), 1)
+
+    def test_static_batch_and_box_dims(self):
+        sampler = MultiScaleSampler(min_size=64, max_size=128, max_boxes=3, seed=0)
+        dataset = sampler(synthetic_dataset(), batch_size=4, parse_fn=parse_fn)
+        image_spec, label_spec = dataset.element_spec
+        self.assertEqual([4, None, None, 3], image_spec.shape.as_list())
+        self.assertEqual([4, 3, 4], label_spec["bbox"].shape.as_list())
+
+
+if __name__ == "__main__":
+    tf.test.main()
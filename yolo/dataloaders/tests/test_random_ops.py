@@ -0,0 +1,39 @@
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo.dataloaders.ops import random_ops
+
+
+class RandomOpsTest(tf.test.TestCase, parameterized.TestCase):
+    def test_same_seed_same_values(self):
+        seed = tf.constant([3, 7])
+        for fn, args in [(random_ops._jitter_rand, (0.005,)), (random_ops._translate_rand, (0.1,)),
+                         (random_ops._box_scale_rand, (10, 19, 13, 0.5)), (random_ops._rand_number, (0.0, 1.0))]:
+            self.assertAllEqual(fn(seed, *args), fn(seed, *args))
+
+    def test_ranges(self):
+        seeds = random_ops.split_seed(tf.constant([1, 2]), 100)
+        for i in range(100):
+            j_x, j_y, j_w, j_h = random_ops._jitter_rand(seeds[i], 0.005)
+            self.assertAllInRange([j_x, j_y], -0.005, 0.005)
+            self.assertAllInRange([j_w, j_h], 0.995, 1.005)
+            self.assertAllInRange(random_ops._translate_rand(seeds[i], 0.1), -0.1, 0.1)
+            self.assertIn(int(random_ops._box_scale_rand(seeds[i], 10, 19, 13, 0.5)), range(10, 19))
+
+    @parameterized.named_parameters(("no_random", 0.0, {13}), ("always_random", 1.0, set(range(10, 19))))
+    def test_box_scale_fraction(self, frac, allowed):
+        seeds = random_ops.split_seed(tf.constant([5, 5]), 50)
+        scales = {int(random_ops._box_scale_rand(seeds[i], 10, 19, 13, frac)) for i in range(50)}
+        self.assertTrue(scales <= allowed)
+
+    def test_add_seeds_is_reproducible(self):
+        dataset = tf.data.Dataset.from_tensor_slices({"image": tf.zeros([4, 2, 2, 3])})
+        augment = lambda data: random_ops.random_brightness(data["image"], random_ops.element_seed(data), 0.5)
+        first = [x.numpy() for x in random_ops.add_seeds(dataset, 11).map(augment, num_parallel_calls=4)]
+        second = [x.numpy() for x in random_ops.add_seeds(dataset, 11).map(augment, num_parallel_calls=4)]
+        self.assertAllEqual(first, second)
+        self.assertNotAllClose(first[0], first[1])
+
+
+if __name__ == "__main__":
+    tf.test.main()
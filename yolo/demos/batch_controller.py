@@ -0,0 +1,163 @@
+import collections
+import numpy as np
+import time
+
+import threading as t
+
+
+class AdaptiveBatchController(object):
+    """
+    feedback controller that picks the batch size and que depth used for video inference at runtime. the end to end
+    latency of each frame and the time spent running each batch are measured, and every window batches the batch size is
+    adjusted:
+
+        target_latency set: the batch size grows by one while the p90 latency is below the target and shrinks by half
+                            as soon as it goes above it (additive increase, multiplicative decrease)
+        target_latency None: the batch size climbs in the direction that increases the inference throughput, and turns
+                             around when the throughput drops
+
+    the que depth follows the batch size as que_scale * batch_size so there is always about one batch waiting.
+
+    using the controller:
+        controller = AdaptiveBatchController(target_latency=0.1, max_batch=16)
+        batch_size = controller.batch_size
+        ... run a batch ...
+        controller.record_batch(batch_size, inference_seconds)
+        controller.record_latency(end_to_end_seconds)
+        print(controller.metrics())
+
+    Args:
+        target_latency: float number of seconds that the end to end latency of a frame should stay under, if None the
+                        controller maximizes the number of frames per second instead
+        min_batch: the smallest batch size the controller can choose
+        max_batch: the largest batch size the controller can choose
+        initial_batch: the batch size to start from, min_batch by default
+        que_scale: integer number of batches that the ques in front of the model can hold
+        window: number of batches measured before the batch size is changed
+        history_size: number of past operating points to keep
+    """
+    def __init__(self,
+                 target_latency=None,
+                 min_batch=1,
+                 max_batch=16,
+                 initial_batch=None,
+                 que_scale=2,
+                 window=8,
+                 history_size=1000):
+        if min_batch < 1 or max_batch < min_batch:
+            raise ValueError(f"invalid batch size range [{min_batch}, {max_batch}]")
+        self._target_latency = target_latency
+        self._min_batch = min_batch
+        self._max_batch = max_batch
+        self._que_scale = que_scale
+        self._window = window
+        self._batch_size = int(np.clip(initial_batch or min_batch, min_batch, max_batch))
+
+        # +1 when the batch size is climbing, -1 when it is falling, used when maximizing fps
+        self._direction = 1
+        self._last_fps = None
+
+        self._frames = 0
+        self._batch_time = 0.0
+        self._batches = 0
+        self._latencies = []
+        self._fps = 0.0
+        self._latency = 0.0
+
+        self._history = collections.deque(maxlen=history_size)
+        self._lock = t.Lock()
+        return
+
+    @property
+    def batch_size(self):
+        return self._batch_size
+
+    @property
+    def que_size(self):
+        return self._batch_size * self._que_scale
+
+    @property
+    def history(self):
+        """list of the operating points chosen so far, see metrics"""
+        with self._lock:
+            return list(self._history)
+
+    def record_latency(self, latency):
+        """record the end to end latency, in seconds, of one frame"""
+        with self._lock:
+            self._latencies.append(latency)
+        return
+
+    def record_batch(self, batch_size, seconds):
+        """
+        record that a batch of batch_size frames took seconds to run through the model
+
+        Return:
+            True if the batch size or que size was changed
+        """
+        with self._lock:
+            self._frames += batch_size
+            self._batch_time += seconds
+            self._batches += 1
+            if self._batches < self._window:
+                return False
+            return self._update()
+
+    def _update(self):
+        fps = self._frames / self._batch_time if self._batch_time > 0 else 0.0
+        latency = float(np.percentile(self._latencies, 90)) if self._latencies else None
+        old = self._batch_size
+
+        if self._target_latency is not None and latency is not None:
+            if latency > self._target_latency:
+                self._batch_size = max(self._batch_size // 2, self._min_batch)
+            else:
+                self._batch_size = min(self._batch_size + 1, self._max_batch)
+        elif self._target_latency is None:
+            if self._last_fps is not None and fps < self._last_fps:
+                self._direction = -self._direction
+            self._batch_size = int(np.clip(self._batch_size + self._direction, self._min_batch, self._max_batch))
+            # turn around at the edges of the range
+            if self._batch_size in (self._min_batch, self._max_batch) and self._batch_size == old:
+                self._direction = -self._direction
+            self._last_fps = fps
+
+        self._fps = fps
+        self._latency = latency if latency is not None else 0.0
+        self._history.append(self._operating_point(old))
+
+        self._frames = 0
+        self._batch_time = 0.0
+        self._batches = 0
+        self._latencies = []
+        return self._batch_size != old
+
+    def _operating_point(self, batch_size):
+        return {
+            "time": time.time(),
+            "batch_size": batch_size,
+            "que_size": batch_size * self._que_scale,
+            "fps": self._fps,
+            "latency_p90_ms": self._latency * 1000,
+        }
+
+    def metrics(self):
+        """
+        Return:
+            dict with the current batch size and que size, the mode of the controller, and the inference fps and p90
+            end to end latency measured in the last window
+        """
+        with self._lock:
+            point = self._operating_point(self._batch_size)
+        point["mode"] = "max_fps" if self._target_latency is None else "target_latency"
+        point["target_latency_ms"] = None if self._target_latency is None else self._target_latency * 1000
+        point["adjustments"] = len(self._history)
+        return point
+
+
+def resize_que(que, size):
+    """change the maximum size of a queue.Queue that is already in use"""
+    with que.mutex:
+        que.maxsize = size
+        que.not_full.notify_all()
+    return
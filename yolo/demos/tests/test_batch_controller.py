@@ -0,0 +1,164 @@
+import threading
+from queue import Queue
+
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo.demos.batch_controller import AdaptiveBatchController
+from yolo.demos.batch_controller import resize_que
+from yolo.demos.video_detect_gpu import FastVideo
+
+
+def run_window(controller, latency, seconds=1.0):
+    """run one window of batches at the current batch size, every frame with the same end to end latency"""
+    changed = False
+    for _ in range(controller._window):
+        batch_size = controller.batch_size
+        for _ in range(batch_size):
+            controller.record_latency(latency)
+        changed = controller.record_batch(batch_size, seconds)
+    return changed
+
+
+class AdaptiveBatchControllerTest(tf.test.TestCase, parameterized.TestCase):
+    def test_invalid_range(self):
+        with self.assertRaises(ValueError):
+            AdaptiveBatchController(min_batch=4, max_batch=2)
+        with self.assertRaises(ValueError):
+            AdaptiveBatchController(min_batch=0)
+        return
+
+    def test_waits_for_the_window(self):
+        controller = AdaptiveBatchController(target_latency=0.1, window=3)
+        controller.record_latency(0.01)
+        self.assertFalse(controller.record_batch(1, 0.01))
+        self.assertFalse(controller.record_batch(1, 0.01))
+        self.assertEqual(controller.batch_size, 1)
+        self.assertTrue(controller.record_batch(1, 0.01))
+        self.assertEqual(controller.batch_size, 2)
+        return
+
+    def test_additive_increase(self):
+        controller = AdaptiveBatchController(target_latency=0.1, max_batch=3, window=2)
+        sizes = []
+        for _ in range(4):
+            run_window(controller, 0.05)
+            sizes.append(controller.batch_size)
+        self.assertEqual(sizes, [2, 3, 3, 3])
+        return
+
+    @parameterized.named_parameters(("halve", 8, 1, 4), ("clamp_to_min", 3, 2, 2), ("at_min", 1, 1, 1))
+    def test_multiplicative_decrease(self, initial_batch, min_batch, expected):
+        controller = AdaptiveBatchController(target_latency=0.1, min_batch=min_batch, initial_batch=initial_batch,
+                                             window=1)
+        changed = run_window(controller, 0.5)
+        self.assertEqual(controller.batch_size, expected)
+        self.assertEqual(changed, expected != initial_batch)
+        return
+
+    def test_max_fps_turns_around_when_fps_drops(self):
+        controller = AdaptiveBatchController(initial_batch=4, window=1)
+        # 4 fps, climbing
+        controller.record_batch(4, 1.0)
+        self.assertEqual(controller.batch_size, 5)
+        # 2.5 fps, slower than before so the batch size goes back down
+        controller.record_batch(5, 2.0)
+        self.assertEqual(controller.batch_size, 4)
+        # 8 fps, faster so it keeps falling
+        controller.record_batch(4, 0.5)
+        self.assertEqual(controller.batch_size, 3)
+        return
+
+    def test_max_fps_turns_around_at_max_batch(self):
+        controller = AdaptiveBatchController(max_batch=2, initial_batch=2, window=1)
+        self.assertFalse(controller.record_batch(2, 1.0))
+        self.assertTrue(controller.record_batch(2, 0.5))
+        self.assertEqual(controller.batch_size, 1)
+        return
+
+    def test_que_size_follows_batch_size(self):
+        controller = AdaptiveBatchController(target_latency=0.1, que_scale=3, window=1)
+        self.assertEqual(controller.que_size, 3)
+        run_window(controller, 0.05)
+        self.assertEqual(controller.que_size, 6)
+        return
+
+    def test_metrics_and_history(self):
+        controller = AdaptiveBatchController(target_latency=0.1, que_scale=2, window=1, history_size=2)
+        for _ in range(3):
+            run_window(controller, 0.05, seconds=0.5)
+
+        history = controller.history
+        self.assertLen(history, 2)
+        self.assertEqual([point["batch_size"] for point in history], [2, 3])
+        self.assertEqual(history[-1]["que_size"], 6)
+        self.assertAllClose(history[-1]["latency_p90_ms"], 50.0)
+
+        metrics = controller.metrics()
+        self.assertEqual(metrics["mode"], "target_latency")
+        self.assertAllClose(metrics["target_latency_ms"], 100.0)
+        self.assertEqual(metrics["batch_size"], 4)
+        self.assertEqual(metrics["que_size"], 8)
+        self.assertAllClose(metrics["fps"], 6.0)
+        self.assertEqual(metrics["adjustments"], 2)
+        self.assertEqual(AdaptiveBatchController().metrics()["mode"], "max_fps")
+        return
+
+
+class ResizeQueTest(tf.test.TestCase):
+    def test_blocked_put_proceeds(self):
+        que = Queue(1)
+        que.put(0)
+        writer = threading.Thread(target=que.put, args=(1,), daemon=True)
+        writer.start()
+        writer.join(timeout=0.1)
+        self.assertTrue(writer.is_alive())
+
+        resize_que(que, 2)
+        writer.join(timeout=5)
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(que.qsize(), 2)
+        self.assertEqual(que.maxsize, 2)
+        return
+
+    def test_shrink(self):
+        que = Queue(4)
+        for i in range(3):
+            que.put(i)
+        resize_que(que, 2)
+        self.assertTrue(que.full())
+        self.assertEqual(que.qsize(), 3)
+        return
+
+
+class FastVideoWaitTimeTest(tf.test.TestCase):
+    def _video(self, wait_time=None):
+        # only the state used by _update_batch_size, so no capture or model is needed
+        video = FastVideo.__new__(FastVideo)
+        video._controller = AdaptiveBatchController(target_latency=0.1, window=1)
+        video._batch_size = video._controller.batch_size
+        video._load_que = Queue(video._controller.que_size)
+        video._user_wait_time = wait_time
+        video._wait_time = video._get_wait_time()
+        return video
+
+    def test_wait_time_follows_batch_size(self):
+        video = self._video()
+        self.assertAllClose(video._wait_time, 0.0001)
+        for batch_size in [2, 3]:
+            video._update_batch_size(video._batch_size, 0.01, [])
+            self.assertEqual(video._batch_size, batch_size)
+            self.assertAllClose(video._wait_time, 0.0015 * batch_size)
+            self.assertEqual(video._load_que.maxsize, video._controller.que_size)
+        return
+
+    def test_given_wait_time_is_kept(self):
+        video = self._video(wait_time=0.05)
+        video._update_batch_size(video._batch_size, 0.01, [])
+        self.assertEqual(video._batch_size, 2)
+        self.assertAllClose(video._wait_time, 0.05)
+        return
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -0,0 +1,108 @@
+import threading
+from unittest import mock
+
+import numpy as np
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo.demos import video_engine
+from yolo.demos.video_engine import StageStats
+from yolo.demos.video_engine import VideoEngine
+
+WIDTH, HEIGHT = 32, 24
+
+
+class FakeCapture(object):
+    """a video file of num_frames black frames"""
+    def __init__(self, source, num_frames=5):
+        self._frames = num_frames
+        self._open = True
+        return
+
+    def isOpened(self):
+        return self._open
+
+    def get(self, prop):
+        return WIDTH if prop == 3 else HEIGHT
+
+    def read(self):
+        if self._frames == 0:
+            return False, None
+        self._frames -= 1
+        return True, np.zeros([HEIGHT, WIDTH, 3], dtype=np.uint8)
+
+    def release(self):
+        self._open = False
+        return
+
+
+def stub_model(images):
+    """no detections for every image in the batch"""
+    batch = images.shape[0]
+    return {
+        "bbox": np.zeros([batch, 4, 4], np.float32),
+        "classes": np.zeros([batch, 4], np.float32),
+        "confidence": np.zeros([batch, 4], np.float32)
+    }
+
+
+class StageStatsTest(tf.test.TestCase):
+    def test_empty(self):
+        self.assertEqual({"count": 0, "fps": 0.0, "mean_ms": 0.0, "p50_ms": 0.0, "p99_ms": 0.0},
+                         StageStats("decode").summary())
+
+    def test_summary(self):
+        stats = StageStats("inference", window=3)
+        for latency in [1.0, 0.01, 0.02, 0.03]:
+            stats.record(latency, items=2)
+        summary = stats.summary()
+        # every item is counted, only the last window latencies are kept
+        self.assertEqual(8, summary["count"])
+        self.assertAllClose(20.0, summary["mean_ms"])
+        self.assertAllClose(20.0, summary["p50_ms"])
+        self.assertGreater(summary["fps"], 0.0)
+
+
+class VideoEngineTest(tf.test.TestCase, parameterized.TestCase):
+    def build_engine(self, num_sources, **kwargs):
+        with mock.patch.object(video_engine.cv2, "VideoCapture", FakeCapture):
+            return VideoEngine(list(range(1, num_sources + 1)),
+                               model=stub_model,
+                               process_width=16,
+                               process_height=16,
+                               labels=["object"],
+                               display=False,
+                               **kwargs)
+
+    @parameterized.named_parameters(("one_thread", 1, 1), ("many_threads", 2, 3))
+    def test_run_returns_at_end_of_stream(self, num_sources, num_preprocess_threads):
+        frames = []
+        engine = self.build_engine(num_sources,
+                                   max_batch=4,
+                                   latency_budget=0.01,
+                                   num_preprocess_threads=num_preprocess_threads,
+                                   on_frame=lambda stream_id, frame_id, *args: frames.append((stream_id, frame_id)))
+
+        runner = threading.Thread(target=lambda: engine.run(print_every=0.05), daemon=True)
+        runner.start()
+        runner.join(timeout=30)
+        self.assertFalse(runner.is_alive(), "run() did not return after the sources ended")
+
+        expected = [(stream_id, frame_id) for stream_id in range(num_sources) for frame_id in range(5)]
+        self.assertCountEqual(expected, frames)
+        stats = engine.stats()
+        self.assertEqual(5 * num_sources, stats["inference"]["count"])
+        self.assertEqual(5 * num_sources, stats["end_to_end"]["count"])
+
+    def test_stop(self):
+        engine = self.build_engine(1, num_preprocess_threads=2)
+        engine.start()
+        engine.stop()
+        runner = threading.Thread(target=engine.join, daemon=True)
+        runner.start()
+        runner.join(timeout=30)
+        self.assertFalse(runner.is_alive())
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -18,6 +18,8 @@ from yolo.utils.testing_utils import draw_box
 from yolo.utils.testing_utils import int_scale_boxes 
 from yolo.utils.testing_utils import gen_colors 
 from yolo.utils.testing_utils import get_coco_names
+from yolo.demos.batch_controller import AdaptiveBatchController
+from yolo.demos.batch_controller import resize_que
 
 
 class FastVideo(object):
@@ -53,6 +55,9 @@ class FastVideo(object):
         gpu_device: string for the device you would like to use to run the model, if the model you pass in is not standard make sure you prep 
                     the model on the same device that you pass in, by default /GPU:0
         preprocess_gpu: the gpu device you would like to use to preprocess the image if you have multiple. by default use the first /GPU:0
+        max_batch: integer for a fixed batch size. if None, the batch size and que depth are picked at runtime by an AdaptiveBatchController
+        target_latency: float number of seconds the adaptive batch size should keep the latency of each frame under, if None the
+                        batch size that gives the most fps is used
 
     Raises: 
         IOError: the video file you would like to use is not found 
@@ -75,7 +80,8 @@ class FastVideo(object):
                  scale_que = 1, 
                  policy = "float16",
                  gpu_device="/GPU:0",
-                 preprocess_gpu="/GPU:0"):
+                 preprocess_gpu="/GPU:0",
+                 target_latency=None):
         self._cap = cv2.VideoCapture(file_name)
         if not self._cap.isOpened():
             raise IOError("video file was not found")
@@ -102,23 +108,12 @@ class FastVideo(object):
         self._policy = policy
         self._model = self._load_model(model)
 
-        # fast but as close to one 2 one as possible
+        # the batch size is measured and adjusted at runtime unless a fixed size is given
         if max_batch == None:
-            if file_name == 0:
-                self._batch_size = 5  # 40 fps more conistent frame to frame
-            else:
-                # faster but more potential for delay from input to output
-                if tf.keras.mixed_precision.experimental.global_policy(
-                ).name == "mixed_float16" or tf.keras.mixed_precision.experimental.global_policy(
-                ).name == "float16":
-                    #self._batch_size = 9 # 45 fps faster but less frame to frame consistent, it will remain consistant, but there is opertunity for more frames to be loaded than
-                    self._batch_size = 5
-                else:
-                    self._batch_size = 3
-
-                if process_width > 416 or process_height > 416:
-                    self._batch_size = 3
+            self._controller = AdaptiveBatchController(target_latency=target_latency, que_scale=scale_que)
+            self._batch_size = self._controller.batch_size
         else:
+            self._controller = None
             self._batch_size = max_batch
 
         self._colors = gen_colors(self._classes)
@@ -132,10 +127,8 @@ class FastVideo(object):
         self._load_que = Queue(self._batch_size * scale_que)
         self._display_que = Queue(1 * scale_que)
         self._running = True
-        if self._batch_size != 1:
-            self._wait_time = 0.0015 * self._batch_size if wait_time == None else wait_time # 0.05 default
-        else:
-            self._wait_time = 0.0001
+        self._user_wait_time = wait_time
+        self._wait_time = self._get_wait_time()
         self._print_conf = print_conf
 
         self._read_fps = 1
@@ -211,12 +204,13 @@ class FastVideo(object):
 
                 # with the CPU load and process an image
                 timeout = 0
+                arrival = time.time()
                 success, image = self._cap.read()
                 with tf.device(process_device):
                     e = datetime.datetime.now()
                     image = preprocess(image)
-                    # then dump the image on the que
-                    self._load_que.put(image)
+                    # then dump the image on the que with the time it was read
+                    self._load_que.put((arrival, image))
                     f = datetime.datetime.now()
 
                 # compute the reading FPS
@@ -312,11 +306,12 @@ class FastVideo(object):
 
         # get one frame and put it inthe process que to get the process started
         if self._cap.isOpened():
+            arrival = time.time()
             success, image = self._cap.read()
             with tf.device(self._pre_process_device):
                 e = datetime.datetime.now()
                 image = preprocess(image)
-                self._load_que.put(image)
+                self._load_que.put((arrival, image))
                 f = datetime.datetime.now()
             with tf.device(self._gpu_device):
                 pimage = tf.image.resize(image,(self._p_width, self._p_height))
@@ -343,10 +338,12 @@ class FastVideo(object):
             while (self._cap.isOpened()):
                 # in case the load que has many frames in it, load one batch
                 proc = []
+                arrivals = []
                 for i in range(self._batch_size):
                     if self._load_que.empty():
                         break
-                    value = self._load_que.get()
+                    arrival, value = self._load_que.get()
+                    arrivals.append(arrival)
                     proc.append(value)
                     # for debugging
                     # we can watch it catch up to real time
@@ -370,6 +367,10 @@ class FastVideo(object):
                                                      self._width, self._height)
                 b = datetime.datetime.now()
 
+                # feed the measurements back to the batch size controller
+                if self._controller != None:
+                    self._update_batch_size(len(proc), (b - a).total_seconds(), arrivals)
+
                 # computation latency to see how much delay between input and output
                 if self._frames >= 1000:
                     self._frames = 0
@@ -435,6 +436,32 @@ class FastVideo(object):
             cv2.destroyAllWindows()
         return
 
+    def _update_batch_size(self, batch_size, seconds, arrivals):
+        now = time.time()
+        for arrival in arrivals:
+            self._controller.record_latency(now - arrival)
+        if self._controller.record_batch(batch_size, seconds):
+            self._batch_size = self._controller.batch_size
+            self._wait_time = self._get_wait_time()
+            resize_que(self._load_que, self._controller.que_size)
+        return
+
+    def _get_wait_time(self):
+        """the time the threads sleep while waiting on a que, it scales with the batch size unless wait_time was given"""
+        if self._batch_size != 1:
+            return 0.0015 * self._batch_size if self._user_wait_time == None else self._user_wait_time # 0.05 default
+        return 0.0001
+
+    def batch_metrics(self):
+        """
+        Return:
+            the current operating point of the adaptive batch size controller and the list of past operating points,
+            or None if a fixed batch size is used
+        """
+        if self._controller == None:
+            return None
+        return self._controller.metrics(), self._controller.history
+
     def print_opt(self):
         #make everything print pretty using ANSI
         print(
@@ -0,0 +1,431 @@
+import cv2
+import collections
+import numpy as np
+import time
+
+import threading as t
+from queue import Queue, Empty, Full
+
+import tensorflow as tf
+
+from yolo.utils.testing_utils import support_windows
+from yolo.utils.testing_utils import prep_gpu
+from yolo.utils.testing_utils import build_model
+from yolo.utils.testing_utils import draw_box
+from yolo.utils.testing_utils import gen_colors
+from yolo.utils.testing_utils import get_coco_names
+from yolo.demos.batch_controller import resize_que
+
+# placed on a que to tell the next stage that no more items will arrive
+_END = None
+
+
+class StageStats(object):
+    """
+    thread safe latency and throughput statistics for one stage of the engine. only the
+    last window latencies are kept so the percentiles follow the current load.
+
+    Args:
+        name: string name of the stage
+        window: integer number of latencies to keep for the percentiles
+    """
+    def __init__(self, name, window=1000):
+        self.name = name
+        self._latencies = collections.deque(maxlen=window)
+        self._count = 0
+        self._start = None
+        self._last = None
+        self._lock = t.Lock()
+        return
+
+    def record(self, latency, items=1):
+        """record that the stage took latency seconds to process items items"""
+        now = time.time()
+        with self._lock:
+            if self._start is None:
+                self._start = now - latency
+            self._last = now
+            self._count += items
+            self._latencies.append(latency)
+        return
+
+    def summary(self):
+        """
+        Return:
+            dict with the number of items processed, the throughput in items per second and
+            the mean, p50 and p99 latency in milliseconds
+        """
+        with self._lock:
+            latencies = np.array(self._latencies, dtype=np.float64) * 1000
+            count = self._count
+            elapsed = (self._last - self._start) if self._start is not None else 0.0
+        if latencies.size == 0:
+            return {"count": 0, "fps": 0.0, "mean_ms": 0.0, "p50_ms": 0.0, "p99_ms": 0.0}
+        return {
+            "count": count,
+            "fps": count / elapsed if elapsed > 0 else 0.0,
+            "mean_ms": float(np.mean(latencies)),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+        }
+
+
+class VideoEngine(object):
+    """
+    pipelined object detection for several video sources at once. decoding, preprocessing, inference, and drawing
+    each run in their own thread(s) connected by bounded blocking ques, so no stage has to poll or sleep while waiting
+    for the others. frames from all of the sources are grouped into dynamic batches: a batch is run as soon as it is full
+    or when the oldest frame in it has waited latency_budget seconds. the engine runs on the CPU by default, a GPU can be
+    used by passing its name as the device.
+
+    using a default model on two sources:
+        engine = VideoEngine(["test.mp4", 0], model="regular", process_width=416, process_height=416)
+        engine.run()
+        print(engine.stats())
+
+    Args:
+        sources: a list of strings for video files or integers for webcams
+        model: a string in {"regular", "tiny", "spp"} for the yolo model you would like to use, or a model object that
+               maps a batch of images to a dict with the keys bbox, classes, and confidence
+        model_version: string in {"v3", "v4"} used when the model is a string
+        process_width: the integer width that frames are resized to before inference
+        process_height: the integer height that frames are resized to before inference
+        max_batch: the largest batch of frames that is sent to the model at once
+        latency_budget: float number of seconds a frame can wait for the rest of its batch to arrive
+        que_size: integer size of each of the ques between the stages
+        num_preprocess_threads: number of threads used to resize and normalize frames
+        pad_batches: if True every batch is padded to max_batch so the model sees one input shape
+        device: string for the device to run the model on, /CPU:0 by default
+        labels: a List[string] of the name of the class associated with each prediction, defaults to COCO
+        display: if True each processed stream is shown in its own window
+        on_frame: optional callable(stream_id, frame_id, image, boxes, classes, confidence) called for each processed frame
+        policy: string for the dtype policy used when the model is a string
+        controller: optional AdaptiveBatchController, if given it picks the batch size and the depth of the que in front
+                    of the model at runtime instead of max_batch and que_size
+
+    Raises:
+        IOError: one of the video sources could not be opened
+        Exception: the model you input is a string and is not in the list of supported models
+    """
+    def __init__(self,
+                 sources,
+                 model="regular",
+                 model_version="v3",
+                 process_width=416,
+                 process_height=416,
+                 max_batch=8,
+                 latency_budget=0.05,
+                 que_size=32,
+                 num_preprocess_threads=2,
+                 pad_batches=True,
+                 device="/CPU:0",
+                 labels=None,
+                 display=True,
+                 on_frame=None,
+                 policy="float32",
+                 controller=None):
+        if not isinstance(sources, (list, tuple)):
+            sources = [sources]
+        self._sources = list(sources)
+        self._caps = []
+        for source in self._sources:
+            cap = cv2.VideoCapture(source)
+            if not cap.isOpened():
+                raise IOError(f"video source {source} was not found")
+            self._caps.append(cap)
+        self._sizes = [(int(cap.get(3)), int(cap.get(4))) for cap in self._caps]
+
+        #support for ANSI cahracters in windows
+        support_windows()
+
+        self._p_width = process_width
+        self._p_height = process_height
+        self._model_version = model_version
+        self._policy = policy
+        self._device = device
+        self._max_batch = max_batch
+        self._latency_budget = latency_budget
+        self._num_preprocess_threads = num_preprocess_threads
+        self._pad_batches = pad_batches
+        self._display = display
+        self._on_frame = on_frame
+        self._controller = controller
+        self._model = self._load_model(model)
+
+        self._labels = get_coco_names(path="yolo/dataloaders/dataset_specs/coco.names") if labels == None else labels
+        self._colors = gen_colors(len(self._labels))
+
+        self._decode_que = Queue(que_size)
+        self._preprocess_que = Queue(que_size if controller == None else controller.que_size)
+        self._draw_que = Queue(que_size)
+        self._running = t.Event()
+        self._threads = []
+        # the last preprocess thread to finish tells the inference thread that no more frames will arrive
+        self._preprocess_alive = 0
+        self._preprocess_lock = t.Lock()
+
+        self._stats = collections.OrderedDict(
+            (name, StageStats(name)) for name in ["decode", "preprocess", "inference", "draw", "end_to_end"])
+        return
+
+    def _load_model(self, model):
+        if model is None:
+            model = "regular"
+        if isinstance(model, str):
+            if model not in {"regular", "tiny", "spp"}:
+                raise Exception("unsupported default model")
+            if "GPU" in self._device.upper():
+                prep_gpu()
+            with tf.device(self._device):
+                model = build_model(name=model,
+                                    model_version=self._model_version,
+                                    w=self._p_width,
+                                    h=self._p_height,
+                                    policy=self._policy)
+        return model
+
+    def _put(self, que, item):
+        """blocking put that gives up once the engine is stopped, so a stopped consumer can not dead lock a producer"""
+        while True:
+            try:
+                que.put(item, timeout=0.1)
+                return True
+            except Full:
+                if not self._running.is_set():
+                    return False
+
+    def _get(self, que, timeout=None):
+        """blocking get that returns _END once the engine is stopped"""
+        deadline = None if timeout is None else time.time() + timeout
+        while self._running.is_set():
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.time())
+            if wait <= 0:
+                raise Empty
+            try:
+                return que.get(timeout=wait)
+            except Empty:
+                continue
+        return _END
+
+    def _decode(self, stream_id):
+        """read frames from one source and put them on the decode que"""
+        cap = self._caps[stream_id]
+        flip = isinstance(self._sources[stream_id], int)
+        frame_id = 0
+        while self._running.is_set() and cap.isOpened():
+            start = time.time()
+            success, image = cap.read()
+            if not success:
+                break
+            # flip the image to make it mirror if you are using a webcam
+            if flip:
+                image = cv2.flip(image, 1)
+            self._stats["decode"].record(time.time() - start)
+            if not self._put(self._decode_que, (stream_id, frame_id, start, image)):
+                break
+            frame_id += 1
+        return
+
+    def _preprocess(self):
+        """resize and normalize frames on the CPU"""
+        try:
+            self._preprocess_frames()
+        finally:
+            with self._preprocess_lock:
+                self._preprocess_alive -= 1
+                last = self._preprocess_alive == 0
+            if last:
+                self._put(self._preprocess_que, _END)
+        return
+
+    def _preprocess_frames(self):
+        while True:
+            item = self._get(self._decode_que)
+            if item is _END:
+                self._put(self._decode_que, _END)
+                break
+            stream_id, frame_id, arrival, image = item
+            start = time.time()
+            pimage = cv2.resize(image, (self._p_width, self._p_height))
+            pimage = pimage.astype(np.float32) / 255
+            self._stats["preprocess"].record(time.time() - start)
+            if not self._put(self._preprocess_que, (stream_id, frame_id, arrival, image, pimage)):
+                break
+        return
+
+    def _batch_size(self):
+        return self._max_batch if self._controller == None else self._controller.batch_size
+
+    def _next_batch(self):
+        """
+        wait for a frame, then collect frames until the batch is full or the first frame has
+        waited latency_budget seconds
+        """
+        first = self._get(self._preprocess_que)
+        if first is _END:
+            return [], True
+        batch = [first]
+        done = False
+        deadline = time.time() + self._latency_budget
+        while len(batch) < self._batch_size():
+            try:
+                item = self._get(self._preprocess_que, timeout=max(deadline - time.time(), 0.0))
+            except Empty:
+                break
+            if item is _END:
+                done = True
+                break
+            batch.append(item)
+        return batch, done
+
+    def _infer(self):
+        """run the model on dynamic batches of frames from all sources"""
+        model = self._model
+        predfunc = model.predict_on_batch if hasattr(model, "predict_on_batch") else model
+        while True:
+            batch, done = self._next_batch()
+            if batch:
+                images = np.stack([item[-1] for item in batch])
+                num = images.shape[0]
+                size = self._batch_size()
+                if self._pad_batches and num < size:
+                    pad = np.zeros((size - num,) + images.shape[1:], dtype=images.dtype)
+                    images = np.concatenate([images, pad], axis=0)
+
+                start = time.time()
+                with tf.device(self._device):
+                    pred = predfunc(images)
+                pred = {key: np.asarray(pred[key])[:num] for key in ["bbox", "classes", "confidence"]}
+                self._stats["inference"].record(time.time() - start, items=num)
+                if self._controller != None and self._controller.record_batch(num, time.time() - start):
+                    resize_que(self._preprocess_que, self._controller.que_size)
+
+                for i, (stream_id, frame_id, arrival, image, _) in enumerate(batch):
+                    result = (stream_id, frame_id, arrival, image, pred["bbox"][i], pred["classes"][i], pred["confidence"][i])
+                    if not self._put(self._draw_que, result):
+                        return
+            if done or not self._running.is_set():
+                break
+        self._put(self._draw_que, _END)
+        return
+
+    def _draw(self):
+        """draw the predictions on the original frames and hand them to the display or the callback"""
+        while True:
+            item = self._get(self._draw_que)
+            if item is _END:
+                break
+            stream_id, frame_id, arrival, image, boxes, classes, conf = item
+            start = time.time()
+            width, height = self._sizes[stream_id]
+            boxes = scale_boxes(boxes, width, height)
+            classes = classes.astype(np.int32)
+            draw_box(image, boxes, classes, conf, self._colors, self._labels)
+            if self._on_frame is not None:
+                self._on_frame(stream_id, frame_id, image, boxes, classes, conf)
+            if self._display:
+                cv2.imshow(f"stream {stream_id}", image)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    self._running.clear()
+            end = time.time()
+            self._stats["draw"].record(end - start)
+            self._stats["end_to_end"].record(end - arrival)
+            if self._controller != None:
+                self._controller.record_latency(end - arrival)
+        self._running.clear()
+        return
+
+    def start(self):
+        """start a thread for each stage of the pipeline"""
+        self._running.set()
+        self._preprocess_alive = self._num_preprocess_threads
+        decoders = [t.Thread(target=self._decode, args=(i,), daemon=True) for i in range(len(self._caps))]
+        preprocessors = [t.Thread(target=self._preprocess, daemon=True) for _ in range(self._num_preprocess_threads)]
+        self._threads = decoders + preprocessors + [t.Thread(target=self._infer, daemon=True),
+                                                    t.Thread(target=self._draw, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+        # once every source is exhausted, tell the preprocessing threads to finish
+        def close_decode():
+            for thread in decoders:
+                thread.join()
+            self._put(self._decode_que, _END)
+        closer = t.Thread(target=close_decode, daemon=True)
+        closer.start()
+        self._threads.append(closer)
+        return
+
+    def stop(self):
+        """stop every stage, frames that are still in the ques are dropped"""
+        self._running.clear()
+        return
+
+    def join(self):
+        """wait for every stage to finish and release the video sources"""
+        for thread in self._threads:
+            thread.join()
+        for cap in self._caps:
+            cap.release()
+        if self._display:
+            cv2.destroyAllWindows()
+        return
+
+    def run(self, print_every=1.0):
+        """process every source until they are exhausted, 'q' is pressed, or a KeyboardInterrupt"""
+        self.start()
+        try:
+            while any(thread.is_alive() for thread in self._threads):
+                time.sleep(print_every)
+                if print_every:
+                    self.print_opt()
+        except KeyboardInterrupt:
+            print("\n\n\n\n\n::: Video Engine Stopped -> KeyBoard Interrupt :::")
+            self.stop()
+        self.join()
+        return self.stats()
+
+    def stats(self):
+        """
+        Return:
+            dict mapping each stage (decode, preprocess, inference, draw, and end_to_end) to its statistics, and
+            controller to the current operating point if an AdaptiveBatchController is used
+        """
+        stats = {name: stage.summary() for name, stage in self._stats.items()}
+        if self._controller != None:
+            stats["controller"] = self._controller.metrics()
+        return stats
+
+    def print_opt(self):
+        #make everything print pretty using ANSI
+        for name, stat in self.stats().items():
+            if name == "controller":
+                continue
+            print(
+                f"                                \r{name:>10}: \033[1;32;40m{stat['p50_ms']:8.2f}\033[0m ms p50, "
+                f"\033[1;32;40m{stat['p99_ms']:8.2f}\033[0m ms p99, \033[1;34;40m{stat['fps']:7.1f}\033[0m fps",
+                end="\n")
+        print("\033[F" * (len(self._stats) + 1), end="\n")
+        return
+
+
+def scale_boxes(boxes, width, height):
+    """numpy version of int_scale_boxes, for normalized [ymin, xmin, ymax, xmax] boxes from the model"""
+    return np.stack([
+        (boxes[..., 1] * width).astype(np.int32),
+        (boxes[..., 3] * width).astype(np.int32),
+        (boxes[..., 0] * height).astype(np.int32),
+        (boxes[..., 2] * height).astype(np.int32)
+    ],
+                    axis=-1)
+
+
+if __name__ == "__main__":
+    engine = VideoEngine(["testing_files/test.mp4", "testing_files/test2.mp4"],
+                         model="regular",
+                         model_version="v3",
+                         process_width=416,
+                         process_height=416,
+                         max_batch=8,
+                         latency_budget=0.05)
+    print(engine.run())
@@ -0,0 +1,110 @@
+"""Accuracy and latency of the exported TFLite models compared with the float model on CPU."""
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from yolo.benchmarks.harness import measure
+from yolo.deploy.tflite_model import TFLiteModel
+
+
+def box_iou(boxes_1, boxes_2):
+    """pairwise iou of [n, 4] and [m, 4] numpy boxes in (ymin, xmin, ymax, xmax)"""
+    lt = np.maximum(boxes_1[:, None, :2], boxes_2[None, :, :2])
+    rb = np.minimum(boxes_1[:, None, 2:], boxes_2[None, :, 2:])
+    intersection = np.prod(np.clip(rb - lt, 0, None), axis=-1)
+    area_1 = np.prod(boxes_1[:, 2:] - boxes_1[:, :2], axis=-1)
+    area_2 = np.prod(boxes_2[:, 2:] - boxes_2[:, :2], axis=-1)
+    return intersection / np.maximum(area_1[:, None] + area_2[None, :] - intersection, 1e-9)
+
+
+def detection_agreement(reference, detections, iou_thresh=0.5):
+    """
+    match the detections of one image to the reference detections of the float model, greedily in order of
+    confidence. a match has the same class and an iou of at least iou_thresh. padded detections have confidence 0
+
+    Return:
+        number of matches, number of reference detections, number of detections
+    """
+    ref_valid = reference["confidence"] > 0
+    det_valid = detections["confidence"] > 0
+    ref_boxes, ref_classes = reference["bbox"][ref_valid], reference["classes"][ref_valid]
+    det_boxes, det_classes = detections["bbox"][det_valid], detections["classes"][det_valid]
+    order = np.argsort(-detections["confidence"][det_valid])
+    if len(ref_boxes) == 0 or len(det_boxes) == 0:
+        return 0, len(ref_boxes), len(det_boxes)
+
+    iou = box_iou(det_boxes, ref_boxes)
+    iou[det_classes[:, None] != ref_classes[None, :]] = 0
+    matched = np.zeros(len(ref_boxes), dtype=bool)
+    matches = 0
+    for i in order:
+        candidates = np.where(matched, 0, iou[i])
+        best = np.argmax(candidates)
+        if candidates[best] >= iou_thresh:
+            matched[best] = True
+            matches += 1
+    return matches, len(ref_boxes), len(det_boxes)
+
+
+def evaluation_images(dataset, num_images, image_size):
+    """float [0, 1] numpy images of a dataset of (image, label) batches"""
+    images = dataset.map(lambda image, label: image).unbatch()
+    images = images.map(lambda image: tf.image.resize(image, (image_size, image_size))).take(num_images)
+    return [image.numpy()[None] for image in images]
+
+
+def compare_models(module, tflite_paths, dataset, num_images=50, num_threads=None, iou_thresh=0.5, warmup=3, iterations=20):
+    """
+    run the float model and every TFLite model on the same images, decode all of them with the float
+    postprocessing, and measure the batch 1 latency of each on CPU
+
+    Args:
+        module: ExportModule of the float model
+        tflite_paths: dict mapping each mode to its .tflite file
+        dataset: dataset of (image, label) batches, ie the test set of model.process_datasets
+        num_images: number of images compared
+
+    Return:
+        dict mapping float (the SavedModel functions) and each mode to its latency (mean, p50, p99 ms and images
+        per second), and for the TFLite models the size of the file, the recall and precision of their detections
+        against the float detections, and the mean absolute error of their raw outputs
+    """
+    images = evaluation_images(dataset, num_images, module._image_size)
+    keys = module._keys
+
+    def postprocess(raw):
+        detections = module.postprocess(*[tf.constant(raw[key]) for key in keys])
+        return {name: value.numpy()[0] for name, value in detections.items()}
+
+    with tf.device("/CPU:0"):
+        reference_raw = []
+        reference = []
+        for image in images:
+            raw = module.raw(tf.constant(image))
+            raw = {key: raw[f"raw_{key}"].numpy() for key in keys}
+            reference_raw.append(raw)
+            reference.append(postprocess(raw))
+        report = {"float": measure(module.raw, (tf.constant(images[0]),), 1, warmup=warmup, iterations=iterations)}
+
+    for mode, path in tflite_paths.items():
+        model = TFLiteModel(path, module.raw_shapes(), num_threads=num_threads)
+        # the accuracy is compared at batch size 1, the size of the exported graph may be different
+        model.resize(1)
+        matches = num_reference = num_detections = 0
+        errors = []
+        for image, ref_raw, ref in zip(images, reference_raw, reference):
+            raw = model(image)
+            errors.extend(np.mean(np.abs(raw[key] - ref_raw[key])) for key in keys)
+            m, r, d = detection_agreement(ref, postprocess(raw), iou_thresh=iou_thresh)
+            matches, num_reference, num_detections = matches + m, num_reference + r, num_detections + d
+
+        uint8_image = (images[0] * 255).round().astype(np.uint8)
+        result = measure(model, (uint8_image,), 1, warmup=warmup, iterations=iterations)
+        result["size_mb"] = os.path.getsize(path) / 2**20
+        result["recall"] = matches / num_reference if num_reference > 0 else 1.0
+        result["precision"] = matches / num_detections if num_detections > 0 else 1.0
+        result["raw_mae"] = float(np.mean(errors))
+        report[mode] = result
+
+    return report
@@ -0,0 +1,317 @@
+"""
+Export a Yolov3 or Yolov4 model as a SavedModel and as float16, dynamic range, and full integer TFLite models.
+
+    python -m yolo.deploy.export --model v4 --size 416 --output export/ --darknet
+    python -m yolo.deploy.export --model v3-tiny --weights tiny.h5 --modes float16,int8 --data_dir ~/tensorflow_datasets
+
+the export directory has:
+    saved_model/: signatures serving_default (uint8 images of any size to detections), raw (float images to the
+                  head outputs), and postprocess (head outputs to detections)
+    {mode}.tflite: the backbone, neck, and head of every mode, with a uint8 image input
+    postprocess.tflite: the float decode and nms, with one [batch, max_boxes, 6] output of the boxes (ymin, xmin,
+                        ymax, xmax), classes, and confidences. it can need the flex delegate for the nms loop
+    export.json: the shapes and settings needed to run the models, see yolo.deploy.tflite_model
+    comparison.json: the latency and the agreement of every TFLite model with the float model on CPU
+"""
+import argparse
+import json
+import os
+import sys
+
+import tensorflow as tf
+
+from yolo.modeling.building_blocks import YoloLayer
+
+TFLITE_MODES = ("float32", "float16", "dynamic", "int8")
+
+
+class ExportModule(tf.Module):
+    """
+    the functions of a model that are exported. the decode uses the static shape YoloLayer, so it works in TFLite
+    and on a fixed size input.
+
+    Args:
+        model: a built Yolov3 or Yolov4 model
+        image_size: size of the square input images
+        batch_size: batch size of the TFLite models, the SavedModel takes any batch size
+        pre_nms_top_k: number of predictions of each path kept before the nms
+    """
+    def __init__(self, model, image_size=416, batch_size=1, pre_nms_top_k=1000):
+        super().__init__()
+        self._model = model
+        self._image_size = image_size
+        self._batch_size = batch_size
+        self._keys = list(model._masks.keys())
+        self._decode = YoloLayer(masks=model._masks,
+                                 anchors=model._boxes,
+                                 thresh=model._thresh,
+                                 cls_thresh=model._class_thresh,
+                                 max_boxes=model._max_boxes,
+                                 path_scale=model._path_scales,
+                                 scale_xy=model._x_y_scales,
+                                 static_shapes=True,
+                                 pre_nms_top_k=pre_nms_top_k)
+
+        image = [None, image_size, image_size, 3]
+        self.serve = tf.function(self._serve, input_signature=[tf.TensorSpec([None, None, None, 3], tf.uint8, name="images")])
+        self.raw = tf.function(self._raw, input_signature=[tf.TensorSpec(image, tf.float32, name="images")])
+        self.postprocess = tf.function(self._postprocess, input_signature=[
+            tf.TensorSpec([None, *self.raw_shapes()[key][1:]], tf.float32, name=f"raw_{key}") for key in self._keys
+        ])
+        return
+
+    def raw_shapes(self, batch_size=None):
+        """dict mapping each path key to the shape of its head output"""
+        model = self._model
+        return {
+            key: [batch_size, self._image_size // model._path_scales[key], self._image_size // model._path_scales[key],
+                  len(model._masks[key]) * (model._classes + 5)] for key in self._keys
+        }
+
+    def _forward(self, images):
+        model = self._model
+        maps = model._backbone(images, training=False)
+        if getattr(model, "_neck", None) != None:
+            maps = model._neck(maps, training=False)
+        raw = model._head(maps, training=False)
+        return {key: tf.cast(raw[key], tf.float32) for key in self._keys}
+
+    def _detect(self, raw):
+        detections = self._decode(raw)
+        return {"bbox": detections["bbox"], "classes": detections["classes"], "confidence": detections["confidence"]}
+
+    def _preprocess(self, images):
+        """uint8 images of any size to float [0, 1] images of the model size, the boxes are relative so they need no rescaling"""
+        images = tf.image.convert_image_dtype(images, tf.float32)
+        if images.shape[1] != self._image_size or images.shape[2] != self._image_size:
+            images = tf.image.resize(images, (self._image_size, self._image_size))
+        return images
+
+    def _serve(self, images):
+        return self._detect(self._forward(self._preprocess(images)))
+
+    def _raw(self, images):
+        return {f"raw_{key}": value for key, value in self._forward(images).items()}
+
+    def _postprocess(self, *raw):
+        return self._detect(dict(zip(self._keys, raw)))
+
+    def _postprocess_packed(self, *raw):
+        # the outputs of a TFLite model are not named, so the detections are packed into one tensor
+        detections = self._postprocess(*raw)
+        return tf.concat([detections["bbox"], tf.cast(detections["classes"][..., None], tf.float32),
+                          detections["confidence"][..., None]], axis=-1)
+
+    def _raw_uint8(self, images):
+        return self._raw(tf.image.convert_image_dtype(images, tf.float32))
+
+    def signatures(self):
+        return {
+            "serving_default": self.serve.get_concrete_function(),
+            "raw": self.raw.get_concrete_function(),
+            "postprocess": self.postprocess.get_concrete_function(),
+        }
+
+    def tflite_function(self, postprocess=False, dtype=tf.uint8):
+        """
+        concrete function with the static batch size of the TFLite models. the uint8 input is converted to float in
+        the model, a float input is for the quantized models, which quantize the float [0, 1] input to uint8 themselves
+        """
+        if postprocess:
+            specs = [tf.TensorSpec(shape, tf.float32, name=f"raw_{key}") for key, shape in self.raw_shapes(self._batch_size).items()]
+            return tf.function(self._postprocess_packed).get_concrete_function(*specs)
+        spec = tf.TensorSpec([self._batch_size, self._image_size, self._image_size, 3], dtype, name="images")
+        if dtype == tf.uint8:
+            return tf.function(self._raw_uint8).get_concrete_function(spec)
+        return tf.function(self._raw).get_concrete_function(spec)
+
+    def metadata(self):
+        model = self._model
+        return {
+            "image_size": self._image_size,
+            "batch_size": self._batch_size,
+            "keys": self._keys,
+            "raw_shapes": self.raw_shapes(self._batch_size),
+            "classes": model._classes,
+            "masks": {key: list(mask) for key, mask in model._masks.items()},
+            "anchors": [list(anchor) for anchor in model._boxes],
+            "path_scales": dict(model._path_scales),
+            "x_y_scales": dict(model._x_y_scales),
+            "thresh": model._thresh,
+            "class_thresh": model._class_thresh,
+            "max_boxes": model._max_boxes,
+        }
+
+    def save(self, path):
+        tf.saved_model.save(self, path, signatures=self.signatures())
+        return path
+
+
+def representative_dataset(dataset, num_samples=100, image_size=None):
+    """
+    calibration images for full integer quantization from a dataset of (image, label) batches of the input
+    pipeline, ie the test set of model.process_datasets. the images are float in [0, 1]
+
+    Return:
+        a generator function for TFLiteConverter.representative_dataset
+    """
+    images = dataset.map(lambda image, label: image).unbatch()
+    if image_size != None:
+        images = images.map(lambda image: tf.image.resize(image, (image_size, image_size)))
+    images = images.take(num_samples).batch(1)
+
+    def gen():
+        for image in images:
+            yield [tf.cast(image, tf.float32)]
+    return gen
+
+
+def convert_tflite(module, mode="float32", representative_data=None, postprocess=False):
+    """
+    convert the head outputs (or the postprocessing) of an ExportModule to TFLite
+
+    Args:
+        module: ExportModule
+        mode: float32, float16 (float16 weights), dynamic (int8 weights, float activations), or int8 (int8 weights
+              and activations, needs representative_data). every mode takes uint8 images
+        representative_data: generator function of calibration inputs, see representative_dataset
+        postprocess: convert the float decode and nms instead, TF ops are allowed for the nms loop
+
+    Return:
+        the TFLite model as bytes
+    """
+    if mode not in TFLITE_MODES:
+        raise ValueError(f"unknown mode {mode}, options are {TFLITE_MODES}")
+    dtype = tf.float32 if mode == "int8" else tf.uint8
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([module.tflite_function(postprocess, dtype)])
+    if postprocess:
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+        return converter.convert()
+
+    if mode == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif mode == "dynamic":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif mode == "int8":
+        if representative_data == None:
+            raise ValueError("int8 quantization needs representative_data for the calibration")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_data
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8
+    return converter.convert()
+
+
+def export(model,
+           export_dir,
+           image_size=416,
+           modes=TFLITE_MODES,
+           calibration=None,
+           evaluation=None,
+           num_calibration=100,
+           num_evaluation=50,
+           batch_size=1,
+           num_threads=None,
+           warmup=3,
+           iterations=20):
+    """
+    write the SavedModel, the TFLite model of every mode, and the postprocessing model to export_dir, and compare
+    the TFLite models with the float model
+
+    Args:
+        model: a built Yolov3 or Yolov4 model
+        modes: TFLite modes to export, see convert_tflite
+        calibration: dataset of (image, label) batches used to calibrate the int8 model
+        evaluation: dataset of (image, label) batches used for the comparison, the calibration dataset if None
+        num_calibration: number of calibration images
+        num_evaluation: number of images of the comparison, 0 skips the comparison
+        num_threads: number of threads of the interpreters in the comparison
+        warmup, iterations: calls before and during the latency measurement of each model
+
+    Return:
+        dict with the paths of the exported files and the comparison, see compare_models
+    """
+    from yolo.deploy.evaluate import compare_models
+    tf.io.gfile.makedirs(export_dir)
+    module = ExportModule(model, image_size=image_size, batch_size=batch_size)
+    paths = {"saved_model": module.save(os.path.join(export_dir, "saved_model"))}
+
+    representative = None
+    if calibration != None:
+        representative = representative_dataset(calibration, num_calibration, image_size)
+    for mode in modes:
+        if mode == "int8" and representative == None:
+            print("skipping int8, it needs a calibration dataset")
+            continue
+        paths[mode] = os.path.join(export_dir, f"{mode}.tflite")
+        with tf.io.gfile.GFile(paths[mode], "wb") as f:
+            f.write(convert_tflite(module, mode, representative))
+
+    try:
+        postprocess = convert_tflite(module, postprocess=True)
+        paths["postprocess"] = os.path.join(export_dir, "postprocess.tflite")
+        with tf.io.gfile.GFile(paths["postprocess"], "wb") as f:
+            f.write(postprocess)
+    except Exception as e:
+        # the SavedModel postprocess signature still has the decode
+        print(f"postprocess.tflite not written: {e}")
+
+    with tf.io.gfile.GFile(os.path.join(export_dir, "export.json"), "w") as f:
+        json.dump(module.metadata(), f, indent=2)
+
+    comparison = None
+    evaluation = calibration if evaluation == None else evaluation
+    if evaluation != None and num_evaluation > 0:
+        tflite_paths = {mode: path for mode, path in paths.items() if mode in TFLITE_MODES}
+        comparison = compare_models(module, tflite_paths, evaluation, num_images=num_evaluation, num_threads=num_threads,
+                                    warmup=warmup, iterations=iterations)
+        with tf.io.gfile.GFile(os.path.join(export_dir, "comparison.json"), "w") as f:
+            json.dump(comparison, f, indent=2)
+    return {"paths": paths, "comparison": comparison}
+
+
+def main(argv=None):
+    from yolo.benchmarks.cases import MODELS
+    from yolo.benchmarks.cases import build_model
+    args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    args.add_argument("--model", default="v4", choices=tuple(MODELS))
+    args.add_argument("--classes", type=int, default=80)
+    args.add_argument("--weights", default=None, help="keras weights of the model")
+    args.add_argument("--darknet", action="store_true", help="load the DarkNet weights of the model")
+    args.add_argument("--size", type=int, default=416)
+    args.add_argument("--batch_size", type=int, default=1, help="batch size of the TFLite models")
+    args.add_argument("--modes", default=",".join(TFLITE_MODES))
+    args.add_argument("--output", default="export")
+    args.add_argument("--dataset", default="coco", help="tfds dataset of the calibration and comparison images")
+    args.add_argument("--split", default="validation")
+    args.add_argument("--data_dir", default=None)
+    args.add_argument("--num_calibration", type=int, default=100)
+    args.add_argument("--num_evaluation", type=int, default=50)
+    args.add_argument("--num_threads", type=int, default=None)
+    args = args.parse_args(argv)
+
+    model = build_model(args.model, classes=args.classes)
+    if args.darknet:
+        model.load_weights_from_dn(use_cache=True)
+    elif args.weights != None:
+        model.load_weights(args.weights)
+
+    calibration = None
+    if args.num_calibration > 0 or args.num_evaluation > 0:
+        import tensorflow_datasets as tfds
+        data = tfds.load(args.dataset, split=args.split, data_dir=args.data_dir, shuffle_files=False)
+        _, calibration = model.process_datasets(data.take(1), data, batch_size=1, image_w=args.size,
+                                                image_h=args.size, fixed_size=True)
+
+    result = export(model, args.output, image_size=args.size, modes=[m for m in args.modes.split(",") if m != ""],
+                    calibration=calibration, num_calibration=args.num_calibration,
+                    num_evaluation=args.num_evaluation, batch_size=args.batch_size, num_threads=args.num_threads)
+    for mode, stats in (result["comparison"] or {}).items():
+        print(f"{mode:<12s} {stats.get('size_mb', 0.0):8.2f} MB  p50: {stats['p50_ms']:10.2f} ms  "
+              f"recall: {stats.get('recall', 1.0):6.3f}  precision: {stats.get('precision', 1.0):6.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
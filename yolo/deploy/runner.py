@@ -0,0 +1,327 @@
+"""
+Batched CPU inference of an exported YOLO model (see yolo.deploy.export) with the SavedModel or a pool of TFLite
+interpreters. images go in as uint8 numpy batches and detections come out as numpy arrays.
+
+    python -m yolo.deploy.runner export/ --mode int8 --images photos/ --batch_size 8 --workers 4 --output detections.json
+    python -m yolo.deploy.runner export/ --mode saved_model --video 0 --intra_op_threads 4
+
+throughput mode (--images) reads a directory with a parallel tf.data pipeline and keeps every worker busy with a
+batch, latency mode (--video, or run_stream) runs each frame as soon as it arrives with a batch of 1.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import queue
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from yolo.training.step_profiler import summarize
+from yolo.deploy.tflite_model import TFLiteModel
+from yolo.deploy.tflite_model import TFLitePostprocess
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png", "*.bmp")
+
+
+def configure_threads(intra_op_threads=None, inter_op_threads=None):
+    """set the TF thread pools of the SavedModel, only possible before TF runs its first op"""
+    try:
+        if intra_op_threads != None:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        if inter_op_threads != None:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError as e:
+        print(f"thread pools not changed, TensorFlow is already initialized: {e}")
+    return
+
+
+def _resize_indices(in_size, out_size):
+    """the two source pixels and the weight of the second one for each output pixel, with half pixel centers"""
+    centers = (np.arange(out_size, dtype=np.float32) + 0.5) * (in_size / out_size) - 0.5
+    centers = np.clip(centers, 0, in_size - 1)
+    lower = np.floor(centers).astype(np.int64)
+    upper = np.minimum(lower + 1, in_size - 1)
+    return lower, upper, centers - lower
+
+
+def resize_images(images, size):
+    """
+    uint8 numpy images resized to size x size, the detections are relative so they need no rescaling. the bilinear
+    resize of tf.image.resize done in numpy, so a frame does not go through eager TF on its way to the interpreter
+    """
+    if images.shape[1] == size and images.shape[2] == size:
+        return images
+    y0, y1, fy = _resize_indices(images.shape[1], size)
+    x0, x1, fx = _resize_indices(images.shape[2], size)
+    images = images.astype(np.float32)
+    fy = fy[None, :, None, None]
+    rows = images[:, y0] * (1 - fy) + images[:, y1] * fy
+    fx = fx[None, None, :, None]
+    resized = rows[:, :, x0] * (1 - fx) + rows[:, :, x1] * fx
+    return np.clip(np.round(resized), 0, 255).astype(np.uint8)
+
+
+class SavedModelBackend(object):
+    """the serving_default signature of the SavedModel, which converts and resizes the uint8 images itself"""
+    def __init__(self, path):
+        self._model = tf.saved_model.load(path)
+        self._serve = self._model.signatures["serving_default"]
+        return
+
+    def __call__(self, images):
+        detections = self._serve(images=tf.constant(images, tf.uint8))
+        return {"bbox": detections["bbox"].numpy(),
+                "classes": detections["classes"].numpy().astype(np.int32),
+                "confidence": detections["confidence"].numpy()}
+
+
+class TFLiteBackend(object):
+    """
+    a pool of TFLite interpreters, each call takes a free interpreter and its postprocessing, so num_workers
+    batches run at the same time. the interpreters release the GIL while they run
+
+    Args:
+        export_dir: directory written by yolo.deploy.export
+        mode: the TFLite model to run, float32, float16, dynamic, or int8
+        num_workers: number of interpreters
+        threads_per_worker: number of threads of each interpreter
+    """
+    def __init__(self, export_dir, mode, metadata, num_workers=1, threads_per_worker=None):
+        self._image_size = metadata["image_size"]
+        shapes = metadata["raw_shapes"]
+        model_path = os.path.join(export_dir, f"{mode}.tflite")
+        postprocess_path = os.path.join(export_dir, "postprocess.tflite")
+
+        saved_postprocess = None
+        if not os.path.exists(postprocess_path):
+            # the decode of the SavedModel is used when the nms could not be converted
+            saved_postprocess = tf.saved_model.load(os.path.join(export_dir, "saved_model")).signatures["postprocess"]
+
+        self._pool = queue.Queue()
+        for _ in range(num_workers):
+            model = TFLiteModel(model_path, shapes, num_threads=threads_per_worker)
+            if saved_postprocess == None:
+                postprocess = TFLitePostprocess(postprocess_path, shapes, num_threads=threads_per_worker)
+            else:
+                postprocess = self._saved_postprocess(saved_postprocess)
+            self._pool.put((model, postprocess))
+        return
+
+    @staticmethod
+    def _saved_postprocess(signature):
+        def postprocess(raw):
+            detections = signature(**{f"raw_{key}": tf.constant(value) for key, value in raw.items()})
+            return {"bbox": detections["bbox"].numpy(),
+                    "classes": detections["classes"].numpy().astype(np.int32),
+                    "confidence": detections["confidence"].numpy()}
+        return postprocess
+
+    def __call__(self, images):
+        images = resize_images(images, self._image_size)
+        model, postprocess = self._pool.get()
+        try:
+            return postprocess(model(images))
+        finally:
+            self._pool.put((model, postprocess))
+
+
+class InferenceRunner(object):
+    """
+    run an exported model on uint8 numpy images on CPU
+
+    example:
+        runner = InferenceRunner("export", mode="int8", num_workers=4, threads_per_worker=2)
+        detections = runner(images)  # uint8 [batch, height, width, 3]
+        for paths, detections in runner.run_directory("photos", batch_size=8):
+            ...
+        print(runner.stats())
+
+    Args:
+        export_dir: directory written by yolo.deploy.export
+        mode: saved_model, or the TFLite model to run (float32, float16, dynamic, int8)
+        num_workers: number of batches that run at the same time, the number of interpreters for TFLite
+        threads_per_worker: number of threads of each TFLite interpreter
+        intra_op_threads: size of the TF thread pool that runs each op of the SavedModel
+        inter_op_threads: size of the TF thread pool that runs independent ops of the SavedModel
+    """
+    def __init__(self,
+                 export_dir,
+                 mode="int8",
+                 num_workers=1,
+                 threads_per_worker=None,
+                 intra_op_threads=None,
+                 inter_op_threads=None):
+        configure_threads(intra_op_threads, inter_op_threads)
+        with open(os.path.join(export_dir, "export.json")) as f:
+            self._metadata = json.load(f)
+        self._image_size = self._metadata["image_size"]
+        if mode == "saved_model":
+            self._backend = SavedModelBackend(os.path.join(export_dir, "saved_model"))
+        else:
+            self._backend = TFLiteBackend(export_dir, mode, self._metadata, num_workers=num_workers,
+                                          threads_per_worker=threads_per_worker)
+        self._num_workers = num_workers
+        self._executor = concurrent.futures.ThreadPoolExecutor(num_workers)
+        self._latencies = {"throughput": [], "latency": []}
+        self._images = {"throughput": 0, "latency": 0}
+        self._elapsed = {"throughput": 0.0, "latency": 0.0}
+        return
+
+    @property
+    def image_size(self):
+        return self._image_size
+
+    def __call__(self, images):
+        """
+        Args:
+            images: uint8 numpy batch [batch, height, width, 3], RGB
+
+        Return:
+            dict with the bbox [batch, max_boxes, 4] (ymin, xmin, ymax, xmax relative to the image), classes, and
+            confidence [batch, max_boxes] numpy arrays, padded detections have confidence 0
+        """
+        images = np.asarray(images)
+        if images.ndim == 3:
+            images = images[None]
+        if images.dtype != np.uint8:
+            raise ValueError(f"images should be uint8, not {images.dtype}")
+        return self._backend(images)
+
+    def _timed(self, mode, images):
+        start = time.perf_counter()
+        detections = self(images)
+        self._latencies[mode].append(time.perf_counter() - start)
+        return detections
+
+    def submit(self, images):
+        """run a batch on the worker pool, returns a concurrent.futures.Future of the detections"""
+        return self._executor.submit(self._timed, "throughput", images)
+
+    def image_dataset(self, directory, batch_size=8, patterns=IMAGE_PATTERNS):
+        """batches of (paths, uint8 images of the model size) of every image in directory, decoded in parallel"""
+        paths = sorted(path for pattern in patterns for path in tf.io.gfile.glob(os.path.join(directory, pattern)))
+        size = self._image_size
+
+        def load(path):
+            image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+            image = tf.image.resize(image, (size, size))
+            return path, tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+
+        dataset = tf.data.Dataset.from_tensor_slices(paths)
+        dataset = dataset.map(load, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+        return dataset.batch(batch_size).prefetch(tf.data.experimental.AUTOTUNE)
+
+    def run_directory(self, directory, batch_size=8, patterns=IMAGE_PATTERNS):
+        """
+        throughput mode, run every image of a directory with up to 2 batches per worker in flight and yield
+        (paths, detections) of each batch in order
+        """
+        pending = []
+        start = time.perf_counter()
+        for paths, images in self.image_dataset(directory, batch_size, patterns).as_numpy_iterator():
+            pending.append((paths, self.submit(images)))
+            self._images["throughput"] += len(paths)
+            if len(pending) >= 2 * self._num_workers:
+                paths, future = pending.pop(0)
+                yield [path.decode() for path in paths], future.result()
+        for paths, future in pending:
+            yield [path.decode() for path in paths], future.result()
+        self._elapsed["throughput"] += time.perf_counter() - start
+        return
+
+    def run_stream(self, frames):
+        """
+        latency mode, run each frame of an iterable of uint8 RGB frames as it arrives and yield its detections,
+        without batching or queueing frames
+        """
+        for frame in frames:
+            start = time.perf_counter()
+            detections = self._timed("latency", np.asarray(frame)[None])
+            self._images["latency"] += 1
+            self._elapsed["latency"] += time.perf_counter() - start
+            yield {key: value[0] for key, value in detections.items()}
+        return
+
+    def stats(self):
+        """
+        Return:
+            dict mapping the throughput and latency modes to the count, mean, p50, and p99 ms of their calls and the
+            images per second
+        """
+        stats = {}
+        for mode, latencies in self._latencies.items():
+            if len(latencies) == 0:
+                continue
+            stats[mode] = summarize(latencies)
+            elapsed = self._elapsed[mode]
+            stats[mode]["images_per_sec"] = self._images[mode] / elapsed if elapsed > 0 else 0.0
+        return stats
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return
+
+
+def video_frames(source):
+    """RGB frames of a video file or webcam id, read with cv2"""
+    import cv2
+    cap = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    try:
+        while cap.isOpened():
+            success, frame = cap.read()
+            if not success:
+                break
+            yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    finally:
+        cap.release()
+    return
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    args.add_argument("export_dir")
+    args.add_argument("--mode", default="int8", help="saved_model, float32, float16, dynamic, or int8")
+    args.add_argument("--images", default=None, help="directory of images, throughput mode")
+    args.add_argument("--video", default=None, help="video file or webcam id, latency mode")
+    args.add_argument("--batch_size", type=int, default=8)
+    args.add_argument("--workers", type=int, default=1)
+    args.add_argument("--threads_per_worker", type=int, default=None)
+    args.add_argument("--intra_op_threads", type=int, default=None)
+    args.add_argument("--inter_op_threads", type=int, default=None)
+    args.add_argument("--output", default=None, help="json file of the detections of every image")
+    args = args.parse_args(argv)
+
+    results = {}
+    with InferenceRunner(args.export_dir, mode=args.mode, num_workers=args.workers,
+                         threads_per_worker=args.threads_per_worker, intra_op_threads=args.intra_op_threads,
+                         inter_op_threads=args.inter_op_threads) as runner:
+        if args.images != None:
+            for paths, detections in runner.run_directory(args.images, batch_size=args.batch_size):
+                for i, path in enumerate(paths):
+                    valid = detections["confidence"][i] > 0
+                    results[path] = {key: value[i][valid].tolist() for key, value in detections.items()}
+        if args.video != None:
+            for _ in runner.run_stream(video_frames(args.video)):
+                pass
+        for mode, stats in runner.stats().items():
+            print(f"{mode:<12s} p50: {stats['p50_ms']:10.2f} ms  p99: {stats['p99_ms']:10.2f} ms  "
+                  f"{stats['images_per_sec']:10.1f} images/sec")
+
+    if args.output != None:
+        with open(args.output, "w") as f:
+            json.dump(results, f)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
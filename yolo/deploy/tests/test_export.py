@@ -0,0 +1,85 @@
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo.benchmarks import synthetic
+from yolo.benchmarks.cases import build_model
+from yolo.deploy.evaluate import detection_agreement
+from yolo.deploy.export import ExportModule
+from yolo.deploy.export import convert_tflite
+from yolo.deploy.export import export
+from yolo.deploy.export import representative_dataset
+from yolo.deploy.tflite_model import TFLiteModel
+
+SIZE = 64
+
+
+def image_batches(num_images=4):
+    images = synthetic.images(num_images, SIZE)
+    return tf.data.Dataset.from_tensor_slices((images, tf.zeros([num_images]))).batch(2)
+
+
+class ExportTest(tf.test.TestCase, parameterized.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.model = build_model("v3-tiny", classes=10)
+        cls.module = ExportModule(cls.model, image_size=SIZE)
+
+    def test_saved_model_signatures(self):
+        path = self.module.save(os.path.join(self.get_temp_dir(), "saved_model"))
+        loaded = tf.saved_model.load(path)
+        self.assertCountEqual(["serving_default", "raw", "postprocess"], list(loaded.signatures))
+
+        images = synthetic.images(2, SIZE)
+        raw = loaded.signatures["raw"](images=images)
+        expected = self.module.raw(images)
+        for key in expected:
+            self.assertAllClose(expected[key], raw[key], atol=1e-4)
+
+        uint8 = tf.image.convert_image_dtype(images, tf.uint8)
+        detections = loaded.signatures["serving_default"](images=uint8)
+        self.assertEqual([2, self.model._max_boxes, 4], detections["bbox"].shape.as_list())
+        post = loaded.signatures["postprocess"](**raw)
+        self.assertAllClose(self.module.serve(uint8)["confidence"], post["confidence"], atol=1e-3)
+
+    @parameterized.named_parameters(("float32", "float32", 1e-4), ("float16", "float16", 1e-2), ("dynamic", "dynamic", 0.2),
+                                    ("int8", "int8", 0.5))
+    def test_tflite_matches_float(self, mode, atol):
+        representative = representative_dataset(image_batches(), num_samples=4)
+        model = TFLiteModel(convert_tflite(self.module, mode, representative), self.module.raw_shapes())
+        self.assertEqual(np.uint8, model.input_dtype)
+
+        images = (synthetic.images(1, SIZE).numpy() * 255).round().astype(np.uint8)
+        raw = model(images)
+        expected = self.module.raw(tf.constant(images / 255.0, tf.float32))
+        for key in self.module._keys:
+            self.assertEqual(expected[f"raw_{key}"].shape, raw[key].shape)
+            self.assertLess(np.mean(np.abs(expected[f"raw_{key}"].numpy() - raw[key])), atol)
+
+    def test_detection_agreement(self):
+        reference = {"bbox": np.array([[0, 0, 0.5, 0.5], [0.5, 0.5, 1, 1], [0, 0, 0, 0]]),
+                     "classes": np.array([1, 2, 0]),
+                     "confidence": np.array([0.9, 0.8, 0.0])}
+        detections = {"bbox": np.array([[0, 0, 0.5, 0.45], [0.5, 0.5, 1, 1], [0, 0, 1, 1]]),
+                      "classes": np.array([1, 3, 0]),
+                      "confidence": np.array([0.7, 0.9, 0.6])}
+        self.assertEqual((1, 2, 3), detection_agreement(reference, detections))
+
+    def test_export(self):
+        export_dir = os.path.join(self.get_temp_dir(), "export")
+        result = export(self.model, export_dir, image_size=SIZE, modes=("float32", "int8"), calibration=image_batches(),
+                        num_calibration=4, num_evaluation=2, warmup=1, iterations=2)
+        for name in ("float32.tflite", "int8.tflite", "export.json", "comparison.json"):
+            self.assertTrue(os.path.exists(os.path.join(export_dir, name)))
+        with open(os.path.join(export_dir, "export.json")) as f:
+            self.assertEqual(SIZE, json.load(f)["image_size"])
+        self.assertCountEqual(["float", "float32", "int8"], list(result["comparison"]))
+        self.assertAlmostEqual(1.0, result["comparison"]["float32"]["recall"], places=3)
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo.benchmarks import synthetic
+from yolo.benchmarks.cases import build_model
+from yolo.deploy.export import export
+from yolo.deploy.runner import InferenceRunner
+from yolo.deploy.runner import resize_images
+
+SIZE = 64
+
+
+def uint8_images(num_images, size=SIZE):
+    return (synthetic.images(num_images, size).numpy() * 255).round().astype(np.uint8)
+
+
+class InferenceRunnerTest(tf.test.TestCase, parameterized.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.export_dir = os.path.join(tf.compat.v1.test.get_temp_dir(), "runner_export")
+        model = build_model("v3-tiny", classes=10)
+        export(model, cls.export_dir, image_size=SIZE, modes=("float32",), num_evaluation=0)
+
+    @parameterized.named_parameters(("saved_model", "saved_model"), ("float32", "float32"))
+    def test_batch(self, mode):
+        with InferenceRunner(self.export_dir, mode=mode, num_workers=2) as runner:
+            detections = runner(uint8_images(3))
+            self.assertEqual((3, 200, 4), detections["bbox"].shape)
+            self.assertEqual((3, 200), detections["confidence"].shape)
+            self.assertEqual(np.int32, detections["classes"].dtype)
+
+            # larger frames are resized to the model size
+            resized = runner(uint8_images(1, 2 * SIZE))
+            self.assertEqual((1, 200, 4), resized["bbox"].shape)
+
+    def test_tflite_matches_saved_model(self):
+        images = uint8_images(2)
+        with InferenceRunner(self.export_dir, mode="saved_model") as saved, \
+             InferenceRunner(self.export_dir, mode="float32") as tflite:
+            expected = saved(images)
+            actual = tflite(images)
+        self.assertAllClose(expected["confidence"], actual["confidence"], atol=1e-3)
+
+    def test_run_directory(self):
+        directory = os.path.join(self.get_temp_dir(), "images")
+        os.makedirs(directory, exist_ok=True)
+        for i, image in enumerate(uint8_images(5, 48)):
+            tf.io.write_file(os.path.join(directory, f"{i}.png"), tf.io.encode_png(image))
+
+        with InferenceRunner(self.export_dir, mode="float32", num_workers=2) as runner:
+            batches = list(runner.run_directory(directory, batch_size=2))
+            stats = runner.stats()
+        self.assertEqual([[os.path.join(directory, f"{i}.png") for i in range(j, min(j + 2, 5))] for j in (0, 2, 4)],
+                         [paths for paths, _ in batches])
+        self.assertEqual((1, 200, 4), batches[-1][1]["bbox"].shape)
+        self.assertEqual(3, stats["throughput"]["count"])
+        self.assertGreater(stats["throughput"]["images_per_sec"], 0)
+
+    def test_run_stream(self):
+        with InferenceRunner(self.export_dir, mode="float32") as runner:
+            outputs = list(runner.run_stream(iter(uint8_images(3))))
+            stats = runner.stats()
+        self.assertLen(outputs, 3)
+        self.assertEqual((200, 4), outputs[0]["bbox"].shape)
+        self.assertEqual(3, stats["latency"]["count"])
+
+
+class ResizeImagesTest(tf.test.TestCase, parameterized.TestCase):
+    @parameterized.named_parameters(("down", 96, 64), ("up", 40, 64), ("wide", (48, 80), 64))
+    def test_matches_tf_resize(self, shape, size):
+        height, width = shape if isinstance(shape, tuple) else (shape, shape)
+        images = np.random.RandomState(0).randint(0, 256, [2, height, width, 3]).astype(np.uint8)
+        expected = tf.cast(tf.clip_by_value(tf.round(tf.image.resize(images, (size, size))), 0, 255), tf.uint8)
+        resized = resize_images(images, size)
+        self.assertEqual(np.uint8, resized.dtype)
+        # the two resizes may round a value that is within float error of .5 differently
+        self.assertAllClose(expected.numpy().astype(np.int32), resized.astype(np.int32), atol=1, rtol=0)
+
+    def test_model_size_is_unchanged(self):
+        images = uint8_images(1)
+        self.assertIs(images, resize_images(images, SIZE))
+
+
+if __name__ == "__main__":
+    tf.test.main()
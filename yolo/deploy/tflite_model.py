@@ -0,0 +1,146 @@
+"""A TFLite interpreter of an exported YOLO model that returns the raw head outputs by path key."""
+import numpy as np
+import tensorflow as tf
+
+
+class TFLiteModel(object):
+    """
+    run a TFLite file written by yolo.deploy.export. the outputs of a TFLite model are not named, so they are matched
+    to the path keys of the model by their grid size, which is different for every path.
+
+    Args:
+        model: path of the .tflite file, or its content as bytes
+        output_shapes: dict mapping each path key to the shape of its raw output, see ExportModule.raw_shapes
+        num_threads: number of threads of the interpreter, None uses the TFLite default
+    """
+    def __init__(self, model, output_shapes, num_threads=None):
+        if isinstance(model, bytes):
+            self._interpreter = tf.lite.Interpreter(model_content=model, num_threads=num_threads)
+        else:
+            self._interpreter = tf.lite.Interpreter(model_path=model, num_threads=num_threads)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._outputs = self._match_outputs(self._interpreter.get_output_details(), output_shapes)
+        self._batch_size = int(self._input["shape"][0])
+        return
+
+    @staticmethod
+    def _match_outputs(details, output_shapes):
+        outputs = {}
+        for key, shape in output_shapes.items():
+            matches = [d for d in details if list(d["shape"][1:]) == list(shape[1:])]
+            if len(matches) != 1:
+                raise ValueError(f"no unique output of shape {shape[1:]} for path {key}, outputs: {[d['shape'] for d in details]}")
+            outputs[key] = matches[0]
+        return outputs
+
+    @property
+    def input_dtype(self):
+        return self._input["dtype"]
+
+    @property
+    def input_shape(self):
+        return tuple(self._input["shape"])
+
+    def resize(self, batch_size):
+        """change the batch size of the interpreter"""
+        if batch_size != self._batch_size:
+            self._interpreter.resize_tensor_input(self._input["index"], [batch_size, *self._input["shape"][1:]])
+            self._interpreter.allocate_tensors()
+            self._outputs = {key: self._detail(d["name"]) for key, d in self._outputs.items()}
+            self._batch_size = batch_size
+        return
+
+    def _detail(self, name):
+        return [d for d in self._interpreter.get_output_details() if d["name"] == name][0]
+
+    def quantize_input(self, images):
+        """
+        images as the input type of the model. uint8 images are in [0, 255] and float images in [0, 1]. the exported
+        models take uint8 images, a full integer model quantizes the [0, 1] range of the float model, so uint8 pixels
+        are only rescaled if the calibration did not find exactly that range
+        """
+        images = np.asarray(images)
+        if self.input_dtype == np.float32:
+            if images.dtype == np.uint8:
+                return images.astype(np.float32) / 255.0
+            return images.astype(np.float32)
+
+        scale, zero_point = self._input["quantization"]
+        if scale == 0:
+            # not quantized, the model converts the pixels itself
+            if images.dtype == np.uint8:
+                return images
+            return np.clip(np.round(images * 255.0), 0, 255).astype(self.input_dtype)
+        if images.dtype == np.uint8:
+            if abs(scale * 255.0 - 1.0) < 1e-6 and zero_point == 0:
+                return images
+            images = images.astype(np.float32) / 255.0
+        info = np.iinfo(self.input_dtype)
+        return np.clip(np.round(images / scale + zero_point), info.min, info.max).astype(self.input_dtype)
+
+    def _dequantize(self, detail, value):
+        scale, zero_point = detail["quantization"]
+        if detail["dtype"] == np.float32 or scale == 0:
+            return value
+        return (value.astype(np.float32) - zero_point) * scale
+
+    def __call__(self, images):
+        """
+        Args:
+            images: numpy batch [batch, height, width, 3], uint8 in [0, 255] or float in [0, 1]
+
+        Return:
+            dict mapping each path key to its raw output as a float32 numpy array
+        """
+        images = self.quantize_input(images)
+        self.resize(images.shape[0])
+        self._interpreter.set_tensor(self._input["index"], images)
+        self._interpreter.invoke()
+        return {key: self._dequantize(d, self._interpreter.get_tensor(d["index"])) for key, d in self._outputs.items()}
+
+
+class TFLitePostprocess(object):
+    """
+    run the postprocess.tflite of an export, the decode and nms of the raw outputs of TFLiteModel
+
+    Args:
+        model: path of postprocess.tflite, or its content as bytes
+        input_shapes: dict mapping each path key to the shape of its raw output, see ExportModule.raw_shapes
+        num_threads: number of threads of the interpreter, None uses the TFLite default
+    """
+    def __init__(self, model, input_shapes, num_threads=None):
+        if isinstance(model, bytes):
+            self._interpreter = tf.lite.Interpreter(model_content=model, num_threads=num_threads)
+        else:
+            self._interpreter = tf.lite.Interpreter(model_path=model, num_threads=num_threads)
+        self._interpreter.allocate_tensors()
+        self._inputs = TFLiteModel._match_outputs(self._interpreter.get_input_details(), input_shapes)
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = int(self._output["shape"][0])
+        return
+
+    def resize(self, batch_size):
+        if batch_size != self._batch_size:
+            for detail in self._inputs.values():
+                self._interpreter.resize_tensor_input(detail["index"], [batch_size, *detail["shape"][1:]])
+            self._interpreter.allocate_tensors()
+            self._output = self._interpreter.get_output_details()[0]
+            self._batch_size = batch_size
+        return
+
+    def __call__(self, raw):
+        """
+        Args:
+            raw: dict mapping each path key to its raw output, the output of TFLiteModel
+
+        Return:
+            dict with the bbox [batch, max_boxes, 4], classes, and confidence [batch, max_boxes] numpy arrays,
+            padded detections have confidence 0
+        """
+        self.resize(next(iter(raw.values())).shape[0])
+        for key, detail in self._inputs.items():
+            self._interpreter.set_tensor(detail["index"], raw[key].astype(np.float32))
+        self._interpreter.invoke()
+        packed = self._interpreter.get_tensor(self._output["index"])
+        return {"bbox": packed[..., :4], "classes": packed[..., 4].astype(np.int32), "confidence": packed[..., 5]}
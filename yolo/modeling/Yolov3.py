@@ -29,6 +29,7 @@ class Yolov3(base_model.Yolo):
             weight_decay = 5e-4, 
             class_thresh: int = 0.45,
             use_nms = True,
+            static_shapes = False,
             using_rt = False,
             max_boxes: int = 200,
             scale_boxes: int = 416,
@@ -79,6 +80,7 @@ class Yolov3(base_model.Yolo):
         self._head_filter_cfg = head_filter
         self._weight_decay = weight_decay
         self._use_nms = use_nms
+        self._static_shapes = static_shapes
         self._using_rt = using_rt
 
         self._clip_grads_norm = clip_grads_norm
@@ -180,7 +182,8 @@ class Yolov3(base_model.Yolo):
                                         scale_mult=self._scale_mult,
                                         path_scale=self._path_scales, 
                                         scale_xy=self._x_y_scales,
-                                        use_nms=self._use_nms)
+                                        use_nms=self._use_nms,
+                                        static_shapes=self._static_shapes)
         else:
             self._head_filter = self._head_filter_cfg
 
@@ -192,19 +195,24 @@ class Yolov3(base_model.Yolo):
         return
 
     def call(self, inputs, training=False):
-        feature_maps = self._backbone(inputs)
-        raw_head = self._head(feature_maps)
+        with tf.name_scope("backbone"):
+            feature_maps = self._backbone(inputs)
+        with tf.name_scope("head"):
+            raw_head = self._head(feature_maps)
         if training or self._using_rt:
             return {"raw_output": raw_head}
         else:
-            predictions = self._head_filter(raw_head)
+            with tf.name_scope("decode"):
+                predictions = self._head_filter(raw_head)
             return predictions
 
     def load_weights_from_dn(self,
                              dn2tf_backbone=True,
                              dn2tf_head=True,
                              config_file=None,
-                             weights_file=None):
+                             weights_file=None,
+                             use_cache=False,
+                             cache_dir=None):
         """
         load the entire Yolov3 Model for tensorflow
 
@@ -232,18 +240,34 @@ class Yolov3(base_model.Yolo):
             dn2tf_head: bool, if true it will load head weights for yolo v3 from darknet .weights file
             config_file: str path for the location of the configuration file to use when decoding darknet weights
             weights_file: str path with the file containing the dark net weights
+            use_cache: bool, if true the converted weights are stored in a cache keyed by the contents of 
+                       the DarkNet files, and loaded from it without reading the DarkNet files when present
+            cache_dir: str path to the directory of the converted weights cache
         """
         if not self._built:
             self.build(self._input_shape)
 
-        if dn2tf_backbone or dn2tf_head:
-            if config_file is None:
-                config_file = download(self._model_name + '.cfg')
-            if weights_file is None:
-                weights_file = download(self._model_name + '.weights')
-            list_encdec = DarkNetConverter.read(config_file, weights_file)
-            encoder, decoder = split_converter(
-                list_encdec, self._encoder_decoder_split_location)
+        if not (dn2tf_backbone or dn2tf_head):
+            return
+
+        if config_file is None:
+            config_file = download(self._model_name + '.cfg')
+        if weights_file is None:
+            weights_file = download(self._model_name + '.weights')
+
+        if use_cache:
+            cache, key, cached = self._dn_weights_cache(cache_dir, config_file, weights_file, f"{dn2tf_backbone}:{dn2tf_head}")
+            if cached is not None:
+                self._set_cached_weights(cached)
+                if dn2tf_backbone:
+                    self._backbone.trainable = False
+                if dn2tf_head:
+                    self._head.trainable = False
+                return
+
+        list_encdec = DarkNetConverter.read(config_file, weights_file)
+        encoder, decoder = split_converter(
+            list_encdec, self._encoder_decoder_split_location)
 
         if dn2tf_backbone:
             load_weights_dnBackbone(self._backbone,
@@ -252,6 +276,10 @@ class Yolov3(base_model.Yolo):
 
         if dn2tf_head:
             load_weights_dnHead(self._head, decoder)
+
+        if use_cache:
+            parts = (["backbone"] if dn2tf_backbone else []) + (["head"] if dn2tf_head else [])
+            cache.put(key, {part: getattr(self, f"_{part}").get_weights() for part in parts})
         return
 
 
@@ -1,3 +1,4 @@
+import collections
 import os
 import tensorflow as tf
 from abc import ABC
@@ -22,6 +23,30 @@ class Yolo(tf.keras.Model, ABC):
                              weights_file=None):
         ...
 
+    def _dn_weights_cache(self, cache_dir, config_file, weights_file, variant):
+        """
+        open the converted weights cache and find the key for the DarkNet files being loaded
+
+        Args:
+            cache_dir: directory of the cache, None uses the default location
+            config_file: path or file for the DarkNet config
+            weights_file: path or file for the DarkNet weights
+            variant: str describing which parts of the model are loaded
+
+        Return:
+            the WeightsCache, the key of the model in the cache, and the cached weights if any
+        """
+        from yolo.utils._darknet2tf.weights_cache import WeightsCache
+        cache = WeightsCache(cache_dir)
+        key = cache.key(config_file, weights_file, f"{self._model_name}:{self.model_name}:{variant}", policy=self._policy)
+        return cache, key, cache.get(key)
+
+    def _set_cached_weights(self, weights):
+        """assign weights from the cache, weights maps the name of each part of the model (backbone, neck, head) to its weights"""
+        for part, values in weights.items():
+            getattr(self, f"_{part}").set_weights(values)
+        return
+
     def process_datasets(self,
                          train,
                          test,
@@ -31,19 +56,54 @@ class Yolo(tf.keras.Model, ABC):
                          fixed_size=False,
                          jitter_im=0.1,
                          jitter_boxes=0.005,
+                         build_grids=False,
+                         seed=None,
+                         multi_scale_every=None,
+                         shuffle_buffer=None,
+                         cache=None,
+                         prefetch_device=None,
+                         input_context=None,
+                         mosaic=0.0,
+                         mixup=0.0,
+                         static_shapes=False,
                          _eval_is_training = False):
+        """
+        build the train and test input pipelines, see InputPipeline. elements are decoded on parallel maps,
+        optionally cached as uint8, augmented one image at a time, then batched and prefetched.
+
+        Args:
+            seed: integer seed that makes the augmentation reproducible
+            multi_scale_every: number of batches in a row that use the same random training resolution, 1 if None.
+                               unused if fixed_size is True
+            shuffle_buffer: number of decoded training elements to shuffle, no shuffle if None
+            cache: None, "memory" to cache the decoded images in memory, or a file path to cache them on disk
+            prefetch_device: device to prefetch the batches to, ie "/GPU:0", only if the dataset is not distributed
+            input_context: tf.distribute.InputContext used to shard the datasets and split the batch between replicas
+            mosaic: fraction of the training images replaced by a 4 image mosaic
+            mixup: fraction of the training images blended with another image
+            static_shapes: every training batch has the same batch size and number of boxes, and one of a fixed
+                           set of sizes (only image_w if fixed_size), so a compiled train step is traced once per size
+        """
 
         from yolo.dataloaders.YoloParser import YoloDecoder
         from yolo.dataloaders.YoloParser import YoloParser
-        from yolo.dataloaders.YoloParser import batch_dataset
+        from yolo.dataloaders.InputPipeline import InputPipeline
+        from yolo.dataloaders.MultiScaleSampler import MultiScaleSampler
         
         parser = YoloParser(image_w=image_w,
                             image_h=image_h,
+                            num_classes=self._classes,
                             fixed_size=fixed_size,
                             jitter_im=jitter_im,
                             jitter_boxes=jitter_boxes,
                             masks=self._masks,
-                            anchors=self._boxes)
+                            anchors=self._boxes,
+                            path_scales=self._path_scales,
+                            use_tie_breaker=self._use_tie_breaker,
+                            build_grids=build_grids,
+                            seed=seed,
+                            mosaic=mosaic,
+                            mixup=mixup)
         decoder = YoloDecoder(image_w=image_w,
                             image_h=image_h,
                             fixed_size=fixed_size,
@@ -52,29 +112,111 @@ class Yolo(tf.keras.Model, ABC):
                             masks=self._masks,
                             anchors=self._boxes)
 
-        dset_decode = decoder.decode
-        train_parser = parser.parse_fn(is_training= True)
-        test_parser = parser.parse_fn(is_training=_eval_is_training)
-        train_transform_batch = batch_dataset(batch_size=batch_size)
-        test_transform_batch = batch_dataset(batch_size=batch_size)
+        def pipeline(is_training, seed, cache, shuffle_buffer):
+            batch_fn = parser.augment_batch if is_training and parser.batch_augmentation else None
+            if is_training and (static_shapes or not fixed_size):
+                # every image of a batch has to be the same size, so the random size is picked once per batch
+                scales = [image_w] if fixed_size else None
+                sampler = MultiScaleSampler(change_every=multi_scale_every or 1, max_boxes=self._max_boxes, seed=seed, scales=scales)
+                # the batches come in a fixed set of shapes, so fit traces the train step once for each of them
+                self._multi_scale_train = True
+                return InputPipeline(decoder.decode, parser.parse_train_at_scale, batch_size,
+                                     shuffle_buffer=shuffle_buffer, cache=cache, seed=seed, sampler=sampler,
+                                     batch_fn=batch_fn, prefetch_device=prefetch_device)
+            return InputPipeline(decoder.decode, parser.parse_fn(is_training=is_training), batch_size,
+                                 shuffle_buffer=shuffle_buffer, cache=cache, seed=seed, batch_fn=batch_fn,
+                                 prefetch_device=prefetch_device)
 
-        train = train.map(dset_decode)
-        test = test.map(dset_decode)
-
-        train = train_transform_batch(train, None)
-        test = train_transform_batch(test, None)
-
-        train = train.map(train_parser)
-        test = test.map(train_parser)
+        test_cache = cache if cache in (None, "memory") else f"{cache}_test"
+        test_seed = None if seed == None else seed + 1
+        train = pipeline(True, seed, cache, shuffle_buffer)(train, input_context)
+        test = pipeline(_eval_is_training, test_seed, test_cache, None)(test, input_context)
         return train, test
 
-    def compile(self, optimizer='rmsprop', loss=None, metrics=None, loss_weights=None, weighted_metrics=None, run_eagerly=None, **kwargs):
+    def compile(self, optimizer='rmsprop', loss=None, metrics=None, loss_weights=None, weighted_metrics=None, run_eagerly=None, jit_compile=False, detection_metric=None, trace_per_shape=None, **kwargs):
+        """
+        Args:
+            jit_compile: compile the train step with XLA. every batch should have a static shape, see the
+                         static_shapes option of process_datasets, and the losses have to be made with
+                         generate_loss(jit_compile=True). fit then traces the step once for each input shape
+                         (see trace_per_shape), use trace_report to check that no shape is traced more than once
+            detection_metric: a metric of the post nms detections updated in test_step, ie YoloDetectionMAP, its
+                              summary is added to the validation logs
+            trace_per_shape: fit traces the train step once for each input shape instead of once for the element spec
+                             of the dataset, see make_train_function. None turns it on with jit_compile and for the
+                             multi-scale training set of process_datasets. a dataset with many shapes is retraced for
+                             each of them, so keep it off unless the shapes come from a small fixed set
+        """
         super().compile(optimizer=optimizer, loss=loss, metrics=metrics, loss_weights=loss_weights, weighted_metrics=weighted_metrics, run_eagerly=run_eagerly, **kwargs)
         self._loss_fn = loss
         self._loss_weights = loss_weights
+        self._detection_metric = detection_metric
+        self._jit_compile = jit_compile
+        self._xla_step = None
+        self._trace_counts = collections.Counter()
+        self._trace_per_shape = trace_per_shape
         return 
+
+    def _use_trace_per_shape(self):
+        trace_per_shape = getattr(self, "_trace_per_shape", None)
+        if trace_per_shape == None:
+            return getattr(self, "_jit_compile", False) or getattr(self, "_multi_scale_train", False)
+        return trace_per_shape
+
+    def make_train_function(self):
+        """
+        keras traces the train function with the element spec of the dataset iterator, which has None for the width
+        and height when the batches come from a MultiScaleSampler, so every size runs the same dynamic shape graph
+        and the losses rebuild their grids on each step instead of reading the grid cache. with trace_per_shape the
+        batch is taken from the iterator outside of the tf.function, and the step is traced once for each input shape
+        """
+        if (self.train_function is not None or self.run_eagerly or not self._use_trace_per_shape() or
+                getattr(self, "_steps_per_execution", None) is not None and int(self._steps_per_execution.numpy()) != 1):
+            return super().make_train_function()
+
+        strategy = self.distribute_strategy
+
+        def run_step(data):
+            outputs = self.train_step(data)
+            with tf.control_dependencies(tf.nest.flatten(outputs)):
+                self._train_counter.assign_add(1)
+            return outputs
+
+        @tf.function
+        def step_function(data):
+            outputs = strategy.run(run_step, args=(data,))
+            # the metrics are the same on every replica, keras reports the first one
+            return tf.nest.map_structure(lambda value: strategy.experimental_local_results(value)[0], outputs)
+
+        def train_function(iterator):
+            return step_function(next(iterator))
+
+        self.train_function = train_function
+        return self.train_function
+
+    def _count_trace(self, name, image):
+        """python code in a tf.function only runs while it is traced, so this counts the traces of each input shape"""
+        if not hasattr(self, "_trace_counts"):
+            self._trace_counts = collections.Counter()
+        self._trace_counts[(name, tuple(image.shape.as_list()))] += 1
+        return
+
+    def trace_report(self):
+        """
+        Return:
+            dict mapping each step function to a dict of the input shapes it was traced for and the number of traces,
+            with static shapes every shape is traced once, more means the step is being retraced
+        """
+        report = collections.defaultdict(dict)
+        for (name, shape), count in sorted(getattr(self, "_trace_counts", {}).items()):
+            report[name][str(shape)] = count
+        return dict(report)
         
     def apply_loss_fn(self, label, y_pred):
+        if not isinstance(self._loss_fn, dict):
+            # a Yolo_Fused_Loss computes every path at once and returns the same metrics
+            return self._loss_fn(label, y_pred)
+
         loss = 0.0
         loss_box = 0.0
         loss_conf = 0.0
@@ -95,38 +237,82 @@ class Yolo(tf.keras.Model, ABC):
         metric_dict["class_loss"] = loss_class
         return loss, metric_dict
 
-    def train_step(self, data):
-        '''
-        for float16 training
-        opt = tf.keras.optimizers.SGD(0.25)
-        opt = tf.keras.mixed_precision.experimental.LossScaleOptimizer(opt, "dynamic")
-        '''
-        #get the data point
-        image, label = data
-
+    def _compute_gradients(self, image, label):
+        """forward pass, loss, and unscaled clipped gradients of one training step"""
         # computer detivative and apply gradients
         num_replicas = tf.distribute.get_strategy().num_replicas_in_sync
         with tf.GradientTape() as tape:
             # compute a prediction
             y_pred = self(image, training=True)
-            loss, metrics = self.apply_loss_fn(label, y_pred["raw_output"])
-            scaled_loss = loss/num_replicas
+            with tf.name_scope("loss"):
+                loss, metrics = self.apply_loss_fn(label, y_pred["raw_output"])
+                scaled_loss = loss/num_replicas
 
-            # scale the loss for numerical stability
-            if isinstance(self.optimizer, mixed_precision.LossScaleOptimizer):
-                scaled_loss = self.optimizer.get_scaled_loss(scaled_loss)
+                # scale the loss for numerical stability
+                if isinstance(self.optimizer, mixed_precision.LossScaleOptimizer):
+                    scaled_loss = self.optimizer.get_scaled_loss(scaled_loss)
 
         # compute the gradient
-        train_vars = self.trainable_variables
-        gradients = tape.gradient(scaled_loss, train_vars)
+        with tf.name_scope("gradients"):
+            train_vars = self.trainable_variables
+            gradients = tape.gradient(scaled_loss, train_vars)
+
+            # get unscaled loss if the scaled_loss was used
+            if isinstance(self.optimizer, mixed_precision.LossScaleOptimizer):
+                gradients = self.optimizer.get_unscaled_gradients(gradients)
+
+            gradients, _ = tf.clip_by_global_norm(gradients, 5.0)
+        return loss, metrics, gradients
+
+    def _apply_gradients(self, gradients):
+        with tf.name_scope("optimizer"):
+            self.optimizer.apply_gradients(zip(gradients, self.trainable_variables))
+        return
+
+    def _build_xla_step(self):
+        """
+        the forward pass, loss, gradients, and update compiled as one XLA cluster. the update stays outside when
+        training on several replicas, since apply_gradients all reduces the gradients between them, or with a
+        dynamic loss scale, which branches on the host
+        """
+        compile_update = (not tf.distribute.has_strategy() and
+                          not isinstance(self.optimizer, mixed_precision.LossScaleOptimizer) and
+                          hasattr(self.optimizer, "_create_all_weights"))
+        if compile_update:
+            # the slots are made up front, so no variables are created inside the compiled function
+            with tf.init_scope():
+                self.optimizer._create_all_weights(self.trainable_variables)
 
-        # get unscaled loss if the scaled_loss was used
-        if isinstance(self.optimizer, mixed_precision.LossScaleOptimizer):
-            gradients = self.optimizer.get_unscaled_gradients(gradients)
+        def step(image, label):
+            self._count_trace("xla_step", image)
+            loss, metrics, gradients = self._compute_gradients(image, label)
+            if compile_update:
+                self._apply_gradients(gradients)
+                return loss, metrics, []
+            return loss, metrics, gradients
 
-        gradients, _ = tf.clip_by_global_norm(gradients, 5.0)
+        self._xla_update = compile_update
+        return tf.function(step, experimental_compile=True)
 
-        self.optimizer.apply_gradients(zip(gradients, train_vars))
+    def train_step(self, data):
+        '''
+        for float16 training
+        opt = tf.keras.optimizers.SGD(0.25)
+        opt = tf.keras.mixed_precision.experimental.LossScaleOptimizer(opt, "dynamic")
+        '''
+        #get the data point
+        image, label = data
+        self._count_trace("train_step", image)
+
+        if getattr(self, "_jit_compile", False):
+            if self._xla_step == None:
+                self._xla_step = self._build_xla_step()
+            loss, metrics, gradients = self._xla_step(image, label)
+            if not self._xla_update:
+                self._apply_gradients(gradients)
+        else:
+            loss, metrics, gradients = self._compute_gradients(image, label)
+            self._apply_gradients(gradients)
         
         #custom metrics
         loss_metrics = {"loss":loss}
@@ -139,24 +325,48 @@ class Yolo(tf.keras.Model, ABC):
 
         # computer detivative and apply gradients
         y_pred = self(image, training=False)
-        loss, metrics = self.apply_loss_fn(label, y_pred["raw_output"])
+        with tf.name_scope("loss"):
+            loss, metrics = self.apply_loss_fn(label, y_pred["raw_output"])
 
         #custom metrics
         loss_metrics = {"loss":loss}
         loss_metrics.update(metrics)
+
+        detection_metric = getattr(self, "_detection_metric", None)
+        if detection_metric != None and "bbox" in y_pred:
+            detection_metric.update_state(label, y_pred)
+            loss_metrics.update(detection_metric.summary())
         return loss_metrics
 
+    def profile(self, dataset, num_steps=20, logdir="./logs/profile", training=True, **kwargs):
+        """
+        time each stage of train_step (or test_step) over num_steps batches of dataset, and record a tf.profiler
+        trace of a few of them. the summary is written to logdir as json and TensorBoard scalars, see StepProfiler
+
+        Return:
+            dict mapping each stage to its mean, p50, and p99 time in ms
+        """
+        from yolo.training.step_profiler import StepProfiler
+        profiler = StepProfiler(self, logdir=logdir, **kwargs)
+        return profiler.profile(dataset, num_steps=num_steps, training=training)
+
     def generate_loss(self,
                       scale: float = 1.0,
-                      loss_type="ciou") -> "Dict[Yolo_Loss]":
+                      loss_type="ciou",
+                      fused=False,
+                      jit_compile=False) -> "Dict[Yolo_Loss]":
         """
         Create loss function instances for each of the detection heads.
 
         Args:
             scale: the amount by which to scale the anchor boxes that were
                    provided in __init__
+            fused: if True, return one Yolo_Fused_Loss that computes the loss
+                   of every head in a single computation
+            jit_compile: leave out the ops XLA can not compile (the nan print), to train with compile(jit_compile=True)
         """
         from yolo.modeling.functions.yolo_loss import Yolo_Loss
+        from yolo.modeling.functions.yolo_loss import Yolo_Fused_Loss
         loss_dict = {}
         for key in self._masks.keys():
             loss_dict[key] = Yolo_Loss(classes = self._classes,
@@ -168,7 +378,11 @@ class Yolo(tf.keras.Model, ABC):
                                        loss_type=loss_type,
                                        path_key=key,
                                        scale_x_y=self._x_y_scales[key],
-                                       use_tie_breaker=self._use_tie_breaker)
+                                       use_tie_breaker=self._use_tie_breaker,
+                                       check_nan=not jit_compile)
+        if fused:
+            self._loss_fn = Yolo_Fused_Loss(loss_dict, loss_type=loss_type)
+            return self._loss_fn
         self._loss_fn = loss_dict
         return loss_dict
 
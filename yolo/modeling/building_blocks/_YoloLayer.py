@@ -9,8 +9,11 @@ import sys
 
 from yolo.utils.loss_utils import GridGenerator
 from yolo.utils.loss_utils import parse_yolo_box_predictions
+from yolo.utils.loss_utils import static_dim
 from yolo.utils.box_utils import _xcycwh_to_yxyx
 
+from official.vision.beta.ops import nms
+
 @ks.utils.register_keras_serializable(package='yolo')
 class YoloLayer(ks.Model):
     def __init__(self,
@@ -24,7 +27,16 @@ class YoloLayer(ks.Model):
                  path_scale=None,
                  scale_xy = None,
                  use_nms = True,
+                 static_shapes = False,
+                 pre_nms_top_k = 1000,
                  **kwargs):
+        """
+        Args:
+            static_shapes: if True, every level keeps its pre_nms_top_k best predictions per image and a tiled batched
+                           nms is used, so every tensor has a static shape. this is the mode to use with XLA and TFLite.
+                           if False, predictions are filtered with a dynamic boolean mask and combined_non_max_suppression
+            pre_nms_top_k: number of predictions kept from each level of each image before nms when static_shapes is True
+        """
         super().__init__(**kwargs)
         self._masks = masks
         self._anchors = anchors
@@ -36,6 +48,8 @@ class YoloLayer(ks.Model):
         self._len_keys = len(self._keys)
         self._path_scale = path_scale
         self._use_nms = use_nms
+        self._static_shapes = static_shapes
+        self._pre_nms_top_k = pre_nms_top_k
         self._scale_xy = scale_xy or {key: 1.0 for key, _ in masks.values()}
         self._generator = {}
         self._len_mask = {}
@@ -54,7 +68,7 @@ class YoloLayer(ks.Model):
         return anchor_generator
 
     def parse_prediction_path(self, generator, len_mask, scale_xy, inputs):
-        shape = tf.shape(inputs)
+        shape = [tf.shape(inputs)[0], static_dim(inputs, 1), static_dim(inputs, 2)]
         #reshape the yolo output to (batchsize, width, height, number_anchors, remaining_points)
         data = tf.reshape(inputs,[shape[0], shape[1], shape[2], len_mask, -1])
         centers, anchors = generator(shape[1], shape[2], shape[0], dtype=data.dtype)
@@ -77,7 +91,103 @@ class YoloLayer(ks.Model):
         classifications = tf.boolean_mask(scaled, mask, axis=1)[:, :200, :]
         return box, classifications
 
+    def parse_prediction_path_static(self, generator, len_mask, scale_xy, inputs):
+        """
+        decode one level and keep the pre_nms_top_k predictions with the highest score in each image. the ranking
+        only needs the objectness and the largest class logit, so the class sigmoids are only computed for the kept
+        predictions.
+        """
+        shape = [tf.shape(inputs)[0], static_dim(inputs, 1), static_dim(inputs, 2)]
+        num_points = inputs.shape[-1] // len_mask
+        data = tf.reshape(inputs,[shape[0], shape[1], shape[2], len_mask, num_points])
+        centers, anchors = generator(shape[1], shape[2], shape[0], dtype=data.dtype)
+
+        _, _, boxes = parse_yolo_box_predictions(data[..., 0:4], tf.cast(shape[1], data.dtype), tf.cast(shape[2], data.dtype), anchors, centers, scale_x_y=scale_xy)
+        box = tf.reshape(_xcycwh_to_yxyx(boxes), [shape[0], -1, 4])
+        data = tf.reshape(data, [shape[0], -1, num_points])
+
+        # sigmoid is monotonic, so the best class score is sigmoid(objectness) * sigmoid(max logit)
+        objectness = tf.math.sigmoid(data[..., 4])
+        score = objectness * tf.math.sigmoid(tf.reduce_max(data[..., 5:], axis=-1))
+        score = tf.where(objectness > self._thresh, score, tf.zeros_like(score))
+
+        k = self._pre_nms_top_k
+        if inputs.shape[1] != None and inputs.shape[2] != None:
+            k = min(k, inputs.shape[1] * inputs.shape[2] * len_mask)
+        else:
+            # the level size is only known at runtime, pad the level up to k predictions so top_k never asks for more
+            # than there are and the output keeps the static shape [batch, k]. the padding has a score below every
+            # real prediction and zero objectness, so it is dropped like any other filtered prediction
+            pad = [[0, 0], [0, tf.maximum(k - tf.shape(score)[1], 0)]]
+            score = tf.pad(score, pad, constant_values=-1.0)
+            objectness = tf.pad(objectness, pad)
+            box = tf.pad(box, pad + [[0, 0]])
+            data = tf.pad(data, pad + [[0, 0]])
+        _, index = tf.math.top_k(score, k=k, sorted=False)
+
+        box = tf.gather(box, index, batch_dims=1)
+        data = tf.gather(data, index, batch_dims=1)
+        objectness = tf.gather(objectness, index, batch_dims=1)
+        mask = tf.cast(objectness > self._thresh, data.dtype)
+        classifications = tf.math.sigmoid(data[..., 5:]) * tf.expand_dims(objectness * mask, axis=-1)
+        return box, classifications
+
+    def static_nms(self, boxes, classifs):
+        """
+        class aware nms with static shapes, using the tiled nms from official/vision/beta/ops/nms.py. each box keeps
+        its best class, and the boxes of each class are moved to their own region of the plane, so one nms over
+        every box never suppresses a box of a different class.
+        """
+        scores = tf.reduce_max(classifs, axis=-1)
+        classes = tf.math.argmax(classifs, axis=-1, output_type=tf.int32)
+        scores, index = tf.math.top_k(scores, k=boxes.shape[1], sorted=True)
+        boxes = tf.gather(boxes, index, batch_dims=1)
+        classes = tf.gather(classes, index, batch_dims=1)
+
+        # boxes of class c are moved to [2c + 1, 2c + 2], all zero boxes are dropped by the nms
+        boxes = tf.clip_by_value(boxes, 0.0, 1.0)
+        offset = tf.expand_dims(tf.cast(classes * 2 + 1, boxes.dtype), axis=-1)
+        valid = tf.expand_dims(scores > self._cls_thresh, axis=-1)
+        boxes = tf.where(valid, boxes + offset, tf.zeros_like(boxes))
+
+        scores, boxes = nms.sorted_non_max_suppression_padded(scores, boxes, self._max_boxes, self._thresh)
+
+        valid = tf.reduce_any(boxes > 0, axis=-1)
+        classes = tf.cast(tf.math.floor((boxes[..., 0] - 1) / 2), tf.int32)
+        classes = tf.where(valid, classes, tf.zeros_like(classes))
+        offset = tf.expand_dims(tf.cast(classes * 2 + 1, boxes.dtype), axis=-1)
+        boxes = tf.where(tf.expand_dims(valid, axis=-1), boxes - offset, tf.zeros_like(boxes))
+        return boxes, classes, scores
+
+    def call_static(self, inputs):
+        boxes, classifs = [], []
+        for key in self._keys:
+            b, c = self.parse_prediction_path_static(self._generator[key], self._len_mask[key], self._scale_xy[key], inputs[key])
+            boxes.append(b)
+            classifs.append(c)
+        boxes = tf.cast(tf.concat(boxes, axis=1), dtype=tf.float32)
+        classifs = tf.cast(tf.concat(classifs, axis=1), dtype=tf.float32)
+
+        if self._use_nms:
+            boxes, classes, scores = self.static_nms(boxes, classifs)
+            return {
+                "bbox": boxes,
+                "classes": tf.cast(classes, tf.float32),
+                "confidence": scores,
+                "raw_output": inputs
+            }
+        else:
+            return {
+                "bbox": boxes,
+                "classes": tf.math.argmax(classifs, axis = -1),
+                "confidence": tf.reduce_max(classifs, axis = -1),
+                "raw_output": inputs
+            }
+
     def call(self, inputs):
+        if self._static_shapes:
+            return self.call_static(inputs)
+
         boxes, classifs = self.parse_prediction_path(self._generator[self._keys[0]], self._len_mask[self._keys[0]], self._scale_xy[self._keys[0]], inputs[self._keys[0]])
         i = 1
         while i < self._len_keys:
@@ -115,6 +225,8 @@ class YoloLayer(ks.Model):
             "cls_thresh": self._cls_thresh,
             "max_boxes": self._max_boxes,
             "scale_mult": self._scale_mult,
+            "static_shapes": self._static_shapes,
+            "pre_nms_top_k": self._pre_nms_top_k,
         }
 
 if __name__ == "__main__":
@@ -4,7 +4,64 @@ import tensorflow as tf
 def build_gridded_gt_v1(y_true: dict, num_classes: int, size: int,
                         num_boxes: int, dtype=tf.float64) -> tf.Tensor:
     """
-    Convert ground truth for use in loss functions.
+    Convert ground truth for use in loss functions. Every box in the batch is
+    written to the grid with a single scatter.
+    Args:
+        y_true: dict[tf.Tensor] containing 'bbox':boxes, 'label':classes
+        num_classes: number of classes
+        size: dimensions of grid S*S
+        dtype: type of float
+        num_boxes: number of boxes in each grid
+    Return:
+        tf.Tensor[batch, size, size, num_boxes, num_classes + 5]
+    """
+    boxes = tf.cast(y_true["bbox"], dtype)  # [xcenter, ycenter, width, height]
+    classes = tf.one_hot(tf.cast(y_true["label"], dtype=tf.int32),
+                         depth=num_classes, dtype=dtype)
+    batches = tf.shape(boxes)[0]
+    gt_boxes = tf.shape(boxes)[1]
+    full = tf.zeros([batches, size, size, num_boxes,
+                     num_classes + 4 + 1], dtype=dtype)
+    # x centered coords
+    x = tf.cast(boxes[..., 0] * tf.cast(size, dtype=dtype), dtype=tf.int32)
+    # y centered coords
+    y = tf.cast(boxes[..., 1] * tf.cast(size, dtype=dtype), dtype=tf.int32)
+
+    # skip padded boxes and boxes centered outside of the image
+    valid = tf.logical_not(tf.math.reduce_all(
+        tf.math.equal(boxes[..., 2:4], 0), axis=-1))
+    valid = tf.logical_and(valid, tf.math.reduce_all(
+        tf.math.greater_equal(boxes[..., 0:2], 0.0), axis=-1))
+    valid = tf.logical_and(valid, tf.math.reduce_all(
+        tf.math.less(boxes[..., 0:2], 1.0), axis=-1))
+
+    # index for box in the output [batch, y, x, box number]
+    index_shape = [batches, gt_boxes, num_boxes]
+    update_index = tf.stack([
+        tf.broadcast_to(tf.reshape(tf.range(batches), [-1, 1, 1]), index_shape),
+        tf.broadcast_to(tf.expand_dims(y, axis=-1), index_shape),
+        tf.broadcast_to(tf.expand_dims(x, axis=-1), index_shape),
+        tf.broadcast_to(tf.range(num_boxes), index_shape)], axis=-1)
+    update_index = tf.where(tf.reshape(valid, [batches, gt_boxes, 1, 1]),
+                            update_index, tf.zeros_like(update_index))
+
+    # value of box to be updated: [x, y, w, h, confidence, classes]
+    value = tf.concat([boxes, tf.ones_like(boxes[..., 0:1]), classes], -1)
+    value = tf.where(tf.expand_dims(valid, axis=-1), value,
+                     tf.zeros_like(value))
+    update = tf.broadcast_to(tf.expand_dims(value, axis=-2),
+                             [batches, gt_boxes, num_boxes, num_classes + 5])
+
+    full = tf.tensor_scatter_nd_add(full, tf.reshape(update_index, [-1, 4]),
+                                    tf.reshape(update, [-1, num_classes + 5]))
+    return full
+
+
+def _build_gridded_gt_v1_loop(y_true: dict, num_classes: int, size: int,
+                        num_boxes: int, dtype=tf.float64) -> tf.Tensor:
+    """
+    Reference (per box loop) implementation of build_gridded_gt_v1, kept for
+    testing and benchmarking.
     Args:
         y_true: dict[tf.Tensor] containing 'bbox':boxes, 'label':classes
         num_classes: number of classes
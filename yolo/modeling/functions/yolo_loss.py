@@ -6,6 +6,7 @@ from yolo.utils.iou_utils import *
 from yolo.utils.loss_utils import GridGenerator
 from yolo.utils.loss_utils import build_grided_gt
 from yolo.utils.loss_utils import parse_yolo_box_predictions
+from yolo.utils.loss_utils import static_dim
 
 
 class Yolo_Loss(object):
@@ -27,6 +28,7 @@ class Yolo_Loss(object):
                  path_key=None,
                  max_val=5,
                  use_tie_breaker=True,
+                 check_nan=True,
                  name=None,
                  **kwargs):
         """
@@ -46,6 +48,8 @@ class Yolo_Loss(object):
             scale_x_y: float used to scale the predictied x and y outputs
             nms_kind: string used for filtering the output and ensuring each object ahs only one prediction
             beta_nms: float for the thresholding value to apply in non max supression(nms) -> not yet implemented
+            check_nan: print an error when the predictions have a nan, tf.print can not be compiled by XLA so 
+                       this has to be False to train with jit_compile
 
         call Return: 
             float: for the average loss 
@@ -64,7 +68,9 @@ class Yolo_Loss(object):
         #self._iou_thresh = 0.213 # recomended use = 0.213 in [yolo]
         self._use_tie_breaker = tf.cast(use_tie_breaker, tf.bool)
 
-        self._loss_type = tf.cast(loss_type, tf.string)
+        # a python string, so the loss is picked while tracing and not with a string comparison in the graph
+        self._loss_type = loss_type
+        self._check_nan = check_nan
         self._iou_normalizer = iou_normalizer
         self._cls_normalizer = cls_normalizer
         self._scale_x_y = scale_x_y
@@ -95,7 +101,11 @@ class Yolo_Loss(object):
     @tf.function(experimental_relax_shapes=True)
     def _get_label_attributes(self, width, height, batch_size, y_true, y_pred, dtype):
         grid_points, anchor_grid = self._anchor_generator(width, height, batch_size, dtype=dtype)
-        y_true = build_grided_gt(y_true, tf.convert_to_tensor(self._masks, dtype=dtype), width, self._classes, tf.shape(y_pred), dtype, self._use_tie_breaker)
+        if "grid" in y_true.keys():
+            # the ground truth was already gridded by the input pipeline
+            y_true = tf.cast(y_true["grid"][self._path_key], dtype)
+        else:
+            y_true = build_grided_gt(y_true, tf.convert_to_tensor(self._masks, dtype=dtype), width, self._classes, tf.shape(y_pred), dtype, self._use_tie_breaker)
         return tf.stop_gradient(grid_points), tf.stop_gradient(anchor_grid), tf.stop_gradient(y_true)
     
     @tf.function(experimental_relax_shapes=True)
@@ -123,11 +133,14 @@ class Yolo_Loss(object):
         return x
 
 
-    @tf.function(experimental_relax_shapes=True)
+    # traced without relaxed shapes, each input size gets its own trace with a static width and height so the
+    # grids come from the shared grid cache. a relaxed trace would see None dims after the second size from the
+    # MultiScaleSampler and rebuild the grid in the graph on every step. under fit the train function has to be
+    # traced per shape as well, see Yolo.make_train_function
+    @tf.function
     def __call__(self, y_true, y_pred):
         #1. generate and store constants and format output
-        shape = tf.shape(y_pred)
-        batch_size, width, height = shape[0], shape[1], shape[2]
+        batch_size, width, height = tf.shape(y_pred)[0], static_dim(y_pred, 1), static_dim(y_pred, 2)
         y_pred = tf.reshape(y_pred, [batch_size, width, height, self._num, -1])
         grid_points, anchor_grid, y_true = self._get_label_attributes(width, height, batch_size, y_true, y_pred, y_pred.dtype)
         
@@ -140,7 +153,8 @@ class Yolo_Loss(object):
         pred_conf = tf.expand_dims(tf.math.sigmoid(y_pred[..., 4]), axis=-1)
         pred_conf = self.rm_nan_inf(pred_conf)
         pred_class = tf.math.sigmoid(y_pred[..., 5:])
-        self.print_error(pred_box)
+        if self._check_nan:
+            self.print_error(pred_box)
 
         #3. split up ground_truth into components, xy, wh, confidence, class -> apply calculations to acchive safe format as predictions
         true_box = y_true[..., 0:4]
@@ -214,3 +228,134 @@ class Yolo_Loss(object):
         layer_config.update(super().get_config())
         return layer_config
 
+
+
+class Yolo_Fused_Loss(object):
+    def __init__(self, losses, loss_type="ciou"):
+        """
+        the loss of every detection head output computed together. each path is flattened to
+        [batch, width * height * anchors, classes + 5] and all of them are joined, so the box decoding, the
+        iou/giou/ciou, and the cross entropies run once for all paths instead of once per path. the per path
+        values are recovered with segment sums, so the losses and metrics match calling each Yolo_Loss.
+
+        Args:
+            losses: dict mapping the key of each path to its Yolo_Loss, they supply the masks, grids, and constants of the path
+            loss_type: string for the key of the loss to use, options -> mse, giou, ciou
+
+        call Return:
+            float: for the total loss, and a dict of the same metrics as Yolo.apply_loss_fn
+        """
+        self._losses = losses
+        self._keys = list(losses.keys())
+        self._loss_type = loss_type
+        return
+
+    def _flatten_path(self, loss, y_true, y_pred):
+        """reshape one path and its labels to [batch, points, -1] and build the per point constants"""
+        batch_size, width, height = tf.shape(y_pred)[0], static_dim(y_pred, 1), static_dim(y_pred, 2)
+        y_pred = tf.reshape(y_pred, [batch_size, width, height, loss._num, -1])
+        grid_points, anchor_grid, y_true = loss._get_label_attributes(width, height, batch_size, y_true, y_pred, y_pred.dtype)
+
+        dtype = y_pred.dtype
+        num = width * height * loss._num
+        # the grids have a batch dimension of 1 and broadcast against the predictions
+        flat = lambda x: tf.reshape(x, tf.stack([tf.shape(x)[0], num, tf.shape(x)[-1]]))
+        const = lambda value: tf.fill([num], tf.cast(value, dtype))
+        size = tf.broadcast_to(tf.cast(tf.stack([width, height]), dtype), [num, 2])
+        return {
+            "y_pred": flat(y_pred),
+            "y_true": flat(y_true),
+            "grid_points": flat(grid_points),
+            "anchor_grid": flat(anchor_grid),
+            "size": size,
+            "scale_x_y": const(loss._scale_x_y),
+            "ignore_thresh": const(loss._ignore_thresh),
+            "iou_normalizer": const(loss._iou_normalizer),
+            "cls_normalizer": const(loss._cls_normalizer),
+        }, num
+
+    # not relaxed for the same reason as Yolo_Loss.__call__, so every input size reads the grid cache
+    @tf.function
+    def __call__(self, y_true, y_pred):
+        #1. flatten every path and join them along the points axis
+        paths = []
+        levels = []
+        for i, key in enumerate(self._keys):
+            path, num = self._flatten_path(self._losses[key], y_true, y_pred[key])
+            paths.append(path)
+            levels.append(tf.fill([num], i))
+        data = {name: tf.concat([path[name] for path in paths], axis=1 if name in ("y_pred", "y_true", "grid_points", "anchor_grid") else 0) for name in paths[0]}
+        levels = tf.concat(levels, axis=0)
+        num_levels = len(self._keys)
+
+        y_pred = data["y_pred"]
+        dtype = y_pred.dtype
+        size = data["size"]
+        grid_points = data["grid_points"]
+        anchor_grid = data["anchor_grid"]
+        scale_x_y = tf.expand_dims(data["scale_x_y"], axis=-1)
+
+        #2. decode the boxes of every path at once
+        pred_xy = tf.math.sigmoid(y_pred[..., 0:2]) * scale_x_y - 0.5 * (scale_x_y - 1)
+        pred_wh = y_pred[..., 2:4]
+        pred_box = K.concatenate([pred_xy / size + grid_points, tf.math.exp(pred_wh) * anchor_grid], axis=-1)
+        pred_conf = tf.expand_dims(tf.math.sigmoid(y_pred[..., 4]), axis=-1)
+        pred_conf = tf.where(tf.math.is_nan(pred_conf), tf.cast(0.0, dtype=dtype), pred_conf)
+        pred_conf = tf.where(tf.math.is_inf(pred_conf), tf.cast(0.0, dtype=dtype), pred_conf)
+        pred_class = tf.math.sigmoid(y_pred[..., 5:])
+
+        true_box = data["y_true"][..., 0:4]
+        true_conf = data["y_true"][..., 4]
+        true_class = data["y_true"][..., 5:]
+
+        #3. box loss, the same for every path
+        if self._loss_type == "giou":
+            iou, giou = compute_giou(true_box, pred_box)
+            loss_box = (1 - giou) * data["iou_normalizer"] * true_conf
+        elif self._loss_type == "ciou":
+            iou, ciou = compute_ciou(true_box, pred_box)
+            loss_box = (1 - ciou) * data["iou_normalizer"] * true_conf
+        else:
+            iou = compute_iou(true_box, pred_box)
+            scale = (2 - true_box[..., 2] * true_box[..., 3]) * data["iou_normalizer"]
+            true_xy = tf.stop_gradient(tf.nn.relu(true_box[..., 0:2] - grid_points) * size)
+            true_wh = tf.math.log(true_box[..., 2:4] / anchor_grid)
+            true_wh = tf.where(tf.math.is_nan(true_wh), tf.cast(0.0, dtype=dtype), true_wh)
+            true_wh = tf.stop_gradient(tf.where(tf.math.is_inf(true_wh), tf.cast(0.0, dtype=dtype), true_wh))
+            loss_xy = tf.reduce_sum(K.square(true_xy - pred_xy), axis=-1)
+            loss_wh = tf.reduce_sum(K.square(true_wh - pred_wh), axis=-1)
+            loss_box = (loss_wh + loss_xy) * true_conf * scale
+        mask_iou = tf.cast(iou < data["ignore_thresh"], dtype=dtype)
+
+        #4. class and confidence cross entropy
+        class_loss = data["cls_normalizer"] * tf.reduce_sum(
+            ks.losses.binary_crossentropy(K.expand_dims(true_class, axis=-1),
+                                          K.expand_dims(pred_class, axis=-1)),
+            axis=-1) * true_conf
+        bce = ks.losses.binary_crossentropy(K.expand_dims(true_conf, axis=-1), pred_conf)
+        conf_loss = (true_conf + (1 - true_conf) * mask_iou) * bce
+
+        #5. sum each path of each image, [batch, points] -> [levels, batch]
+        def path_sum(x):
+            return tf.math.unsorted_segment_sum(tf.transpose(tf.cast(x, dtype)), levels, num_levels)
+
+        loss_box = tf.reduce_mean(path_sum(loss_box), axis=-1)
+        conf_loss = tf.reduce_mean(path_sum(conf_loss), axis=-1)
+        class_loss = tf.reduce_mean(path_sum(class_loss), axis=-1)
+        loss = tf.reduce_sum(loss_box + conf_loss + class_loss)
+
+        #6. metrics for each path
+        found = tf.cast(tf.squeeze(pred_conf, axis=-1) > 0.5, dtype=dtype) * true_conf
+        recall50 = tf.reduce_mean(tf.math.divide_no_nan(path_sum(found), path_sum(true_conf)), axis=-1)
+        iou_sum = tf.reduce_sum(path_sum(iou), axis=-1)
+        iou_count = tf.reduce_sum(path_sum(tf.cast(iou > 0, dtype=dtype)), axis=-1)
+        avg_iou = tf.math.divide_no_nan(iou_sum, iou_count)
+
+        metric_dict = dict()
+        for i, key in enumerate(self._keys):
+            metric_dict[f"recall50_{key}"] = tf.stop_gradient(recall50[i])
+            metric_dict[f"avg_iou_{key}"] = tf.stop_gradient(avg_iou[i])
+        metric_dict["box_loss"] = tf.reduce_sum(loss_box)
+        metric_dict["conf_loss"] = tf.reduce_sum(conf_loss)
+        metric_dict["class_loss"] = tf.reduce_sum(class_loss)
+        return loss, metric_dict
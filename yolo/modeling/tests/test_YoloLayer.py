@@ -0,0 +1,72 @@
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo.modeling.building_blocks import YoloLayer
+
+
+MASKS = {"1024": [6, 7, 8], "512": [3, 4, 5], "256": [0, 1, 2]}
+ANCHORS = [(10, 13), (16, 30), (33, 23), (30, 61), (62, 45), (59, 119), (116, 90), (156, 198), (373, 326)]
+PATH_SCALES = {"1024": 32, "512": 16, "256": 8}
+
+
+def build_layer(static_shapes, classes=80):
+    return YoloLayer(masks=MASKS,
+                     anchors=ANCHORS,
+                     thresh=0.45,
+                     cls_thresh=0.45,
+                     max_boxes=20,
+                     path_scale=PATH_SCALES,
+                     scale_xy={key: 1.0 for key in MASKS},
+                     static_shapes=static_shapes)
+
+
+def sparse_predictions(batch_size=2, size=416, classes=80):
+    """head outputs that are confident in only a few well separated cells"""
+    inputs = {}
+    for level, (key, scale) in enumerate(PATH_SCALES.items()):
+        width = size // scale
+        data = tf.fill([batch_size, width, width, 3, classes + 5], -10.0)
+        updates = [[b, (3 * b + 2) % width, (5 * b + 1) % width, b % 3] for b in range(batch_size)]
+        # a different score and class on each level so the order after nms is unique
+        values = tf.concat([tf.zeros([batch_size, 4]), tf.fill([batch_size, 1], 4.0 - level),
+                            tf.one_hot((tf.range(batch_size) * 7 + level * 3) % classes, classes) * 20 - 10], axis=-1)
+        data = tf.tensor_scatter_nd_update(data, updates, values)
+        inputs[key] = tf.reshape(data, [batch_size, width, width, -1])
+    return inputs
+
+
+class YoloLayerTest(tf.test.TestCase, parameterized.TestCase):
+    def test_static_matches_combined_nms(self):
+        inputs = sparse_predictions()
+        expected = build_layer(False)(inputs)
+        actual = build_layer(True)(inputs)
+        for key in ["bbox", "classes", "confidence"]:
+            self.assertAllClose(expected[key][:, :3], actual[key][:, :3], atol=1e-5)
+        self.assertAllEqual(actual["confidence"][:, 3:], tf.zeros_like(actual["confidence"][:, 3:]))
+
+    @parameterized.named_parameters(("batch_1", 1), ("batch_4", 4))
+    def test_static_output_shapes(self, batch_size):
+        layer = build_layer(True)
+        spec = {key: tf.TensorSpec([batch_size, 416 // s, 416 // s, 255], tf.float32) for key, s in PATH_SCALES.items()}
+        concrete = tf.function(layer.call_static).get_concrete_function(spec)
+        self.assertEqual([batch_size, 20, 4], concrete.structured_outputs["bbox"].shape.as_list())
+        self.assertEqual([batch_size, 20], concrete.structured_outputs["classes"].shape.as_list())
+        self.assertEqual([batch_size, 20], concrete.structured_outputs["confidence"].shape.as_list())
+
+    @parameterized.named_parameters(("320", 320), ("416", 416))
+    def test_static_unknown_spatial_dims(self, size):
+        # with unknown spatial dims every level has fewer than pre_nms_top_k predictions, e.g. 10 * 10 * 3 at 320
+        layer = build_layer(True)
+        spec = {key: tf.TensorSpec([None, None, None, 255], tf.float32) for key in PATH_SCALES}
+        decode = tf.function(layer.call_static, input_signature=[spec])
+        self.assertEqual([None, 20, 4], decode.get_concrete_function().structured_outputs["bbox"].shape.as_list())
+
+        inputs = sparse_predictions(size=size)
+        expected = build_layer(False)(inputs)
+        actual = decode(inputs)
+        for key in ["bbox", "classes", "confidence"]:
+            self.assertAllClose(expected[key][:, :3], actual[key][:, :3], atol=1e-5)
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -0,0 +1,139 @@
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo import Yolov3
+from yolo.benchmarks import synthetic
+from yolo.modeling.functions.yolo_loss import Yolo_Loss
+from yolo.modeling.functions.yolo_loss import Yolo_Fused_Loss
+from yolo.utils.loss_utils import GridGenerator
+from yolo.utils.loss_utils import build_grided_gt_levels
+from yolo.utils.tests.test_loss_utils import random_ground_truth
+
+
+MASKS = {"1024": [6, 7, 8], "512": [3, 4, 5], "256": [0, 1, 2]}
+ANCHORS = [(10, 13), (16, 30), (33, 23), (30, 61), (62, 45), (59, 119), (116, 90), (156, 198), (373, 326)]
+PATH_SCALES = {"1024": 32, "512": 16, "256": 8}
+
+
+def build_losses(loss_type, classes):
+    return {
+        key: Yolo_Loss(classes=classes,
+                       mask=MASKS[key],
+                       anchors=ANCHORS,
+                       scale_anchors=PATH_SCALES[key],
+                       loss_type=loss_type,
+                       path_key=f"fused_test_{key}",
+                       scale_x_y=1.0 + 0.05 * i,
+                       use_tie_breaker=True) for i, key in enumerate(MASKS)
+    }
+
+
+class YoloFusedLossTest(tf.test.TestCase, parameterized.TestCase):
+    @parameterized.named_parameters(("ciou", "ciou"), ("giou", "giou"), ("mse", "mse"))
+    def test_matches_per_path_losses(self, loss_type):
+        classes, batch_size, size = 10, 2, 256
+        y_true = random_ground_truth(batch_size, 20, classes)
+        y_pred = {
+            key: tf.random.normal([batch_size, size // scale, size // scale, 3 * (classes + 5)], seed=i)
+            for i, (key, scale) in enumerate(PATH_SCALES.items())
+        }
+        losses = build_losses(loss_type, classes)
+
+        expected_loss = 0.0
+        expected = {"box_loss": 0.0, "conf_loss": 0.0, "class_loss": 0.0}
+        for key in y_pred:
+            _loss, _box, _conf, _class, _avg_iou, _recall50 = losses[key](y_true, y_pred[key])
+            expected_loss += _loss
+            expected["box_loss"] += _box
+            expected["conf_loss"] += _conf
+            expected["class_loss"] += _class
+            expected[f"avg_iou_{key}"] = _avg_iou
+            expected[f"recall50_{key}"] = _recall50
+
+        loss, metrics = Yolo_Fused_Loss(losses, loss_type=loss_type)(y_true, y_pred)
+        self.assertAllClose(expected_loss, loss, rtol=1e-4)
+        self.assertEqual(set(expected), set(metrics))
+        for key in expected:
+            self.assertAllClose(expected[key], metrics[key], rtol=1e-4, atol=1e-5)
+
+
+class YoloLossGridTest(tf.test.TestCase, parameterized.TestCase):
+    @parameterized.named_parameters(("ciou", "ciou"), ("mse", "mse"))
+    def test_precomputed_grids_match(self, loss_type):
+        classes, batch_size, size = 10, 2, 256
+        y_true = random_ground_truth(batch_size, 20, classes)
+        losses = {
+            key: Yolo_Loss(classes=classes,
+                           mask=MASKS[key],
+                           anchors=ANCHORS,
+                           scale_anchors=PATH_SCALES[key],
+                           loss_type=loss_type,
+                           path_key=f"grid_test_{loss_type}_{key}") for key in MASKS
+        }
+        # the gridded labels are looked up by the path key of each loss
+        masks = {f"grid_test_{loss_type}_{key}": MASKS[key] for key in MASKS}
+        scales = {f"grid_test_{loss_type}_{key}": PATH_SCALES[key] for key in MASKS}
+        y_true_grid = dict(y_true)
+        y_true_grid["grid"] = build_grided_gt_levels(y_true, masks, size, scales, classes, tf.float32, True)
+
+        for i, key in enumerate(MASKS):
+            y_pred = tf.random.normal([batch_size, size // PATH_SCALES[key], size // PATH_SCALES[key], 3 * (classes + 5)], seed=i)
+            expected = losses[key](y_true, y_pred)
+            actual = losses[key](y_true_grid, y_pred)
+            for value, expected_value in zip(actual, expected):
+                self.assertAllClose(expected_value, value, rtol=1e-5, atol=1e-6)
+        return
+
+
+class YoloLossGridCacheTest(tf.test.TestCase):
+    def setUp(self):
+        super().setUp()
+        GridGenerator.cache.clear()
+        return
+
+    def test_every_size_reads_the_cache(self):
+        classes, sizes = 10, [13, 26, 19]
+        y_true = random_ground_truth(2, 20, classes)
+        losses = [Yolo_Loss(classes=classes,
+                            mask=MASKS["1024"],
+                            anchors=ANCHORS,
+                            scale_anchors=PATH_SCALES["1024"],
+                            path_key=f"cache_test_{i}") for i in range(2)]
+
+        # the first loss builds the grids of each size, the second traces the same sizes and reads them
+        for loss in losses:
+            for size in sizes:
+                loss(y_true, tf.random.normal([2, size, size, 3 * (classes + 5)]))
+
+        stats = GridGenerator.cache.stats()
+        self.assertEqual(stats["uncached"], 0)
+        self.assertEqual(stats["misses"], 2 * len(sizes))
+        self.assertEqual(stats["hits"], 2 * len(sizes))
+        return
+
+    def test_fit_reads_the_cache_at_every_size(self):
+        classes, sizes = 10, [64, 96]
+        model = Yolov3(model="tiny", classes=classes, policy="float32")
+        model.build([None, None, None, 3])
+        model.compile(optimizer=tf.keras.optimizers.SGD(1e-3), loss=model.generate_loss(loss_type="ciou"), trace_per_shape=True)
+
+        # batches of two sizes in one dataset, like a MultiScaleSampler the element spec has no width or height
+        dataset = None
+        for i, size in enumerate(sizes):
+            batch = tf.data.Dataset.from_tensors((synthetic.images(2, size, seed=i),
+                                                  synthetic.labels(2, num_boxes=8, classes=classes, num_anchors=6, seed=i)))
+            dataset = batch.repeat(2) if dataset == None else dataset.concatenate(batch.repeat(2))
+        self.assertEqual(dataset.element_spec[0].shape.as_list(), [2, None, None, 3])
+
+        GridGenerator.cache.clear()
+        model.fit(dataset, epochs=2, verbose=0)
+
+        stats = GridGenerator.cache.stats()
+        self.assertEqual(stats["uncached"], 0)
+        self.assertGreater(stats["misses"], 0)
+        self.assertEqual({str((2, size, size, 3)): 1 for size in sizes}, model.trace_report()["train_step"])
+        return
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -0,0 +1,63 @@
+import numpy as np
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo import Yolov3
+from yolo.benchmarks import synthetic
+
+
+def build_tiny(jit_compile, classes=10):
+    model = Yolov3(model="tiny", classes=classes, policy="float32")
+    model.build([None, None, None, 3])
+    loss_fn = model.generate_loss(loss_type="ciou", jit_compile=jit_compile)
+    model.compile(optimizer=tf.keras.optimizers.SGD(1e-3), loss=loss_fn, jit_compile=jit_compile)
+    return model
+
+
+def batches(sizes, steps_per_size=2, batch_size=2, classes=10):
+    for i, size in enumerate(sizes):
+        for step in range(steps_per_size):
+            yield (synthetic.images(batch_size, size, seed=i * steps_per_size + step),
+                   synthetic.labels(batch_size, num_boxes=8, classes=classes, num_anchors=6, seed=step))
+
+
+class XlaTrainStepTest(tf.test.TestCase, parameterized.TestCase):
+    def test_compiles_once_per_scale(self):
+        sizes = [64, 96]
+        model = build_tiny(jit_compile=True)
+        train_step = tf.function(model.train_step)
+        for data in batches(sizes):
+            metrics = train_step(data)
+            self.assertTrue(np.isfinite(metrics["loss"].numpy()))
+
+        report = model.trace_report()
+        self.assertEqual({str((2, size, size, 3)): 1 for size in sizes}, report["train_step"])
+        self.assertEqual({str((2, size, size, 3)): 1 for size in sizes}, report["xla_step"])
+
+    def test_fit_compiles_once_per_scale(self):
+        sizes = [64, 96]
+        model = build_tiny(jit_compile=True)
+        # one dataset with every size, its element spec has no width or height like a MultiScaleSampler
+        dataset = tf.data.Dataset.from_generator(
+            lambda: batches(sizes),
+            output_types=(tf.float32, {"bbox": tf.float32, "classes": tf.int32, "best_anchors": tf.float32}),
+            output_shapes=([2, None, None, 3], {"bbox": [2, 8, 4], "classes": [2, 8], "best_anchors": [2, 8, 5]}))
+        history = model.fit(dataset, epochs=2, verbose=0)
+        self.assertTrue(np.all(np.isfinite(history.history["loss"])))
+
+        report = model.trace_report()
+        self.assertEqual({str((2, size, size, 3)): 1 for size in sizes}, report["train_step"])
+        self.assertEqual({str((2, size, size, 3)): 1 for size in sizes}, report["xla_step"])
+
+    def test_matches_uncompiled_loss(self):
+        data = next(batches([64]))
+        compiled = build_tiny(jit_compile=True)
+        eager = build_tiny(jit_compile=False)
+        eager.set_weights(compiled.get_weights())
+        compiled_loss = tf.function(compiled.train_step)(data)["loss"]
+        eager_loss = tf.function(eager.train_step)(data)["loss"]
+        self.assertAllClose(eager_loss, compiled_loss, rtol=1e-3)
+
+
+if __name__ == "__main__":
+    tf.test.main()
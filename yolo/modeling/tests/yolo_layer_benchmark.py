@@ -0,0 +1,47 @@
+"""Latency of the static shape YoloLayer post-processing against the dynamic boolean mask version."""
+import time
+
+import tensorflow as tf
+
+from yolo.modeling.tests.test_YoloLayer import build_layer, PATH_SCALES
+
+
+def random_predictions(batch_size, size, classes=80):
+    return {
+        key: tf.random.normal([batch_size, size // scale, size // scale, 3 * (classes + 5)], mean=-2.0)
+        for key, scale in PATH_SCALES.items()
+    }
+
+
+def time_fn(fn, inputs, iterations=20):
+    # the first call traces the function, so it is left out of the timing
+    fn(inputs)
+    start = time.time()
+    for _ in range(iterations):
+        out = fn(inputs)
+    _ = out["bbox"].numpy()
+    return (time.time() - start) / iterations
+
+
+def main(batch_sizes=(1, 8), sizes=(416, 608), iterations=20, device="/CPU:0"):
+    for size in sizes:
+        for batch_size in batch_sizes:
+            with tf.device(device):
+                inputs = random_predictions(batch_size, size)
+                dynamic = tf.function(build_layer(False))
+                static = tf.function(build_layer(True))
+                static_xla = tf.function(build_layer(True).call_static, experimental_compile=True)
+                dynamic_time = time_fn(dynamic, inputs, iterations=iterations)
+                static_time = time_fn(static, inputs, iterations=iterations)
+                try:
+                    xla_time = time_fn(static_xla, inputs, iterations=iterations)
+                except Exception:
+                    xla_time = float("nan")
+            print(f"size: {size}, batch: {batch_size:2d}, dynamic: {dynamic_time * 1000:8.2f} ms, "
+                  f"static: {static_time * 1000:8.2f} ms, static xla: {xla_time * 1000:8.2f} ms, "
+                  f"speedup: {dynamic_time / static_time:5.2f}x")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import tensorflow as tf
 import tensorflow.keras as ks
 from tensorflow.keras import backend as K
 from yolo.utils.iou_utils import *
+from yolo.utils.box_utils import _xcycwh_to_yxyx
 
 
 class YoloMAP_recall(ks.metrics.Metric):
@@ -42,6 +43,8 @@ class YoloMAP(ks.metrics.Metric):
         self._thresh = threshold
         self._num = num
         self._value = self.add_weight(name="total_recall", initializer='zeros')
+        self._count = self.add_weight(name="total_samples",
+                                      initializer='zeros')
         return
 
     def update_state(self, y_true, y_pred, sample_weight=None):
@@ -57,11 +60,12 @@ class YoloMAP(ks.metrics.Metric):
             tf.cast(pred_conf > self._thresh, dtype=self.dtype) * true_conf,
             axis=(1, 2,
                   3)) / (tf.reduce_sum(true_conf, axis=(1, 2, 3)) + 1e-16)
-        self._value.assign(tf.reduce_mean(value))
+        self._value.assign_add(tf.reduce_mean(value))
+        self._count.assign_add(tf.cast(1.0, dtype=tf.float32))
         return
 
     def result(self):
-        return self._value
+        return self._value / self._count
 
 
 class YoloMAP_recall75(ks.metrics.Metric):
@@ -195,3 +199,168 @@ class YoloClass_recall(ks.metrics.Metric):
 
     def result(self):
         return self._value / self._count
+
+
+def pairwise_iou(boxes_1, boxes_2):
+    """iou of every pair of [batch, n, 4] and [batch, m, 4] boxes in (ymin, xmin, ymax, xmax), [batch, n, m]"""
+    lt = tf.maximum(boxes_1[:, :, None, :2], boxes_2[:, None, :, :2])
+    rb = tf.minimum(boxes_1[:, :, None, 2:], boxes_2[:, None, :, 2:])
+    intersection = tf.reduce_prod(tf.nn.relu(rb - lt), axis=-1)
+    area_1 = tf.reduce_prod(boxes_1[..., 2:] - boxes_1[..., :2], axis=-1)
+    area_2 = tf.reduce_prod(boxes_2[..., 2:] - boxes_2[..., :2], axis=-1)
+    return tf.math.divide_no_nan(intersection, area_1[:, :, None] + area_2[:, None, :] - intersection)
+
+
+class YoloDetectionMAP(ks.metrics.Metric):
+    """
+    streaming mAP and recall over the post nms detections of the model. every update matches the detections of a
+    batch to the ground truth at each iou threshold, then adds the true and false positives to a fixed size
+    histogram of confidences for each class, so the state never grows and the result is a cumulative sum over the
+    bins. the detections are matched in order of confidence to the unmatched ground truth box of the same class
+    with the highest iou, like the COCO evaluation, but crowd boxes and area ranges are not handled and the
+    confidences are rounded to num_bins bins, so the numbers are close to pycocotools, not equal.
+
+    use it in validation with model.compile(detection_metric=YoloDetectionMAP(classes)), test_step then adds mAP,
+    mAP50, mAP75, and recall50 to the logs
+
+    Args:
+        num_classes: number of classes of the model
+        iou_thresholds: iou thresholds of a true positive, mAP is the mean over them
+        num_bins: number of confidence bins in [0, 1] of the precision recall curves
+    """
+    def __init__(self, num_classes, iou_thresholds=None, num_bins=100, name="mAP", **kwargs):
+        super().__init__(name=name, **kwargs)
+        if iou_thresholds == None:
+            iou_thresholds = [0.5 + 0.05 * i for i in range(10)]
+        self._num_classes = num_classes
+        self._iou_thresholds = list(iou_thresholds)
+        self._num_bins = num_bins
+        shape = [len(self._iou_thresholds), num_classes, num_bins]
+        self._true_positives = self.add_weight(name="true_positives", shape=shape, initializer="zeros")
+        self._false_positives = self.add_weight(name="false_positives", shape=shape, initializer="zeros")
+        self._num_ground_truth = self.add_weight(name="num_ground_truth", shape=[num_classes], initializer="zeros")
+        return
+
+    def _match(self, iou, same_class, valid_detections):
+        """
+        greedy matching of detections sorted by confidence
+
+        Args:
+            iou: [batch, detections, ground truth]
+            same_class: [batch, detections, ground truth] bool
+            valid_detections: [batch, detections] bool
+
+        Return:
+            [thresholds, batch, detections] bool true positives
+        """
+        thresholds = tf.constant(self._iou_thresholds, dtype=iou.dtype)[:, None, None]
+        iou = tf.where(same_class, iou, -tf.ones_like(iou))
+        num_detections = tf.shape(iou)[1]
+        matched = tf.zeros([len(self._iou_thresholds), tf.shape(iou)[0], tf.shape(iou)[2]], dtype=tf.bool)
+        true_positives = tf.TensorArray(tf.bool, size=num_detections)
+
+        def body(i, matched, true_positives):
+            candidates = tf.where(matched, -tf.ones_like(matched, iou.dtype), iou[None, :, i, :])
+            best = tf.argmax(candidates, axis=-1, output_type=tf.int32)
+            best_iou = tf.reduce_max(candidates, axis=-1)
+            is_match = (best_iou >= thresholds[..., 0]) & valid_detections[None, :, i]
+            matched = matched | (tf.one_hot(best, tf.shape(iou)[2], on_value=True, off_value=False) & is_match[..., None])
+            return i + 1, matched, true_positives.write(i, is_match)
+
+        _, _, true_positives = tf.while_loop(lambda i, *_: i < num_detections, body,
+                                             [tf.constant(0), matched, true_positives])
+        return tf.transpose(true_positives.stack(), [1, 2, 0])
+
+    def update_state(self, y_true, y_pred, sample_weight=None):
+        """
+        Args:
+            y_true: label dict with the padded bbox (x, y, w, h) and classes of the ground truth
+            y_pred: prediction dict of the model with the padded bbox (ymin, xmin, ymax, xmax), classes, and confidence
+                    of the detections after nms, padded detections have confidence 0
+        """
+        true_box = _xcycwh_to_yxyx(tf.cast(y_true["bbox"], tf.float32))
+        true_class = tf.cast(y_true["classes"], tf.int32)
+        valid_truth = tf.reduce_any(tf.not_equal(y_true["bbox"], 0), axis=-1)
+
+        confidence = tf.cast(y_pred["confidence"], tf.float32)
+        order = tf.argsort(confidence, axis=-1, direction="DESCENDING")
+        confidence = tf.gather(confidence, order, batch_dims=1)
+        pred_box = tf.gather(tf.cast(y_pred["bbox"], tf.float32), order, batch_dims=1)
+        pred_class = tf.gather(tf.cast(y_pred["classes"], tf.int32), order, batch_dims=1)
+        valid_detections = confidence > 0
+
+        iou = pairwise_iou(pred_box, true_box)
+        same_class = tf.equal(pred_class[:, :, None], true_class[:, None, :]) & valid_truth[:, None, :]
+        true_positives = self._match(iou, same_class, valid_detections)
+
+        # the histogram bin of every detection at every threshold
+        num_thresholds = len(self._iou_thresholds)
+        bins = tf.clip_by_value(tf.cast(confidence * self._num_bins, tf.int32), 0, self._num_bins - 1)
+        pred_class = tf.clip_by_value(pred_class, 0, self._num_classes - 1)
+        index = pred_class * self._num_bins + bins
+        index = tf.range(num_thresholds)[:, None, None] * (self._num_classes * self._num_bins) + index[None]
+        index = tf.reshape(index, [-1])
+        valid = tf.reshape(tf.tile(valid_detections[None], [num_thresholds, 1, 1]), [-1])
+        true_positives = tf.reshape(true_positives, [-1])
+        size = num_thresholds * self._num_classes * self._num_bins
+
+        tp = tf.math.unsorted_segment_sum(tf.cast(true_positives & valid, self.dtype), index, size)
+        fp = tf.math.unsorted_segment_sum(tf.cast(~true_positives & valid, self.dtype), index, size)
+        num_truth = tf.math.unsorted_segment_sum(tf.cast(tf.reshape(valid_truth, [-1]), self.dtype),
+                                                 tf.clip_by_value(tf.reshape(true_class, [-1]), 0, self._num_classes - 1),
+                                                 self._num_classes)
+        self._true_positives.assign_add(tf.reshape(tp, self._true_positives.shape))
+        self._false_positives.assign_add(tf.reshape(fp, self._false_positives.shape))
+        self._num_ground_truth.assign_add(num_truth)
+        return
+
+    def pr_curves(self):
+        """
+        Return:
+            precision and recall [thresholds, classes, bins], bin k holds the detections with a confidence of at least
+            (num_bins - 1 - k) / num_bins
+        """
+        tp = tf.cumsum(self._true_positives[..., ::-1], axis=-1)
+        fp = tf.cumsum(self._false_positives[..., ::-1], axis=-1)
+        precision = tf.math.divide_no_nan(tp, tp + fp)
+        recall = tf.math.divide_no_nan(tp, self._num_ground_truth[None, :, None])
+        return precision, recall
+
+    def average_precision(self):
+        """the area under the interpolated precision recall curve of each threshold and class, [thresholds, classes]"""
+        precision, recall = self.pr_curves()
+        # the interpolated precision at a recall is the best precision at that recall or more
+        precision = tf.transpose(precision, [2, 0, 1])
+        precision = tf.scan(tf.maximum, precision[::-1])[::-1]
+        precision = tf.transpose(precision, [1, 2, 0])
+        recall_steps = recall - tf.pad(recall[..., :-1], [[0, 0], [0, 0], [1, 0]])
+        return tf.reduce_sum(recall_steps * precision, axis=-1)
+
+    def _mean_over_classes(self, values):
+        present = tf.cast(self._num_ground_truth > 0, values.dtype)
+        return tf.math.divide_no_nan(tf.reduce_sum(values * present, axis=-1), tf.reduce_sum(present))
+
+    def summary(self):
+        """
+        Return:
+            dict with mAP over all the iou thresholds, mAP50 and mAP75, and recall50, the recall at iou 0.5 of all
+            the detections. classes without ground truth are left out of the means
+        """
+        ap = self._mean_over_classes(self.average_precision())
+        _, recall = self.pr_curves()
+        results = {"mAP": tf.reduce_mean(ap)}
+        for name, thresh in (("50", 0.5), ("75", 0.75)):
+            matches = [i for i, t in enumerate(self._iou_thresholds) if abs(t - thresh) < 1e-6]
+            if len(matches) > 0:
+                results[f"mAP{name}"] = ap[matches[0]]
+                if name == "50":
+                    results["recall50"] = self._mean_over_classes(recall[matches[0], :, -1])
+        return results
+
+    def result(self):
+        return self.summary()["mAP"]
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({"num_classes": self._num_classes, "iou_thresholds": self._iou_thresholds, "num_bins": self._num_bins})
+        return config
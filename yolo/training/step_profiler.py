@@ -0,0 +1,213 @@
+"""Per stage timing and tf.profiler traces of the YOLO train and test steps."""
+import collections
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from yolo.utils.loss_utils import build_grided_gt_levels
+from yolo.utils.loss_utils import static_dim
+
+
+def sync(outputs):
+    """wait until every tensor in outputs is computed by copying one value of each to the host"""
+    for tensor in tf.nest.flatten(outputs):
+        if isinstance(tensor, tf.Tensor):
+            _ = tf.reshape(tensor, [-1])[:1].numpy()
+    return outputs
+
+
+def summarize(times):
+    """count, mean, p50, and p99 in ms of a list of times in seconds"""
+    times = np.asarray(times, dtype=np.float64) * 1000
+    return {
+        "count": int(times.size),
+        "mean_ms": float(np.mean(times)),
+        "p50_ms": float(np.percentile(times, 50)),
+        "p99_ms": float(np.percentile(times, 99))
+    }
+
+
+class StepProfiler(object):
+    """
+    time each stage of a Yolo train or test step and trace a window of steps with tf.profiler. works on CPU only
+    hosts, the trace then only has host events.
+
+    every stage is compiled on its own and the profiler waits for it to finish before starting the next, so the
+    stages are:
+        backbone, neck (v4), head: the forward pass of each part of the model
+        decode: the YoloLayer post processing (test steps only)
+        gridding: matching the labels to the output grids, skipped if the pipeline already built the grids
+        loss: the loss of every output path
+        forward_backward: the real training step up to the clipped gradients (model._compute_gradients)
+        backward: forward_backward minus the forward and loss stages, the cost of the gradient computation
+        optimizer: applying the gradients
+        step: the time of a full step as it runs during training
+    the split stages do not overlap the way the fused step does, so their sum is usually more than step.
+
+    profiling a model:
+        summary = model.profile(train, num_steps=20, logdir="./logs/profile")
+
+    the summary is written to logdir/step_profile.json and to TensorBoard scalars in logdir, and the tf.profiler
+    trace of the profiled window is in logdir/plugins/profile.
+
+    Args:
+        model: a built and compiled Yolo model
+        logdir: directory of the summary and the trace
+        profile_start: first timed step that is traced with tf.profiler
+        profile_steps: number of steps traced with tf.profiler, 0 disables the trace
+        warmup: steps run before the timing starts, so tracing the functions is not measured
+    """
+    def __init__(self, model, logdir="./logs/profile", profile_start=2, profile_steps=3, warmup=2):
+        self._model = model
+        self._logdir = logdir
+        self._profile_start = profile_start
+        self._profile_steps = profile_steps
+        self._warmup = warmup
+        self._times = collections.OrderedDict()
+        self._recording = False
+        self._tracing = False
+        self._batch_size = None
+        return
+
+    def _record(self, name, seconds):
+        if self._recording:
+            self._times.setdefault(name, []).append(seconds)
+        return
+
+    def _time(self, name, fn, *args):
+        start = time.perf_counter()
+        outputs = sync(fn(*args))
+        seconds = time.perf_counter() - start
+        self._record(name, seconds)
+        return outputs, seconds
+
+    def _stage_functions(self, training):
+        model = self._model
+        forward = [("backbone", model._backbone)]
+        if getattr(model, "_neck", None) != None:
+            forward.append(("neck", model._neck))
+        forward.append(("head", model._head))
+
+        def layer_fn(layer):
+            return tf.function(lambda x: layer(x, training=training), experimental_relax_shapes=True)
+
+        def grid(label, image):
+            label = dict(label)
+            label["grid"] = build_grided_gt_levels(label, model._masks, static_dim(image, 1), model._path_scales,
+                                                   model._classes, tf.float32, model._use_tie_breaker)
+            return label
+
+        return {
+            "forward": [(name, layer_fn(layer)) for name, layer in forward],
+            "decode": tf.function(model._head_filter, experimental_relax_shapes=True),
+            "gridding": tf.function(grid, experimental_relax_shapes=True),
+            "loss": tf.function(model.apply_loss_fn, experimental_relax_shapes=True),
+            "forward_backward": tf.function(model._compute_gradients, experimental_relax_shapes=True),
+            "optimizer": tf.function(model._apply_gradients, experimental_relax_shapes=True),
+        }
+
+    def _run_step(self, stages, image, label, training):
+        forward_time = 0.0
+        x = image
+        for name, fn in stages["forward"]:
+            x, seconds = self._time(name, fn, x)
+            forward_time += seconds
+        raw = x
+
+        if not training:
+            _, seconds = self._time("decode", stages["decode"], raw)
+            forward_time += seconds
+
+        gridded = label
+        if "grid" not in label:
+            gridded, seconds = self._time("gridding", stages["gridding"], label, image)
+            forward_time += seconds
+        _, seconds = self._time("loss", stages["loss"], gridded, raw)
+        forward_time += seconds
+
+        if not training:
+            self._record("step", forward_time)
+            return
+
+        # the real step, with the labels the model gets during training
+        (_, _, gradients), backward_time = self._time("forward_backward", stages["forward_backward"], image, label)
+        _, optimizer_time = self._time("optimizer", stages["optimizer"], gradients)
+        self._record("backward", max(backward_time - forward_time, 0.0))
+        self._record("step", backward_time + optimizer_time)
+        return
+
+    def _start_trace(self):
+        try:
+            tf.profiler.experimental.start(self._logdir)
+            self._tracing = True
+        except Exception as e:
+            # the trace is optional, ie another profiler is already running
+            print(f"tf.profiler trace not recorded: {e}")
+        return
+
+    def _stop_trace(self):
+        if self._tracing:
+            tf.profiler.experimental.stop()
+            self._tracing = False
+        return
+
+    def profile(self, dataset, num_steps=20, training=True):
+        """
+        Args:
+            dataset: tf.data.Dataset of (image, label) batches
+            num_steps: number of steps that are timed, after the warmup steps
+            training: profile train_step if True, otherwise test_step
+
+        Return:
+            dict mapping each stage to its count, mean, p50, and p99 time in ms
+        """
+        stages = self._stage_functions(training)
+        self._times = collections.OrderedDict()
+        trace_end = self._profile_start + self._profile_steps
+        mode = "train" if training else "test"
+
+        try:
+            for i, (image, label) in enumerate(dataset.take(self._warmup + num_steps)):
+                step = i - self._warmup
+                self._recording = step >= 0
+                self._batch_size = int(tf.shape(image)[0])
+                if self._profile_steps > 0 and step == self._profile_start:
+                    self._start_trace()
+                with tf.profiler.experimental.Trace(mode, step_num=step, _r=1):
+                    self._run_step(stages, image, label, training)
+                if step == trace_end - 1:
+                    self._stop_trace()
+        finally:
+            self._stop_trace()
+            self._recording = False
+
+        summary = self.summary()
+        self.write(summary)
+        return summary
+
+    def summary(self):
+        summary = collections.OrderedDict((name, summarize(times)) for name, times in self._times.items())
+        if "step" in summary and self._batch_size != None:
+            summary["step"]["images_per_sec"] = self._batch_size * 1000 / summary["step"]["mean_ms"]
+        return summary
+
+    def write(self, summary=None):
+        """write the summary to logdir/step_profile.json and as TensorBoard scalars"""
+        summary = self.summary() if summary == None else summary
+        tf.io.gfile.makedirs(self._logdir)
+        with tf.io.gfile.GFile(os.path.join(self._logdir, "step_profile.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+
+        writer = tf.summary.create_file_writer(self._logdir)
+        with writer.as_default():
+            for name, stats in summary.items():
+                for key, value in stats.items():
+                    tf.summary.scalar(f"profile/{name}/{key}", value, step=0)
+                # the time of every step, to see warm up effects and outliers
+                for step, seconds in enumerate(self._times.get(name, [])):
+                    tf.summary.scalar(f"profile/{name}/step_ms", seconds * 1000, step=step)
+        writer.flush()
+        return
@@ -0,0 +1,75 @@
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo.training.recall_metric import YoloDetectionMAP
+
+# two ground truth boxes per image in (x, y, w, h), and padding
+TRUTH = {"bbox": tf.constant([[[0.25, 0.25, 0.5, 0.5], [0.75, 0.75, 0.5, 0.5], [0, 0, 0, 0]]] * 2),
+         "classes": tf.constant([[0, 1, 0]] * 2)}
+# the same boxes in (ymin, xmin, ymax, xmax)
+BOXES = [[0.0, 0.0, 0.5, 0.5], [0.5, 0.5, 1.0, 1.0]]
+
+
+def detections(boxes, classes, confidence, max_boxes=4):
+    pad = max_boxes - len(boxes)
+    return {"bbox": tf.constant([boxes + [[0.0] * 4] * pad] * 2),
+            "classes": tf.constant([classes + [0] * pad] * 2, tf.float32),
+            "confidence": tf.constant([confidence + [0.0] * pad] * 2)}
+
+
+class YoloDetectionMAPTest(tf.test.TestCase, parameterized.TestCase):
+    def test_perfect_detections(self):
+        metric = YoloDetectionMAP(num_classes=3)
+        metric.update_state(TRUTH, detections(BOXES, [0, 1], [0.9, 0.8]))
+        summary = metric.summary()
+        self.assertAllClose(1.0, summary["mAP"])
+        self.assertAllClose(1.0, summary["mAP50"])
+        self.assertAllClose(1.0, summary["recall50"])
+
+    def test_wrong_class(self):
+        metric = YoloDetectionMAP(num_classes=3)
+        metric.update_state(TRUTH, detections(BOXES, [1, 0], [0.9, 0.8]))
+        self.assertAllClose(0.0, metric.result())
+
+    def test_false_positive_before_true_positive(self):
+        # class 0 has a false positive at 0.9 and its true positive at 0.5, so precision is 0.5 at recall 1
+        metric = YoloDetectionMAP(num_classes=2, iou_thresholds=[0.5])
+        metric.update_state(TRUTH, detections(BOXES + [[0.6, 0.0, 0.9, 0.3]], [0, 1, 0], [0.5, 0.8, 0.9]))
+        ap = metric.average_precision()
+        self.assertAllClose([[0.5, 1.0]], ap)
+        self.assertAllClose(0.75, metric.result())
+
+    def test_iou_thresholds(self):
+        # a box shifted to an iou of 2 / 3 with the ground truth only counts at the thresholds up to 0.65
+        shifted = [[0.0, 0.1, 0.5, 0.6], BOXES[1]]
+        metric = YoloDetectionMAP(num_classes=2)
+        metric.update_state(TRUTH, detections(shifted, [0, 1], [0.9, 0.8]))
+        summary = metric.summary()
+        self.assertAllClose(1.0, summary["mAP50"])
+        self.assertAllClose(0.5, summary["mAP75"])
+        self.assertAllClose((0.4 + 1.0) / 2, summary["mAP"])
+
+    def test_duplicate_is_false_positive(self):
+        metric = YoloDetectionMAP(num_classes=2, iou_thresholds=[0.5])
+        metric.update_state(TRUTH, detections(BOXES + [BOXES[0]], [0, 1, 0], [0.9, 0.8, 0.7]))
+        precision, recall = metric.pr_curves()
+        self.assertAllClose(0.5, precision[0, 0, -1])
+        self.assertAllClose(1.0, recall[0, 0, -1])
+
+    def test_streaming_and_reset(self):
+        metric = YoloDetectionMAP(num_classes=2, iou_thresholds=[0.5])
+        metric.update_state(TRUTH, detections(BOXES[:1], [0], [0.9]))
+        metric.update_state(TRUTH, detections(BOXES, [0, 1], [0.9, 0.8]))
+        self.assertAllClose(0.75, metric.summary()["recall50"])
+        metric.reset_states()
+        self.assertAllClose(0.0, metric.result())
+
+    def test_in_tf_function(self):
+        metric = YoloDetectionMAP(num_classes=3)
+        update = tf.function(metric.update_state)
+        update(TRUTH, detections(BOXES, [0, 1], [0.9, 0.8]))
+        self.assertAllClose(1.0, metric.result())
+
+
+if __name__ == "__main__":
+    tf.test.main()
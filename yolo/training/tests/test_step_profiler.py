@@ -0,0 +1,43 @@
+import json
+import os
+
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo import Yolov3
+from yolo.utils.tests.test_loss_utils import random_ground_truth
+
+
+def synthetic_batches(batch_size=2, size=64, classes=10, num_batches=4):
+    images = tf.random.uniform([num_batches * batch_size, size, size, 3], seed=1)
+    labels = random_ground_truth(num_batches * batch_size, 8, classes, num_anchors=6)
+    return tf.data.Dataset.from_tensor_slices((images, labels)).batch(batch_size)
+
+
+def build_tiny(classes=10):
+    model = Yolov3(model="tiny", classes=classes, policy="float32")
+    model.build([None, None, None, 3])
+    loss_fn = model.generate_loss(loss_type="ciou")
+    model.compile(optimizer=tf.keras.optimizers.SGD(1e-3), loss=loss_fn)
+    return model
+
+
+class StepProfilerTest(tf.test.TestCase, parameterized.TestCase):
+    def test_train_stages(self):
+        logdir = self.get_temp_dir()
+        model = build_tiny()
+        summary = model.profile(synthetic_batches(), num_steps=3, logdir=logdir, training=True,
+                                warmup=1, profile_start=0, profile_steps=1)
+        for stage in ["backbone", "head", "gridding", "loss", "forward_backward", "backward", "optimizer", "step"]:
+            self.assertIn(stage, summary)
+            self.assertEqual(3, summary[stage]["count"])
+            self.assertLessEqual(summary[stage]["p50_ms"], summary[stage]["p99_ms"])
+        self.assertGreater(summary["step"]["images_per_sec"], 0)
+
+        with open(os.path.join(logdir, "step_profile.json")) as f:
+            self.assertEqual(set(summary), set(json.load(f)))
+        self.assertNotEmpty(tf.io.gfile.glob(os.path.join(logdir, "events.out.tfevents.*")))
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -166,7 +166,8 @@ def _train_yolo(model_version="v3",
                 fixed_size=False,
                 metrics_full=True,
                 check_point_path="/tmp/checkpoint/yolo_check_point",
-                log_dir="./logs"):
+                log_dir="./logs",
+                profile_batch=0):
     logical_gpus, gpus = configure_gpus(gpus=gpus, memory_limit=memory_limit)
     strategy = tf.distribute.MirroredStrategy(devices=logical_gpus)
 
@@ -222,10 +223,12 @@ def _train_yolo(model_version="v3",
         # modprobe nvidia NVreg_RestrictProfilingToAdminUsers=0
         # sudo vim /etc/modprobe.d/nvidia-kernel-common.conf
         # write options nvidia "NVreg_RestrictProfilingToAdminUsers=0"
+        # profile_batch traces a window of steps with tf.profiler, use model.profile for the per stage times
         tensorboard = tf.keras.callbacks.TensorBoard(log_dir=log_dir,
                                                      histogram_freq=0,
                                                      write_graph=True,
-                                                     update_freq=1000)
+                                                     update_freq=1000,
+                                                     profile_batch=profile_batch)
 
         callbacks = [term_nan, check_points, tensorboard]
         # model.fit(train, validation_data=test, shuffle= True, epochs=epochs, callbacks=callbacks)
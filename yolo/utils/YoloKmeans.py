@@ -2,13 +2,14 @@ import numpy as np
 import pickle
 import tensorflow_datasets as tfds
 import matplotlib.pyplot as plt
-from yolo.utils.iou_utils import compute_iou
-from yolo.utils.box_utils import _yxyx_to_xcycwh
 import tensorflow as tf
 
+# number of boxes compared against the clusters at once, bounds the memory used by the iou matrix
+_CHUNK_SIZE = 1 << 16
+
 
 class YoloKmeans:
-    """K-means for YOLO anchor box priors
+    """K-means for YOLO anchor box priors, using 1 - IOU as the distance
     Args:
         boxes(np.ndarray): a matrix containing image widths and heights
         k(int): number of clusters
@@ -16,10 +17,10 @@ class YoloKmeans:
     To use:
         km = YoloKmeans(boxes = np.random.rand(20, 2), k = 3, with_color = True)
         centroids, map = km.run_kmeans()
-        
+
         km = YoloKmeans()
         km.load_voc_boxes()
-        centroids = km.run_kmeans()
+        centroids = km.run_kmeans(restarts = 8)
 
         km = YoloKmeans()
         km.get_box_from_file("voc_boxes.pkl")
@@ -28,6 +29,10 @@ class YoloKmeans:
         km = YoloKmeans()
         km.get_box_from_dataset(tfds.load('voc', split=['train', 'test', 'validation']))
         centroids = km.run_kmeans()
+
+        # without holding every box in memory
+        km = YoloKmeans()
+        centroids = km.run_minibatch_kmeans(YoloKmeans.box_dataset(tfds.load('coco', split='train')))
     """
     def __init__(self, boxes=None, k=9, with_color=False):
 
@@ -38,21 +43,75 @@ class YoloKmeans:
         self._boxes = boxes
         self._with_color = with_color
 
-    def iou(self, boxes, clusters):
-        n = boxes.shape[0]
-        boxes = tf.repeat(boxes, self._k, axis=0)
-        boxes = tf.reshape(boxes, (n, self._k, -1))
-        boxes = tf.cast(boxes, tf.float32)
+    @staticmethod
+    def iou(boxes, clusters):
+        """
+        iou of boxes and clusters that share the same top left corner, broadcast over every pair
+
+        Args:
+            boxes: array of shape [..., n, 2] holding widths and heights
+            clusters: array of shape [..., k, 2] holding widths and heights
+
+        Return:
+            array of shape [..., n, k]
+        """
+        boxes = np.asarray(boxes, dtype=np.float32)[..., :, None, :]
+        clusters = np.asarray(clusters, dtype=np.float32)[..., None, :, :]
+        intersection = np.prod(np.minimum(boxes, clusters), axis=-1)
+        union = np.prod(boxes, axis=-1) + np.prod(clusters, axis=-1) - intersection
+        return intersection / np.maximum(union, np.finfo(np.float32).eps)
 
-        clusters = tf.tile(clusters, [n, 1])
-        clusters = tf.reshape(clusters, (n, self._k, -1))
-        clusters = tf.cast(clusters, tf.float32)
+    @classmethod
+    def _assign(cls, boxes, clusters):
+        """
+        index of the closest cluster and its iou for every box and every restart
 
-        zeros = tf.cast(tf.zeros(boxes.shape), dtype=tf.float32)
+        Args:
+            boxes: array of shape [n, 2]
+            clusters: array of shape [restarts, k, 2]
 
-        boxes = tf.concat([zeros, boxes], axis=-1)
-        clusters = tf.concat([zeros, clusters], axis=-1)
-        return compute_iou(boxes, clusters)
+        Return:
+            int array [restarts, n] and float array [restarts, n]
+        """
+        assignments, best = [], []
+        for start in range(0, boxes.shape[0], _CHUNK_SIZE):
+            iou = cls.iou(boxes[start:start + _CHUNK_SIZE], clusters)
+            assignments.append(np.argmax(iou, axis=-1))
+            best.append(np.max(iou, axis=-1))
+        return np.concatenate(assignments, axis=-1), np.concatenate(best, axis=-1)
+
+    @classmethod
+    def _kmeans_pp(cls, boxes, k, restarts, rng):
+        """
+        k-means++ seeding for several restarts at once: each new cluster is sampled with
+        probability proportional to the squared distance from the closest cluster picked so far
+
+        Return:
+            array of shape [restarts, k, 2]
+        """
+        n = boxes.shape[0]
+        clusters = np.empty((restarts, k, 2), dtype=np.float32)
+        clusters[:, 0] = boxes[rng.integers(n, size=restarts)]
+        dist = np.full((restarts, n), np.inf, dtype=np.float32)
+        for i in range(1, k):
+            _, best = cls._assign(boxes, clusters[:, i - 1:i])
+            dist = np.minimum(dist, np.square(1 - best))
+            total = np.sum(dist, axis=-1, keepdims=True)
+            # all of the boxes are already on a cluster, fall back to sampling uniformly
+            prob = np.where(total > 0, dist / np.maximum(total, np.finfo(np.float32).tiny), 1 / n)
+            cdf = np.cumsum(prob, axis=-1)
+            samples = rng.random((restarts, 1)) * cdf[:, -1:]
+            index = np.minimum(np.sum(cdf < samples, axis=-1), n - 1)
+            clusters[:, i] = boxes[index]
+        return clusters
+
+    def _seed(self, boxes, restarts, init, rng):
+        if init == 'kmeans++':
+            return self._kmeans_pp(boxes, self._k, restarts, rng)
+        elif init == 'random':
+            index = np.stack([rng.choice(boxes.shape[0], self._k, replace=False) for _ in range(restarts)])
+            return boxes[index]
+        raise ValueError(f'unknown init {init}, expected kmeans++ or random')
 
     def get_box_from_file(self, filename):
         try:
@@ -61,15 +120,36 @@ class YoloKmeans:
             pass
         self._boxes = pickle.load(f)
 
-    def get_box_from_dataset(self, dataset):
-        box_ls = []
-        if not isinstance(dataset, list):
-            dataset = [dataset]
-        for ds in dataset:
-            for el in ds:
-                for box in list(el['objects']['bbox']):
-                    box_ls.append(_yxyx_to_xcycwh(box).numpy()[..., 2:])
-        self._boxes = np.array(box_ls)
+    @staticmethod
+    def box_dataset(dataset, batch_size=4096):
+        """
+        map a tfds detection dataset to a dataset of batches of box widths and heights,
+        without moving single boxes through python
+
+        Args:
+            dataset: a tf.data.Dataset, or a list of them, with the boxes in el['objects']['bbox'] as [ymin, xmin, ymax, xmax]
+            batch_size: number of boxes in each batch
+
+        Return:
+            tf.data.Dataset of float32 tensors of shape [<= batch_size, 2]
+        """
+        if isinstance(dataset, list):
+            datasets = dataset
+            dataset = datasets[0]
+            for ds in datasets[1:]:
+                dataset = dataset.concatenate(ds)
+
+        def get_wh(el):
+            box = tf.cast(el['objects']['bbox'], tf.float32)
+            return tf.stack([box[..., 3] - box[..., 1], box[..., 2] - box[..., 0]], axis=-1)
+
+        dataset = dataset.map(get_wh, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+        dataset = dataset.unbatch().batch(batch_size)
+        return dataset.prefetch(tf.data.experimental.AUTOTUNE)
+
+    def get_box_from_dataset(self, dataset, batch_size=4096):
+        box_ls = [batch.numpy() for batch in self.box_dataset(dataset, batch_size=batch_size)]
+        self._boxes = np.concatenate(box_ls, axis=0) if box_ls else np.zeros((0, 2), dtype=np.float32)
 
     def load_voc_boxes(self):
         self.get_box_from_dataset(
@@ -83,30 +163,123 @@ class YoloKmeans:
     def get_boxes(self):
         return self._boxes
 
-    def run_kmeans(self, max_iter=300):
+    def run_kmeans(self, max_iter=300, restarts=1, init='kmeans++', seed=None):
+        """
+        Lloyd's k-means on every box, with all of the restarts run together in one set of array operations.
+
+        Args:
+            max_iter: the maximum number of iterations
+            restarts: number of independent runs, the run with the highest mean iou is returned
+            init: 'kmeans++' or 'random' seeding
+            seed: seed of the random number generator
+
+        Return:
+            the clusters sorted by area, and the cluster of each box if with_color is True
+        """
         if not isinstance(self._boxes, np.ndarray):
             raise Exception('Box Not found')
 
-        box_num = self._boxes.shape[0]
+        boxes = self._boxes.astype(np.float32)
         k = self._k
-        dists = np.zeros((box_num, k))
-        last = np.zeros((box_num, ))
-        np.random.seed()
-        clusters = self._boxes[np.random.choice(box_num, k, replace=False)]
+        rng = np.random.default_rng(seed)
+        clusters = self._seed(boxes, restarts, init, rng)
+        # cluster ids offset by restart, so the means of every restart come from one bincount
+        offset = np.arange(restarts)[:, None] * k
+        last = None
         num_iters = 0
 
         while num_iters < max_iter:
-            dists = 1 - self.iou(self._boxes, clusters)
-            curr = np.argmin(dists, axis=-1)
-            if (curr == last).all():
+            curr, _ = self._assign(boxes, clusters)
+            if last is not None and (curr == last).all():
                 break
-            for i in range(k):
-                clusters[i] = np.mean(self._boxes[curr == i], axis=0)
+            flat = (curr + offset).ravel()
+            counts = np.bincount(flat, minlength=restarts * k).reshape(restarts, k)
+            sums = np.stack([
+                np.bincount(flat, weights=np.tile(boxes[:, i], restarts), minlength=restarts * k)
+                for i in range(2)
+            ],
+                            axis=-1).reshape(restarts, k, 2)
+            # empty clusters keep their last position
+            clusters = np.where(counts[..., None] > 0, sums / np.maximum(counts[..., None], 1), clusters)
+            clusters = clusters.astype(np.float32)
             last = curr
             num_iters += 1
-        print(f'num_iters = {num_iters}')
-        clusters = np.array(sorted(clusters, key=lambda x: x[0] * x[1]))
+
+        last, best = self._assign(boxes, clusters)
+        run = int(np.argmax(np.mean(best, axis=-1)))
+        return self._finish(clusters[run], last[run])
+
+    def run_minibatch_kmeans(self, dataset=None, max_steps=1000, batch_size=4096, restarts=1, init='kmeans++', seed=None):
+        """
+        mini-batch k-means (Sculley 2010) that streams boxes instead of holding all of them, each cluster moves
+        towards the boxes assigned to it with a learning rate of 1 / (number of boxes it has seen).
+
+        Args:
+            dataset: an iterable of [m, 2] arrays or tensors of widths and heights such as the output of box_dataset,
+                     if None mini-batches are sampled from the loaded boxes
+            max_steps: the maximum number of mini-batches to use
+            batch_size: size of the sampled mini-batches when dataset is None
+            restarts: number of independent runs, the run with the highest mean iou on the first mini-batch is returned
+            init: 'kmeans++' or 'random' seeding from the first mini-batch
+            seed: seed of the random number generator
+
+        Return:
+            the clusters sorted by area, and the cluster of each loaded box if with_color is True
+        """
+        k = self._k
+        rng = np.random.default_rng(seed)
+        if dataset is None:
+            if not isinstance(self._boxes, np.ndarray):
+                raise Exception('Box Not found')
+            boxes = self._boxes.astype(np.float32)
+            dataset = (boxes[rng.integers(boxes.shape[0], size=batch_size)] for _ in range(max_steps))
+
+        clusters = None
+        counts = np.zeros((restarts, k), dtype=np.float64)
+        offset = np.arange(restarts)[:, None] * k
+        for step, batch in enumerate(dataset):
+            if step >= max_steps:
+                break
+            batch = np.asarray(batch, dtype=np.float32)
+            if clusters is None:
+                if batch.shape[0] < k:
+                    continue
+                first = batch
+                clusters = self._seed(batch, restarts, init, rng).astype(np.float64)
+
+            curr, _ = self._assign(batch, clusters)
+            flat = (curr + offset).ravel()
+            batch_counts = np.bincount(flat, minlength=restarts * k).reshape(restarts, k)
+            sums = np.stack([
+                np.bincount(flat, weights=np.tile(batch[:, i], restarts), minlength=restarts * k)
+                for i in range(2)
+            ],
+                            axis=-1).reshape(restarts, k, 2)
+            counts += batch_counts
+            # the per box updates c += (x - c) / count summed over the batch
+            rate = batch_counts / np.maximum(counts, 1)
+            means = sums / np.maximum(batch_counts[..., None], 1)
+            clusters += rate[..., None] * (means - clusters)
+
+        if clusters is None:
+            raise Exception('Box Not found')
+
+        _, best = self._assign(first, clusters)
+        run = int(np.argmax(np.mean(best, axis=-1)))
+        clusters = clusters[run].astype(np.float32)
+        last = None
+        if self._with_color and isinstance(self._boxes, np.ndarray):
+            last, _ = self._assign(self._boxes.astype(np.float32), clusters[None])
+            last = last[0]
+        return self._finish(clusters, last)
+
+    def _finish(self, clusters, last):
+        order = np.argsort(clusters[:, 0] * clusters[:, 1])
+        clusters = clusters[order]
         if self._with_color:
+            if last is not None:
+                # relabel the boxes to match the sorted clusters
+                last = np.argsort(order)[last]
             return clusters, last
         else:
             return clusters
@@ -115,7 +288,7 @@ class YoloKmeans:
 if __name__ == '__main__':
     km = YoloKmeans(with_color=True)
     km.load_coco_boxes()
-    centroids, cmap = km.run_kmeans()
+    centroids, cmap = km.run_kmeans(restarts=4)
     boxes = km.get_boxes()
     plt.scatter(boxes[:, 0], boxes[:, 1], c=cmap)
     plt.scatter(centroids[:, 0], centroids[:, 1], c='b')
@@ -71,7 +71,10 @@ class DarkNetConverter(_DarkNetSectionList):
         clz: Type[T],
         config_file: Union[PathABC, io.TextIOBase],
         weights_file: Union[PathABC, io.RawIOBase,
-                            io.BufferedIOBase] = None) -> T:
+                            io.BufferedIOBase] = None,
+        quiet: bool = False,
+        use_mmap: bool = True,
+        cache_file: PathABC = None) -> T:
         """
         Parse the config and weights files and read the DarkNet layer's encoder,
         decoder, and output layers. The number of bytes in the file is also returned.
@@ -79,6 +82,12 @@ class DarkNetConverter(_DarkNetSectionList):
         Args:
             config_file: str, path to yolo config file from Darknet
             weights_file: str, path to yolo weights file from Darknet
+            quiet: bool, if True the layers are not printed while reading
+            use_mmap: bool, if True the weights file is memory-mapped once and
+                      the layers hold read-only views into it
+            cache_file: str, optional path to an .npz file used to cache the
+                        weights after they are converted to the TensorFlow
+                        layout
 
         Returns:
             a DarkNetConverter object
@@ -86,14 +95,31 @@ class DarkNetConverter(_DarkNetSectionList):
         from .read_weights import read_weights
 
         full_net = clz()
-        read_weights(full_net, config_file, weights_file)
+        full_net._source = (config_file, weights_file)
+        read_weights(full_net,
+                     config_file,
+                     weights_file,
+                     quiet=quiet,
+                     use_mmap=use_mmap,
+                     cache_file=cache_file)
         return full_net
 
     def to_tf(self,
               thresh=0.45,
               class_thresh=0.45,
               max_boxes=200,
-              use_mixed=True):
+              use_mixed=True,
+              use_cache=False,
+              cache_dir=None):
+        """
+        Build a Keras model from the DarkNet layers and assign the weights.
+
+        Args:
+            use_cache: bool, if true the weights of the model are stored in and
+                       loaded from the converted weights cache, keyed by the
+                       files that this object was read from
+            cache_dir: str, path to the directory of the cache
+        """
         import tensorflow as tf
 
         tensors = _DarkNetSectionList()
@@ -125,9 +151,26 @@ class DarkNetConverter(_DarkNetSectionList):
                                    use_mixed=use_mixed))
         model.build(self.net.shape)
 
+        source = getattr(self, '_source', (None, None))
+        cached = None
+        if use_cache and None not in source:
+            from .weights_cache import WeightsCache
+            cache = WeightsCache(cache_dir)
+            key = cache.key(*source,
+                            variant='darknet',
+                            policy='mixed_float16' if use_mixed else 'float32')
+            cached = cache.get(key)
+
+        if cached is not None:
+            model.set_weights(cached['model'])
+            return model
+
         for cfg, layer in zip(self, layers):
             if layer is not None:
                 layer.set_weights(cfg.get_weights())
+
+        if use_cache and None not in source:
+            cache.put(key, {'model': model.get_weights()})
         return model
 
     def _process_yolo_layer(self,
@@ -11,6 +11,9 @@ _flags.DEFINE_boolean('weights_only', False,
 
 from . import DarkNetConverter
 
+# models that the converted weights cache can be pre-warmed for
+_PREWARM_MODELS = ('darknet', 'yolov3', 'yolov3-spp', 'yolov3-tiny', 'yolov4')
+
 
 def _makeParser(parser):
     parser.add_argument('cfg',
@@ -24,11 +27,58 @@ def _makeParser(parser):
                         type=_argparse.FileType('rb'),
                         nargs='?')
     parser.add_argument(
-        'output', help='name of the location to save the generated model')
+        'output',
+        help='name of the location to save the generated model',
+        nargs='?')
+    parser.add_argument(
+        '--prewarm',
+        default=None,
+        choices=_PREWARM_MODELS,
+        help='convert the weights for this model and store them in the '
+        'converted weights cache instead of saving a model')
+    parser.add_argument('--cache_dir',
+                        default=None,
+                        help='directory of the converted weights cache')
+    parser.add_argument('--policy',
+                        default='float32',
+                        help='dtype policy of the model to pre-warm')
+    parser.add_argument('--clear_cache',
+                        action='store_true',
+                        help='remove every entry in the converted weights '
+                        'cache')
+
+
+def prewarm(model_name, cfg=None, weights=None, cache_dir=None,
+            policy='float32'):
+    """
+    Convert the DarkNet weights for a model and store them in the converted
+    weights cache so that the next time they are loaded, the DarkNet files do
+    not have to be read.
+    """
+    if model_name == 'darknet':
+        DarkNetConverter.read(cfg, weights, quiet=True).to_tf(
+            use_mixed=policy != 'float32', use_cache=True, cache_dir=cache_dir)
+        return
+
+    if model_name == 'yolov4':
+        from yolo import Yolov4
+        model = Yolov4(model='regular', policy=policy)
+    else:
+        from yolo import Yolov3
+        variant = model_name[len('yolov3-'):] or 'regular'
+        model = Yolov3(model=variant, policy=policy)
+    model.load_weights_from_dn(dn2tf_backbone=True,
+                               dn2tf_head=True,
+                               config_file=cfg,
+                               weights_file=weights,
+                               use_cache=True,
+                               cache_dir=cache_dir)
+    return
 
 
 def main(argv, args=None):
     from ..file_manager import download
+    from .weights_cache import WeightsCache
     import os
 
     if args is None:
@@ -37,6 +87,26 @@ def main(argv, args=None):
     cfg = args.cfg
     weights = args.weights
     output = args.output
+
+    if args.clear_cache:
+        WeightsCache(args.cache_dir).invalidate()
+
+    if args.prewarm is not None:
+        if args.prewarm == 'darknet':
+            cfg = cfg or download('yolov3.cfg')
+            weights = weights or download('yolov3.weights')
+        prewarm(args.prewarm,
+                cfg=cfg,
+                weights=weights,
+                cache_dir=args.cache_dir,
+                policy=args.policy)
+        return
+
+    if output is None:
+        if args.clear_cache:
+            return
+        _parser.error('the output argument is required')
+
     if cfg is None:
         cfg = download('yolov3.cfg')
     if weights is None:
@@ -44,7 +114,7 @@ def main(argv, args=None):
 
     model = DarkNetConverter.read(cfg, weights).to_tf()
     if output != os.devnull:
-        if flags.FLAGS.weights_only:
+        if _flags.FLAGS.weights_only:
             model.save_weights(output)
         else:
             model.save(output)
@@ -55,7 +125,6 @@ _makeParser(_parser)
 
 from absl import app
 import sys
-from . import main, _parser
 
 if __name__ == '__main__':
     # I dislike Abseil's current help menu. I like the default Python one
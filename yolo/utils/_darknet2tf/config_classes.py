@@ -59,6 +59,30 @@ class Config(ABC):
         '''
         return 0
 
+    def num_weights(self) -> int:
+        '''
+        Returns:
+            the number of float32 values that are stored for the current layer
+            in the weights file. This is used to build an index of the offset
+            of each layer in the file without reading it.
+        '''
+        return 0
+
+    def load_weights_view(self, buffer) -> int:
+        '''
+        Load the weights for the current layer from a buffer (usually a
+        read-only, memory-mapped view of the weights file) without copying
+        them.
+
+        Arguments:
+            buffer: 1D float32 Numpy array that starts at the first weight of
+                    the current layer
+
+        Returns:
+            the number of bytes read.
+        '''
+        return 0
+
     def get_weights(self) -> list:
         '''
         Returns:
@@ -67,6 +91,13 @@ class Config(ABC):
         '''
         return []
 
+    def set_weights(self, weights: list):
+        '''
+        Set the weights of the current layer from a list of Numpy arrays that
+        are in the same order and layout as the output of get_weights.
+        '''
+        return
+
     @classmethod
     def from_dict(clz, net, layer_dict) -> "Config":
         '''
@@ -163,19 +194,34 @@ class convCFG(Config):
         h = len_width(self.h, self.size, self.pad, self.stride)
         return (w, h, self.filters)
 
+    def num_weights(self):
+        if self.batch_normalize == 1:
+            return self.filters * 4 + self.nweights
+        return self.filters + self.nweights
+
     def load_weights(self, files):
-        self.biases = read_n_floats(self.filters, files)
+        # read all of the values for the layer at once instead of one read
+        # for each of the biases, scales, rolling mean, variance, and kernel
+        return self.load_weights_view(read_n_floats(self.num_weights(), files))
+
+    def load_weights_view(self, buffer):
+        self.biases = buffer[0:self.filters]
         bytes_read = self.filters
 
         if self.batch_normalize == 1:
-            self.scales = read_n_floats(self.filters, files)
-            self.rolling_mean = read_n_floats(self.filters, files)
-            self.rolling_variance = read_n_floats(self.filters, files)
-            bytes_read += self.filters * 3
+            self.scales = buffer[bytes_read:bytes_read + self.filters]
+            bytes_read += self.filters
+            self.rolling_mean = buffer[bytes_read:bytes_read + self.filters]
+            bytes_read += self.filters
+            self.rolling_variance = buffer[bytes_read:bytes_read +
+                                           self.filters]
+            bytes_read += self.filters
 
         # used as a guide:
         # https://github.com/thtrieu/darkflow/blob/master/darkflow/dark/convolution.py
-        weights = read_n_floats(self.nweights, files)
+        # the transpose is only a strided view, so the kernel is not copied
+        # into the TensorFlow layout until it is assigned to a variable
+        weights = buffer[bytes_read:bytes_read + self.nweights]
         self.weights = weights.reshape(self.filters, self.c, self.size,
                                        self.size).transpose([2, 3, 1, 0])
         bytes_read += self.nweights
@@ -197,6 +243,14 @@ class convCFG(Config):
         else:
             return [self.weights, self.biases]
 
+    def set_weights(self, weights):
+        if self.batch_normalize:
+            (self.weights, self.scales, self.biases, self.rolling_mean,
+             self.rolling_variance) = weights
+        else:
+            self.weights, self.biases = weights
+        return
+
     def to_tf(self, tensors):
         from yolo.modeling.building_blocks import DarkConv
         layer = DarkConv(
@@ -2,6 +2,7 @@
 This file contains the code to parse DarkNet weight files.
 """
 
+import hashlib
 import io
 import numpy as np
 import os
@@ -11,6 +12,7 @@ from typing import Union
 from .config_classes import *
 from .dn2dicts import convertConfigFile
 from ..file_manager import PathABC, get_size, open_if_not_open
+from .weights_cache import WeightsCache
 
 
 def build_layer(layer_dict, file, net):
@@ -25,27 +27,54 @@ def build_layer(layer_dict, file, net):
     return layer, bytes_read
 
 
-def read_file(full_net, config, weights=None):
-    """read the file and construct weights net list"""
-    bytes_read = 0
-
-    if weights is not None:
-        major, minor, revision = read_n_int(3, weights)
-        bytes_read += 12
-
-        if ((major * 10 + minor) >= 2):
-            print("64 seen")
-            iseen = read_n_long(1, weights, unsigned=True)[0]
-            bytes_read += 8
-        else:
-            print("32 seen")
-            iseen = read_n_int(1, weights, unsigned=True)[0]
-            bytes_read += 4
-
+def _print_header(major, minor, revision, iseen, quiet=False):
+    if not quiet:
+        print("64 seen" if (major * 10 + minor) >= 2 else "32 seen")
         print(f"major: {major}")
         print(f"minor: {minor}")
         print(f"revision: {revision}")
         print(f"iseen: {iseen}")
+    return
+
+
+def read_header(weights, quiet=False):
+    """read the version and the number of images seen from the weights file"""
+    bytes_read = 0
+    major, minor, revision = read_n_int(3, weights)
+    bytes_read += 12
+
+    if ((major * 10 + minor) >= 2):
+        iseen = read_n_long(1, weights, unsigned=True)[0]
+        bytes_read += 8
+    else:
+        iseen = read_n_int(1, weights, unsigned=True)[0]
+        bytes_read += 4
+
+    _print_header(major, minor, revision, iseen, quiet=quiet)
+    return bytes_read
+
+
+def read_header_view(buffer, quiet=False):
+    """read the header from a memory-mapped weights file"""
+    major, minor, revision = buffer[0:12].view('<i4')
+
+    if ((major * 10 + minor) >= 2):
+        iseen = buffer[12:20].view('<u8')[0]
+        bytes_read = 20
+    else:
+        iseen = buffer[12:16].view('<u4')[0]
+        bytes_read = 16
+
+    _print_header(major, minor, revision, iseen, quiet=quiet)
+    return bytes_read
+
+
+def read_file(full_net, config, weights=None, quiet=False):
+    """read the file and construct weights net list"""
+    bytes_read = 0
+
+    if weights is not None:
+        bytes_read += read_header(weights, quiet=quiet)
 
     for i, layer_dict in enumerate(config):
         try:
@@ -57,7 +86,144 @@ def read_file(full_net, config, weights=None):
     return bytes_read
 
 
-def read_weights(full_net, config_file, weights_file):
+def build_offset_index(full_net, header_size=0):
+    """
+    find the byte offset of the weights of every layer in the weights file
+    using only the parsed config
+
+    Args:
+        full_net: DarkNetConverter containing layers without weights
+        header_size: number of bytes in the header of the weights file
+
+    Returns:
+        list of (offset, number of float32 values) for each layer in
+        full_net.data and the total size of the weights file in bytes
+    """
+    index = []
+    offset = header_size
+    for layer in full_net.data:
+        count = layer.num_weights()
+        index.append((offset, count))
+        offset += count * 4
+    return index, offset
+
+
+def _mmap_weights(weights_file):
+    """memory map the weights file once in read-only mode"""
+    if isinstance(weights_file, io.IOBase):
+        try:
+            weights_file.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            # in memory files cannot be mapped
+            return None
+    return np.memmap(weights_file, dtype=np.uint8, mode='r')
+
+
+def read_file_mmap(full_net, config, buffer, quiet=False):
+    """
+    construct the weights net list from a memory-mapped weights file. The
+    weights of each layer are read-only views into the map, so nothing is
+    copied until the weights are assigned to TensorFlow variables.
+    """
+    header_size = read_header_view(buffer, quiet=quiet)
+    read_file(full_net, config)
+
+    index, size = build_offset_index(full_net, header_size)
+    if size != buffer.shape[0]:
+        raise IOError('error reading weights file')
+
+    floats = buffer[header_size:].view('<f4')
+    bytes_read = header_size
+    for i, (layer, (offset, count)) in enumerate(zip(full_net.data, index)):
+        start = (offset - header_size) // 4
+        try:
+            bytes_read += layer.load_weights_view(floats[start:start + count])
+        except Exception as e:
+            raise ValueError(f"Cannot read weights for layer [#{i}]") from e
+    return bytes_read
+
+
+def source_hash(config_file, weights_file, cache_dir):
+    """
+    sha256 of the contents of the config and weights files, the key of the
+    cache. A copied or touched file keeps its key, and a different file of
+    the same size does not match. The hash of each file is remembered in the
+    index of a WeightsCache in cache_dir and only recomputed when its size or
+    modification time changes, so a warm start does not read the weights file.
+    """
+    hashes = WeightsCache(cache_dir)
+    sha = hashlib.sha256()
+    for file in (config_file, weights_file):
+        sha.update(hashes._content_hash(file).encode())
+    return sha.hexdigest()
+
+
+def save_cache(full_net, cache_file, size, digest):
+    """
+    save the TensorFlow layout weights of every layer to an .npz file so the
+    next startup can skip reading and converting the DarkNet weights
+
+    Args:
+        digest: the source_hash of the files the weights were read from
+    """
+    arrays = {
+        "__size__": np.array(size),
+        "__layers__": np.array(len(full_net.data)),
+        "__sha256__": np.array(digest)
+    }
+    for i, layer in enumerate(full_net.data):
+        for j, weights in enumerate(layer.get_weights()):
+            arrays[f"{i}_{j}"] = weights
+    with open(cache_file, "wb") as file:
+        np.savez(file, **arrays)
+    return
+
+
+def load_cache(full_net, cache_file, size, digest):
+    """
+    load the weights of every layer in full_net from a cache written by
+    save_cache. Returns False if the cache was written for other files or
+    does not match the model.
+    """
+    if not os.path.exists(cache_file):
+        return False
+    with np.load(cache_file) as cache:
+        if "__sha256__" not in cache.files or str(cache["__sha256__"]) != digest:
+            return False
+        if int(cache["__size__"]) != size or int(cache["__layers__"]) != len(full_net.data):
+            return False
+        files = set(cache.files)
+        for i, layer in enumerate(full_net.data):
+            weights = []
+            while f"{i}_{len(weights)}" in files:
+                weights.append(cache[f"{i}_{len(weights)}"])
+            if weights:
+                layer.set_weights(weights)
+    return True
+
+
+def read_weights(full_net,
+                 config_file,
+                 weights_file,
+                 quiet=False,
+                 use_mmap=True,
+                 cache_file=None):
+    """
+    Parse the config file and read the weights of every layer into full_net.
+
+    Args:
+        full_net: empty DarkNetConverter to append the layers to
+        config_file: path or open file for the DarkNet config
+        weights_file: path or open file for the DarkNet weights, if None only
+                      the config is parsed
+        quiet: bool, if True nothing is printed while reading
+        use_mmap: bool, if True the weights file is memory-mapped and every
+                  layer holds read-only views into it instead of copies
+        cache_file: optional path to an .npz file holding the converted
+                    TensorFlow layout weights. It is used instead of the
+                    weights file if it was written for files with the same
+                    contents, and is written otherwise.
+    """
     if weights_file is None:
         with open_if_not_open(config_file) as config:
             config = convertConfigFile(config)
@@ -65,15 +231,32 @@ def read_weights(full_net, config_file, weights_file):
         return full_net
 
     size = get_size(weights_file)
-    with open_if_not_open(config_file) as config, \
-        open_if_not_open(weights_file, "rb") as weights:
+    with open_if_not_open(config_file) as config:
         config = convertConfigFile(config)
-        bytes_read = read_file(full_net, config, weights)
+
+    digest = None
+    if cache_file is not None:
+        digest = source_hash(config_file, weights_file, os.path.dirname(os.path.abspath(cache_file)))
+        read_file(full_net, config)
+        if load_cache(full_net, cache_file, size, digest):
+            return full_net
+        del full_net.data[:]
+
+    buffer = _mmap_weights(weights_file) if use_mmap else None
+    if buffer is not None:
+        bytes_read = read_file_mmap(full_net, config, buffer, quiet=quiet)
+    else:
+        with open_if_not_open(weights_file, "rb") as weights:
+            bytes_read = read_file(full_net, config, weights, quiet=quiet)
+
+    if not quiet:
         print('full net: ')
         for e in full_net:
             print(f"{e.w} {e.h} {e.c}\t{e}")
-        print(
-            f"bytes_read: {bytes_read}, original_size: {size}, final_position: {weights.tell()}"
-        )
+        print(f"bytes_read: {bytes_read}, original_size: {size}")
     if (bytes_read != size):
         raise IOError('error reading weights file')
+
+    if cache_file is not None:
+        save_cache(full_net, cache_file, size, digest)
+    return full_net
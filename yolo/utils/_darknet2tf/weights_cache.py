@@ -0,0 +1,240 @@
+"""
+A content-addressed cache for DarkNet weights that were already converted and
+remapped into the layout used by the TensorFlow models.
+
+Reading a DarkNet config and weights file and remapping every layer to the
+Keras layers of a model is slow, so the ready-to-assign weight lists of each
+part of the model are stored in an .npz file keyed by the contents of the
+config and weights files, the model variant, and the dtype policy. Warm starts
+only need to load the .npz file and assign it.
+"""
+
+import hashlib
+import io
+import json
+import os
+import time
+
+import numpy as np
+
+from typing import Dict, List, Optional, Union
+
+from ..file_manager import PathABC
+
+_INDEX = 'index.json'
+_CHUNK_SIZE = 1 << 20
+
+
+def _file_id(file: Union[PathABC, io.IOBase]):
+    """the absolute path, size, and modification time of a file on disk"""
+    if isinstance(file, io.IOBase):
+        file = getattr(file, 'name', None)
+        if not isinstance(file, (str, bytes, os.PathLike)):
+            return None
+    path = os.path.abspath(os.fsdecode(file))
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime
+
+
+def hash_file(file: Union[PathABC, io.IOBase]) -> str:
+    """
+    Find the sha256 hash of a file given either as a path or an open (seekable)
+    file object. The position of an open file object is not changed.
+    """
+    sha = hashlib.sha256()
+    if isinstance(file, io.IOBase):
+        position = file.tell()
+        file.seek(0)
+        chunk = file.read(_CHUNK_SIZE)
+        while chunk:
+            sha.update(chunk if isinstance(chunk, bytes) else chunk.encode())
+            chunk = file.read(_CHUNK_SIZE)
+        file.seek(position)
+    else:
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+                sha.update(chunk)
+    return sha.hexdigest()
+
+
+class WeightsCache(object):
+    """
+    A directory of converted weights with a size cap. When the total size of
+    the entries is larger than max_size, the least recently used entries are
+    removed.
+
+    example:
+        cache = WeightsCache()
+        key = cache.key('yolov4.cfg', 'yolov4.weights', 'yolov4', 'float32')
+        weights = cache.get(key)
+        if weights is None:
+            weights = {'backbone': backbone.get_weights()}
+            cache.put(key, weights)
+    """
+    def __init__(self,
+                 cache_dir: PathABC = None,
+                 max_size: int = 4 * (1 << 30)):
+        """
+        Args:
+            cache_dir: directory to store the converted weights in, defaults to
+                       cache/converted next to the downloaded DarkNet files
+            max_size: the maximum number of bytes that the cache can hold
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.abspath('cache'), 'converted')
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+        os.makedirs(self._cache_dir, exist_ok=True)
+        self._index = self._read_index()
+        return
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    @property
+    def size(self) -> int:
+        """total number of bytes held by the cache"""
+        return sum(entry['size'] for entry in self._index['entries'].values())
+
+    def _read_index(self):
+        path = os.path.join(self._cache_dir, _INDEX)
+        try:
+            with open(path, 'r') as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault('entries', {})
+        index.setdefault('hashes', {})
+        return index
+
+    def _write_index(self):
+        path = os.path.join(self._cache_dir, _INDEX)
+        with open(path + '.tmp', 'w') as file:
+            json.dump(self._index, file, indent=1)
+        os.replace(path + '.tmp', path)
+        return
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, key + '.npz')
+
+    def _content_hash(self, file: Union[PathABC, io.IOBase]) -> str:
+        """hash a file, reusing the last hash if the file was not modified"""
+        file_id = _file_id(file)
+        if file_id is not None:
+            path, size, mtime = file_id
+            known = self._index['hashes'].get(path)
+            if known is not None and known['size'] == size and known[
+                    'mtime'] == mtime:
+                return known['sha256']
+        digest = hash_file(file if file_id is None else file_id[0])
+        if file_id is not None:
+            self._index['hashes'][path] = {
+                'size': size,
+                'mtime': mtime,
+                'sha256': digest
+            }
+            self._write_index()
+        return digest
+
+    def key(self,
+            config_file: Union[PathABC, io.IOBase],
+            weights_file: Union[PathABC, io.IOBase],
+            variant: str,
+            policy: str = 'float32') -> str:
+        """
+        Build the key of the converted weights of a model.
+
+        Args:
+            config_file: path or open file for the DarkNet config
+            weights_file: path or open file for the DarkNet weights
+            variant: name of the model variant and anything else that changes
+                     how the weights are remapped
+            policy: name of the dtype policy that the model is built with
+
+        Returns:
+            the key as a hex string
+        """
+        sha = hashlib.sha256()
+        for part in (self._content_hash(config_file),
+                     self._content_hash(weights_file), variant, policy):
+            sha.update(str(part).encode())
+            sha.update(b'\0')
+        return sha.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, List[np.ndarray]]]:
+        """
+        Look up the converted weights for a key. The time of the hit is only
+        kept in memory and written to the index with the next put or
+        invalidate, so a hit does not rewrite the index.
+
+        Returns:
+            a dict mapping the name of each part of the model to its weight
+            list, or None if the key is not in the cache
+        """
+        entry = self._index['entries'].get(key)
+        if entry is None or not os.path.exists(self._path(key)):
+            return None
+
+        weights = {}
+        with np.load(self._path(key)) as data:
+            for name in data.files:
+                part, i = name.rsplit(':', 1)
+                weights.setdefault(part, {})[int(i)] = data[name]
+        weights = {
+            part: [values[i] for i in sorted(values)]
+            for part, values in weights.items()
+        }
+
+        entry['last_used'] = time.time()
+        return weights
+
+    def put(self, key: str, weights: Dict[str, List[np.ndarray]]):
+        """
+        Store converted weights, evicting the least recently used entries if
+        the cache grows larger than max_size.
+
+        Args:
+            key: the key from WeightsCache.key
+            weights: a dict mapping the name of each part of the model to its
+                     weight list
+        """
+        arrays = {
+            f'{part}:{i}': value
+            for part, values in weights.items()
+            for i, value in enumerate(values)
+        }
+        path = self._path(key)
+        with open(path + '.tmp', 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(path + '.tmp', path)
+
+        self._index['entries'][key] = {
+            'size': os.path.getsize(path),
+            'last_used': time.time()
+        }
+        self._evict()
+        self._write_index()
+        return
+
+    def invalidate(self, key: str = None):
+        """remove the entry for a key, or every entry if the key is None"""
+        keys = list(self._index['entries']) if key is None else [key]
+        for key in keys:
+            self._index['entries'].pop(key, None)
+            if os.path.exists(self._path(key)):
+                os.remove(self._path(key))
+        self._write_index()
+        return
+
+    def _evict(self):
+        entries = self._index['entries']
+        total = self.size
+        for key in sorted(entries, key=lambda k: entries[k]['last_used']):
+            if total <= self._max_size:
+                break
+            total -= entries[key]['size']
+            del entries[key]
+            if os.path.exists(self._path(key)):
+                os.remove(self._path(key))
+        return
@@ -1,4 +1,4 @@
-from yolo.dataloaders.YoloKmeans import YoloKmeans
+from yolo.utils.YoloKmeans import YoloKmeans
 import tensorflow_datasets as tfds
 import numpy as np
 
@@ -8,7 +8,7 @@ def build_anchor_boxes(dataset, num_boxes=9, width=416., height=416.):
         raise ValueError('num_boxes should be an Integer')
     km = YoloKmeans(k=num_boxes)
     km.get_box_from_dataset(dataset)
-    centroids = km.run_kmeans()
+    centroids = km.run_kmeans(restarts=4)
     centroids = np.multiply(centroids,
                             np.tile(np.array([width, height]), [num_boxes, 1]))
     return centroids.astype(int)
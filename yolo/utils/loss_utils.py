@@ -1,3 +1,7 @@
+import collections
+import threading
+
+import numpy as np
 import tensorflow as tf
 from tensorflow.keras import backend as K
 
@@ -13,7 +17,103 @@ def parse_yolo_box_predictions(unscaled_box, width, height, anchor_grid, grid_po
 @tf.function(experimental_relax_shapes=True)
 def build_grided_gt(y_true, mask, size, classes, true_shape, dtype, use_tie_breaker):
     """
-    convert ground truth for use in loss functions
+    convert ground truth for use in loss functions, all boxes in the batch are matched to the 
+    anchor mask at once and written to the grid with a single scatter
+    Args: 
+        y_true: tf.Tensor[] ground truth [box coords[0:4], classes_onehot[0:-1], best_fit_anchor_box]
+        mask: list of the anchor boxes choresponding to the output, ex. [1, 2, 3] tells this layer to predict only the first 3 anchors in the total. 
+        size: the dimensions of this output, for regular, it progresses from 13, to 26, to 52
+    
+    Return:
+        tf.Tensor[] of shape [batch, size, size, #of_anchors, 4, 1, num_classes]
+    """
+    boxes = tf.cast(y_true["bbox"], dtype) 
+    classes = tf.one_hot(tf.cast(y_true["classes"], dtype = tf.int32), depth = classes, dtype = dtype)
+    anchors = tf.cast(y_true["best_anchors"], tf.int32) 
+    mask = tf.cast(mask, dtype=tf.int32)
+
+    batches = tf.shape(boxes)[0]
+    num_boxes = tf.shape(boxes)[1]
+    len_masks = tf.shape(mask)[0]
+    num_anchors = tf.shape(anchors)[-1]
+
+    full = tf.zeros([batches, size, size, len_masks, true_shape[-1]], dtype = dtype)
+
+    x = tf.cast(boxes[..., 0] * tf.cast(size, dtype=dtype),
+                dtype=tf.int32)
+    y = tf.cast(boxes[..., 1] * tf.cast(size, dtype=dtype),
+                dtype=tf.int32)
+
+    # boxes that are padding or have a center outside of the image are never written
+    valid = tf.logical_not(tf.reduce_all(tf.math.equal(boxes[..., 2:4], 0), axis=-1))
+    valid = tf.logical_and(valid, tf.reduce_all(tf.math.greater_equal(boxes[..., 0:2], 0.0), axis=-1))
+    valid = tf.logical_and(valid, tf.reduce_all(tf.math.less(boxes[..., 0:2], 1.0), axis=-1))
+
+    # [batch, box, anchor_id, mask] match every ranked anchor to this layers mask
+    match = tf.math.equal(tf.expand_dims(anchors, axis=-1), mask)
+    p = tf.cast(tf.argmax(tf.cast(match, dtype=tf.int32), axis=-1), dtype=tf.int32)
+
+    # the tie breaker considers the first len(mask) ranked anchors, otherwise only the best one
+    num_used = tf.where(tf.cast(use_tie_breaker, tf.bool), len_masks, 1)
+    used_anchor = tf.range(num_anchors) < num_used
+    candidate = tf.reduce_any(match, axis=-1) & tf.expand_dims(valid, axis=-1) & used_anchor
+
+    # the best anchor is always written, a lower ranked anchor is only written if no box at or 
+    # before it in the batch wrote its best anchor to the same cell and anchor
+    primary = candidate[..., 0]
+    same_cell = tf.math.equal(tf.expand_dims(x, axis=-1), tf.expand_dims(x, axis=-2)) & tf.math.equal(tf.expand_dims(y, axis=-1), tf.expand_dims(y, axis=-2))
+    box_ids = tf.range(num_boxes)
+    before = tf.expand_dims(box_ids, axis=-1) >= tf.expand_dims(box_ids, axis=0)
+    owner = same_cell & before & tf.expand_dims(primary, axis=-2)
+    same_anchor = tf.math.equal(tf.expand_dims(p, axis=-2), tf.expand_dims(tf.expand_dims(p[..., 0], axis=-2), axis=-1))
+    blocked = tf.reduce_any(tf.expand_dims(owner, axis=-1) & same_anchor, axis=-2)
+    write = candidate & tf.logical_or(tf.equal(tf.range(num_anchors), 0), tf.logical_not(blocked))
+
+    # the boxes output from yolo have the x and y indexes swapped, so the grid is indexed [batch, y, x, anchor]
+    batch_index = tf.broadcast_to(tf.reshape(tf.range(batches), [-1, 1, 1]), tf.shape(p))
+    y_index = tf.broadcast_to(tf.expand_dims(y, axis=-1), tf.shape(p))
+    x_index = tf.broadcast_to(tf.expand_dims(x, axis=-1), tf.shape(p))
+    update_index = tf.stack([batch_index, y_index, x_index, p], axis=-1)
+    update_index = tf.where(tf.expand_dims(write, axis=-1), update_index, tf.zeros_like(update_index))
+
+    const = tf.ones_like(boxes[..., 0:1])
+    value = K.concatenate([boxes, const, classes], axis=-1)
+    update = tf.where(tf.expand_dims(write, axis=-1), tf.expand_dims(value, axis=-2), tf.zeros_like(tf.expand_dims(value, axis=-2)))
+
+    full = tf.tensor_scatter_nd_add(full, tf.reshape(update_index, [-1, 4]), tf.reshape(update, [-1, tf.shape(value)[-1]]))
+    return full
+
+
+def build_grided_gt_levels(y_true, masks, width, path_scales, classes, dtype, use_tie_breaker):
+    """
+    build the gridded ground truth for every output path of the model, used to grid the labels
+    in the input pipeline so the loss functions do not have to
+    Args: 
+        y_true: dict of tf.Tensor with the keys bbox, classes, and best_anchors, batched or unbatched
+        masks: dict mapping each path key to the list of anchors predicted by that path
+        width: width in pixels of the image the model will see
+        path_scales: dict mapping each path key to the down sampling factor of that path, ex. {"1024": 32, "512": 16, "256": 8}
+    
+    Return:
+        dict mapping each path key to a tf.Tensor[] of shape [batch, size, size, #of_anchors, 4 + 1 + num_classes]
+    """
+    unbatched = y_true["bbox"].shape.rank == 2
+    if unbatched:
+        y_true = {key: tf.expand_dims(y_true[key], axis=0) for key in ["bbox", "classes", "best_anchors"]}
+
+    grids = dict()
+    true_shape = tf.convert_to_tensor([classes + 5])
+    for key in masks.keys():
+        size = width // path_scales[key]
+        grid = build_grided_gt(y_true, tf.convert_to_tensor(masks[key], dtype=dtype), size, classes, true_shape, dtype, use_tie_breaker)
+        grids[key] = tf.squeeze(grid, axis=0) if unbatched else grid
+    return grids
+
+
+@tf.function(experimental_relax_shapes=True)
+def _build_grided_gt_loop(y_true, mask, size, classes, true_shape, dtype, use_tie_breaker):
+    """
+    reference (per box python loop) implementation of build_grided_gt, kept for testing and benchmarking
     Args: 
         y_true: tf.Tensor[] ground truth [box coords[0:4], classes_onehot[0:-1], best_fit_anchor_box]
         mask: list of the anchor boxes choresponding to the output, ex. [1, 2, 3] tells this layer to predict only the first 3 anchors in the total. 
@@ -111,7 +211,7 @@ def _build_grid_points(lwidth, lheight, num, dtype):
         x_left, y_left = tf.meshgrid(tf.range(0, lheight), tf.range(0, lwidth))
         x_y = K.stack([x_left, y_left], axis=-1)
         x_y = tf.cast(x_y, dtype=dtype) / tf.cast(lwidth, dtype=dtype)
-        x_y = tf.expand_dims(tf.repeat(tf.expand_dims(x_y, axis=-2),num,axis=-2),axis=0)
+        x_y = tf.broadcast_to(x_y[None, :, :, None, :], [1, lwidth, lheight, num, 2])
     return x_y
 
 
@@ -120,14 +220,86 @@ def _build_anchor_grid(width, height, anchors, num, dtype):
     with tf.name_scope("anchor_grid"):
         """ get the transformed anchor boxes for each dimention """
         anchors = tf.cast(anchors, dtype=dtype)
-        anchors = tf.reshape(anchors, [1, -1])
-        anchors = tf.repeat(anchors, width * height, axis=0)
-        anchors = tf.reshape(anchors, [1, width, height, num, -1])
+        anchors = tf.reshape(anchors, [1, 1, 1, num, -1])
+        anchors = tf.broadcast_to(anchors, [1, width, height, num, tf.shape(anchors)[-1]])
     return anchors
 
 
+def _np_grid_points(width, height, num, dtype):
+    """numpy version of _build_grid_points, used to fill the grid cache"""
+    x_left, y_left = np.meshgrid(np.arange(height), np.arange(width))
+    x_y = np.stack([x_left, y_left], axis=-1) / width
+    x_y = np.broadcast_to(x_y[None, :, :, None, :], [1, width, height, num, 2])
+    return x_y.astype(dtype.as_numpy_dtype)
+
+
+def _np_anchor_grid(width, height, anchors, num, dtype):
+    """numpy version of _build_anchor_grid, used to fill the grid cache"""
+    anchors = np.reshape(np.asarray(anchors, dtype=np.float64), [1, 1, 1, num, -1])
+    anchors = np.broadcast_to(anchors, [1, width, height, num, anchors.shape[-1]])
+    return anchors.astype(dtype.as_numpy_dtype)
+
+
+def static_dim(x, axis):
+    """the size of an axis as a python int if it is known while tracing, otherwise as a tensor"""
+    dim = x.shape[axis]
+    return int(dim) if dim is not None else tf.shape(x)[axis]
+
+
+class GridCache(object):
+    """
+    bounded least recently used cache of the grid point and anchor grid tensors, shared by every GridGenerator.
+    the tensors are built once per key outside of any graph, so a new trace for a size that was seen before
+    embeds the cached constant instead of rebuilding the grid.
+
+    Args:
+        max_size: the largest number of tensors held
+    """
+    def __init__(self, max_size=64):
+        self._max_size = max_size
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+        return
+
+    def get(self, key, build):
+        """return the tensor for key, calling build() to make it on a miss"""
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+        with tf.init_scope():
+            value = tf.constant(build())
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+        return value
+
+    def stats(self):
+        """
+        Return:
+            dict with the number of hits, misses, calls with dynamic sizes that could not be cached, and entries held
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "uncached": self.uncached, "size": len(self._cache)}
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+            self.uncached = 0
+        return
+
+
 class GridGenerator(object):
     inuse = dict()
+    cache = GridCache()
 
     def __init__(self,
                  anchors,
@@ -136,29 +308,21 @@ class GridGenerator(object):
                  name=None,
                  low_memory=True,
                  reset = False):
-        self.dtype = tf.keras.backend.floatx()
-        if masks != None:
-            self._num = len(masks)
-        else:
-            self._num = tf.shape(anchors)[0]
+        """
+        build the grid points and anchor grids of one output path. the grids are taken from GridGenerator.cache,
+        keyed by the width, height, number of anchors, anchors, scale, and dtype, so every generator with the
+        same configuration (the loss and the YoloLayer of a path) shares them, and a grid is only built the first
+        time a size is used. the grids have a batch dimension of 1 and broadcast across the batch.
 
-        self._low_memory = low_memory
+        low_memory is kept for compatibility, both modes use the cache.
+        """
+        self.dtype = tf.keras.backend.floatx()
         if masks != None:
             anchors = [anchors[mask] for mask in masks]
-
-        self._lock = False
+        self._anchors = [tuple(float(v) for v in anchor) for anchor in anchors]
+        self._num = len(self._anchors)
+        self._low_memory = low_memory
         self._scale_anchors = scale_anchors
-        self._anchors = tf.convert_to_tensor(anchors)
-
-        if not self._low_memory:
-            self._prev_width = 13
-            self._grid_points = _build_grid_points(13, 13, self._num,
-                                                   self.dtype)
-            self._anchor_grid = _build_anchor_grid(
-                13, 13,
-                tf.cast(self._anchors, self.dtype) /
-                tf.cast(self._scale_anchors * 13, self.dtype), self._num,
-                self.dtype)
 
         if name != None:
             if name not in GridGenerator.inuse.keys() or reset == True:
@@ -169,70 +333,40 @@ class GridGenerator(object):
                 raise Exception("the name you are using is already in use")
         return
 
-    @tf.function(experimental_relax_shapes=True)
-    def _extend_batch(self, grid, batch_size):
-        return tf.repeat(grid, batch_size, axis=0)
+    def __call__(self, width, height, batch_size=None, dtype=None):
+        """
+        Args:
+            width: int or scalar tensor, python ints are looked up in the cache
+            height: int or scalar tensor
+            batch_size: unused, the grids broadcast across the batch
+            dtype: dtype of the grids, defaults to the keras floatx
 
-    @tf.function(experimental_relax_shapes=True)
-    def _get_grids_high_memory(self, width, height, batch_size, dtype=None):
-        self._lock = True
-        if dtype == None:
-            self.dtype = tf.keras.backend.floatx()
-        else:
-            self.dtype = dtype
-
-        if width != self._prev_width:
-            del self._anchor_grid
-            del self._grid_points
-            self._grid_points = _build_grid_points(width, height, self._num,
-                                                   self.dtype)
-            self._anchor_grid = _build_anchor_grid(
+        Return:
+            grid_points, anchor_grid of shape [1, width, height, num anchors, 2]
+        """
+        dtype = tf.as_dtype(tf.keras.backend.floatx() if dtype == None else dtype)
+        self.dtype = dtype
+        static_width = tf.get_static_value(width)
+        static_height = tf.get_static_value(height)
+
+        if static_width is None or static_height is None:
+            # the size is only known when the graph runs, so the grid is built in the graph
+            GridGenerator.cache.uncached += 1
+            grid_points = _build_grid_points(width, height, self._num, dtype)
+            anchor_grid = _build_anchor_grid(
                 width, height,
-                tf.cast(self._anchors, self.dtype) /
-                tf.cast(self._scale_anchors * width, self.dtype), self._num,
-                self.dtype)
-            self._prev_width = width
-        else:
-            self._grid_points = tf.cast(self._grid_points, self.dtype)
-            self._anchor_grid = tf.cast(self._anchor_grid, self.dtype)
-
-        if self._grid_points.dtype != self.dtype:
-            self._grid_points = tf.cast(self._grid_points, self.dtype)
-            self._anchor_grid = tf.cast(self._anchor_grid, self.dtype)
-
-        grid_points = self._extend_batch(self._grid_points, batch_size)
-        anchor_grid = self._extend_batch(self._anchor_grid, batch_size)
-        self._lock = False
-        return tf.stop_gradient(grid_points), tf.stop_gradient(anchor_grid)
-
-    @tf.function(experimental_relax_shapes=True)
-    def _get_grids_low_memory(self, width, height, batch_size, dtype=None):
-        if not self._lock:
-            if dtype == None:
-                self.dtype = tf.keras.backend.floatx()
-            else:
-                self.dtype = dtype
-        grid_points = _build_grid_points(width, height, self._num, self.dtype)
-        anchor_grid = _build_anchor_grid(
-            width, height,
-            tf.cast(self._anchors, self.dtype) /
-            tf.cast(self._scale_anchors * width, self.dtype), self._num, self.dtype)
-        grid_points = self._extend_batch(grid_points, batch_size)
-        anchor_grid = self._extend_batch(anchor_grid, batch_size)
-        return tf.stop_gradient(grid_points), tf.stop_gradient(anchor_grid)
-
-    @tf.function(experimental_relax_shapes=True)
-    def __call__(self, width, height, batch_size, dtype=None):
-        if self._low_memory or self._lock:
-            return self._get_grids_low_memory(width,
-                                              height,
-                                              batch_size,
-                                              dtype=dtype)
-        else:
-            return self._get_grids_high_memory(width,
-                                               height,
-                                               batch_size,
-                                               dtype=dtype)
+                tf.cast(self._anchors, dtype) /
+                tf.cast(self._scale_anchors * width, dtype), self._num, dtype)
+            return tf.stop_gradient(grid_points), tf.stop_gradient(anchor_grid)
+
+        width, height = int(static_width), int(static_height)
+        grid_points = GridGenerator.cache.get(
+            ("points", width, height, self._num, dtype.name),
+            lambda: _np_grid_points(width, height, self._num, dtype))
+        anchor_grid = GridGenerator.cache.get(
+            ("anchors", width, height, self._num, self._anchors, self._scale_anchors, dtype.name),
+            lambda: _np_anchor_grid(width, height, np.asarray(self._anchors) / (self._scale_anchors * width), self._num, dtype))
+        return grid_points, anchor_grid
 
     @staticmethod
     def get_generator_from_key(key):
@@ -75,7 +75,7 @@ class TensorRT(object):
         converter = trt.TrtGraphConverterV2(input_saved_model_dir=self._model_path, conversion_params=self._params)
         converter.convert()
         converter.build(self.gen_fn)
-        self._converter.save(self._model_save_path)
+        converter.save(self._model_save_path)
         self._converted = True
         return 
     
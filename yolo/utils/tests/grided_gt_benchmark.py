@@ -0,0 +1,35 @@
+"""Micro-benchmark of the vectorized ground truth builder against the python loop."""
+import time
+
+import tensorflow as tf
+
+from yolo.utils.loss_utils import build_grided_gt
+from yolo.utils.loss_utils import _build_grided_gt_loop
+from yolo.utils.tests.test_loss_utils import random_ground_truth
+
+
+def time_fn(fn, *args, iterations=10):
+    # the first call traces the function, so it is left out of the timing
+    fn(*args)
+    start = time.time()
+    for _ in range(iterations):
+        out = fn(*args)
+    _ = out.numpy()
+    return (time.time() - start) / iterations
+
+
+def main(batch_sizes=(1, 16, 64), num_boxes=100, classes=80, size=52, iterations=10):
+    mask = tf.constant([0, 1, 2], dtype=tf.float32)
+    true_shape = tf.constant([1, size, size, 3, classes + 5])
+    for batch_size in batch_sizes:
+        y_true = random_ground_truth(batch_size, num_boxes, classes)
+        args = (y_true, mask, size, classes, true_shape, tf.float32, True)
+        loop_time = time_fn(_build_grided_gt_loop, *args, iterations=iterations)
+        vec_time = time_fn(build_grided_gt, *args, iterations=iterations)
+        print(f"batch: {batch_size:3d}, boxes: {num_boxes}, loop: {loop_time * 1000:9.2f} ms, "
+              f"vectorized: {vec_time * 1000:7.2f} ms, speedup: {loop_time / vec_time:6.1f}x")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Benchmark of the vectorized anchor k-means against the original repeat/tile implementation."""
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from yolo.utils.iou_utils import compute_iou
+from yolo.utils.YoloKmeans import YoloKmeans
+
+
+def reference_kmeans(boxes, k, max_iter=300):
+    """the original implementation, it repeats the boxes k times and loops over the clusters"""
+    def iou(boxes, clusters):
+        n = boxes.shape[0]
+        boxes = tf.repeat(boxes, k, axis=0)
+        boxes = tf.cast(tf.reshape(boxes, (n, k, -1)), tf.float32)
+        clusters = tf.tile(clusters, [n, 1])
+        clusters = tf.cast(tf.reshape(clusters, (n, k, -1)), tf.float32)
+        zeros = tf.cast(tf.zeros(boxes.shape), dtype=tf.float32)
+        boxes = tf.concat([zeros, boxes], axis=-1)
+        clusters = tf.concat([zeros, clusters], axis=-1)
+        return compute_iou(boxes, clusters)
+
+    box_num = boxes.shape[0]
+    last = np.zeros((box_num, ))
+    clusters = boxes[np.random.choice(box_num, k, replace=False)]
+    num_iters = 0
+    while num_iters < max_iter:
+        curr = np.argmin(1 - iou(boxes, clusters), axis=-1)
+        if (curr == last).all():
+            break
+        for i in range(k):
+            clusters[i] = np.mean(boxes[curr == i], axis=0)
+        last = curr
+        num_iters += 1
+    return clusters
+
+
+def mean_iou(boxes, clusters):
+    return float(np.mean(np.max(YoloKmeans.iou(boxes, clusters), axis=-1)))
+
+
+def time_fn(fn):
+    start = time.time()
+    out = fn()
+    return time.time() - start, out
+
+
+def main(sizes=(10000, 100000, 860000), k=9, restarts=4, seed=0):
+    rng = np.random.default_rng(seed)
+    for size in sizes:
+        # log normal widths and heights look like the boxes of a detection dataset
+        boxes = np.clip(np.exp(rng.normal(-2.5, 1.0, (size, 2))), 1e-3, 1).astype(np.float32)
+        km = YoloKmeans(boxes=boxes, k=k)
+
+        ref_time, ref = time_fn(lambda: reference_kmeans(boxes.copy(), k))
+        vec_time, vec = time_fn(lambda: km.run_kmeans(restarts=restarts, seed=seed))
+        mb_time, mb = time_fn(lambda: km.run_minibatch_kmeans(max_steps=200, restarts=restarts, seed=seed))
+        print(f"boxes: {size:7d}, reference: {ref_time:8.2f} s (iou {mean_iou(boxes, ref):.4f}), "
+              f"vectorized x{restarts}: {vec_time:7.2f} s (iou {mean_iou(boxes, vec):.4f}), "
+              f"mini-batch x{restarts}: {mb_time:6.2f} s (iou {mean_iou(boxes, mb):.4f})")
+    return
+
+
+if __name__ == "__main__":
+    main()
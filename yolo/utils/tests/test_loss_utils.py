@@ -0,0 +1,164 @@
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo.utils.loss_utils import build_grided_gt
+from yolo.utils.loss_utils import build_grided_gt_levels
+from yolo.utils.loss_utils import _build_grided_gt_loop
+from yolo.utils.loss_utils import _build_grid_points
+from yolo.utils.loss_utils import _build_anchor_grid
+from yolo.utils.loss_utils import GridGenerator
+from yolo.utils.loss_utils import GridCache
+from yolo.modeling.functions.build_gridded_gt import build_gridded_gt_v1
+from yolo.modeling.functions.build_gridded_gt import _build_gridded_gt_v1_loop
+from yolo.dataloaders.YoloParser import YoloParser
+
+MASKS = {"1024": [6, 7, 8], "512": [3, 4, 5], "256": [0, 1, 2]}
+PATH_SCALES = {"1024": 32, "512": 16, "256": 8}
+
+
+def random_ground_truth(batch_size, num_boxes, classes, num_anchors=9, seed=0):
+    """build a padded batch of boxes in the format produced by YoloParser"""
+    tf.random.set_seed(seed)
+    xy = tf.random.uniform([batch_size, num_boxes, 2], minval=-0.05, maxval=1.0)
+    wh = tf.random.uniform([batch_size, num_boxes, 2], minval=0.01, maxval=0.5)
+    pad = tf.cast(tf.random.uniform([batch_size, num_boxes, 1]) > 0.2, tf.float32)
+    boxes = tf.concat([xy, wh], axis=-1) * pad
+    labels = tf.random.uniform([batch_size, num_boxes], maxval=classes, dtype=tf.int32)
+    ranked = tf.argsort(tf.random.uniform([batch_size, num_boxes, num_anchors]), axis=-1)[..., :5]
+    keep = tf.random.uniform([batch_size, num_boxes, 5]) > 0.5
+    keep = tf.concat([tf.ones_like(keep[..., :1]), keep[..., 1:]], axis=-1)
+    best_anchors = tf.where(keep, ranked, -1)
+    return {"bbox": boxes,
+            "classes": labels,
+            "label": labels,
+            "best_anchors": tf.cast(best_anchors, tf.float32)}
+
+
+class BuildGridedGTTest(tf.test.TestCase, parameterized.TestCase):
+    @parameterized.named_parameters(("tie_breaker", True, [0, 1, 2], 13),
+                                    ("no_tie_breaker", False, [0, 1, 2], 13),
+                                    ("tie_breaker_mid", True, [3, 4, 5], 26),
+                                    ("crowded", True, [6, 7, 8], 2))
+    def test_matches_loop(self, use_tie_breaker, mask, size):
+        classes = 10
+        y_true = random_ground_truth(2, 20, classes)
+        true_shape = tf.constant([2, size, size, len(mask), classes + 5])
+        mask = tf.constant(mask, dtype=tf.float32)
+        expected = _build_grided_gt_loop(y_true, mask, size, classes, true_shape, tf.float32, use_tie_breaker)
+        actual = build_grided_gt(y_true, mask, size, classes, true_shape, tf.float32, use_tie_breaker)
+        self.assertAllClose(expected, actual)
+        return
+
+    @parameterized.named_parameters(("small", 7, 2), ("large", 13, 3))
+    def test_v1_matches_loop(self, size, num_boxes):
+        classes = 20
+        y_true = random_ground_truth(2, 10, classes)
+        expected = _build_gridded_gt_v1_loop(y_true, classes, size, num_boxes, dtype=tf.float32)
+        actual = build_gridded_gt_v1(y_true, classes, size, num_boxes, dtype=tf.float32)
+        self.assertAllClose(expected, actual)
+        return
+
+
+class BuildGridedGTLevelsTest(tf.test.TestCase, parameterized.TestCase):
+    def expected_grids(self, y_true, width, classes, batch_size):
+        expected = dict()
+        for key, mask in MASKS.items():
+            size = width // PATH_SCALES[key]
+            true_shape = tf.constant([batch_size, size, size, len(mask), classes + 5])
+            expected[key] = build_grided_gt(y_true, tf.constant(mask, dtype=tf.float32), size, classes, true_shape, tf.float32, True)
+        return expected
+
+    @parameterized.named_parameters(("small", 256), ("large", 416))
+    def test_batched_matches_each_path(self, width):
+        classes = 10
+        y_true = random_ground_truth(2, 20, classes)
+        grids = build_grided_gt_levels(y_true, MASKS, width, PATH_SCALES, classes, tf.float32, True)
+        expected = self.expected_grids(y_true, width, classes, 2)
+        self.assertEqual(set(grids.keys()), set(MASKS.keys()))
+        for key in MASKS:
+            size = width // PATH_SCALES[key]
+            self.assertAllEqual(grids[key].shape, [2, size, size, 3, classes + 5])
+            self.assertAllClose(expected[key], grids[key])
+        return
+
+    def test_parser_grids_match_each_path(self):
+        classes, width = 10, 320
+        y_true = random_ground_truth(1, 20, classes)
+        # boxes the parser will not move, so the loss side grid can be built from the same labels
+        y_true["bbox"] = tf.clip_by_value(y_true["bbox"], 0.0, 1.0)
+        data = {"source_id": tf.constant(0),
+                "image": tf.zeros([64, 64, 3], tf.uint8),
+                "bbox": y_true["bbox"][0],
+                "classes": y_true["classes"][0],
+                "best_anchors": y_true["best_anchors"][0],
+                "seed": tf.constant([1, 2])}
+        parser = YoloParser(num_classes=classes, jitter_im=0.0, jitter_boxes=0.0, masks=MASKS,
+                            path_scales=PATH_SCALES, build_grids=True)
+        image, label = parser.parse_train_at_scale(data, width)
+
+        self.assertAllEqual(image.shape, [width, width, 3])
+        expected = self.expected_grids(y_true, width, classes, 1)
+        for key in MASKS:
+            self.assertAllClose(expected[key][0], label["grid"][key])
+        return
+
+
+class GridGeneratorTest(tf.test.TestCase, parameterized.TestCase):
+    def setUp(self):
+        super().setUp()
+        GridGenerator.cache.clear()
+        return
+
+    @parameterized.named_parameters(("square", 13, 13), ("wide", 20, 15))
+    def test_matches_graph_grids(self, width, height):
+        anchors = [(10, 13), (16, 30), (33, 23)]
+        generator = GridGenerator(anchors, scale_anchors=32)
+        grid_points, anchor_grid = generator(width, height, 4, dtype=tf.float32)
+        self.assertAllEqual(grid_points.shape, [1, width, height, 3, 2])
+
+        expected_points = _build_grid_points(tf.constant(width), tf.constant(height), 3, tf.float32)
+        expected_anchors = _build_anchor_grid(tf.constant(width), tf.constant(height),
+                                              tf.constant(anchors, tf.float32) / (32 * width), 3, tf.float32)
+        self.assertAllClose(expected_points, grid_points)
+        self.assertAllClose(expected_anchors, anchor_grid)
+        return
+
+    def test_cache_is_shared(self):
+        anchors = [(10, 13), (16, 30), (33, 23)]
+        first = GridGenerator(anchors, scale_anchors=32)
+        second = GridGenerator(anchors, scale_anchors=32)
+        first(13, 13, dtype=tf.float32)
+        second(13, 13, dtype=tf.float32)
+        second(26, 26, dtype=tf.float32)
+        stats = GridGenerator.cache.stats()
+        self.assertEqual(stats["misses"], 4)
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["size"], 4)
+        return
+
+    def test_dynamic_size_is_not_cached(self):
+        generator = GridGenerator([(10, 13), (16, 30)], scale_anchors=8)
+
+        @tf.function(input_signature=[tf.TensorSpec([], tf.int32)])
+        def grids(size):
+            return generator(size, size, dtype=tf.float32)
+
+        grid_points, anchor_grid = grids(tf.constant(52))
+        self.assertAllEqual(tf.shape(anchor_grid), [1, 52, 52, 2, 2])
+        self.assertEqual(GridGenerator.cache.stats()["uncached"], 1)
+        self.assertEqual(GridGenerator.cache.stats()["size"], 0)
+        return
+
+    def test_lru_eviction(self):
+        cache = GridCache(max_size=2)
+        for key in [1, 2, 1, 3]:
+            cache.get(key, lambda: [float(key)])
+        self.assertEqual(cache.stats()["size"], 2)
+        self.assertEqual(cache.hits, 1)
+        cache.get(1, lambda: [0.0])
+        self.assertEqual(cache.hits, 2)
+        return
+
+
+if __name__ == "__main__":
+    tf.test.main()
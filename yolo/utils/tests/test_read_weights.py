@@ -0,0 +1,110 @@
+import os
+from unittest import mock
+
+import numpy as np
+import tensorflow as tf
+
+from yolo.utils._darknet2tf import DarkNetConverter
+from yolo.utils._darknet2tf import weights_cache
+
+CONFIG = """[net]
+width=8
+height=8
+channels=3
+
+[convolutional]
+batch_normalize=1
+filters=4
+size=3
+stride=1
+pad=1
+activation=leaky
+
+[convolutional]
+filters=2
+size=1
+stride=1
+pad=1
+activation=linear
+"""
+# (3 * 4 * 3 * 3 + 4 * 4) + (4 * 2 + 2)
+NUM_WEIGHTS = 134
+
+
+def write_weights(path, values):
+    header = np.array([0, 2, 0], "<i4").tobytes() + np.array([5], "<u8").tobytes()
+    with open(path, "wb") as file:
+        file.write(header + values.astype("<f4").tobytes())
+    return path
+
+
+def layer_weights(net):
+    return [layer.get_weights() for layer in net.data if hasattr(layer, "get_weights")]
+
+
+class ReadWeightsTest(tf.test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = self.create_tempdir().full_path
+        self.cfg = os.path.join(self.dir, "tiny.cfg")
+        with open(self.cfg, "w") as file:
+            file.write(CONFIG)
+        self.weights = write_weights(os.path.join(self.dir, "tiny.weights"), np.arange(NUM_WEIGHTS))
+        self.cache = os.path.join(self.dir, "tiny.npz")
+
+    def assertSameWeights(self, expected, actual):
+        self.assertLen(actual, len(expected))
+        for e, a in zip(expected, actual):
+            self.assertLen(a, len(e))
+            for x, y in zip(e, a):
+                self.assertAllEqual(x, y)
+
+    def test_mmap_matches_read(self):
+        mapped = DarkNetConverter.read(self.cfg, self.weights, quiet=True, use_mmap=True)
+        read = DarkNetConverter.read(self.cfg, self.weights, quiet=True, use_mmap=False)
+        self.assertSameWeights(layer_weights(read), layer_weights(mapped))
+        kernel, scales, biases, _, _ = layer_weights(mapped)[1]
+        self.assertEqual((3, 3, 3, 4), kernel.shape)
+        self.assertAllEqual([0, 1, 2, 3], biases)
+        self.assertAllEqual([4, 5, 6, 7], scales)
+
+        # an open file is mapped as well
+        with open(self.weights, "rb") as file:
+            from_file = DarkNetConverter.read(self.cfg, file, quiet=True, use_mmap=True)
+        self.assertSameWeights(layer_weights(read), layer_weights(from_file))
+
+    def test_mmap_size_mismatch(self):
+        write_weights(self.weights, np.arange(NUM_WEIGHTS - 1))
+        with self.assertRaises(IOError):
+            DarkNetConverter.read(self.cfg, self.weights, quiet=True, use_mmap=True)
+
+    def test_cache_round_trip(self):
+        expected = layer_weights(DarkNetConverter.read(self.cfg, self.weights, quiet=True, cache_file=self.cache))
+        self.assertTrue(os.path.exists(self.cache))
+        # the weights file is not read when the cache matches it
+        cached = DarkNetConverter.read(self.cfg, self.weights, quiet=True, use_mmap=False, cache_file=self.cache)
+        self.assertSameWeights(expected, layer_weights(cached))
+
+    def test_warm_start_does_not_hash(self):
+        DarkNetConverter.read(self.cfg, self.weights, quiet=True, cache_file=self.cache)
+        with mock.patch.object(weights_cache, "hash_file", wraps=weights_cache.hash_file) as hash_file:
+            DarkNetConverter.read(self.cfg, self.weights, quiet=True, cache_file=self.cache)
+            self.assertEqual(hash_file.call_count, 0)
+            # a modified file is hashed again
+            os.utime(self.weights, (0, 0))
+            DarkNetConverter.read(self.cfg, self.weights, quiet=True, cache_file=self.cache)
+            self.assertEqual(hash_file.call_count, 1)
+
+    def test_cache_keyed_on_contents(self):
+        DarkNetConverter.read(self.cfg, self.weights, quiet=True, cache_file=self.cache)
+        # another file of the same size with an older modification time
+        write_weights(self.weights, -np.arange(NUM_WEIGHTS))
+        os.utime(self.weights, (0, 0))
+        expected = layer_weights(DarkNetConverter.read(self.cfg, self.weights, quiet=True))
+        actual = layer_weights(DarkNetConverter.read(self.cfg, self.weights, quiet=True, cache_file=self.cache))
+        self.assertSameWeights(expected, actual)
+        self.assertAllEqual([0, -1, -2, -3], actual[1][2])
+
+
+if __name__ == "__main__":
+    tf.test.main()
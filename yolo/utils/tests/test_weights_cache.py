@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from yolo.utils._darknet2tf.weights_cache import WeightsCache
+from yolo.utils._darknet2tf.weights_cache import hash_file
+
+
+def write_file(path, contents):
+    with open(path, "wb") as file:
+        file.write(contents)
+    return path
+
+
+def weights(size, value=1.0):
+    return {"backbone": [np.full([size], value, np.float32), np.arange(3, dtype=np.float32)],
+            "head": [np.zeros([2, 2], np.float32)]}
+
+
+class WeightsCacheTest(tf.test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = self.create_tempdir().full_path
+        self.cache_dir = os.path.join(self.dir, "converted")
+        self.cfg = write_file(os.path.join(self.dir, "model.cfg"), b"[net]\n")
+        self.weights = write_file(os.path.join(self.dir, "model.weights"), b"\x00" * 64)
+
+    def test_key(self):
+        cache = WeightsCache(self.cache_dir)
+        key = cache.key(self.cfg, self.weights, "regular")
+        self.assertEqual(key, cache.key(self.cfg, self.weights, "regular"))
+        self.assertNotEqual(key, cache.key(self.cfg, self.weights, "tiny"))
+        self.assertNotEqual(key, cache.key(self.cfg, self.weights, "regular", "mixed_float16"))
+
+        # same size and a new modification time, but different contents
+        write_file(self.weights, b"\x01" * 64)
+        os.utime(self.weights, (0, 0))
+        self.assertNotEqual(key, cache.key(self.cfg, self.weights, "regular"))
+
+        with open(self.weights, "rb") as file:
+            self.assertEqual(hash_file(self.weights), hash_file(file))
+            self.assertEqual(0, file.tell())
+
+    def test_hit_and_miss(self):
+        cache = WeightsCache(self.cache_dir)
+        key = cache.key(self.cfg, self.weights, "regular")
+        self.assertIsNone(cache.get(key))
+
+        expected = weights(10)
+        cache.put(key, expected)
+        # a new instance reads the index written by the first one
+        actual = WeightsCache(self.cache_dir).get(key)
+        self.assertEqual(set(expected), set(actual))
+        for part in expected:
+            self.assertLen(actual[part], len(expected[part]))
+            for e, a in zip(expected[part], actual[part]):
+                self.assertAllEqual(e, a)
+
+    def test_hit_does_not_write_index(self):
+        cache = WeightsCache(self.cache_dir)
+        cache.put("a", weights(10))
+        index = os.path.join(self.cache_dir, "index.json")
+        os.utime(index, ns=(0, 0))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertEqual(0, os.stat(index).st_mtime_ns)
+
+    def test_eviction_order(self):
+        cache = WeightsCache(self.cache_dir)
+        cache.put("a", weights(1000))
+        entry_size = cache.size
+        cache = WeightsCache(self.cache_dir, max_size=int(entry_size * 2.5))
+        cache.put("b", weights(1000))
+        # a is used after b, so b is the least recently used entry
+        cache.get("a")
+        cache.put("c", weights(1000))
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, "b.npz")))
+        self.assertLessEqual(cache.size, int(entry_size * 2.5))
+
+        # the index written by the put keeps the hit of a, which is now older than c
+        cache = WeightsCache(self.cache_dir, max_size=int(entry_size * 2.5))
+        cache.put("d", weights(1000))
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_invalidate(self):
+        cache = WeightsCache(self.cache_dir)
+        for key in ["a", "b", "c"]:
+            cache.put(key, weights(10))
+        cache.invalidate("a")
+        self.assertIsNone(WeightsCache(self.cache_dir).get("a"))
+        self.assertIsNotNone(WeightsCache(self.cache_dir).get("b"))
+
+        cache.invalidate()
+        cache = WeightsCache(self.cache_dir)
+        self.assertEqual(0, cache.size)
+        self.assertEqual(["index.json"], os.listdir(self.cache_dir))
+
+    def test_clear_cache_flag(self):
+        from yolo.utils._darknet2tf.__main__ import main
+        cache = WeightsCache(self.cache_dir)
+        cache.put("a", weights(10))
+        main(["darknet2tf", "--clear_cache", "--cache_dir", self.cache_dir])
+        self.assertIsNone(WeightsCache(self.cache_dir).get("a"))
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -0,0 +1,48 @@
+import numpy as np
+import tensorflow as tf
+from absl.testing import parameterized
+
+from yolo.utils.YoloKmeans import YoloKmeans
+
+
+def clustered_boxes(centers, boxes_per_center=500, stddev=0.01, seed=0):
+    """widths and heights scattered around a few known anchors"""
+    rng = np.random.default_rng(seed)
+    boxes = [c + rng.normal(0, stddev, (boxes_per_center, 2)) for c in centers]
+    return np.clip(np.concatenate(boxes, axis=0), 0.001, 1).astype(np.float32)
+
+
+class YoloKmeansTest(tf.test.TestCase, parameterized.TestCase):
+    centers = np.array([[0.05, 0.05], [0.2, 0.3], [0.6, 0.5]], dtype=np.float32)
+
+    def test_iou(self):
+        boxes = np.array([[0.2, 0.2], [0.4, 0.1]], dtype=np.float32)
+        clusters = np.array([[0.2, 0.2], [0.1, 0.4], [0.4, 0.4]], dtype=np.float32)
+        expected = [[1.0, 0.02 / 0.06, 0.25], [0.02 / 0.06, 0.01 / 0.07, 0.25]]
+        self.assertAllClose(expected, YoloKmeans.iou(boxes, clusters))
+
+    @parameterized.named_parameters(("kmeans++", "kmeans++", 1), ("random_restarts", "random", 4),
+                                    ("kmeans++_restarts", "kmeans++", 4))
+    def test_run_kmeans(self, init, restarts):
+        km = YoloKmeans(boxes=clustered_boxes(self.centers), k=3, with_color=True)
+        clusters, labels = km.run_kmeans(restarts=restarts, init=init, seed=1)
+        self.assertAllClose(self.centers, clusters, atol=2e-3)
+        self.assertAllEqual(np.repeat(np.arange(3), 500), labels)
+
+    def test_run_minibatch_kmeans(self):
+        boxes = clustered_boxes(self.centers)
+        dataset = tf.data.Dataset.from_tensor_slices(boxes).shuffle(1500, seed=0).batch(256).repeat(5)
+        km = YoloKmeans(k=3)
+        clusters = km.run_minibatch_kmeans(dataset, restarts=3, seed=2)
+        self.assertAllClose(self.centers, clusters, atol=5e-3)
+
+    def test_box_dataset(self):
+        bbox = tf.constant([[[0.1, 0.2, 0.5, 0.3], [0.0, 0.0, 1.0, 1.0]]], dtype=tf.float32)
+        dataset = tf.data.Dataset.from_tensor_slices({"objects": {"bbox": bbox}})
+        km = YoloKmeans()
+        km.get_box_from_dataset(dataset, batch_size=1)
+        self.assertAllClose([[0.1, 0.4], [1.0, 1.0]], km.get_boxes())
+
+
+if __name__ == "__main__":
+    tf.test.main()